@@ -3,12 +3,22 @@
 """
 import os
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, Optional, List
 from langchain_community.llms import Ollama
 from utils.file_utils import FileUtils
 from utils.json_parser import JSONParser
 from utils.prompt_templates import PromptTemplates
+from utils.compact_format import CompactFormat
 from utils.time_checker import TimeChecker
+from utils.llm_pool import resolve_concurrency
+from utils.chapter_budget import BudgetedLLM, ChapterBudgetExceeded, DeferredQueue
+from utils.entity_candidates import EntityCandidateExtractor
+from utils.entity_registry import EntityRegistry
+from utils.extractive_compressor import ExtractiveCompressor
+from analyzers.chapter_packer import ChapterPacker
+from processors.stylometrics import Stylometrics
 
 
 class ChapterAnalyzer:
@@ -24,7 +34,8 @@ class ChapterAnalyzer:
             output_dir: 输出目录
             no_time_check: 是否跳过时间检查
         """
-        self.llm = llm
+        self._llm = llm
+        self._local = threading.local()
         self.config = config
         self.output_dir = os.path.join(output_dir, 'chapter_summaries')
         os.makedirs(self.output_dir, exist_ok=True)
@@ -35,6 +46,37 @@ class ChapterAnalyzer:
         # 如果禁用时间检查，传入空配置给TimeChecker
         time_check_config = {} if no_time_check else config
         self.time_checker = TimeChecker(time_check_config)
+        
+        # 同时分析的章节数（默认等于LLM端点数）
+        self.max_concurrent = resolve_concurrency(config)
+        
+        # 超出单章预算的章节推迟到最后重试
+        self.deferred = DeferredQueue(config)
+        
+        # 连续短章节打包分析（默认关闭）
+        self.packer = ChapterPacker(config)
+        
+        # 本地实体候选（剔除原文中不存在的角色/地点名）
+        self.candidates = EntityCandidateExtractor(config)
+        
+        # 跨章节滚动的已知实体词典（规范名 + 别名），注入提示词并统一结果中的名字
+        self.registry = EntityRegistry(config, output_dir)
+        
+        # 输出格式：json（默认）或 compact（逐行 | 分隔，本地解析为相同结构，输出Token更少）
+        self.compact_output = config.get('extraction', {}).get('output_format', 'json') == 'compact'
+        
+        # 抽取式预压缩（开启 compression.chapter 时代替硬截断）
+        self.compressor = ExtractiveCompressor(config)
+        
+        # 提示词Token预算（单章提示词超出模型上下文时警告）
+        self.prompt_budget = PromptBudget(config)
+    
+    @property
+    def llm(self):
+        """当前线程使用的LLM（推迟重试时为备用模型，有预算时扣减预算）"""
+        llm = getattr(self._local, 'llm', None) or self._llm
+        budget = getattr(self._local, 'budget', None)
+        return BudgetedLLM(llm, budget) if budget else llm
     
     def analyze_chapter(self, chapter: Dict) -> Optional[Dict]:
         """
@@ -49,15 +91,24 @@ class ChapterAnalyzer:
         chapter_number = chapter['number']
         
         # 检查是否已存在结果
-        output_file = os.path.join(self.output_dir, f"chapter_{chapter_number:03d}.json")
+        output_file = self._output_file(chapter)
         if os.path.exists(output_file):
             print(f"  章节 {chapter_number} 已分析，跳过")
             return FileUtils.load_json(output_file)
         
         # 构建prompt（智能截断，保留完整句子）
         content = chapter['content']
-        max_length = 6000  # 增加上下文长度
-        if len(content) > max_length:
+        # 推迟重试时使用更短的内容窗口
+        max_length = self.deferred.deferred_max_length if getattr(self._local, 'deferred', False) else 6000
+        compression = None
+        if self.compressor.chapter_enabled:
+            # 按TextRank得分在预算内选句，优先保留对话和实体名所在的句子
+            target = self.compressor.target_for()
+            if getattr(self._local, 'deferred', False):
+                target = min(target, max_length)
+            names = self.candidates.salient_names(content, self.registry.known_in(content))
+            content, compression = self.compressor.compress(content, names, target)
+        elif len(content) > max_length:
             # 在max_length附近找到句号、问号、感叹号等标点
             truncate_pos = max_length
             for i in range(max_length, max(0, max_length - 200), -1):
@@ -66,10 +117,20 @@ class ChapterAnalyzer:
                     break
             content = content[:truncate_pos]
         
-        prompt = PromptTemplates.CHAPTER_ANALYSIS.format(
-            chapter_text=content,
-            chapter_number=chapter_number
-        )
+        # 已知实体：只列出本章出现过的，要求模型对它们只输出增量信息
+        if self.compact_output:
+            prompt = self.registry.to_prompt(content) + CompactFormat.build_prompt(
+                'chapter', "分析以下小说章节，提取关键信息。", content)
+        else:
+            prompt = self.registry.to_prompt(content) + PromptTemplates.CHAPTER_ANALYSIS.format(
+                chapter_text=content,
+                chapter_number=chapter_number
+            )
+        
+        # 模型路由：每个章节从最弱档位开始
+        if hasattr(self.llm, 'reset'):
+            self.llm.reset()
+        self.prompt_budget.check(f"chapter {chapter_number}", prompt, llm=self.llm, warn_only=True)
         
         # 调用LLM（带重试）
         for attempt in range(self.retry_times):
@@ -85,19 +146,35 @@ class ChapterAnalyzer:
                     # Ollama等返回字符串
                     response_text = str(response)
                 
-                # 解析JSON
-                result = JSONParser.parse(response_text)
+                # 解析JSON（紧凑格式在本地解析为相同结构）
+                if self.compact_output:
+                    result = CompactFormat.parse('chapter', response_text)
+                else:
+                    result = JSONParser.parse(response_text)
+                if isinstance(result, dict):
+                    self._apply_stylometrics(result, chapter)
                 
                 if result and self._validate_chapter_result(result):
+                    # 剔除原文中不存在的角色和地点（LLM臆造的名字）
+                    result['characters'] = self.candidates.filter_entities(result['characters'], content, '角色', self.registry.surface_forms)
+                    result['locations'] = self.candidates.filter_entities(result['locations'], content, '地点', self.registry.surface_forms)
+                    # 别名统一为规范名
+                    self.registry.normalize(result)
+                    
                     # 添加基本信息
                     result['chapter_number'] = chapter_number
                     result['chapter_title'] = chapter.get('title', '')
                     result['word_count'] = chapter['word_count']
+                    if compression:
+                        result['compression'] = compression
                     
                     # 保存结果
                     FileUtils.save_json(result, output_file)
                     return result
                 else:
+                    # 解析失败时升级到更强的模型档位（启用模型路由时）
+                    if hasattr(self.llm, 'escalate'):
+                        self.llm.escalate()
                     # JSON解析失败，打印调试信息
                     if attempt < self.retry_times - 1:
                         print(f"  ⚠️  章节 {chapter_number} JSON解析失败，重新调用LLM重试 {attempt + 1}/{self.retry_times}")
@@ -161,6 +238,46 @@ class ChapterAnalyzer:
         
         return True
     
+    def _output_file(self, chapter: Dict) -> str:
+        """章节结果文件路径"""
+        return os.path.join(self.output_dir, f"chapter_{chapter['number']:03d}.json")
+    
+    def invalidate(self, chapter: Dict):
+        """删除章节已有的结果（原文变化后重新分析）"""
+        output_file = self._output_file(chapter)
+        if os.path.exists(output_file):
+            os.remove(output_file)
+    
+    def _apply_stylometrics(self, result: Dict, chapter: Dict):
+        """附加本地文体统计（单次调用已包含风格描述，保留LLM结果，缺少时用统计结果补上）"""
+        metrics = Stylometrics.compute(chapter['content'])
+        result['stylometrics'] = metrics
+        if not isinstance(result.get('writing_style_notes'), dict):
+            result['writing_style_notes'] = Stylometrics.to_style_notes(metrics)
+    
+    def _store_packed(self, chapter: Dict, result: Dict) -> bool:
+        """
+        保存打包分析拆分出的单章结果
+        
+        Args:
+            chapter: 章节数据
+            result: 该章节的分析结果
+            
+        Returns:
+            结果是否合格（不合格的章节回退单章分析）
+        """
+        self._apply_stylometrics(result, chapter)
+        if not self._validate_chapter_result(result):
+            return False
+        result['characters'] = self.candidates.filter_entities(result['characters'], chapter['content'], '角色', self.registry.surface_forms)
+        result['locations'] = self.candidates.filter_entities(result['locations'], chapter['content'], '地点', self.registry.surface_forms)
+        self.registry.normalize(result)
+        result['chapter_number'] = chapter['number']
+        result['chapter_title'] = chapter.get('title', '')
+        result['word_count'] = chapter['word_count']
+        FileUtils.save_json(result, self._output_file(chapter))
+        return True
+    
     def batch_analyze(self, chapters: list) -> list:
         """
         批量分析章节
@@ -178,21 +295,110 @@ class ChapterAnalyzer:
         print(f"第一层：单章分析")
         print(f"━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━")
         
-        for idx, chapter in enumerate(chapters, 1):
-            # 检查时间（每个章节前检查）
-            self.time_checker.check_and_wait()
-            
-            print(f"📖 分析章节 {idx}/{total}: {chapter.get('title', chapter['filename'])}")
-            
+        # 连续短章节先打包分析，结果写入各章节文件后由下面的逐章流程直接加载
+        if self.packer.enabled:
+            self.packer.run(
+                chapters, self.llm,
+                is_done=lambda chapter: os.path.exists(self._output_file(chapter)),
+                store=self._store_packed,
+                max_workers=self.max_concurrent,
+                before_call=self.time_checker.check_and_wait,
+                hint=self.registry.to_prompt
+            )
+        
+        if self.max_concurrent > 1:
+            print(f"⚡ 并发分析: {self.max_concurrent} 个章节同时进行")
+            # 按窗口并发：窗口内的章节读取同一份实体词典，窗口结束后按章节顺序登记，
+            # 已知实体提示词和别名归一化不受线程完成顺序影响，重复运行结果一致
+            with ThreadPoolExecutor(max_workers=self.max_concurrent) as executor:
+                for start in range(0, total, self.max_concurrent):
+                    window = list(enumerate(chapters[start:start + self.max_concurrent], start + 1))
+                    futures = [
+                        executor.submit(self._analyze_one, idx, total, chapter)
+                        for idx, chapter in window
+                    ]
+                    for (_, chapter), future in zip(window, futures):
+                        result = future.result()
+                        self._observe(result, chapter)
+                        if result:
+                            results.append(result)
+        else:
+            for idx, chapter in enumerate(chapters, 1):
+                result = self._analyze_one(idx, total, chapter)
+                self._observe(result, chapter)
+                if result:
+                    results.append(result)
+        
+        # 重试超出预算而被推迟的章节
+        retried = self._retry_deferred(total)
+        if retried:
+            results = sorted(results + retried, key=lambda r: r.get('chapter_number', 0))
+        
+        print(f"\n💾 已保存单章结果: {len(results)}/{total} 个JSON文件")
+        return results
+    
+    def _analyze_one(self, idx: int, total: int, chapter: Dict) -> Optional[Dict]:
+        """分析单个章节并打印进度（批量分析的工作单元）"""
+        # 检查时间（每个章节前检查）
+        self.time_checker.check_and_wait()
+        
+        print(f"📖 分析章节 {idx}/{total}: {chapter.get('title', chapter['filename'])}")
+        
+        self._local.budget = self.deferred.new_budget()
+        try:
             result = self.analyze_chapter(chapter)
-            if result:
-                results.append(result)
-                print(f"  ✓ 成功")
-            else:
-                print(f"  ✗ 失败")
+        except ChapterBudgetExceeded as e:
+            self.deferred.park(idx, chapter, e)
+            return None
+        finally:
+            self._local.budget = None
+        
+        if result:
+            print(f"  ✓ 成功")
+        else:
+            print(f"  ✗ 失败")
+        
+        # 避免请求过快
+        time.sleep(0.5)
+        
+        return result
+    
+    def _observe(self, result: Optional[Dict], chapter: Dict):
+        """登记单章结果中的实体（批量分析按章节顺序调用）"""
+        # 登记本章实体，供后续章节的提示词使用
+        self.registry.observe(result, chapter['number'])
+    
+    def _retry_deferred(self, total: int) -> List[Dict]:
+        """
+        重试被推迟的章节（不限预算，使用更短的内容窗口和备用模型）
+        
+        Args:
+            total: 章节总数
             
-            # 避免请求过快
-            time.sleep(0.5)
+        Returns:
+            重试成功的结果列表
+        """
+        items = self.deferred.drain()
+        if not items:
+            return []
+        
+        print(f"\n🔁 重试推迟的章节: {len(items)} 个（内容窗口 {self.deferred.deferred_max_length} 字）")
+        self._local.deferred = True
+        self._local.llm = self.deferred.alternate_llm(self._llm)
+        
+        results = []
+        try:
+            for idx, chapter in items:
+                print(f"📖 重试章节 {idx}/{total}: {chapter.get('title', chapter['filename'])}")
+                result = self.analyze_chapter(chapter)
+                if result:
+                    self._observe(result, chapter)
+                    results.append(result)
+                    print(f"  ✓ 成功")
+                else:
+                    print(f"  ✗ 失败")
+        finally:
+            self._local.deferred = False
+            self._local.llm = None
         
-        print(f"\n💾 已保存单章结果: {len(results)}/{total} 个JSON文件")
         return results
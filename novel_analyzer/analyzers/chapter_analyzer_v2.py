@@ -4,10 +4,22 @@
 import os
 import json
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, Optional, List
 from utils.file_utils import FileUtils
 from utils.json_parser import JSONParser
+from utils.prompt_templates import PromptTemplates
 from utils.time_checker import TimeChecker
+from utils.llm_pool import resolve_concurrency
+from utils.chapter_budget import BudgetedLLM, ChapterBudgetExceeded, DeferredQueue
+from utils.entity_candidates import EntityCandidateExtractor
+from utils.entity_registry import EntityRegistry
+from utils.extractive_compressor import ExtractiveCompressor
+from utils.compact_format import CompactFormat, CompactFormatError
+from utils.prompt_budget import PromptBudget
+from analyzers.chapter_packer import ChapterPacker
+from processors.stylometrics import Stylometrics
 
 
 class ChapterAnalyzerV2:
@@ -32,6 +44,16 @@ class ChapterAnalyzerV2:
         'chapter_summary'
     ]
     
+    # 打包结果中各任务字段的类型（类型不符的任务交给单任务提取）
+    TASK_TYPES = {
+        'characters': list,
+        'locations': list,
+        'events': list,
+        'world_elements': list,
+        'writing_style_notes': dict,
+        'chapter_summary': dict
+    }
+    
     def __init__(self, llm, config: dict, output_dir: str, no_time_check: bool = False):
         """
         初始化单章分析器V2
@@ -42,7 +64,11 @@ class ChapterAnalyzerV2:
             output_dir: 输出目录
             no_time_check: 是否跳过时间检查
         """
-        self.llm = llm
+        self._llm = llm
+        # 启用模型路由时，每个任务按 chapter.<任务名> 路由到各自的模型档位
+        self.router = llm if hasattr(llm, 'route') else None
+        # 当前线程正在执行的任务所用的路由LLM（并发分析章节时各线程独立）
+        self._local = threading.local()
         self.config = config
         self.output_dir = os.path.join(output_dir, 'chapter_summaries')
         self.temp_dir = os.path.join(output_dir, 'chapter_temp')
@@ -55,6 +81,49 @@ class ChapterAnalyzerV2:
         # 如果禁用时间检查，传入空配置给TimeChecker
         time_check_config = {} if no_time_check else config
         self.time_checker = TimeChecker(time_check_config)
+        
+        # 同时分析的章节数（默认等于LLM端点数）
+        self.max_concurrent = resolve_concurrency(config)
+        
+        # 超出单章预算的章节推迟到最后重试
+        self.deferred = DeferredQueue(config)
+        
+        # 连续短章节打包分析（默认关闭）
+        self.packer = ChapterPacker(config)
+        
+        # 本地角色/地点候选（可代替角色名单调用，并剔除原文中不存在的名字）
+        self.candidates = EntityCandidateExtractor(config)
+        
+        # 跨章节滚动的已知实体词典（规范名 + 别名），注入提示词并统一结果中的名字
+        self.registry = EntityRegistry(config, output_dir)
+        
+        # 风格任务默认由本地文体统计完成，设置 stylometrics.llm_style_task 后才调用LLM
+        self.llm_style_task = bool((config.get('stylometrics', {}) or {}).get('llm_style_task', False))
+        
+        # 输出格式：json（默认）或 compact（逐行 | 分隔，本地解析为相同结构，输出Token更少）
+        self.compact_output = config.get('extraction', {}).get('output_format', 'json') == 'compact'
+        
+        # 提取模式：split（默认，每个任务单独调用）或 adaptive（先整章单次调用，只补提缺失或不合格的任务）
+        self.adaptive = config.get('extraction', {}).get('mode', 'split') == 'adaptive'
+        
+        # 抽取式预压缩（开启 compression.chapter 时代替硬截断，各任务可配置不同预算）
+        self.compressor = ExtractiveCompressor(config)
+        
+        # 提示词Token预算（各任务提示词超出模型上下文时警告）
+        self.prompt_budget = PromptBudget(config)
+    
+    @property
+    def llm(self):
+        """当前使用的LLM（任务执行期间为该任务的路由LLM，有预算时扣减预算）"""
+        llm = getattr(self._local, 'llm', None) or self._llm
+        budget = getattr(self._local, 'budget', None)
+        return BudgetedLLM(llm, budget) if budget else llm
+    
+    def _invoke(self, task: str, prompt: str):
+        """调用当前LLM（调用前按模型上下文检查提示词Token数）"""
+        llm = self.llm
+        self.prompt_budget.check(f"chapter.{task}", prompt, llm=llm, warn_only=True)
+        return llm.invoke(prompt)
     
     def analyze_chapter(self, chapter: Dict) -> Optional[Dict]:
         """
@@ -80,8 +149,12 @@ class ChapterAnalyzerV2:
         
         # 准备章节内容（智能截断）
         content = chapter['content']
-        max_length = 6000
-        if len(content) > max_length:
+        # 推迟重试时使用更短的内容窗口
+        max_length = self.deferred.deferred_max_length if getattr(self._local, 'deferred', False) else 6000
+        compressed = self._compress_chapter(chapter, max_length) if self.compressor.chapter_enabled else None
+        if compressed:
+            content = compressed[None][0]
+        elif len(content) > max_length:
             truncate_pos = max_length
             for i in range(max_length, max(0, max_length - 200), -1):
                 if content[i] in '。！？…\n':
@@ -93,6 +166,14 @@ class ChapterAnalyzerV2:
         chapter_temp_dir = os.path.join(self.temp_dir, safe_title)
         os.makedirs(chapter_temp_dir, exist_ok=True)
         
+        # 本地文体统计（使用完整原文，不占用LLM调用）
+        stylometrics = Stylometrics.compute(chapter['content'])
+        
+        # 自适应模式：还没有任何任务缓存时先整章单次调用，合格的任务写入缓存
+        if self.adaptive and not any(
+                os.path.exists(os.path.join(chapter_temp_dir, f"{task_name}.json")) for task_name in self.TASKS):
+            self._single_call(chapter, content)
+        
         # 执行分段提取
         result = {}
         success_count = 0
@@ -112,9 +193,17 @@ class ChapterAnalyzerV2:
                 except Exception as e:
                     print(f" ⚠️  缓存损坏，重新提取")
             
-            # 调用LLM提取该部分
+            # 风格任务由本地统计替代
+            if task_name == 'writing_style_notes' and not self.llm_style_task:
+                result[task_name] = Stylometrics.to_style_notes(stylometrics)
+                print(f" ✓ 本地统计")
+                success_count += 1
+                continue
+            
+            # 调用LLM提取该部分（预压缩时使用该任务预算的压缩文本）
             task_start = time.time()
-            task_result = self._retry_extract(task_name, content, chapter_number)
+            task_content = compressed[task_name][0] if compressed else content
+            task_result = self._retry_extract(task_name, task_content, chapter_number)
             task_elapsed = time.time() - task_start
             
             if task_result is not None:
@@ -138,6 +227,13 @@ class ChapterAnalyzerV2:
             print(f"  ⚠️  章节 {chapter_number} 部分任务失败 ({success_count}/{len(self.TASKS)})")
             # 即使部分失败，也保存已有结果
         
+        # 别名统一为规范名
+        self.registry.normalize(result)
+        result['stylometrics'] = stylometrics
+        if compressed:
+            result['compression'] = dict(compressed[None][1], tasks={
+                task_name: compressed[task_name][1]['ratio'] for task_name in self.TASKS})
+        
         # 添加基本信息
         result['chapter_number'] = chapter_number
         result['chapter_title'] = chapter.get('title', '')
@@ -152,6 +248,30 @@ class ChapterAnalyzerV2:
         return result
     
     def _retry_extract(self, task_name: str, content: str, chapter_number: int) -> Optional[any]:
+        """
+        带重试机制的提取函数（启用模型路由时使用该任务的路由LLM）
+        
+        Args:
+            task_name: 任务名称
+            content: 章节内容
+            chapter_number: 章节号
+            
+        Returns:
+            提取结果
+        """
+        if self.router is None:
+            return self._retry_extract_task(task_name, content, chapter_number)
+        
+        # 提取方法统一通过 self.llm 调用，任务期间当前线程切换为该任务的路由LLM
+        # 推迟重试时使用 deferred 路由（备用模型）
+        prefix = getattr(self._local, 'route_prefix', None) or 'chapter'
+        self._local.llm = self.router.route(f'{prefix}.{task_name}')
+        try:
+            return self._retry_extract_task(task_name, content, chapter_number)
+        finally:
+            self._local.llm = None
+    
+    def _retry_extract_task(self, task_name: str, content: str, chapter_number: int) -> Optional[any]:
         """
         带重试机制的提取函数
         
@@ -187,6 +307,9 @@ class ChapterAnalyzerV2:
                 if result is not None:
                     return result
                 else:
+                    # 解析失败时升级到更强的模型档位（启用模型路由时）
+                    if hasattr(self.llm, 'escalate'):
+                        self.llm.escalate()
                     if attempt < self.retry_times - 1:
                         print(f"\n        ⚠️  解析失败，准备重试", end='', flush=True)
                         time.sleep(1)
@@ -205,36 +328,51 @@ class ChapterAnalyzerV2:
         """
         提取角色信息（分步骤执行）
         
-        步骤1: 获取角色名单
+        步骤1: 获取角色名单（本地候选置信度足够高时不调用LLM）
         步骤2: 逐个分析角色详情
         步骤3: 整合结果
         """
         try:
             # ===== 步骤1: 获取角色名单 =====
-            step1_prompt = f"""阅读以下章节内容，列出本章出现的所有角色名字。
-
-章节内容：
-{content}
-
-要求：
-1. 只输出角色名字列表，用JSON数组格式
-2. 不要包含任何解释或额外信息
-3. 格式：["角色1", "角色2", "角色3"]
-
-角色名单："""
-            
-            response = self.llm.invoke(step1_prompt)
-            response_text = response.content if hasattr(response, 'content') else str(response)
-            character_names = JSONParser.parse(response_text)
+            # 本地候选置信度足够高时直接使用，省去名单调用
+            candidates = self.candidates.extract(content) if self.candidates.enabled else None
+            character_names = self.candidates.confident_names(candidates) if candidates else []
+            if character_names:
+                print(f"\n        🔎 本地候选名单 ({len(character_names)}人, 置信度 {candidates['confidence']:.2f})",
+                      end='', flush=True)
+            else:
+                character_names = self._list_character_names(content)
+                if not character_names:
+                    print(f"        ⚠️  角色名单提取失败", end='', flush=True)
+                    return []
+                if self.candidates.enabled:
+                    # 剔除原文中不存在的名字（LLM臆造的角色）
+                    kept = self.candidates.filter_names(character_names, content, self.registry.surface_forms)
+                    dropped = [str(n) for n in character_names if n not in kept]
+                    if dropped:
+                        print(f"\n        🧹 剔除原文中不存在的角色: {', '.join(dropped[:5])}",
+                              end='', flush=True)
+                    character_names = kept
             
-            if not character_names or not isinstance(character_names, list):
-                print(f"        ⚠️  角色名单提取失败", end='', flush=True)
-                return []
+            # 别名统一为规范名（同一角色只分析一次）
+            character_names = list(dict.fromkeys(
+                self.registry.canonical_character(n) if isinstance(n, str) else n for n in character_names))
             
             # ===== 步骤2: 逐个分析角色 =====
             characters = []
             for name in character_names[:10]:  # 最多分析10个角色，避免过多调用
-                step2_prompt = f"""分析章节中角色"{name}"的信息。
+                if self.compact_output:
+                    char_data = self._invoke_compact(
+                        'character', f'分析章节中角色"{name}"的信息（C 行第一列写"{name}"）。', content,
+                        prefix=self.registry.describe_character(name))
+                    if char_data:
+                        char_data['name'] = name  # 确保name字段正确
+                    characters.append(char_data if char_data else self._basic_character(name))
+                    time.sleep(0.3)  # 避免请求过快
+                    continue
+                
+                # 已知角色只要求输出本章新增的信息
+                step2_prompt = self.registry.describe_character(name) + f"""分析章节中角色"{name}"的信息。
 
 章节内容：
 {content}
@@ -258,7 +396,7 @@ class ChapterAnalyzerV2:
 
 只输出JSON对象："""
                 
-                char_response = self.llm.invoke(step2_prompt)
+                char_response = self._invoke('characters', step2_prompt)
                 char_text = char_response.content if hasattr(char_response, 'content') else str(char_response)
                 char_data = JSONParser.parse(char_text)
                 
@@ -269,15 +407,7 @@ class ChapterAnalyzerV2:
                         characters.append(char_data)
                 else:
                     # 如果解析失败，创建基本信息
-                    characters.append({
-                        "name": name,
-                        "role": "supporting",
-                        "first_appearance": False,
-                        "status_changes": [],
-                        "relationships": [],
-                        "appearance_traits": [],
-                        "personality_traits": []
-                    })
+                    characters.append(self._basic_character(name))
                 
                 time.sleep(0.3)  # 避免请求过快
             
@@ -288,9 +418,49 @@ class ChapterAnalyzerV2:
             print(f"        ⚠️  角色提取异常: {str(e)[:100]}")
             raise
     
+    @staticmethod
+    def _basic_character(name: str) -> Dict:
+        """角色详情解析失败时使用的基本信息"""
+        return {
+            "name": name,
+            "role": "supporting",
+            "first_appearance": False,
+            "status_changes": [],
+            "relationships": [],
+            "appearance_traits": [],
+            "personality_traits": []
+        }
+    
+    def _list_character_names(self, content: str) -> Optional[List]:
+        """调用LLM列出章节中的角色名单（角色提取步骤1）"""
+        step1_prompt = self.registry.to_prompt(content, kinds=('characters',)) + f"""阅读以下章节内容，列出本章出现的所有角色名字。
+
+章节内容：
+{content}
+
+要求：
+1. 只输出角色名字列表，用JSON数组格式
+2. 不要包含任何解释或额外信息
+3. 格式：["角色1", "角色2", "角色3"]
+
+角色名单："""
+        
+        response = self._invoke('characters', step1_prompt)
+        response_text = response.content if hasattr(response, 'content') else str(response)
+        character_names = JSONParser.parse(response_text)
+        
+        if not character_names or not isinstance(character_names, list):
+            return None
+        return character_names
+    
     def _extract_locations(self, content: str, chapter_number: int) -> Optional[List]:
         """提取地点信息"""
-        prompt = f"""分析以下章节内容，只提取地点信息。
+        if self.compact_output:
+            result = self._invoke_compact('locations', "分析以下章节内容，只提取地点信息。", content,
+                                          prefix=self.registry.to_prompt(content, kinds=('locations',)))
+            return self.candidates.filter_entities(result, content, '地点', self.registry.surface_forms)
+        
+        prompt = self.registry.to_prompt(content, kinds=('locations',)) + f"""分析以下章节内容，只提取地点信息。
 
 章节内容：
 {content}
@@ -308,7 +478,7 @@ class ChapterAnalyzerV2:
 只输出JSON数组，不要其他文字。"""
         
         try:
-            response = self.llm.invoke(prompt)
+            response = self._invoke('locations', prompt)
             response_text = response.content if hasattr(response, 'content') else str(response)
             result = JSONParser.parse(response_text)
             
@@ -317,7 +487,8 @@ class ChapterAnalyzerV2:
                 print(f"        ⚠️  JSON解析失败，尝试修复...", end='', flush=True)
                 result = self._fix_json_with_llm(response_text, 'locations')
             
-            return result
+            # 剔除原文中不存在的地点
+            return self.candidates.filter_entities(result, content, '地点', self.registry.surface_forms)
         except Exception as e:
             print(f"        ⚠️  LLM调用异常: {str(e)[:100]}")
             raise
@@ -343,7 +514,7 @@ class ChapterAnalyzerV2:
 
 事件列表："""
             
-            response = self.llm.invoke(step1_prompt)
+            response = self._invoke('events', step1_prompt)
             response_text = response.content if hasattr(response, 'content') else str(response)
             event_descriptions = JSONParser.parse(response_text)
             
@@ -354,6 +525,14 @@ class ChapterAnalyzerV2:
             # ===== 步骤2: 逐个分析事件详情 =====
             events = []
             for desc in event_descriptions[:5]:  # 最多分析5个事件
+                if self.compact_output:
+                    event_data = self._invoke_compact('event', f'分析该事件的详细信息："{desc}"', content)
+                    if event_data:
+                        event_data['description'] = desc  # 确保描述正确
+                    events.append(event_data if event_data else self._basic_event(desc))
+                    time.sleep(0.3)  # 避免请求过快
+                    continue
+                
                 step2_prompt = f"""分析该事件的详细信息："{desc}"
 
 章节内容：
@@ -370,7 +549,7 @@ class ChapterAnalyzerV2:
 
 只输出JSON对象："""
                 
-                event_response = self.llm.invoke(step2_prompt)
+                event_response = self._invoke('events', step2_prompt)
                 event_text = event_response.content if hasattr(event_response, 'content') else str(event_response)
                 event_data = JSONParser.parse(event_text)
                 
@@ -379,13 +558,7 @@ class ChapterAnalyzerV2:
                     events.append(event_data)
                 else:
                     # 解析失败时创建基本事件
-                    events.append({
-                        "type": "development",
-                        "description": desc,
-                        "importance": "medium",
-                        "emotional_tone": "平静",
-                        "participants": []
-                    })
+                    events.append(self._basic_event(desc))
                 
                 time.sleep(0.3)  # 避免请求过快
             
@@ -395,8 +568,22 @@ class ChapterAnalyzerV2:
             print(f"        ⚠️  事件提取异常: {str(e)[:100]}")
             raise
     
+    @staticmethod
+    def _basic_event(desc: str) -> Dict:
+        """事件详情解析失败时使用的基本事件"""
+        return {
+            "type": "development",
+            "description": desc,
+            "importance": "medium",
+            "emotional_tone": "平静",
+            "participants": []
+        }
+    
     def _extract_world_elements(self, content: str, chapter_number: int) -> Optional[List]:
         """提取世界观元素"""
+        if self.compact_output:
+            return self._invoke_compact('world_elements', "分析以下章节内容，只提取世界观相关元素。", content)
+        
         prompt = f"""分析以下章节内容，只提取世界观相关元素。
 
 章节内容：
@@ -414,7 +601,7 @@ class ChapterAnalyzerV2:
 只输出JSON数组，不要其他文字。"""
         
         try:
-            response = self.llm.invoke(prompt)
+            response = self._invoke('world_elements', prompt)
             response_text = response.content if hasattr(response, 'content') else str(response)
             result = JSONParser.parse(response_text)
             
@@ -430,6 +617,9 @@ class ChapterAnalyzerV2:
     
     def _extract_writing_style(self, content: str, chapter_number: int) -> Optional[Dict]:
         """提取写作风格"""
+        if self.compact_output:
+            return self._invoke_compact('writing_style_notes', "分析以下章节内容，只提取写作风格信息。", content)
+        
         prompt = f"""分析以下章节内容，只提取写作风格信息。
 
 章节内容：
@@ -446,7 +636,7 @@ class ChapterAnalyzerV2:
 只输出JSON对象，不要其他文字。"""
         
         try:
-            response = self.llm.invoke(prompt)
+            response = self._invoke('writing_style_notes', prompt)
             response_text = response.content if hasattr(response, 'content') else str(response)
             result = JSONParser.parse(response_text)
             
@@ -460,6 +650,30 @@ class ChapterAnalyzerV2:
             print(f"        ⚠️  LLM调用异常: {str(e)[:100]}")
             raise
     
+    def _invoke_compact(self, task: str, intro: str, content: str, prefix: str = '') -> Optional[any]:
+        """
+        以紧凑行格式调用LLM并在本地严格解析
+        
+        Args:
+            task: CompactFormat 任务名
+            intro: 任务说明
+            content: 章节内容
+            prefix: 提示词前缀（如已知实体列表）
+            
+        Returns:
+            与JSON模式相同结构的结果，解析失败返回None（交给重试/升级模型，不调用JSON修复）
+        """
+        try:
+            response = self._invoke(task, prefix + CompactFormat.build_prompt(task, intro, content))
+            response_text = response.content if hasattr(response, 'content') else str(response)
+            return CompactFormat.decode(task, response_text)
+        except CompactFormatError as e:
+            print(f"        ⚠️  紧凑格式解析失败: {str(e)[:100]}", end='', flush=True)
+            return None
+        except Exception as e:
+            print(f"        ⚠️  LLM调用异常: {str(e)[:100]}")
+            raise
+    
     def _fix_json_with_llm(self, broken_json: str, data_type: str) -> Optional[any]:
         """
         让LLM修复错误的JSON格式
@@ -500,7 +714,7 @@ class ChapterAnalyzerV2:
 修复后的JSON："""
         
         try:
-            response = self.llm.invoke(fix_prompt)
+            response = self._invoke('json_fix', fix_prompt)
             response_text = response.content if hasattr(response, 'content') else str(response)
             
             # 再次尝试解析
@@ -518,6 +732,9 @@ class ChapterAnalyzerV2:
     
     def _extract_chapter_summary(self, content: str, chapter_number: int) -> Optional[Dict]:
         """提取章节摘要"""
+        if self.compact_output:
+            return self._invoke_compact('chapter_summary', "分析以下章节内容，生成章节摘要。", content)
+        
         prompt = f"""分析以下章节内容，生成章节摘要。
 
 章节内容：
@@ -534,7 +751,7 @@ class ChapterAnalyzerV2:
 只输出JSON对象，不要其他文字。"""
         
         try:
-            response = self.llm.invoke(prompt)
+            response = self._invoke('chapter_summary', prompt)
             response_text = response.content if hasattr(response, 'content') else str(response)
             result = JSONParser.parse(response_text)
             
@@ -582,6 +799,158 @@ class ChapterAnalyzerV2:
         
         return safe_name
     
+    def _is_analyzed(self, chapter: Dict) -> bool:
+        """章节是否已有完整结果"""
+        safe_title = self._sanitize_filename(chapter.get('title', f"chapter_{chapter['number']:03d}"))
+        return os.path.exists(os.path.join(self.output_dir, f"{safe_title}.json"))
+    
+    def invalidate(self, chapter: Dict):
+        """删除章节已有的结果和任务临时文件（原文变化后重新分析）"""
+        safe_title = self._sanitize_filename(chapter.get('title', f"chapter_{chapter['number']:03d}"))
+        output_file = os.path.join(self.output_dir, f"{safe_title}.json")
+        if os.path.exists(output_file):
+            os.remove(output_file)
+        self._cleanup_temp_files(os.path.join(self.temp_dir, safe_title))
+    
+    def _compress_chapter(self, chapter: Dict, max_length: int) -> Dict:
+        """
+        按各任务的Token预算预压缩章节（相同预算只压缩一次）
+        
+        Args:
+            chapter: 章节数据
+            max_length: 当前内容窗口（推迟重试时预算不超过该值）
+            
+        Returns:
+            {任务名: (压缩文本, 压缩统计)}，键 None 为默认预算
+        """
+        raw = chapter['content']
+        names = self.candidates.salient_names(raw, self.registry.known_in(raw))
+        deferred = getattr(self._local, 'deferred', False)
+        
+        by_target = {}
+        compressed = {}
+        for task_name in [None] + self.TASKS:
+            target = self.compressor.target_for(task_name)
+            if deferred:
+                target = min(target, max_length)
+            if target not in by_target:
+                by_target[target] = self.compressor.compress(raw, names, target)
+            compressed[task_name] = by_target[target]
+        
+        stats = compressed[None][1]
+        if stats['ratio'] < 1:
+            print(f"    🗜️  预压缩: {stats['original_tokens']} → {stats['compressed_tokens']} Token "
+                  f"(保留 {stats['kept_sentences']}/{stats['total_sentences']} 句)")
+        return compressed
+    
+    def _single_call(self, chapter: Dict, content: str) -> int:
+        """
+        整章单次调用（V1 的 CHAPTER_ANALYSIS），合格的任务写入临时文件
+        
+        只调用一次，不重试：解析失败或缺失的任务交给后面的逐任务提取，
+        因此最坏情况只比逐任务提取多一次调用。
+        
+        Args:
+            chapter: 章节数据
+            content: 截断后的章节内容
+            
+        Returns:
+            写入缓存的任务数
+        """
+        chapter_number = chapter['number']
+        # 风格由本地文体统计代替时不要求模型输出 S 行
+        compact_task = 'chapter' if self.llm_style_task else 'chapter_no_style'
+        if self.compact_output:
+            prompt = self.registry.to_prompt(content) + CompactFormat.build_prompt(
+                compact_task, "分析以下小说章节，提取关键信息。", content)
+        else:
+            prompt = self.registry.to_prompt(content) + PromptTemplates.CHAPTER_ANALYSIS.format(
+                chapter_text=content,
+                chapter_number=chapter_number
+            )
+        
+        print(f"    → 整章单次调用...", end='', flush=True)
+        if self.router is not None:
+            self._local.llm = self.router.route('chapter.single')
+        try:
+            response = self._invoke('single', prompt)
+            response_text = response.content if hasattr(response, 'content') else str(response)
+        except ChapterBudgetExceeded:
+            raise
+        except Exception as e:
+            print(f" ✗ 调用失败: {str(e)[:100]}")
+            return 0
+        finally:
+            self._local.llm = None
+        
+        if self.compact_output:
+            result = CompactFormat.parse(compact_task, response_text)
+        else:
+            result = JSONParser.parse(response_text)
+        if not isinstance(result, dict):
+            print(f" ✗ 解析失败，改为逐任务提取")
+            return 0
+        
+        # 剔除原文中不存在的角色和地点（LLM臆造的名字）
+        for task_name, label in (('characters', '角色'), ('locations', '地点')):
+            if isinstance(result.get(task_name), list):
+                result[task_name] = self.candidates.filter_entities(
+                    result[task_name], content, label, self.registry.surface_forms)
+        
+        stored = self._store_fragments(chapter, result)
+        print(f" ✓ {len(stored)}/{len(self.TASKS)} 个任务合格")
+        return len(stored)
+    
+    def _valid_fragment(self, task_name: str, value) -> bool:
+        """单个任务结果是否合格（类型、条目结构；角色和事件不能为空）"""
+        if not isinstance(value, self.TASK_TYPES[task_name]):
+            return False
+        if task_name == 'chapter_summary':
+            return isinstance(value.get('main_content'), str) and bool(value['main_content'].strip())
+        if task_name == 'writing_style_notes':
+            return True
+        
+        key = {'characters': 'name', 'locations': 'name', 'events': 'description',
+               'world_elements': 'element'}[task_name]
+        if task_name in ('characters', 'events') and not value:
+            return False
+        return all(isinstance(item, dict) and isinstance(item.get(key), str) and item[key] for item in value)
+    
+    def _store_fragments(self, chapter: Dict, result: Dict) -> List[str]:
+        """
+        把整章结果（打包分析拆分出的单章结果或整章单次调用结果）中合格的任务写入临时文件
+        
+        之后 analyze_chapter 从缓存加载这些任务，只对缺失或不合格的任务单独调用LLM。
+        
+        Args:
+            chapter: 章节数据
+            result: 该章节的分析结果
+            
+        Returns:
+            已写入的任务名列表
+        """
+        safe_title = self._sanitize_filename(chapter.get('title', f"chapter_{chapter['number']:03d}"))
+        chapter_temp_dir = os.path.join(self.temp_dir, safe_title)
+        os.makedirs(chapter_temp_dir, exist_ok=True)
+        
+        self.registry.normalize(result)
+        if not self.llm_style_task:
+            result['writing_style_notes'] = Stylometrics.to_style_notes(Stylometrics.compute(chapter['content']))
+        
+        stored = []
+        for task_name in self.TASKS:
+            value = result.get(task_name)
+            if not self._valid_fragment(task_name, value):
+                continue
+            with open(os.path.join(chapter_temp_dir, f"{task_name}.json"), 'w', encoding='utf-8') as f:
+                json.dump(value, f, ensure_ascii=False, indent=2)
+            stored.append(task_name)
+        return stored
+    
+    def _store_packed(self, chapter: Dict, result: Dict) -> bool:
+        """打包分析拆分出的单章结果写入临时文件（返回是否所有任务都已写入）"""
+        return len(self._store_fragments(chapter, result)) == len(self.TASKS)
+    
     def batch_analyze(self, chapters: list) -> list:
         """
         批量分析章节
@@ -599,19 +968,111 @@ class ChapterAnalyzerV2:
         print(f"第一层：单章分析 (V2 - 分段输出版本)")
         print(f"━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━")
         
-        for idx, chapter in enumerate(chapters, 1):
-            # 检查时间（每个章节前检查）
-            self.time_checker.check_and_wait()
-            
-            print(f"📖 分析章节 {idx}/{total}: {chapter.get('title', chapter['filename'])}")
-            
-            result = self.analyze_chapter(chapter)
-            if result:
-                results.append(result)
-                print(f"  ✓ 成功")
-            else:
-                print(f"  ✗ 失败")
+        # 连续短章节先打包分析（一次调用完成多个章节的全部任务），
+        # 结果写入各任务的临时文件，下面的逐章流程从缓存加载，只补提缺失的任务
+        if self.packer.enabled:
+            packed_llm = self.router.route('chapter.packed') if self.router else self._llm
+            self.packer.run(
+                chapters, packed_llm,
+                is_done=self._is_analyzed,
+                store=self._store_packed,
+                max_workers=self.max_concurrent,
+                before_call=self.time_checker.check_and_wait,
+                hint=self.registry.to_prompt
+            )
+        
+        if self.max_concurrent > 1:
+            print(f"⚡ 并发分析: {self.max_concurrent} 个章节同时进行")
+            # 按窗口并发：窗口内的章节读取同一份实体词典，窗口结束后按章节顺序登记，
+            # 已知实体提示词和别名归一化不受线程完成顺序影响，重复运行结果一致
+            with ThreadPoolExecutor(max_workers=self.max_concurrent) as executor:
+                for start in range(0, total, self.max_concurrent):
+                    window = list(enumerate(chapters[start:start + self.max_concurrent], start + 1))
+                    futures = [
+                        executor.submit(self._analyze_one, idx, total, chapter)
+                        for idx, chapter in window
+                    ]
+                    for (_, chapter), future in zip(window, futures):
+                        result = future.result()
+                        self._observe(result, chapter)
+                        if result:
+                            results.append(result)
+        else:
+            for idx, chapter in enumerate(chapters, 1):
+                result = self._analyze_one(idx, total, chapter)
+                self._observe(result, chapter)
+                if result:
+                    results.append(result)
+        
+        # 重试超出预算而被推迟的章节
+        retried = self._retry_deferred(total)
+        if retried:
+            results = sorted(results + retried, key=lambda r: r.get('chapter_number', 0))
         
         print(f"\n💾 已保存单章结果: {len(results)}/{total} 个JSON文件")
         print(f"📁 临时文件目录: {self.temp_dir}")
         return results
+    
+    def _analyze_one(self, idx: int, total: int, chapter: Dict) -> Optional[Dict]:
+        """分析单个章节并打印进度（批量分析的工作单元）"""
+        # 检查时间（每个章节前检查）
+        self.time_checker.check_and_wait()
+        
+        print(f"📖 分析章节 {idx}/{total}: {chapter.get('title', chapter['filename'])}")
+        
+        self._local.budget = self.deferred.new_budget()
+        try:
+            result = self.analyze_chapter(chapter)
+        except ChapterBudgetExceeded as e:
+            self.deferred.park(idx, chapter, e)
+            return None
+        finally:
+            self._local.budget = None
+        
+        if result:
+            print(f"  ✓ 成功")
+        else:
+            print(f"  ✗ 失败")
+        
+        return result
+    
+    def _observe(self, result: Optional[Dict], chapter: Dict):
+        """登记单章结果中的实体（批量分析按章节顺序调用）"""
+        # 记录已确认的实体，供后续章节的本地候选和已知实体词典使用
+        self.candidates.learn(result)
+        self.registry.observe(result, chapter['number'])
+    
+    def _retry_deferred(self, total: int) -> List[Dict]:
+        """
+        重试被推迟的章节（不限预算，使用更短的内容窗口和备用模型）
+        
+        Args:
+            total: 章节总数
+            
+        Returns:
+            重试成功的结果列表
+        """
+        items = self.deferred.drain()
+        if not items:
+            return []
+        
+        print(f"\n🔁 重试推迟的章节: {len(items)} 个（内容窗口 {self.deferred.deferred_max_length} 字）")
+        self._local.deferred = True
+        self._local.route_prefix = self.deferred.deferred_route if self.router else None
+        
+        results = []
+        try:
+            for idx, chapter in items:
+                print(f"📖 重试章节 {idx}/{total}: {chapter.get('title', chapter['filename'])}")
+                result = self.analyze_chapter(chapter)
+                if result:
+                    self._observe(result, chapter)
+                    results.append(result)
+                    print(f"  ✓ 成功")
+                else:
+                    print(f"  ✗ 失败")
+        finally:
+            self._local.deferred = False
+            self._local.route_prefix = None
+        
+        return results
@@ -0,0 +1,225 @@
+"""
+短章节打包分析 - 多个连续短章节共用一次LLM调用
+
+网络小说常见 1500-2500 字的短章节，逐章分析时每次调用都要重复发送完整的指令和
+JSON 结构说明。打包模式把连续的短章节按 Token 预算装入同一个提示词，要求 LLM
+返回按章节号区分的 JSON 数组，再拆分回各章节原有的结果文件。打包结果中缺失或
+不合格的章节交回单章分析处理。
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Any, Callable, Optional
+from utils.json_parser import JSONParser
+from utils.model_router import ModelRouter
+from utils.prompt_budget import PromptBudget
+from utils.prompt_templates import PromptTemplates
+
+
+class ChapterPacker:
+    """短章节打包分析器"""
+
+    def __init__(self, config: dict):
+        """
+        初始化打包分析器
+
+        Args:
+            config: 配置字典（读取 packing 段）
+        """
+        packing = config.get('packing', {}) or {}
+        self.enabled = bool(packing.get('enabled', False))
+        self.short_chapter_max_length = int(packing.get('short_chapter_max_length', 2500))
+        self.max_chapters = int(packing.get('max_chapters', 4))
+        self.token_budget = int(packing.get('token_budget', 8000))
+        self.retry_times = int(packing.get('retry_times', 2))
+        # 组装好的打包提示词按模型上下文检查（分组时的 token_budget 只估算了章节正文）
+        self.prompt_budget = PromptBudget(config)
+
+    # ========== 分组 ==========
+
+    def plan(self, chapters: List[Dict], is_done: Callable[[Dict], bool]) -> List[List[Dict]]:
+        """
+        把连续的待分析短章节分组（每组不超过章节数上限和Token预算）
+
+        Args:
+            chapters: 章节列表（按章节顺序）
+            is_done: 判断章节是否已有分析结果的函数
+
+        Returns:
+            分组列表（只保留至少两个章节的组）
+        """
+        packs = []
+        current = []
+        current_tokens = 0
+
+        for chapter in chapters:
+            content = chapter.get('content', '')
+            if is_done(chapter) or len(content) > self.short_chapter_max_length:
+                # 长章节或已分析章节打断连续性
+                packs.append(current)
+                current, current_tokens = [], 0
+                continue
+
+            tokens = ModelRouter.estimate_tokens(content)
+            if current and (len(current) >= self.max_chapters
+                            or current_tokens + tokens > self.token_budget):
+                packs.append(current)
+                current, current_tokens = [], 0
+            current.append(chapter)
+            current_tokens += tokens
+
+        packs.append(current)
+        return [pack for pack in packs if len(pack) >= 2]
+
+    # ========== 分析 ==========
+
+    def run(self, chapters: List[Dict], llm: Any, is_done: Callable[[Dict], bool],
+            store: Callable[[Dict, Dict], bool], max_workers: int = 1,
+            before_call: Optional[Callable[[], None]] = None,
+            hint: Optional[Callable[[str], str]] = None) -> Dict[str, int]:
+        """
+        打包分析所有可打包的章节，并把结果写回各章节的结果文件
+
+        Args:
+            chapters: 章节列表
+            llm: 打包调用使用的LLM
+            is_done: 判断章节是否已有分析结果的函数
+            store: 保存单章结果的函数，结果合格时返回True
+            max_workers: 同时进行的打包调用数
+            before_call: 每次调用前执行的函数（如运行时间检查）
+            hint: 根据本组章节内容生成提示词前缀的函数（如已知实体列表）
+
+        Returns:
+            统计 {'packs', 'packed_chapters', 'stored', 'fallback'}
+        """
+        packs = self.plan(chapters, is_done)
+        stats = {'packs': len(packs), 'packed_chapters': sum(len(p) for p in packs),
+                 'stored': 0, 'fallback': 0}
+        if not packs:
+            return stats
+
+        print(f"📦 打包分析: {stats['packed_chapters']} 个短章节分为 {len(packs)} 组")
+
+        def work(pack: List[Dict]) -> int:
+            if before_call:
+                before_call()
+            results = self.analyze_pack(pack, llm, hint)
+            stored = 0
+            for chapter in pack:
+                result = results.get(chapter['number'])
+                if result is not None and store(chapter, result):
+                    stored += 1
+            missing = len(pack) - stored
+            numbers = f"{pack[0]['number']}-{pack[-1]['number']}"
+            if missing:
+                print(f"  📦 章节 {numbers}: {stored}/{len(pack)} 章成功，其余回退单章分析")
+            else:
+                print(f"  📦 章节 {numbers}: {stored}/{len(pack)} 章成功")
+            return stored
+
+        if max_workers > 1:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                stored_counts = list(executor.map(work, packs))
+        else:
+            stored_counts = [work(pack) for pack in packs]
+
+        stats['stored'] = sum(stored_counts)
+        stats['fallback'] = stats['packed_chapters'] - stats['stored']
+        print(f"📦 打包完成: {len(packs)} 次调用覆盖 {stats['stored']} 章"
+              f"（节省约 {max(0, stats['stored'] - len(packs))} 次单章调用），"
+              f"{stats['fallback']} 章回退单章分析")
+        return stats
+
+    def analyze_pack(self, pack: List[Dict], llm: Any,
+                     hint: Optional[Callable[[str], str]] = None) -> Dict[int, Dict]:
+        """
+        对一组章节发起一次打包调用
+
+        Args:
+            pack: 章节组
+            llm: LLM实例
+            hint: 提示词前缀函数
+
+        Returns:
+            {章节号: 该章节的分析结果}（只包含本组中的章节）
+        """
+        prompt = self.build_prompt(pack)
+        if hint:
+            prompt = hint('\n'.join(chapter['content'] for chapter in pack)) + prompt
+        numbers = {chapter['number'] for chapter in pack}
+
+        if hasattr(llm, 'reset'):
+            llm.reset()
+        self.prompt_budget.check(f"chapter.packed {min(numbers)}-{max(numbers)}", prompt, llm=llm, warn_only=True)
+
+        for attempt in range(self.retry_times):
+            try:
+                response = llm.invoke(prompt)
+                response_text = response.content if hasattr(response, 'content') else str(response)
+            except Exception as e:
+                print(f"  ❌ 打包调用出错: {e}")
+                time.sleep(2)
+                continue
+
+            results = self.split_response(response_text, numbers)
+            if results:
+                return results
+
+            # 一章都没有解析出来时才重试（部分缺失的章节交给单章分析）
+            if hasattr(llm, 'escalate'):
+                llm.escalate()
+            print(f"  ⚠️  打包结果解析失败，重试 {attempt + 1}/{self.retry_times}")
+
+        return {}
+
+    @staticmethod
+    def build_prompt(pack: List[Dict]) -> str:
+        """构建打包分析提示词"""
+        blocks = []
+        for chapter in pack:
+            title = chapter.get('title', '')
+            blocks.append(f"【第{chapter['number']}章】{title}\n{chapter['content']}")
+        return PromptTemplates.PACKED_CHAPTER_ANALYSIS.format(
+            chapter_count=len(pack),
+            chapters_text='\n\n'.join(blocks),
+            chapter_numbers=', '.join(str(chapter['number']) for chapter in pack)
+        )
+
+    @staticmethod
+    def split_response(response_text: str, numbers: set) -> Dict[int, Dict]:
+        """
+        把打包响应拆分为各章节的结果
+
+        Args:
+            response_text: LLM响应文本
+            numbers: 本组的章节号
+
+        Returns:
+            {章节号: 分析结果}
+        """
+        # JSONParser 优先截取 {...}，数组响应需要先按 [...] 截取
+        candidates = []
+        start, end = response_text.find('['), response_text.rfind(']')
+        if start != -1 and end > start:
+            candidates.append(response_text[start:end + 1])
+        candidates.append(response_text)
+
+        for text in candidates:
+            data = JSONParser.parse(text)
+            if isinstance(data, dict):
+                data = data.get('chapters', [data])
+            if not isinstance(data, list):
+                continue
+
+            results = {}
+            for item in data:
+                if not isinstance(item, dict):
+                    continue
+                try:
+                    number = int(item.get('chapter_number'))
+                except (TypeError, ValueError):
+                    continue
+                if number in numbers and number not in results:
+                    results[number] = item
+            if results:
+                return results
+        return {}
@@ -0,0 +1,283 @@
+"""
+分层抽样 - 只分析部分章节，快速生成近似模板
+
+超长小说（几千章）完整分析需要数周。抽样模式按以下层次选出章节子集，走正常流程生成模板：
+1. 开篇：前 opening_chapters 章全部选入（世界观、主角、文风都在开篇集中交代）
+2. 卷边界：检测到的每个分卷切换处前后各选 boundary_window 章（卷末高潮与新卷开端）
+3. 中段：剩余名额在其余章节中均匀分布（含最后一章）
+
+模板中附带覆盖率和置信度估计；置信度用 Good-Turing 估计：已抽样章节中只出现过一次的
+角色/地点/世界观条目占全部出现次数的比例，近似于“再读一章会遇到新条目”的概率。
+抽样状态保存在 intermediate/sample_state.json，之后的运行可以用 --sample-fill 继续补充
+未抽样的章节（每次优先补最大的空档），已分析的章节结果直接复用。
+"""
+import os
+import re
+import math
+import shutil
+import hashlib
+from collections import Counter
+from typing import Dict, List, Any, Optional
+from utils.file_utils import FileUtils
+from utils.source_catalog import SourceCatalog
+
+
+class ChapterSampler:
+    """章节分层抽样"""
+
+    STATE_FILENAME = 'sample_state.json'
+    STAGE_DIRNAME = 'sample'
+    VERSION = 1
+
+    # 分卷标记（标题或文件名中的“第X卷/部/集”“卷X”）
+    VOLUME_PATTERN = re.compile(
+        r'第\s*([0-9０-９零〇一二两三四五六七八九十百千]+)\s*[卷部集]|卷\s*([0-9０-９零〇一二两三四五六七八九十百千]+)')
+
+    def __init__(self, config: dict, output_dir: str):
+        """
+        初始化抽样器
+
+        Args:
+            config: 配置字典（读取 sampling 段）
+            output_dir: 中间结果目录（抽样状态和抽样结果的分段/整体分析保存在其下）
+        """
+        settings = config.get('sampling', {}) or {}
+        self.ratio = float(settings.get('ratio', 0.1))
+        self.min_chapters = int(settings.get('min_chapters', 30))
+        self.max_chapters = int(settings.get('max_chapters', 300))
+        self.opening_chapters = int(settings.get('opening_chapters', 20))
+        self.boundary_window = int(settings.get('boundary_window', 2))
+
+        self.output_dir = output_dir
+        self.state_file = os.path.join(output_dir, self.STATE_FILENAME)
+        # 抽样结果的分段汇总和整体分析单独保存，不影响完整分析；单章结果与完整分析共用
+        self.stage_dir = os.path.join(output_dir, self.STAGE_DIRNAME)
+        self.coverage: Dict[str, Any] = {}
+
+    # ========== 抽样 ==========
+
+    def select(self, chapters: List[Dict], fill: int = 0) -> List[Dict]:
+        """
+        选出抽样章节（已有抽样状态时沿用，并按 fill 补充）
+
+        Args:
+            chapters: 预处理后的全部章节（按章节号排序）
+            fill: 本次补充的章节数
+
+        Returns:
+            抽样章节列表（按章节号排序）
+        """
+        total = len(chapters)
+        boundaries = self.detect_volume_boundaries(chapters)
+        state = self._load_state()
+        numbers = {ch['number'] for ch in chapters}
+
+        if state and set(state['sampled']) <= numbers:
+            picked = {i for i, ch in enumerate(chapters) if ch['number'] in set(state['sampled'])}
+            rounds = state.get('rounds', 1)
+            print(f"🎯 沿用上次的抽样: {len(picked)}/{total} 章")
+        else:
+            picked = self._stratified(total, boundaries)
+            rounds = 1
+            print(f"🎯 分层抽样: {len(picked)}/{total} 章（开篇 {min(self.opening_chapters, total)} 章，"
+                  f"{len(boundaries)} 个卷边界）")
+
+        if fill > 0:
+            added = self._fill_gaps(total, picked, fill)
+            picked |= added
+            rounds += 1
+            print(f"➕ 补充抽样: {len(added)} 章（共 {len(picked)}/{total} 章）")
+
+        sampled = [chapters[i] for i in sorted(picked)]
+        self.coverage = self._coverage(chapters, sorted(picked), boundaries)
+        self._prepare_stage(sampled)
+        self._save_state(total, sampled, rounds)
+        return sampled
+
+    def target_size(self, total: int) -> int:
+        """抽样章节数（按比例，限制在 [min_chapters, max_chapters] 内）"""
+        return min(total, max(self.min_chapters, min(self.max_chapters, int(math.ceil(total * self.ratio)))))
+
+    def _stratified(self, total: int, boundaries: List[int]) -> set:
+        """
+        分层选出章节下标
+
+        Args:
+            total: 章节总数
+            boundaries: 分卷起始章节的下标
+
+        Returns:
+            章节下标集合
+        """
+        target = self.target_size(total)
+        picked = set(range(min(self.opening_chapters, target)))
+
+        # 卷边界：上一卷最后 boundary_window 章 + 新卷开头 boundary_window 章；名额不足时均匀取部分边界
+        boundary_budget = max(0, target - len(picked)) // 2
+        per_boundary = 2 * self.boundary_window
+        if boundaries and boundary_budget >= per_boundary:
+            keep = min(len(boundaries), boundary_budget // per_boundary)
+            step = len(boundaries) / keep
+            for k in range(keep):
+                start = boundaries[int(k * step)]
+                picked.update(i for i in range(start - self.boundary_window, start + self.boundary_window)
+                              if 0 <= i < total)
+
+        # 中段：剩余名额均匀分布在未选中的章节上（含最后一章）
+        rest = [i for i in range(total) if i not in picked]
+        remaining = target - len(picked)
+        if rest and remaining > 0:
+            if remaining >= len(rest):
+                picked.update(rest)
+            elif remaining == 1:
+                picked.add(rest[-1])
+            else:
+                step = (len(rest) - 1) / (remaining - 1)
+                picked.update(rest[int(round(k * step))] for k in range(remaining))
+        return picked
+
+    @staticmethod
+    def _fill_gaps(total: int, picked: set, count: int) -> set:
+        """
+        补充抽样：每次取当前最大空档的中点
+
+        Args:
+            total: 章节总数
+            picked: 已选章节下标
+            count: 补充数量
+
+        Returns:
+            新增的章节下标
+        """
+        chosen = sorted(picked)
+        added = set()
+        for _ in range(min(count, total - len(chosen))):
+            # 首尾之外的空档也算（哨兵 -1 与 total）
+            edges = [-1] + chosen + [total]
+            gap, left = max((edges[i + 1] - edges[i], edges[i]) for i in range(len(edges) - 1))
+            if gap <= 1:
+                break
+            index = left + gap // 2
+            chosen = sorted(chosen + [index])
+            added.add(index)
+        return added
+
+    @classmethod
+    def detect_volume_boundaries(cls, chapters: List[Dict]) -> List[int]:
+        """
+        检测分卷边界（分卷标记变化处，或标题中的章节号重新从1开始处）
+
+        Args:
+            chapters: 全部章节
+
+        Returns:
+            各卷起始章节的下标（不含第一卷）
+        """
+        boundaries = []
+        previous_volume, previous_number = None, None
+        for i, chapter in enumerate(chapters):
+            text = f"{chapter.get('title', '')} {chapter.get('filename', '')}"
+            match = cls.VOLUME_PATTERN.search(text)
+            volume = (match.group(1) or match.group(2)) if match else None
+            number = SourceCatalog._parse_chapter_number(chapter.get('title', ''))
+
+            if i and volume and previous_volume and volume != previous_volume:
+                boundaries.append(i)
+            elif i and number == 1 and previous_number and previous_number > 1:
+                boundaries.append(i)
+            previous_volume = volume or previous_volume
+            previous_number = number
+        return boundaries
+
+    # ========== 覆盖率与置信度 ==========
+
+    def _coverage(self, chapters: List[Dict], picked: List[int], boundaries: List[int]) -> Dict[str, Any]:
+        """抽样覆盖率（章节数、字数、最大空档、各层章节数）"""
+        total_words = sum(ch.get('word_count', 0) for ch in chapters) or 1
+        sampled_words = sum(chapters[i].get('word_count', 0) for i in picked)
+        edges = [-1] + picked + [len(chapters)]
+        opening = min(self.opening_chapters, len(chapters))
+        near_boundary = {i for b in boundaries
+                         for i in range(b - self.boundary_window, b + self.boundary_window)}
+        return {
+            'sampled_chapters': len(picked),
+            'total_chapters': len(chapters),
+            'chapter_ratio': round(len(picked) / max(len(chapters), 1), 4),
+            'word_ratio': round(sampled_words / total_words, 4),
+            'max_gap': max(edges[i + 1] - edges[i] - 1 for i in range(len(edges) - 1)),
+            'volume_boundaries': len(boundaries),
+            'strata': {
+                'opening': sum(1 for i in picked if i < opening),
+                'volume_boundary': sum(1 for i in picked if i >= opening and i in near_boundary),
+                'middle': sum(1 for i in picked if i >= opening and i not in near_boundary)
+            }
+        }
+
+    def annotate(self, chapter_results: List[Dict]) -> Dict[str, Any]:
+        """
+        由抽样章节的分析结果估计模板置信度
+
+        Args:
+            chapter_results: 抽样章节的单章分析结果
+
+        Returns:
+            模板标注 {'mode', 'coverage', 'confidence'}
+        """
+        counters = {'characters': Counter(), 'locations': Counter(), 'world_elements': Counter()}
+        for result in chapter_results:
+            for field, counter in counters.items():
+                items = result.get(field) if isinstance(result.get(field), list) else []
+                key = 'element' if field == 'world_elements' else 'name'
+                counter.update({item.get(key) for item in items if isinstance(item, dict) and item.get(key)})
+
+        confidence = {}
+        for field, counter in counters.items():
+            occurrences = sum(counter.values())
+            singletons = sum(1 for count in counter.values() if count == 1)
+            # Good-Turing：下一章出现未见条目的概率约为 只出现一次的条目数 / 总出现次数
+            confidence[field] = round(1 - singletons / occurrences, 3) if occurrences else 0.0
+
+        overall = min(confidence.values()) if confidence else 0.0
+        level = 'high' if overall >= 0.8 else 'medium' if overall >= 0.6 else 'low'
+        annotation = {
+            'mode': 'stratified_sample',
+            'coverage': dict(self.coverage, analyzed_chapters=len(chapter_results)),
+            'confidence': dict(confidence, overall=overall, level=level)
+        }
+        print(f"📐 抽样覆盖率: {self.coverage.get('chapter_ratio', 0):.1%} 章节，"
+              f"{self.coverage.get('word_ratio', 0):.1%} 字数，最大空档 {self.coverage.get('max_gap', 0)} 章；"
+              f"置信度 {overall:.2f}（{level}）")
+        return annotation
+
+    # ========== 状态 ==========
+
+    def _prepare_stage(self, sampled: List[Dict]):
+        """抽样集合变化时清空抽样结果的分段汇总和整体分析（单章结果保留）"""
+        digest = self._digest(sampled)
+        state = self._load_state()
+        if state and state.get('sha1') != digest and os.path.isdir(self.stage_dir):
+            shutil.rmtree(self.stage_dir)
+            print(f"  ♻️  抽样章节有变化，重新生成抽样的分段汇总与整体分析")
+        os.makedirs(self.stage_dir, exist_ok=True)
+
+    @staticmethod
+    def _digest(sampled: List[Dict]) -> str:
+        return hashlib.sha1(','.join(str(ch['number']) for ch in sampled).encode('utf-8')).hexdigest()
+
+    def _load_state(self) -> Optional[Dict]:
+        if not os.path.exists(self.state_file):
+            return None
+        state = FileUtils.load_json(self.state_file)
+        if isinstance(state, dict) and state.get('version') == self.VERSION:
+            return state
+        return None
+
+    def _save_state(self, total: int, sampled: List[Dict], rounds: int):
+        FileUtils.save_json({
+            'version': self.VERSION,
+            'total_chapters': total,
+            'rounds': rounds,
+            'sha1': self._digest(sampled),
+            'sampled': [ch['number'] for ch in sampled],
+            'coverage': self.coverage
+        }, self.state_file)
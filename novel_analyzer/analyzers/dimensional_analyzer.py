@@ -4,14 +4,36 @@
 """
 import json
 import os
+import hashlib
+from types import MappingProxyType
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List, Any, Optional
 from collections import defaultdict
+from processors.character_graph import CharacterGraph
+from processors.aggregate_records import to_jsonable
 
 
 class DimensionalAnalyzer:
     """维度分析器 - 多维度并行分析"""
     
+    # 维度定义：结果键 -> (标题, 分析方法, 依赖的聚合数据键, 输出文件)
+    DIMENSIONS = {
+        'character_dimension': ('👥 维度1：角色分析', 'analyze_character_dimension',
+                                ('characters',), 'dimension_1_characters.json'),
+        'plot_dimension': ('📖 维度2：情节分析', 'analyze_plot_dimension',
+                           ('events', 'plot_arcs'), 'dimension_2_plot.json'),
+        'world_dimension': ('🌍 维度3：世界观分析', 'analyze_world_dimension',
+                            ('world_elements', 'locations'), 'dimension_3_world.json'),
+        'style_dimension': ('✍️  维度4：风格分析', 'analyze_style_dimension',
+                            ('writing_styles', 'plot_arcs'), 'dimension_4_style.json'),
+    }
+    
+    # 维度分析逻辑版本（输出结构或分析方法变化时递增，已缓存的维度结果随之作废）
+    DIMENSIONS_VERSION = 2
+    
+    CACHE_FILENAME = '.dimension_cache.json'
+    
     def __init__(self, llm, config: dict, aggregated_data: Dict[str, Any], output_dir: str):
         """
         初始化维度分析器
@@ -32,53 +54,136 @@ class DimensionalAnalyzer:
         self.retry_times = config.get('extraction', {}).get('retry_times', 3)
         self.timeout = config.get('extraction', {}).get('timeout', 120)
     
-    def analyze_all_dimensions(self) -> Dict[str, Any]:
+    def analyze_all_dimensions(self, concurrent: bool = False, max_workers: int = 4,
+                               use_cache: bool = True) -> Dict[str, Any]:
         """
-        并行分析所有维度
+        分析所有维度
+        
+        Args:
+            concurrent: 是否并发执行四个维度（各维度只读取聚合数据快照，互不依赖）
+            max_workers: 并发线程数
+            use_cache: 输入数据哈希与上次完成时一致的维度直接复用已有结果
         
         Returns:
             包含所有维度分析结果的字典
         """
         print("\n" + "="*60)
-        print("🎯 策略2：多维度并行分析")
+        print(f"🎯 策略2：多维度{'并发' if concurrent else '并行'}分析")
         print("="*60)
         
-        results = {}
-        
-        # 维度1: 角色线
-        print("\n👥 维度1：角色分析...")
-        results['character_dimension'] = self.analyze_character_dimension()
+        # 只读快照：维度分析期间不能替换或增删聚合数据的顶层键。
+        # 只复制了顶层（浅拷贝），各记录列表和字典仍与原数据共享，
+        # 维度分析方法只能读取，排序/筛选时须先生成新列表
+        original_data = self.data
+        self.data = MappingProxyType(dict(original_data))
         
-        # 维度2: 情节线
-        print("\n📖 维度2：情节分析...")
-        results['plot_dimension'] = self.analyze_plot_dimension()
+        cache = self._load_dimension_cache() if use_cache else {}
+        input_hashes = {key: self._hash_dimension_inputs(key) for key in self.DIMENSIONS}
         
-        # 维度3: 世界观
-        print("\n🌍 维度3：世界观分析...")
-        results['world_dimension'] = self.analyze_world_dimension()
-        
-        # 维度4: 风格线
-        print("\n✍️  维度4：风格分析...")
-        results['style_dimension'] = self.analyze_style_dimension()
-        
-        # 保存综合结果
+        results = {}
+        pending = []
+        for key, (label, _, _, filename) in self.DIMENSIONS.items():
+            cached = self._load_cached_dimension(filename) if cache.get(key) == input_hashes[key] else None
+            if cached is not None:
+                print(f"\n{label}... ⏭️  输入未变化，复用已有结果")
+                results[key] = cached
+            else:
+                pending.append(key)
+        
+        try:
+            if concurrent and len(pending) > 1:
+                with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                    futures = {key: executor.submit(self._run_dimension, key) for key in pending}
+                    for key in pending:
+                        results[key] = futures[key].result()
+                        cache[key] = input_hashes[key]
+                        self._save_dimension_cache(cache)
+            else:
+                for key in pending:
+                    results[key] = self._run_dimension(key)
+                    cache[key] = input_hashes[key]
+                    self._save_dimension_cache(cache)
+        finally:
+            self.data = original_data
+        
+        # 所有维度完成后按固定顺序组装综合结果
+        results = {key: results[key] for key in self.DIMENSIONS}
         output_file = self.output_dir / 'dimensional_analysis_complete.json'
         with open(output_file, 'w', encoding='utf-8') as f:
             json.dump(results, f, ensure_ascii=False, indent=2)
         
-        print(f"\n✨ 多维度分析完成！")
+        print(f"\n✨ 多维度分析完成！（执行 {len(pending)} 个维度，复用 {len(self.DIMENSIONS) - len(pending)} 个）")
         print(f"💾 结果已保存到: {output_file}")
         
         return results
     
+    def _run_dimension(self, key: str) -> Dict[str, Any]:
+        """执行单个维度分析"""
+        label, method_name, _, _ = self.DIMENSIONS[key]
+        print(f"\n{label}...")
+        return getattr(self, method_name)()
+    
+    def _hash_dimension_inputs(self, key: str) -> str:
+        """
+        计算维度输入的哈希
+        
+        包含该维度读取的聚合数据、维度定义与分析逻辑版本，以及影响结果的配置（生成模板所用的模型），
+        任一变化都会重新分析该维度。
+        """
+        _, method_name, input_keys, filename = self.DIMENSIONS[key]
+        llm_config = self.config.get('llm', {}) or {}
+        # 与 init_llm 一致：环境变量优先于 config.yaml
+        provider = os.getenv('LLM_PROVIDER', llm_config.get('provider', 'ollama'))
+        model_env = 'OPENAI_MODEL' if provider == 'openai' else 'OLLAMA_MODEL'
+        payload = {
+            'version': self.DIMENSIONS_VERSION,
+            'dimension': [method_name, list(input_keys), filename],
+            'settings': {
+                'provider': provider,
+                'model': os.getenv(model_env, llm_config.get('model', '')),
+                'temperature': os.getenv('LLM_TEMPERATURE', llm_config.get('temperature'))
+            },
+            'data': {k: self.data.get(k) for k in input_keys}
+        }
+        serialized = json.dumps(payload, ensure_ascii=False, sort_keys=True, default=to_jsonable)
+        return hashlib.sha1(serialized.encode('utf-8')).hexdigest()
+    
+    def _load_dimension_cache(self) -> Dict[str, str]:
+        """读取上次完成时各维度的输入哈希"""
+        cache_file = self.output_dir / self.CACHE_FILENAME
+        if not cache_file.exists():
+            return {}
+        try:
+            with open(cache_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"  ⚠️  维度缓存损坏，忽略: {e}")
+            return {}
+    
+    def _save_dimension_cache(self, cache: Dict[str, str]):
+        """保存各维度的输入哈希"""
+        with open(self.output_dir / self.CACHE_FILENAME, 'w', encoding='utf-8') as f:
+            json.dump(cache, f, ensure_ascii=False, indent=2)
+    
+    def _load_cached_dimension(self, filename: str) -> Optional[Dict[str, Any]]:
+        """读取已有的维度结果文件，不存在或损坏返回None"""
+        output_file = self.output_dir / filename
+        if not output_file.exists():
+            return None
+        try:
+            with open(output_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception:
+            return None
+    
     def analyze_character_dimension(self) -> Dict[str, Any]:
         """
         维度1：角色线分析
         
         策略：
         1. 智能筛选：只保留重要角色（出场>5次）
-        2. 关系图谱：构建角色关系网络
-        3. 成长轨迹：追踪角色发展
+        2. 关系图谱：基于全部角色的共现矩阵构建角色关系网络
+        3. 成长轨迹：追踪角色关系演变
         """
         characters = self.data.get('characters', [])
         
@@ -91,8 +196,18 @@ class DimensionalAnalyzer:
         print(f"  原始角色数: {len(characters)}")
         print(f"  重要角色数: {len(important_chars)} (出场>5次)")
         
-        # 构建角色关系网络
+        # 构建角色关系图（全部角色参与共现计算，按中心度选出核心角色）
+        graph = CharacterGraph.build(characters)
+        graph_data = graph.to_prompt_data(top_n=30)
+        print(f"  关系图: {len(graph.names)} 个角色, {len(graph_data['edges'])} 条核心关系边")
+        
+        # 按中心度排序重要角色
+        rank = {node['name']: i for i, node in enumerate(graph_data['nodes'])}
+        important_chars.sort(key=lambda c: (rank.get(c['name'], len(rank)), -c.get('total_appearances', 0)))
+        
+        # 构建角色关系网络（LLM 声明的关系 + 共现图中的关联角色）
         relationships = self._extract_relationships(important_chars)
+        co_occurrence = self._extract_co_occurrence(graph_data)
         
         # 分类角色（主角、配角、反派）
         categorized = self._categorize_characters(important_chars)
@@ -113,6 +228,8 @@ class DimensionalAnalyzer:
                 for char in important_chars[:20]  # 只保留前20个最重要角色
             ],
             'relationships': relationships,
+            'co_occurrence': co_occurrence,
+            'relationship_graph': graph_data,
             'categorization': categorized
         }
         
@@ -177,7 +294,9 @@ class DimensionalAnalyzer:
                     'chapter': event['chapter_number'],
                     'type': event['type'],
                     'description': event['description'][:100],  # 截断描述
-                    'participants': event.get('participants', [])[:5]
+                    'participants': event.get('participants', [])[:5],
+                    # 聚类合并的事件附带章节跨度
+                    **({'chapter_span': event['chapter_span']} if 'chapter_span' in event else {})
                 }
                 for event in important_events[:30]  # 只保留前30个重要事件
             ],
@@ -309,19 +428,26 @@ class DimensionalAnalyzer:
         perspectives = writing_styles.get('narrative_perspectives', {})
         intensities = writing_styles.get('emotional_intensities', {})
         focuses = writing_styles.get('description_focuses', {})
+        # 本地文体统计（句长、对话占比、人称、标点密度、重复度）
+        stylometrics = writing_styles.get('stylometrics') or {}
+        
+        dominant_perspective = max(perspectives.items(), key=lambda x: x[1])[0] if perspectives else 'unknown'
+        if stylometrics:
+            dominant_perspective = stylometrics.get('dominant_perspective', dominant_perspective)
         
         compressed_data = {
             'sampled_chapters': sampled_chapters,
             'narrative_style': {
                 'perspectives': perspectives,
-                'dominant_perspective': max(perspectives.items(), key=lambda x: x[1])[0] if perspectives else 'unknown'
+                'dominant_perspective': dominant_perspective
             },
             'emotional_pattern': {
                 'intensities': intensities,
                 'average_intensity': self._calculate_avg_intensity(intensities)
             },
             'description_focus': focuses,
-            'key_phrases_sample': writing_styles.get('key_phrases', [])[:20]
+            'key_phrases_sample': writing_styles.get('key_phrases', [])[:20],
+            'stylometrics': stylometrics
         }
         
         # 调用LLM生成写作指南
@@ -365,6 +491,16 @@ class DimensionalAnalyzer:
         
         return dict(relationships)
     
+    def _extract_co_occurrence(self, graph_data: Dict[str, Any]) -> Dict[str, List[str]]:
+        """提取共现关联（核心角色 -> 共现最强的关联角色）"""
+        co_occurrence = defaultdict(list)
+        
+        for edge in graph_data['edges']:
+            co_occurrence[edge['source']].append(edge['target'])
+            co_occurrence[edge['target']].append(edge['source'])
+        
+        return dict(co_occurrence)
+    
     def _categorize_characters(self, characters: List[Dict]) -> Dict[str, List[str]]:
         """分类角色"""
         categorized = {
@@ -399,10 +535,11 @@ class DimensionalAnalyzer:
         for i in range(0, total_chapters, segment_size):
             end_chapter = min(i + segment_size, total_chapters)
             
-            # 该段的重要事件
+            # 该段的重要事件（聚类合并的跨章事件与本段有交集即计入）
             segment_events = [
                 e for e in important_events
-                if i < e['chapter_number'] <= end_chapter
+                if (e.get('chapter_span') or [e['chapter_number']])[0] <= end_chapter
+                and (e.get('chapter_span') or [e['chapter_number']])[-1] > i
             ]
             
             if segment_events:
@@ -489,6 +626,7 @@ class DimensionalAnalyzer:
             'template_type': 'character_template',
             'main_characters': data['important_characters'][:5],
             'relationships': data['relationships'],
+            'co_occurrence': data['co_occurrence'],
             'note': '这是简化版demo，实际使用时会调用LLM生成详细模板'
         }
     
@@ -517,5 +655,6 @@ class DimensionalAnalyzer:
             'narrative_style': data['narrative_style'],
             'emotional_pattern': data['emotional_pattern'],
             'key_phrases': data['key_phrases_sample'][:10],
+            'stylometrics': data.get('stylometrics', {}),
             'note': '这是简化版demo，实际使用时会调用LLM生成详细指南'
         }
@@ -0,0 +1,208 @@
+"""
+连载跟更 - 只分析新增或内容变化的章节
+
+每次完成全流程后记录各章节内容的哈希（intermediate/follow_state.json）。下次以跟更模式
+运行时与当前原文比较：
+1. 内容变化的章节删除旧结果后重新分析；新增章节正常分析；未变化的章节直接复用已有结果
+2. 只删除并重算受影响的分段（从第一个变化章节所在的分段起，通常只有末尾分段）
+3. 整体分析把上次的结果和新增/修订的分段汇总交给LLM增量更新，不再发送全部分段；
+   有章节被删除（章节号整体变化）时回退为完整的整体分析
+4. 已生成知识库时，只有新增章节则把新章节折叠进保存的聚合状态，否则重新聚合（见 LayeredStorageGenerator.update_layers）
+"""
+import os
+import glob
+import time
+import hashlib
+from typing import Dict, List, Optional, Tuple
+from utils.file_utils import FileUtils
+
+
+class FollowTracker:
+    """连载跟更的章节状态"""
+
+    STATE_FILENAME = 'follow_state.json'
+    PREVIOUS_GLOBAL_FILENAME = 'global_analysis.prev.json'
+    VERSION = 1
+
+    def __init__(self, output_dir: str, config: dict):
+        """
+        初始化跟更状态
+
+        Args:
+            output_dir: 中间结果目录
+            config: 配置字典
+        """
+        self.output_dir = output_dir
+        self.state_file = os.path.join(output_dir, self.STATE_FILENAME)
+        self.segment_dir = os.path.join(output_dir, 'segment_summaries')
+        self.segment_size = config.get('processing', {}).get('segment_size', 20)
+
+        # {章节号(字符串): {'title': ..., 'sha1': ...}}
+        self.chapters: Dict[str, Dict[str, str]] = {}
+        self.has_state = False
+        self._load()
+
+    @staticmethod
+    def digest(chapter: Dict) -> str:
+        """章节内容哈希"""
+        return hashlib.sha1(chapter['content'].encode('utf-8')).hexdigest()
+
+    # ========== 比较 ==========
+
+    def diff(self, chapters: List[Dict]) -> Dict[str, List]:
+        """
+        与上次记录比较
+
+        Args:
+            chapters: 预处理后的章节列表
+
+        Returns:
+            {'new': [章节], 'changed': [章节], 'removed': [章节号]}
+        """
+        current = {str(ch['number']) for ch in chapters}
+        delta = {'new': [], 'changed': [], 'removed': []}
+        for chapter in chapters:
+            previous = self.chapters.get(str(chapter['number']))
+            if previous is None:
+                delta['new'].append(chapter)
+            elif previous.get('sha1') != self.digest(chapter):
+                delta['changed'].append(chapter)
+        delta['removed'] = sorted(int(num) for num in self.chapters if num not in current)
+
+        if not self.has_state:
+            print(f"📌 跟更模式: 首次记录章节状态（{len(chapters)} 章，已有结果直接复用）")
+        else:
+            print(f"📌 跟更模式: 新增 {len(delta['new'])} 章，内容变化 {len(delta['changed'])} 章，"
+                  f"删除 {len(delta['removed'])} 章")
+        return delta
+
+    @staticmethod
+    def has_changes(delta: Dict[str, List]) -> bool:
+        """是否有需要处理的变化"""
+        return any(delta.values())
+
+    # ========== 失效 ==========
+
+    def invalidate_chapters(self, delta: Dict[str, List], chapter_analyzer):
+        """
+        删除内容变化章节的旧结果（新增章节没有旧结果，按常规流程分析）
+
+        Args:
+            delta: diff 的结果
+            chapter_analyzer: 单章分析器（V1/V2，提供 invalidate）
+        """
+        for chapter in delta['changed']:
+            chapter_analyzer.invalidate(chapter)
+            print(f"  ♻️  章节 {chapter['number']} 内容已变化，重新分析")
+
+    def invalidate_segments(self, chapter_results: List[Dict], delta: Dict[str, List]) -> Optional[int]:
+        """
+        删除受影响的分段汇总（从第一个变化章节所在的分段起）
+
+        分段边界按交给 SegmentSummarizer 的列表计算（补入重复章节之后），
+        另外删除范围内包含变化章节的旧分段，边界有变化时也不会沿用过期的汇总。
+
+        Args:
+            chapter_results: 分段汇总使用的单章结果列表（apply_duplicates 之后，按章节号排序）
+            delta: diff 的结果
+
+        Returns:
+            受影响的第一个分段的起始章节号（首次记录或没有变化时为None）
+        """
+        if not self.has_state:
+            return None
+
+        dirty = {ch['number'] for ch in delta['new'] + delta['changed']}
+        numbers = [r.get('chapter_number') for r in chapter_results]
+        if delta['removed']:
+            # 删除章节后分段边界整体变化，从被删除的位置起重算
+            dirty.update(num for num in numbers if num > min(delta['removed']))
+        positions = [i for i, num in enumerate(numbers) if num in dirty]
+        if not positions:
+            return None
+
+        affected_start = numbers[positions[0] // self.segment_size * self.segment_size]
+        removed = 0
+        for path in glob.glob(os.path.join(self.segment_dir, 'segment_*.json')):
+            bounds = self._segment_bounds(os.path.basename(path)[len('segment_'):-len('.json')])
+            if bounds is None:
+                continue
+            start, end = bounds
+            if start >= affected_start or any(start <= num <= end for num in dirty):
+                os.remove(path)
+                removed += 1
+        print(f"  ♻️  从第 {affected_start} 章起的分段需要重新汇总（删除 {removed} 个旧分段）")
+        return affected_start
+
+    def take_previous_global(self, delta: Dict[str, List]) -> Optional[Dict]:
+        """
+        取出上次的整体分析用于增量更新（原文件改名保存，使整体分析重新生成）
+
+        Args:
+            delta: diff 的结果
+
+        Returns:
+            上次的整体分析；首次记录时返回None（沿用已有结果），
+            有章节被删除时返回None（需要完整的整体分析）
+        """
+        output_file = os.path.join(self.output_dir, 'global_analysis.json')
+        if not self.has_state or not os.path.exists(output_file):
+            # 首次记录时已有的整体分析仍然有效，直接复用
+            return None
+
+        previous = FileUtils.load_json(output_file)
+        os.replace(output_file, os.path.join(self.output_dir, self.PREVIOUS_GLOBAL_FILENAME))
+        return None if delta['removed'] else previous
+
+    @classmethod
+    def segments_from(cls, segment_results: List[Dict], affected_start: Optional[int]) -> List[Dict]:
+        """受影响的分段汇总（起始章节号不小于 affected_start）"""
+        if affected_start is None:
+            return []
+        return [seg for seg in segment_results
+                if (cls._segment_start(str(seg.get('segment_range', ''))) or 0) >= affected_start]
+
+    @classmethod
+    def _segment_start(cls, segment_range: str) -> Optional[int]:
+        """分段范围（如 001-020）的起始章节号"""
+        bounds = cls._segment_bounds(segment_range)
+        return bounds[0] if bounds else None
+
+    @staticmethod
+    def _segment_bounds(segment_range: str) -> Optional[Tuple[int, int]]:
+        """分段范围（如 001-020）的起止章节号"""
+        try:
+            start, end = segment_range.split('-')[:2]
+            return int(start), int(end)
+        except ValueError:
+            return None
+
+    # ========== 持久化 ==========
+
+    def save(self, chapters: List[Dict]):
+        """
+        记录本次全部章节的内容哈希（全流程完成后调用）
+
+        Args:
+            chapters: 预处理后的章节列表
+        """
+        self.chapters = {
+            str(ch['number']): {'title': ch.get('title', ''), 'sha1': self.digest(ch)}
+            for ch in chapters
+        }
+        self.has_state = True
+        FileUtils.save_json({
+            'version': self.VERSION,
+            'updated_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'chapters': self.chapters
+        }, self.state_file)
+        print(f"📌 已记录 {len(chapters)} 章的跟更状态: {self.state_file}")
+
+    def _load(self):
+        """加载上次的章节状态"""
+        if not os.path.exists(self.state_file):
+            return
+        data = FileUtils.load_json(self.state_file)
+        if isinstance(data, dict) and data.get('version') == self.VERSION:
+            self.chapters = data.get('chapters', {}) or {}
+            self.has_state = True
@@ -8,6 +8,8 @@ from typing import List, Dict, Optional
 from utils.file_utils import FileUtils
 from utils.json_parser import JSONParser
 from utils.prompt_templates import PromptTemplates
+from utils.prompt_budget import PromptBudget
+from analyzers.segment_reducer import SegmentReducer
 
 
 class GlobalAnalyzer:
@@ -26,6 +28,10 @@ class GlobalAnalyzer:
         self.config = config
         self.output_dir = output_dir
         self.retry_times = config.get('extraction', {}).get('retry_times', 3)
+        
+        # 分段数据超出提示词预算时先逐层归并
+        self.reducer = SegmentReducer(llm, config, output_dir)
+        self.budget = PromptBudget(config)
     
     def analyze_global(self, segment_summaries: List[Dict]) -> Optional[Dict]:
         """
@@ -51,12 +57,67 @@ class GlobalAnalyzer:
         # 准备分段汇总数据
         segments_data = self._prepare_segments_data(segment_summaries)
         
-        # 构建prompt
-        prompt = PromptTemplates.GLOBAL_ANALYSIS.format(
-            segments_data=json.dumps(segments_data, ensure_ascii=False, indent=2),
+        # 超出提示词预算时逐层归并（每个归并节点都有检查点）
+        if self.reducer.needs_reduce(segments_data):
+            segments_data = self.reducer.reduce(segments_data)
+        
+        # 构建prompt（紧凑序列化，超出模型上下文时先删除风格、世界观、地点字段）
+        prompt = self.budget.build(
+            'global', PromptTemplates.GLOBAL_ANALYSIS, 'segments_data', segments_data,
+            trim_fields=('style', 'world_building', 'locations'), llm=self.llm,
             total_segments=len(segment_summaries)
         )
         
+        return self._invoke(prompt, output_file)
+    
+    def analyze_delta(self, previous: Dict, new_segments: List[Dict], total_segments: int) -> Optional[Dict]:
+        """
+        连载跟更：在上次整体分析的基础上并入新增/修订的分段（不重新发送全部分段）
+        
+        Args:
+            previous: 上次的整体分析结果
+            new_segments: 新增或修订的分段汇总
+            total_segments: 全书现有分段数
+            
+        Returns:
+            更新后的整体分析结果（失败返回None）
+        """
+        print(f"\n━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━")
+        print(f"第三层：整体分析（增量更新）")
+        print(f"━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━")
+        print(f"并入 {len(new_segments)} 个新增/修订分段（全书 {total_segments} 个分段）\n")
+        
+        output_file = os.path.join(self.output_dir, 'global_analysis.json')
+        segments_data = self._prepare_segments_data(new_segments)
+        if self.reducer.needs_reduce(segments_data):
+            segments_data = self.reducer.reduce(segments_data)
+        
+        ranges = [str(seg.get('segment_range') or '?') for seg in segments_data] or ['?']
+        segment_range = f"{ranges[0].split('-')[0]}-{ranges[-1].split('-')[-1]}"
+        # 上次的分析保持完整键名（作为输出结构的样例），只去掉缩进
+        prompt = self.budget.build(
+            'global.delta', PromptTemplates.GLOBAL_DELTA, 'segments_data', segments_data,
+            trim_fields=('style', 'world_building', 'locations'), llm=self.llm,
+            previous_analysis=json.dumps(previous, ensure_ascii=False, separators=(',', ':')),
+            segment_range=segment_range, total_segments=total_segments
+        )
+        return self._invoke(prompt, output_file)
+    
+    def _invoke(self, prompt: str, output_file: str) -> Optional[Dict]:
+        """
+        调用LLM生成整体分析（带重试），成功时保存结果
+        
+        Args:
+            prompt: 提示词
+            output_file: 结果文件路径
+            
+        Returns:
+            整体分析结果（失败返回None）
+        """
+        # 模型路由：整体分析从最弱档位开始
+        if hasattr(self.llm, 'reset'):
+            self.llm.reset()
+        
         # 调用LLM（带重试）
         print(f"🤖 开始整体分析...")
         for attempt in range(self.retry_times):
@@ -79,6 +140,9 @@ class GlobalAnalyzer:
                     print(f"✓ 整体分析成功")
                     return result
                 else:
+                    # 解析失败时升级到更强的模型档位（启用模型路由时）
+                    if hasattr(self.llm, 'escalate'):
+                        self.llm.escalate()
                     if attempt < self.retry_times - 1:
                         print(f"⚠️  JSON解析失败，重新调用LLM重试 {attempt + 1}/{self.retry_times}")
                         time.sleep(2)
@@ -2,25 +2,56 @@
 文件预处理模块
 """
 import os
-from typing import List, Dict
+import re
+import copy
+import math
+from collections import Counter
+from typing import List, Dict, Optional
 from utils.file_utils import FileUtils
+from utils.minhash import MinHasher, LSHIndex
 
 
 class NovelPreprocessor:
     """小说预处理器"""
     
-    def __init__(self, novel_folder: str, config: dict):
+    # 请假条、上架感言、求票公告等非正文章节的标题
+    NOTICE_TITLE_PATTERN = re.compile(r'请假|感言|上架|公告|通知|单章|求票|作者的话|致读者|推荐票|月票')
+    # 正文中的公告用语（按每千字出现次数判断）
+    NOTICE_WORDS = ('请假', '月票', '推荐票', '打赏', '订阅', '求票', '加更', '上架', '更新', '书友', '作者')
+    
+    def __init__(self, novel_folder: str, config: dict, calls_per_chapter: int = 1):
         """
         初始化预处理器
         
         Args:
             novel_folder: 小说文件夹路径
             config: 配置字典
+            calls_per_chapter: 单章分析的估计LLM调用次数（用于统计去重节省的调用）
         """
         self.novel_folder = novel_folder
         self.config = config
         self.chapters = []
         self.statistics = {}
+        
+        # 近似重复章节与非正文章节检测（MinHash/LSH + 低信息量启发式）
+        settings = config.get('deduplication', {}) or {}
+        self.dedup_enabled = bool(settings.get('enabled', True))
+        self.dedup_action = settings.get('action', 'reuse')
+        self.dedup_threshold = float(settings.get('threshold', 0.8))
+        self.non_story_enabled = bool(settings.get('non_story', True))
+        self.min_unique_ratio = float(settings.get('min_unique_ratio', 0.5))
+        self.min_entropy = float(settings.get('min_entropy', 6.0))
+        self.notice_density = float(settings.get('notice_density', 3.0))
+        self.notice_title_density = float(settings.get('notice_title_density', 1.0))
+        self.notice_max_length = int(settings.get('notice_max_length', 800))
+        num_perm = int(settings.get('num_perm', 128))
+        self.hasher = MinHasher(num_perm, int(settings.get('shingle_size', 5)))
+        self.bands = int(settings.get('bands', 32))
+        self.calls_per_chapter = calls_per_chapter
+        
+        self.duplicates = []   # 近似重复的章节（duplicate_of 为被复用的章节号）
+        self.non_story = []    # 非正文章节（non_story 为判断原因）
+        self.notice_review = []  # 标题像公告但按正文分析的章节（待人工复核）
     
     def load_and_process(self) -> List[Dict]:
         """
@@ -43,6 +74,10 @@ class NovelPreprocessor:
         # 过滤章节
         self._filter_chapters()
         
+        # 近似重复与非正文章节检测
+        if self.dedup_enabled:
+            self._detect_duplicates()
+        
         # 生成统计信息
         self._generate_statistics()
         
@@ -72,6 +107,124 @@ class NovelPreprocessor:
         
         self.chapters = filtered
     
+    def _detect_duplicates(self):
+        """
+        标记近似重复章节与非正文章节并从待分析列表中移出
+        
+        非正文章节（请假条、感言、凑字数的重复内容）直接跳过；与前面某章的片段 Jaccard
+        相似度达到阈值的章节记为该章的重复（duplicate_of），分析完成后由 apply_duplicates
+        复用该章结果（action=reuse）或不输出（action=skip）。
+        """
+        print("🔍 正在检测重复与非正文章节...")
+        index = LSHIndex(self.hasher.num_perm, self.bands)
+        shingles = {}
+        kept = []
+        
+        for chapter in self.chapters:
+            chapter_shingles = self.hasher.shingles(chapter['content'])
+            
+            reason = self._non_story_reason(chapter, chapter_shingles) if self.non_story_enabled else None
+            if reason:
+                chapter['non_story'] = reason
+                self.non_story.append(chapter)
+                print(f"  跳过非正文章节 {chapter['number']} {chapter.get('title', '')}（{reason}）")
+                continue
+            if self.non_story_enabled and self.NOTICE_TITLE_PATTERN.search(chapter.get('title', '')):
+                # 标题含公告类字眼（如“皇榜公告”）但正文不像公告：照常分析，记录下来供复核
+                self.notice_review.append(chapter)
+                print(f"  📝 章节 {chapter['number']} {chapter.get('title', '')} 标题像公告但正文不像，按正文分析（待复核）")
+            
+            signature = self.hasher.signature(chapter_shingles)
+            source = None
+            for number in index.query(signature):
+                # LSH 候选再用精确 Jaccard 确认
+                similarity = MinHasher.jaccard(chapter_shingles, shingles[number])
+                if similarity >= self.dedup_threshold:
+                    source = (number, similarity)
+                    break
+            
+            if source:
+                chapter['duplicate_of'] = source[0]
+                self.duplicates.append(chapter)
+                print(f"  章节 {chapter['number']} {chapter.get('title', '')} 与章节 {source[0]} "
+                      f"重复（相似度 {source[1]:.2f}）")
+                continue
+            
+            index.add(chapter['number'], signature)
+            shingles[chapter['number']] = chapter_shingles
+            kept.append(chapter)
+        
+        removed = len(self.chapters) - len(kept)
+        if removed:
+            action = '复用原章节结果' if self.dedup_action == 'reuse' else '跳过'
+            print(f"⚠️  {len(self.duplicates)} 个重复章节（{action}），{len(self.non_story)} 个非正文章节（跳过）")
+        self.chapters = kept
+    
+    def _non_story_reason(self, chapter: Dict, shingles: set) -> Optional[str]:
+        """
+        判断章节是否为非正文（返回原因，正文返回None）
+        
+        Args:
+            chapter: 章节数据
+            shingles: 章节的片段集合
+            
+        Returns:
+            原因描述或None
+        """
+        content = ''.join(chapter['content'].split())
+        if not content:
+            return '空内容'
+        
+        # 凑字数的重复内容：不同片段占比很低
+        positions = max(1, len(content) - self.hasher.shingle_size + 1)
+        unique_ratio = len(shingles) / positions
+        if unique_ratio < self.min_unique_ratio:
+            return f"重复内容（片段不重复率 {unique_ratio:.2f}）"
+        
+        # 低信息量：字符熵过低（大量重复的少数字符）
+        counts = Counter(content)
+        entropy = -sum(c / len(content) * math.log2(c / len(content)) for c in counts.values())
+        if entropy < self.min_entropy:
+            return f"低信息量（字符熵 {entropy:.1f}）"
+        
+        # 公告：正文公告用语密集；或标题像公告，且正文也有公告用语或篇幅很短
+        # （“皇榜公告”“单章”之类的标题也会出现在正文章节中，只凭标题不跳过）
+        density = sum(content.count(word) for word in self.NOTICE_WORDS) * 1000 / len(content)
+        title_hit = bool(self.NOTICE_TITLE_PATTERN.search(chapter.get('title', '')))
+        if density >= self.notice_density or (title_hit and (
+                density >= self.notice_title_density or len(content) <= self.notice_max_length)):
+            return f"公告/感言（公告用语 {density:.1f}/千字）"
+        return None
+    
+    def apply_duplicates(self, results: List[Dict]) -> List[Dict]:
+        """
+        为重复章节补上被复用章节的分析结果（action=reuse；skip 时原样返回）
+        
+        Args:
+            results: 单章分析结果列表
+            
+        Returns:
+            按章节号排序的结果列表
+        """
+        if self.dedup_action != 'reuse' or not self.duplicates:
+            return results
+        
+        by_number = {r.get('chapter_number'): r for r in results}
+        reused = []
+        for chapter in self.duplicates:
+            source = by_number.get(chapter['duplicate_of'])
+            if not source:
+                continue
+            result = copy.deepcopy(source)
+            result['chapter_number'] = chapter['number']
+            result['chapter_title'] = chapter.get('title', '')
+            result['duplicate_of'] = chapter['duplicate_of']
+            reused.append(result)
+        
+        if reused:
+            print(f"♻️  {len(reused)} 个重复章节复用了原章节的分析结果")
+        return sorted(results + reused, key=lambda r: r.get('chapter_number', 0))
+    
     def _generate_statistics(self):
         """生成统计信息"""
         total_words = sum(ch['word_count'] for ch in self.chapters)
@@ -85,11 +238,29 @@ class NovelPreprocessor:
             'max_chapter_length': max(ch['word_count'] for ch in self.chapters) if self.chapters else 0
         }
         
+        if self.dedup_enabled:
+            avoided = len(self.duplicates) + len(self.non_story)
+            self.statistics['deduplication'] = {
+                'duplicate_chapters': {ch['number']: ch['duplicate_of'] for ch in self.duplicates},
+                'non_story_chapters': {ch['number']: ch['non_story'] for ch in self.non_story},
+                'notice_review_chapters': {ch['number']: ch.get('title', '') for ch in self.notice_review},
+                'chapters_avoided': avoided,
+                'llm_calls_avoided': avoided * self.calls_per_chapter
+            }
+        
         print("\n📊 统计信息:")
         print(f"  总章节数: {self.statistics['total_chapters']}")
         print(f"  总字数: {self.statistics['total_words']:,}")
         print(f"  平均章节长度: {self.statistics['average_chapter_length']:,} 字")
-        print(f"  章节长度范围: {self.statistics['min_chapter_length']:,} - {self.statistics['max_chapter_length']:,} 字\n")
+        print(f"  章节长度范围: {self.statistics['min_chapter_length']:,} - {self.statistics['max_chapter_length']:,} 字")
+        if self.dedup_enabled:
+            dedup = self.statistics['deduplication']
+            print(f"  重复/非正文章节: {len(self.duplicates)}/{len(self.non_story)}，"
+                  f"省去约 {dedup['llm_calls_avoided']} 次LLM调用")
+            if self.notice_review:
+                print(f"  标题像公告、按正文分析的章节（请复核）: "
+                      f"{', '.join(str(ch['number']) for ch in self.notice_review[:20])}")
+        print()
     
     def get_statistics(self) -> Dict:
         """
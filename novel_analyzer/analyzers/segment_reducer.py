@@ -0,0 +1,227 @@
+"""
+分段逐层归并 - 整体分析前把大量分段汇总归并到提示词预算以内
+
+长篇小说（如 2000 章 = 100 个分段）的全部分段汇总无法一次放进整体分析的提示词。
+归并器按 fan_in 把相邻分段分组，每组由 LLM 合并为一个更高层的汇总，同一层的各组
+并行处理；逐层归并直到数据量不超过 token_budget。每个归并节点都保存为检查点
+（记录输入内容的哈希），重试或重新运行时直接复用已完成且输入未变的节点。
+"""
+import os
+import json
+import time
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Any, Optional
+from utils.file_utils import FileUtils
+from utils.json_parser import JSONParser
+from utils.llm_pool import resolve_concurrency
+from utils.model_router import ModelRouter
+from utils.prompt_budget import PromptBudget
+from utils.prompt_templates import PromptTemplates
+
+
+class SegmentReducer:
+    """分段汇总的逐层归并器"""
+
+    TREE_DIRNAME = 'global_tree'
+
+    def __init__(self, llm, config: dict, output_dir: str):
+        """
+        初始化归并器
+
+        Args:
+            llm: LangChain LLM实例（或路由LLM）
+            config: 配置字典（读取 global_reduce 段）
+            output_dir: 中间结果目录（节点检查点保存在其下的 global_tree/）
+        """
+        settings = config.get('global_reduce', {}) or {}
+        self.llm = llm
+        self.enabled = bool(settings.get('enabled', True))
+        self.fan_in = max(2, int(settings.get('fan_in', 8)))
+        self.token_budget = int(settings.get('token_budget', 12000))
+        self.max_levels = int(settings.get('max_levels', 4))
+        self.max_workers = int(settings.get('max_workers', 0) or 0) or resolve_concurrency(config)
+        self.retry_times = config.get('extraction', {}).get('retry_times', 3)
+        self.tree_dir = os.path.join(output_dir, self.TREE_DIRNAME)
+        self.budget = PromptBudget(config)
+
+    def estimate_tokens(self, segments: List[Dict]) -> int:
+        """按整体分析提示词中的序列化方式估算分段数据的Token数"""
+        return ModelRouter.estimate_tokens(self.budget.serialize(segments))
+
+    def needs_reduce(self, segments: List[Dict]) -> bool:
+        """分段数据是否超出整体分析的提示词预算"""
+        return self.enabled and len(segments) > 1 and self.estimate_tokens(segments) > self.token_budget
+
+    def reduce(self, segments: List[Dict]) -> List[Dict]:
+        """
+        逐层归并直到不超过预算（或达到最大层数）
+
+        Args:
+            segments: 精简后的分段数据（按章节顺序）
+
+        Returns:
+            归并后的节点列表（结构与分段数据相同）
+        """
+        nodes = segments
+        level = 0
+        while self.needs_reduce(nodes) and level < self.max_levels:
+            level += 1
+            groups = [nodes[i:i + self.fan_in] for i in range(0, len(nodes), self.fan_in)]
+            print(f"🌲 归并第 {level} 层: {len(nodes)} 个节点 → {len(groups)} 个"
+                  f"（约 {self.estimate_tokens(nodes)} Token，预算 {self.token_budget}）")
+
+            workers = min(self.max_workers, len(groups))
+            if workers > 1:
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    nodes = list(executor.map(lambda group: self._reduce_group(level, group), groups))
+            else:
+                nodes = [self._reduce_group(level, group) for group in groups]
+
+        if self.needs_reduce(nodes):
+            print(f"⚠️  归并 {level} 层后仍超出预算（约 {self.estimate_tokens(nodes)} Token），继续整体分析")
+        elif level:
+            print(f"✓ 归并完成: {len(nodes)} 个节点，约 {self.estimate_tokens(nodes)} Token")
+        return nodes
+
+    # ========== 单个节点 ==========
+
+    def _reduce_group(self, level: int, group: List[Dict]) -> Dict:
+        """
+        合并一组相邻节点（已有检查点且输入未变时直接复用）
+
+        Args:
+            level: 层号（从1开始）
+            group: 相邻节点列表
+
+        Returns:
+            合并后的节点
+        """
+        if len(group) == 1:
+            return group[0]
+
+        segment_range = self._span(group)
+        node_file = os.path.join(self.tree_dir, f"level{level}_{segment_range}.json")
+        digest = hashlib.sha1(json.dumps(group, ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()
+
+        if os.path.exists(node_file):
+            checkpoint = FileUtils.load_json(node_file)
+            if checkpoint and checkpoint.get('input_sha1') == digest:
+                print(f"  ✓ 节点 L{level} {segment_range} 已完成，复用")
+                return checkpoint['node']
+
+        node = self._merge_with_llm(group, segment_range)
+        if node is None:
+            # LLM合并失败时用本地合并兜底（不保存检查点，下次运行重新尝试）
+            print(f"  ⚠️  节点 L{level} {segment_range} 合并失败，使用本地合并")
+            return self._merge_locally(group, segment_range)
+
+        os.makedirs(self.tree_dir, exist_ok=True)
+        FileUtils.save_json({'input_sha1': digest, 'level': level, 'node': node}, node_file)
+        print(f"  ✓ 节点 L{level} {segment_range} ({len(group)} 个分段)")
+        return node
+
+    def _merge_with_llm(self, group: List[Dict], segment_range: str) -> Optional[Dict]:
+        """调用LLM合并一组节点（带重试，失败返回None）"""
+        prompt = self.budget.build(
+            f'global.merge {segment_range}', PromptTemplates.SEGMENT_MERGE, 'segments_data', group,
+            trim_fields=('style', 'locations'), llm=self.llm,
+            total_segments=len(group), segment_range=segment_range
+        )
+
+        # 模型路由：每个节点从最弱档位开始（档位按线程记录，并行节点互不影响）
+        if hasattr(self.llm, 'reset'):
+            self.llm.reset()
+
+        for attempt in range(self.retry_times):
+            try:
+                response = self.llm.invoke(prompt)
+                response_text = response.content if hasattr(response, 'content') else str(response)
+                result = JSONParser.parse(response_text)
+
+                if isinstance(result, dict) and JSONParser.validate_structure(
+                        result, ['characters', 'plot', 'world_building']):
+                    result['segment_range'] = segment_range
+                    return result
+
+                if hasattr(self.llm, 'escalate'):
+                    self.llm.escalate()
+                if attempt < self.retry_times - 1:
+                    print(f"  ⚠️  节点 {segment_range} JSON解析失败，重试 {attempt + 1}/{self.retry_times}")
+                    time.sleep(2)
+            except Exception as e:
+                print(f"  ❌ 节点 {segment_range} 调用LLM出错: {e}")
+                if attempt < self.retry_times - 1:
+                    time.sleep(2)
+        return None
+
+    @staticmethod
+    def _span(group: List[Dict]) -> str:
+        """一组节点覆盖的章节范围（如 001-160）"""
+        first = str(group[0].get('segment_range') or '?').split('-')[0]
+        last = str(group[-1].get('segment_range') or '?').split('-')[-1]
+        return f"{first}-{last}"
+
+    # ========== 本地兜底合并 ==========
+
+    @classmethod
+    def _merge_locally(cls, group: List[Dict], segment_range: str) -> Dict:
+        """
+        不调用LLM的合并（列表字段拼接去重并截断，叙述字段按顺序拼接）
+
+        Args:
+            group: 相邻节点列表
+            segment_range: 章节范围
+
+        Returns:
+            合并后的节点
+        """
+        characters = {}
+        for node in group:
+            for char in cls._dict(node.get('characters')).get('main_characters', []) or []:
+                if isinstance(char, dict) and char.get('name') and char['name'] not in characters:
+                    characters[char['name']] = char
+
+        plots = [cls._dict(node.get('plot')) for node in group]
+        worlds = [cls._dict(node.get('world_building')) for node in group]
+        return {
+            'segment_range': segment_range,
+            'characters': {
+                'main_characters': list(characters.values())[:15],
+                'character_count': len(characters)
+            },
+            'locations': cls._union(cls._locations(node.get('locations')) for node in group)[:20],
+            'plot': {
+                'main_storyline': '；'.join(str(p.get('main_storyline', ''))[:200] for p in plots
+                                           if p.get('main_storyline')),
+                'key_events': cls._union(p.get('key_events') for p in plots)[:20],
+                'conflicts': cls._union(p.get('conflicts') for p in plots)[:10],
+                'emotional_arc': ' → '.join(str(p.get('emotional_arc')) for p in plots if p.get('emotional_arc'))
+            },
+            'world_building': {
+                key: cls._union(w.get(key) for w in worlds)[:15]
+                for key in ('power_system_details', 'social_structure', 'special_items')
+            },
+            'style': cls._dict(group[-1].get('style'))
+        }
+
+    @staticmethod
+    def _dict(value: Any) -> Dict:
+        return value if isinstance(value, dict) else {}
+
+    @staticmethod
+    def _locations(value: Any) -> List:
+        """分段的地点可能是列表，也可能是 {'main_locations': [...]}"""
+        if isinstance(value, dict):
+            return value.get('main_locations', []) or []
+        return value if isinstance(value, list) else []
+
+    @staticmethod
+    def _union(lists) -> List:
+        """按顺序拼接去重（忽略非列表与不可哈希的值）"""
+        seen = []
+        for values in lists:
+            for value in values if isinstance(values, list) else []:
+                if isinstance(value, str) and value not in seen:
+                    seen.append(value)
+        return seen
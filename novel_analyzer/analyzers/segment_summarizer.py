@@ -2,12 +2,16 @@
 分段汇总器模块
 """
 import os
-import json
+import copy
 import time
 from typing import List, Dict, Optional
 from utils.file_utils import FileUtils
 from utils.json_parser import JSONParser
 from utils.prompt_templates import PromptTemplates
+from utils.prompt_budget import PromptBudget
+from processors.stylometrics import Stylometrics
+from processors.segment_digest import SegmentDigest
+from utils.extractive_compressor import ExtractiveCompressor
 
 
 class SegmentSummarizer:
@@ -29,6 +33,13 @@ class SegmentSummarizer:
         
         self.segment_size = config.get('processing', {}).get('segment_size', 20)
         self.retry_times = config.get('extraction', {}).get('retry_times', 3)
+        
+        # hybrid（默认）：可数、可列举的字段在本地计算，只请LLM撰写叙述字段；llm：整段交给LLM
+        self.hybrid = (config.get('segment_summary', {}) or {}).get('mode', 'hybrid') == 'hybrid'
+        self.budget = PromptBudget(config)
+        
+        # 抽取式预压缩章节摘要（开启 compression.segment 时代替固定截断，仅混合模式）
+        self.compressor = ExtractiveCompressor(config)
     
     def summarize_segments(self, chapter_results: List[Dict]) -> List[Dict]:
         """
@@ -49,6 +60,9 @@ class SegmentSummarizer:
         print(f"━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━")
         print(f"总共需要汇总 {num_segments} 个分段\n")
         
+        # 前面分段中出现过的角色（用于精确判断新角色）
+        seen_characters = set()
+        
         for i in range(0, total_chapters, self.segment_size):
             segment_chapters = chapter_results[i:i + self.segment_size]
             start_num = segment_chapters[0]['chapter_number']
@@ -56,7 +70,9 @@ class SegmentSummarizer:
             
             print(f"📝 汇总分段 {start_num:03d}-{end_num:03d} ({len(segment_chapters)}章)")
             
-            summary = self.summarize_segment(segment_chapters, start_num, end_num)
+            summary = self.summarize_segment(segment_chapters, start_num, end_num, set(seen_characters))
+            seen_characters.update(char.get('name') for ch in segment_chapters
+                                   for char in ch.get('characters', []) or [] if isinstance(char, dict))
             if summary:
                 segment_summaries.append(summary)
                 print(f"  ✓ 成功")
@@ -68,7 +84,8 @@ class SegmentSummarizer:
         print(f"\n💾 已保存分段汇总: {len(segment_summaries)} 个JSON文件")
         return segment_summaries
     
-    def summarize_segment(self, chapters: List[Dict], start_num: int, end_num: int) -> Optional[Dict]:
+    def summarize_segment(self, chapters: List[Dict], start_num: int, end_num: int,
+                          seen_before: Optional[set] = None) -> Optional[Dict]:
         """
         汇总单个分段
         
@@ -76,6 +93,7 @@ class SegmentSummarizer:
             chapters: 章节分析结果列表
             start_num: 起始章节号
             end_num: 结束章节号
+            seen_before: 前面分段中出现过的角色名（混合模式判断新角色用）
             
         Returns:
             汇总结果字典
@@ -86,18 +104,40 @@ class SegmentSummarizer:
             print(f"  分段 {start_num:03d}-{end_num:03d} 已汇总，跳过")
             return FileUtils.load_json(output_file)
         
-        # 准备章节数据（精简版）
-        chapters_data = self._prepare_chapters_data(chapters)
         total_words = sum(ch.get('word_count', 0) for ch in chapters)
+        compression = None
         
-        # 构建prompt
-        prompt = PromptTemplates.SEGMENT_SUMMARY.format(
-            chapters_data=json.dumps(chapters_data, ensure_ascii=False, indent=2),
-            start_chapter=start_num,
-            end_chapter=end_num,
-            total_chapters=len(chapters),
-            total_words=total_words
-        )
+        if self.hybrid:
+            # 混合模式：本地计算可数字段，提示词只包含逐章概要
+            facts = SegmentDigest.compute(chapters, seen_before)
+            summaries = None
+            if self.compressor.segment_enabled:
+                summaries, compression = self._compress_summaries(chapters, facts)
+            prompt = PromptTemplates.SEGMENT_NARRATIVE.format(
+                segment_range=f"{start_num}-{end_num}",
+                total_chapters=len(chapters),
+                total_words=total_words,
+                segment_digest=SegmentDigest.to_prompt(chapters, facts, summaries),
+                main_characters='、'.join(c['name'] for c in facts['characters_summary']['main_characters'])
+            )
+            self.budget.check(f"segment {start_num:03d}-{end_num:03d}", prompt, llm=self.llm)
+        else:
+            # 准备章节数据（精简版）
+            chapters_data = self._prepare_chapters_data(chapters)
+            
+            # 构建prompt（紧凑序列化，超出模型上下文时先删除世界观、地点、事件字段）
+            prompt = self.budget.build(
+                f"segment {start_num:03d}-{end_num:03d}", PromptTemplates.SEGMENT_SUMMARY, 'chapters_data',
+                chapters_data, trim_fields=('world_elements', 'locations', 'events'), llm=self.llm,
+                start_chapter=start_num,
+                end_chapter=end_num,
+                total_chapters=len(chapters),
+                total_words=total_words
+            )
+        
+        # 模型路由：每个分段从最弱档位开始
+        if hasattr(self.llm, 'reset'):
+            self.llm.reset()
         
         # 调用LLM（带重试）
         for attempt in range(self.retry_times):
@@ -114,16 +154,33 @@ class SegmentSummarizer:
                 # 解析JSON
                 result = JSONParser.parse(response_text)
                 
+                # 混合模式：叙述字段填入本地计算结果
+                if self.hybrid:
+                    if isinstance(result, dict) and self._validate_narrative(result):
+                        result = SegmentDigest.apply_narrative(copy.deepcopy(facts), result)
+                    else:
+                        result = None
+                
                 if result and self._validate_segment_result(result):
                     # 添加基本信息
                     result['segment_range'] = f"{start_num:03d}-{end_num:03d}"
                     result['total_chapters'] = len(chapters)
                     result['total_words'] = total_words
+                    if compression:
+                        result['compression'] = compression
+                    
+                    # 对话比例使用本地文体统计的实测值
+                    dialogue_ratio = Stylometrics.dialogue_ratio_label([ch.get('stylometrics') for ch in chapters])
+                    if dialogue_ratio and isinstance(result.get('style_patterns'), dict):
+                        result['style_patterns']['dialogue_ratio'] = dialogue_ratio
                     
                     # 保存结果
                     FileUtils.save_json(result, output_file)
                     return result
                 else:
+                    # 解析失败时升级到更强的模型档位（启用模型路由时）
+                    if hasattr(self.llm, 'escalate'):
+                        self.llm.escalate()
                     if attempt < self.retry_times - 1:
                         print(f"  ⚠️  分段 {start_num:03d}-{end_num:03d} JSON解析失败，重新调用LLM重试 {attempt + 1}/{self.retry_times}")
                         time.sleep(2)
@@ -140,6 +197,33 @@ class SegmentSummarizer:
         print(f"  ❌ 分段 {start_num:03d}-{end_num:03d} 汇总失败")
         return None
     
+    def _compress_summaries(self, chapters: List[Dict], facts: Dict) -> tuple:
+        """
+        预压缩各章摘要（按TextRank选句，优先保留主要角色所在的句子）
+        
+        Args:
+            chapters: 章节分析结果列表
+            facts: SegmentDigest.compute 的结果
+            
+        Returns:
+            ({章节号: 压缩后的摘要}, 压缩统计)
+        """
+        names = [c['name'] for c in facts['characters_summary']['main_characters']]
+        summaries = {}
+        original = compressed = 0
+        for ch in chapters:
+            summary = ch.get('chapter_summary') if isinstance(ch.get('chapter_summary'), dict) else {}
+            text = str(summary.get('main_content', ''))
+            summaries[ch.get('chapter_number')], stats = self.compressor.compress(
+                text, names, self.compressor.segment_chapter_tokens)
+            original += stats['original_tokens']
+            compressed += stats['compressed_tokens']
+        return summaries, {
+            'original_tokens': original,
+            'compressed_tokens': compressed,
+            'ratio': round(compressed / original, 3) if original else 1.0
+        }
+    
     def _prepare_chapters_data(self, chapters: List[Dict]) -> List[Dict]:
         """
         准备章节数据（精简版，避免prompt过长）
@@ -167,6 +251,19 @@ class SegmentSummarizer:
             })
         return simplified
     
+    def _validate_narrative(self, result: dict) -> bool:
+        """
+        验证混合模式的叙述字段
+        
+        Args:
+            result: LLM返回的叙述字段
+            
+        Returns:
+            是否有效
+        """
+        storyline = result.get('main_storyline')
+        return isinstance(storyline, str) and bool(storyline.strip())
+    
     def _validate_segment_result(self, result: dict) -> bool:
         """
         验证分段汇总结果
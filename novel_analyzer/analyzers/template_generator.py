@@ -23,12 +23,13 @@ class TemplateGenerator:
         self.output_dir = output_dir
         os.makedirs(output_dir, exist_ok=True)
     
-    def generate_all_templates(self, global_analysis: Dict) -> bool:
+    def generate_all_templates(self, global_analysis: Dict, sampling: Optional[Dict] = None) -> bool:
         """
         生成所有模板文件
         
         Args:
             global_analysis: 整体分析结果
+            sampling: 抽样模式的覆盖率与置信度标注（写入各模板的 metadata.sampling）
             
         Returns:
             是否成功
@@ -50,6 +51,8 @@ class TemplateGenerator:
             print(f"📝 生成 {filename}...")
             try:
                 template = generator_func(global_analysis)
+                if sampling:
+                    template['metadata']['sampling'] = sampling
                 output_path = os.path.join(self.output_dir, filename)
                 FileUtils.save_json(template, output_path)
                 print(f"  ✓ 成功保存到 {output_path}")
@@ -31,6 +31,10 @@ from analyzers.chapter_analyzer import ChapterAnalyzer
 from analyzers.segment_summarizer import SegmentSummarizer
 from analyzers.global_analyzer import GlobalAnalyzer
 from analyzers.template_generator import TemplateGenerator
+from analyzers.follow_tracker import FollowTracker
+from analyzers.chapter_sampler import ChapterSampler
+from utils.model_router import ModelRouter
+from utils.llm_pool import LLMClientPool, parse_endpoints
 
 
 def load_config(config_path: str = None) -> dict:
@@ -60,20 +64,76 @@ def init_llm(config: dict):
         config: 配置字典
         
     Returns:
-        LLM实例
+        LLM实例（启用 routing 时返回 ModelRouter）
     """
     llm_config = config.get('llm', {})
     extraction_config = config.get('extraction', {})
     
     # 从环境变量读取配置（优先级高于config.yaml）
     provider = os.getenv('LLM_PROVIDER', llm_config.get('provider', 'ollama'))
-    temperature = float(os.getenv('LLM_TEMPERATURE', llm_config.get('temperature', 0.3)))
-    max_tokens = int(os.getenv('LLM_MAX_TOKENS', llm_config.get('max_tokens', 3000)))
-    timeout = int(os.getenv('LLM_TIMEOUT', extraction_config.get('timeout', 120)))
+    settings = {
+        'provider': provider,
+        'temperature': float(os.getenv('LLM_TEMPERATURE', llm_config.get('temperature', 0.3))),
+        'max_tokens': int(os.getenv('LLM_MAX_TOKENS', llm_config.get('max_tokens', 3000))),
+        'timeout': int(os.getenv('LLM_TIMEOUT', extraction_config.get('timeout', 120))),
+        # 多端点负载均衡（逗号分隔），设置后忽略 base_url
+        'endpoints': parse_endpoints(os.getenv('LLM_ENDPOINTS', llm_config.get('endpoints'))),
+    }
     
     if provider == 'ollama':
-        model = os.getenv('OLLAMA_MODEL', llm_config.get('model', 'qwen2.5:7b-instruct'))
-        base_url = os.getenv('OLLAMA_BASE_URL', llm_config.get('base_url', 'http://localhost:11434'))
+        settings['model'] = os.getenv('OLLAMA_MODEL', llm_config.get('model', 'qwen2.5:7b-instruct'))
+        settings['base_url'] = os.getenv('OLLAMA_BASE_URL', llm_config.get('base_url', 'http://localhost:11434'))
+    elif provider == 'openai':
+        settings['model'] = os.getenv('OPENAI_MODEL', llm_config.get('model', 'gpt-3.5-turbo'))
+        settings['base_url'] = os.getenv('OPENAI_API_BASE', llm_config.get('base_url'))
+        settings['api_key'] = os.getenv('OPENAI_API_KEY', llm_config.get('api_key', 'dummy'))
+    
+    llm = create_llm(settings)
+    
+    if ModelRouter.is_enabled(config):
+        # 路由档位继承 llm 段配置，default 档位使用上面按环境变量初始化的模型
+        extraction_timeout = extraction_config.get('timeout', 120)
+        router = ModelRouter(
+            config,
+            lambda profile: create_llm(dict({'timeout': extraction_timeout}, **profile)),
+            default_llm=llm
+        )
+        print(f"✓ 已启用模型路由: {len(router.profiles)} 个档位, {len(router.routes)} 条路由")
+        return router
+    
+    return llm
+
+
+def create_llm(settings: dict):
+    """
+    根据模型配置创建LLM实例
+    
+    Args:
+        settings: 模型配置（provider, model, base_url, api_key, temperature, max_tokens, timeout,
+                  endpoints）
+        
+    Returns:
+        LLM实例（配置了多个端点时返回 LLMClientPool）
+    """
+    endpoints = parse_endpoints(settings.get('endpoints'))
+    if endpoints:
+        single = {k: v for k, v in settings.items() if k != 'endpoints'}
+        pool = LLMClientPool(
+            endpoints,
+            lambda url: create_llm(dict(single, base_url=url)),
+            provider=settings.get('provider', 'ollama')
+        )
+        print(f"✓ LLM客户端池: {len(endpoints)} 个端点（按未完成请求数负载均衡）")
+        return pool
+    
+    provider = settings.get('provider', 'ollama')
+    temperature = float(settings.get('temperature', 0.3))
+    max_tokens = int(settings.get('max_tokens', 3000))
+    timeout = int(settings.get('timeout', 120))
+    
+    if provider == 'ollama':
+        model = settings.get('model', 'qwen2.5:7b-instruct')
+        base_url = settings.get('base_url', 'http://localhost:11434')
         
         llm = OllamaLLM(
             model=model,
@@ -87,9 +147,9 @@ def init_llm(config: dict):
         print(f"  超时: {timeout}秒")
     
     elif provider == 'openai':
-        model = os.getenv('OPENAI_MODEL', llm_config.get('model', 'gpt-3.5-turbo'))
-        base_url = os.getenv('OPENAI_API_BASE', llm_config.get('base_url'))
-        api_key = os.getenv('OPENAI_API_KEY', llm_config.get('api_key', 'dummy'))
+        model = settings.get('model', 'gpt-3.5-turbo')
+        base_url = settings.get('base_url')
+        api_key = settings.get('api_key', 'dummy')
         
         llm = ChatOpenAI(
             model=model,
@@ -110,6 +170,28 @@ def init_llm(config: dict):
     return llm
 
 
+def route_llm(llm, task: str):
+    """获取某个阶段使用的LLM（未启用路由时原样返回）"""
+    return llm.route(task) if isinstance(llm, ModelRouter) else llm
+
+
+def estimate_chapter_calls(config: dict, args) -> int:
+    """
+    估算单章分析的LLM调用次数（用于统计重复/非正文章节省去的调用）
+
+    V1 与自适应模式为1次。V2 按任务拆分：角色名单、地点、事件列表、世界观、章节摘要各1次，
+    角色详情每个角色1次（最多10个），事件详情每个事件1次（最多5个，提示词要求3-5个），
+    启用 llm_style_task 时写作风格再加1次；按每章约8个角色、4个事件估算，共约17次。
+    """
+    adaptive = args.adaptive or config.get('extraction', {}).get('mode', 'split') == 'adaptive'
+    if not (args.use_v2 or args.adaptive) or adaptive:
+        return 1
+    per_task = 5
+    typical_characters, typical_events = 8, 4
+    llm_style_task = (config.get('stylometrics', {}) or {}).get('llm_style_task', False)
+    return per_task + typical_characters + typical_events + (1 if llm_style_task else 0)
+
+
 def check_time_allowed(config: dict) -> bool:
     """
     检查当前时间是否在允许的运行时间段内
@@ -183,7 +265,18 @@ def main():
     parser.add_argument('--config', '-c', help='配置文件路径')
     parser.add_argument('--no-time-check', action='store_true', help='跳过运行时间检查')
     parser.add_argument('--use-v2', action='store_true', help='使用V2分段输出版本（更稳定，容错性更强）')
+    parser.add_argument('--adaptive', action='store_true',
+                        help='自适应模式：先整章单次调用，只对缺失或不合格的字段使用V2逐任务提取（隐含 --use-v2）')
+    parser.add_argument('--follow', action='store_true',
+                        help='连载跟更：只分析新增或内容变化的章节，重算末尾分段并增量更新整体分析')
+    parser.add_argument('--sample', action='store_true',
+                        help='抽样模式：只分析分层抽样的章节（开篇、卷边界、中段均匀），快速生成近似模板')
+    parser.add_argument('--sample-fill', type=int, default=0, metavar='N',
+                        help='在上次的抽样基础上补充 N 个未抽样章节（优先补最大空档，隐含 --sample）')
     parser.add_argument('--aggregate', action='store_true', help='聚合章节数据并生成分层存储')
+    parser.add_argument('--streaming', action='store_true', help='流式聚合（逐章折叠，不保留原始章节，适合超长小说）')
+    parser.add_argument('--cluster-events', action='store_true',
+                        help='聚合时合并跨章节重复的事件（等同于 event_clustering.enabled: true）')
     parser.add_argument('--model-type', default='gpt4', choices=['gpt4', 'claude', 'llama3'],
                        help='目标LLM类型（用于分块大小控制）')
     
@@ -240,23 +333,46 @@ def main():
             
             # 创建分层存储生成器
             storage_dir = os.path.join(args.output, 'knowledge_base')
-            generator = LayeredStorageGenerator(novel_name, storage_dir, args.model_type)
+            event_clustering = dict(config.get('event_clustering', {}) or {})
+            if args.cluster_events:
+                event_clustering['enabled'] = True
+            generator = LayeredStorageGenerator(novel_name, storage_dir, args.model_type, event_clustering)
             
             # 生成所有层级
-            generator.generate_all_layers(chapter_summaries_dir)
+            generator.generate_all_layers(chapter_summaries_dir, streaming=args.streaming)
             return
         
         # 第一步：预处理
         print("\n" + "="*60)
         print("步骤 1: 文件预处理")
         print("="*60)
-        preprocessor = NovelPreprocessor(args.input, config)
+        preprocessor = NovelPreprocessor(args.input, config, estimate_chapter_calls(config, args))
         chapters = preprocessor.load_and_process()
         
         if not chapters:
             print("❌ 没有可处理的章节，退出")
             return
         
+        # 抽样模式：只分析分层抽样的章节，分段汇总与整体分析保存在 intermediate/sample 下
+        sampler = None
+        stage_dir = intermediate_dir
+        if args.sample or args.sample_fill > 0:
+            if args.follow:
+                print("⚠️  抽样模式不支持连载跟更，已忽略 --follow")
+                args.follow = False
+            sampler = ChapterSampler(config, intermediate_dir)
+            chapters = sampler.select(chapters, args.sample_fill)
+            stage_dir = sampler.stage_dir
+        
+        # 连载跟更：与上次记录的章节内容哈希比较
+        tracker = None
+        if args.follow:
+            tracker = FollowTracker(intermediate_dir, config)
+            delta = tracker.diff(chapters)
+            if tracker.has_state and not tracker.has_changes(delta):
+                print("✓ 没有新增或变化的章节，无需更新")
+                return
+        
         # 第二步：单章分析
         print("\n" + "="*60)
         print("步骤 2: 单章分析")
@@ -269,14 +385,22 @@ def main():
             print("✓ 恢复分析...")
         
         # 根据参数选择分析器版本
-        if args.use_v2:
+        if args.adaptive:
+            config.setdefault('extraction', {})['mode'] = 'adaptive'
+        if args.use_v2 or args.adaptive:
             from analyzers.chapter_analyzer_v2 import ChapterAnalyzerV2
-            print("🔧 使用V2分段输出版本")
+            print("🔧 使用V2分段输出版本" + ("（自适应：整章单次调用 + 逐任务补提）" if args.adaptive else ""))
             chapter_analyzer = ChapterAnalyzerV2(llm, config, intermediate_dir, args.no_time_check)
         else:
-            chapter_analyzer = ChapterAnalyzer(llm, config, intermediate_dir, args.no_time_check)
+            chapter_analyzer = ChapterAnalyzer(route_llm(llm, 'chapter'), config, intermediate_dir, args.no_time_check)
+        
+        if tracker:
+            tracker.invalidate_chapters(delta, chapter_analyzer)
         
         chapter_results = chapter_analyzer.batch_analyze(chapters)
+        # 近似重复的章节复用原章节的结果（不再调用LLM；抽样模式下不补入未抽样的章节）
+        if not sampler:
+            chapter_results = preprocessor.apply_duplicates(chapter_results)
         
         if not chapter_results:
             print("❌ 单章分析失败，退出")
@@ -286,7 +410,8 @@ def main():
         print("\n" + "="*60)
         print("步骤 3: 分段汇总")
         print("="*60)
-        segment_summarizer = SegmentSummarizer(llm, config, intermediate_dir)
+        affected_start = tracker.invalidate_segments(chapter_results, delta) if tracker else None
+        segment_summarizer = SegmentSummarizer(route_llm(llm, 'segment'), config, stage_dir)
         segment_results = segment_summarizer.summarize_segments(chapter_results)
         
         if not segment_results:
@@ -297,8 +422,15 @@ def main():
         print("\n" + "="*60)
         print("步骤 4: 整体分析")
         print("="*60)
-        global_analyzer = GlobalAnalyzer(llm, config, intermediate_dir)
-        global_analysis = global_analyzer.analyze_global(segment_results)
+        global_analyzer = GlobalAnalyzer(route_llm(llm, 'global'), config, stage_dir)
+        previous_global = tracker.take_previous_global(delta) if tracker else None
+        new_segments = FollowTracker.segments_from(segment_results, affected_start) if tracker else []
+        global_analysis = None
+        if previous_global and new_segments:
+            # 增量更新：上次的整体分析 + 新增/修订的分段（失败时回退完整的整体分析）
+            global_analysis = global_analyzer.analyze_delta(previous_global, new_segments, len(segment_results))
+        if not global_analysis:
+            global_analysis = global_analyzer.analyze_global(segment_results)
         
         if not global_analysis:
             print("❌ 整体分析失败，退出")
@@ -309,7 +441,24 @@ def main():
         print("步骤 5: 生成最终模板")
         print("="*60)
         template_generator = TemplateGenerator(config, args.output)
-        success = template_generator.generate_all_templates(global_analysis)
+        sampling = sampler.annotate(chapter_results) if sampler else None
+        success = template_generator.generate_all_templates(global_analysis, sampling)
+        
+        if tracker:
+            # 已生成过知识库时一并更新（只有新增章节时增量折叠，不调用LLM）
+            storage_dir = os.path.join(args.output, 'knowledge_base')
+            novel_name = os.path.basename(args.input.rstrip('/'))
+            if os.path.isdir(os.path.join(storage_dir, novel_name)):
+                from processors.layered_storage import LayeredStorageGenerator
+                print("\n" + "="*60)
+                print("步骤 6: 更新知识库")
+                print("="*60)
+                event_clustering = dict(config.get('event_clustering', {}) or {})
+                if args.cluster_events:
+                    event_clustering['enabled'] = True
+                generator = LayeredStorageGenerator(novel_name, storage_dir, args.model_type, event_clustering)
+                generator.update_layers(os.path.join(intermediate_dir, 'chapter_summaries'))
+            tracker.save(chapters)
         
         # 计算耗时
         end_time = datetime.now()
@@ -329,14 +478,21 @@ def main():
         print(f"   5. quality_criteria.json   - 质量标准")
         print(f"\n📂 中间结果：")
         print(f"   - 单章分析: {intermediate_dir}/chapter_summaries/")
-        print(f"   - 分段汇总: {intermediate_dir}/segment_summaries/")
-        print(f"   - 整体分析: {intermediate_dir}/global_analysis.json")
+        print(f"   - 分段汇总: {stage_dir}/segment_summaries/")
+        print(f"   - 整体分析: {stage_dir}/global_analysis.json")
+        if sampler:
+            print(f"   - 抽样状态: {sampler.state_file}（--sample-fill N 继续补充未抽样章节）")
         
         if success:
             print(f"\n🎉 所有模板生成成功！")
         else:
             print(f"\n⚠️  部分模板生成失败，请检查输出目录")
         
+        # 模型路由统计（各路由的耗时与费用）
+        if isinstance(llm, ModelRouter):
+            llm.print_report()
+            llm.save_report(os.path.join(intermediate_dir, 'routing_report.json'))
+        
     except KeyboardInterrupt:
         print("\n\n⚠️  用户中断执行")
     except Exception as e:
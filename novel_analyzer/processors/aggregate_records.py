@@ -0,0 +1,572 @@
+"""
+紧凑聚合记录 - 以 __slots__ 记录类表示角色/地点/事件
+
+出场章节使用 array 存储章节号，章节标题集中保存在章节标题表中，
+名称、类型等高频重复字符串统一 intern。记录对外仍提供与旧版字典相同的
+只读访问方式（record['name']、record.get(...)），序列化时通过 to_dict()
+还原为完全兼容的 JSON 结构。
+
+流式聚合时，随章节数线性增长的列表（事件、情节线索、关键短语、文体指标）
+改用 JsonlSpool 逐行写入临时文件，需要时再逐条读回；角色状态变化、关系和地点
+描述这些逐章累积的明细写入 HistoryStore（临时 SQLite 文件），记录中只保留
+SpilledList 句柄。dump_json 可直接把含有 JsonlSpool 的数据结构写成 JSON 文件，
+不必整体载入内存。
+"""
+import os
+import sys
+import json
+import sqlite3
+from array import array
+from collections.abc import Mapping
+from typing import Any, Dict, Iterable, Iterator, List, Optional, TextIO
+
+
+def intern_str(value: Any) -> Any:
+    """对字符串执行 intern，非字符串原样返回"""
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def to_jsonable(obj: Any) -> Any:
+    """
+    json.dump 的 default 钩子，将紧凑记录还原为字典
+
+    Args:
+        obj: 无法直接序列化的对象
+
+    Returns:
+        可序列化的对象
+    """
+    if hasattr(obj, 'to_dict'):
+        return obj.to_dict()
+    if isinstance(obj, array):
+        return obj.tolist()
+    if isinstance(obj, JsonlSpool):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+class ChapterTitleTable:
+    """章节标题表：chapter_number -> chapter_title（每章只保存一份）"""
+
+    __slots__ = ('_titles',)
+
+    def __init__(self):
+        self._titles = {}
+
+    def add(self, chapter_num: int, title: str) -> str:
+        """登记章节标题（同一章节号以首次登记为准）"""
+        return self._titles.setdefault(chapter_num, intern_str(title))
+
+    def to_state(self) -> List[list]:
+        """导出为可 JSON 序列化的增量聚合状态（章节号可能不是字符串，按键值对保存）"""
+        return [[chapter_num, title] for chapter_num, title in self._titles.items()]
+
+    @classmethod
+    def from_state(cls, pairs: List[list]) -> 'ChapterTitleTable':
+        """由 to_state 的结果重建标题表"""
+        table = cls()
+        for chapter_num, title in pairs:
+            table.add(chapter_num, title)
+        return table
+
+    def merge(self, other: 'ChapterTitleTable'):
+        """合并另一张标题表（已登记的章节号保持不变）"""
+        for chapter_num, title in other._titles.items():
+            self._titles.setdefault(chapter_num, title)
+
+    def get(self, chapter_num: int) -> str:
+        """获取章节标题"""
+        title = self._titles.get(chapter_num)
+        return title if title is not None else f'第{chapter_num}章'
+
+    def __len__(self) -> int:
+        return len(self._titles)
+
+
+class _CompactRecord(Mapping):
+    """紧凑记录基类：按旧版字典结构提供只读 Mapping 访问"""
+
+    __slots__ = ()
+
+    # 旧版字典的键顺序（子类覆盖）
+    FIELDS = ()
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        return getattr(self, '_get_' + key)()
+
+    def __iter__(self):
+        return iter(self.FIELDS)
+
+    def __len__(self) -> int:
+        return len(self.FIELDS)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """还原为与旧版完全一致的字典"""
+        return {key: self[key] for key in self.FIELDS}
+
+
+class _AppearanceMixin:
+    """出场章节相关的公共实现（依赖 chapters / first_flags / titles 槽位）"""
+
+    __slots__ = ()
+
+    def add_appearance(self, chapter_num: int, is_first: Any):
+        """记录一次出场，并维护最早出场章节"""
+        self.chapters.append(chapter_num)
+        self.first_flags.append(1 if is_first is True or is_first in ('true', 'True', 1) else 0)
+        if chapter_num < self.first_chapter:
+            self.first_chapter = chapter_num
+
+    def _merge_appearances(self, other):
+        """合并另一条记录的出场章节（other 的章节在 self 之后）"""
+        self.chapters.extend(other.chapters)
+        self.first_flags.extend(other.first_flags)
+        if other.first_chapter < self.first_chapter:
+            self.first_chapter = other.first_chapter
+
+    def _get_first_appearance_chapter(self) -> int:
+        return self.first_chapter
+
+    def _get_first_appearance_title(self) -> str:
+        return self.titles.get(self.first_chapter)
+
+    def _get_appearance_chapters(self) -> List[Dict]:
+        return [
+            {
+                'chapter_number': num,
+                'chapter_title': self.titles.get(num),
+                'is_first_appearance': bool(flag)
+            }
+            for num, flag in zip(self.chapters, self.first_flags)
+        ]
+
+
+class CharacterRecord(_AppearanceMixin, _CompactRecord):
+    """角色聚合记录"""
+
+    __slots__ = ('name', 'role', 'first_chapter', 'chapters', 'first_flags',
+                 'status_changes', 'relationships', 'appearance_traits',
+                 'personality_traits', 'titles')
+
+    FIELDS = ('name', 'role', 'first_appearance_chapter', 'first_appearance_title',
+              'appearance_chapters', 'status_changes', 'relationships',
+              'appearance_traits', 'personality_traits', 'total_appearances')
+
+    def __init__(self, name: str, role: Any, first_chapter: int, titles: ChapterTitleTable):
+        self.name = intern_str(name)
+        self.role = intern_str(role)
+        self.first_chapter = first_chapter
+        self.chapters = array('i')
+        self.first_flags = bytearray()
+        self.status_changes = []       # [(chapter, change)]
+        self.relationships = []        # [(chapter, ((key, value), ...))]
+        self.appearance_traits = {}    # 有序去重：trait -> None
+        self.personality_traits = {}
+        self.titles = titles
+
+    def add_status_change(self, chapter_num: int, change: Any):
+        # 落盘的明细不驻留内存，不必 intern（intern 表只增不减）
+        if isinstance(self.status_changes, SpilledList):
+            self.status_changes.append((chapter_num, change))
+        else:
+            self.status_changes.append((chapter_num, intern_str(change)))
+
+    def add_relationship(self, chapter_num: int, rel: Dict):
+        if isinstance(self.relationships, SpilledList):
+            self.relationships.append((chapter_num, tuple(rel.items())))
+        else:
+            self.relationships.append(
+                (chapter_num, tuple((intern_str(k), intern_str(v)) for k, v in rel.items()))
+            )
+
+    def add_traits(self, appearance: Iterable, personality: Iterable):
+        for trait in appearance:
+            if trait:
+                self.appearance_traits.setdefault(intern_str(trait), None)
+        for trait in personality:
+            if trait:
+                self.personality_traits.setdefault(intern_str(trait), None)
+
+    def to_state(self) -> list:
+        """导出为可 JSON 序列化的增量聚合状态（与 from_state 对应）"""
+        return [self.name, self.role, self.first_chapter, self.chapters.tolist(), list(self.first_flags),
+                self.status_changes, self.relationships,
+                list(self.appearance_traits), list(self.personality_traits)]
+
+    @classmethod
+    def from_state(cls, values: list, titles: ChapterTitleTable) -> 'CharacterRecord':
+        """由 to_state 的结果重建记录"""
+        name, role, first_chapter, chapters, flags, status_changes, relationships, \
+            appearance, personality = values
+        record = cls(name, role, first_chapter, titles)
+        record.chapters.extend(chapters)
+        record.first_flags.extend(flags)
+        for chapter_num, change in status_changes:
+            record.add_status_change(chapter_num, change)
+        for chapter_num, items in relationships:
+            record.add_relationship(chapter_num, dict(items))
+        record.add_traits(appearance, personality)
+        return record
+
+    def merge(self, other: 'CharacterRecord'):
+        """合并同名角色在后续章节中的记录（角色定位以先出现者为准）"""
+        self._merge_appearances(other)
+        self.status_changes.extend(other.status_changes)
+        self.relationships.extend(other.relationships)
+        for trait in other.appearance_traits:
+            self.appearance_traits.setdefault(trait, None)
+        for trait in other.personality_traits:
+            self.personality_traits.setdefault(trait, None)
+
+    @property
+    def total_appearances(self) -> int:
+        return len(self.chapters)
+
+    def _get_name(self):
+        return self.name
+
+    def _get_role(self):
+        return self.role
+
+    def _get_status_changes(self) -> List[Dict]:
+        return [{'chapter': num, 'change': change} for num, change in self.status_changes]
+
+    def _get_relationships(self) -> List[Dict]:
+        return [{'chapter': num, **dict(items)} for num, items in self.relationships]
+
+    def _get_appearance_traits(self) -> List:
+        return list(self.appearance_traits)
+
+    def _get_personality_traits(self) -> List:
+        return list(self.personality_traits)
+
+    def _get_total_appearances(self) -> int:
+        return len(self.chapters)
+
+
+class LocationRecord(_AppearanceMixin, _CompactRecord):
+    """地点聚合记录"""
+
+    __slots__ = ('name', 'type', 'first_chapter', 'chapters', 'first_flags',
+                 'descriptions', 'titles')
+
+    FIELDS = ('name', 'type', 'first_appearance_chapter', 'first_appearance_title',
+              'appearance_chapters', 'descriptions')
+
+    def __init__(self, name: str, loc_type: Any, first_chapter: int, titles: ChapterTitleTable):
+        self.name = intern_str(name)
+        self.type = intern_str(loc_type)
+        self.first_chapter = first_chapter
+        self.chapters = array('i')
+        self.first_flags = bytearray()
+        self.descriptions = []         # [(chapter, description)]
+        self.titles = titles
+
+    def add_description(self, chapter_num: int, description: Any):
+        self.descriptions.append((chapter_num, description))
+
+    def to_state(self) -> list:
+        """导出为可 JSON 序列化的增量聚合状态（与 from_state 对应）"""
+        return [self.name, self.type, self.first_chapter, self.chapters.tolist(), list(self.first_flags),
+                self.descriptions]
+
+    @classmethod
+    def from_state(cls, values: list, titles: ChapterTitleTable) -> 'LocationRecord':
+        """由 to_state 的结果重建记录"""
+        name, loc_type, first_chapter, chapters, flags, descriptions = values
+        record = cls(name, loc_type, first_chapter, titles)
+        record.chapters.extend(chapters)
+        record.first_flags.extend(flags)
+        for chapter_num, description in descriptions:
+            record.add_description(chapter_num, description)
+        return record
+
+    def merge(self, other: 'LocationRecord'):
+        """合并同名地点在后续章节中的记录（地点类型以先出现者为准）"""
+        self._merge_appearances(other)
+        self.descriptions.extend(other.descriptions)
+
+    @property
+    def total_appearances(self) -> int:
+        return len(self.chapters)
+
+    def _get_name(self):
+        return self.name
+
+    def _get_type(self):
+        return self.type
+
+    def _get_descriptions(self) -> List[Dict]:
+        return [{'chapter': num, 'description': desc} for num, desc in self.descriptions]
+
+
+class EventRecord(_CompactRecord):
+    """事件聚合记录"""
+
+    __slots__ = ('chapter', 'type', 'description', 'importance',
+                 'emotional_tone', 'participants', 'titles')
+
+    FIELDS = ('chapter_number', 'chapter_title', 'type', 'description',
+              'importance', 'emotional_tone', 'participants')
+
+    def __init__(self, chapter_num: int, event: Dict, titles: ChapterTitleTable):
+        participants = event.get('participants', [])
+        self.chapter = chapter_num
+        self.type = intern_str(event.get('type', 'unknown'))
+        self.description = event.get('description', '')
+        self.importance = intern_str(event.get('importance', 'medium'))
+        self.emotional_tone = intern_str(event.get('emotional_tone', ''))
+        self.participants = (
+            tuple(intern_str(p) for p in participants)
+            if isinstance(participants, list) else participants
+        )
+        self.titles = titles
+
+    def to_state(self) -> list:
+        """导出为可 JSON 序列化的增量聚合状态（与 from_state 对应）"""
+        return [self.chapter, self.type, self.description, self.importance,
+                self.emotional_tone, self.participants]
+
+    @classmethod
+    def from_state(cls, values: list, titles: ChapterTitleTable) -> 'EventRecord':
+        """由 to_state 的结果重建记录（参与者列表在记录中以元组保存）"""
+        chapter_num, event_type, description, importance, emotional_tone, participants = values
+        return cls(chapter_num, {
+            'type': event_type,
+            'description': description,
+            'importance': importance,
+            'emotional_tone': emotional_tone,
+            'participants': participants
+        }, titles)
+
+    def _get_chapter_number(self) -> int:
+        return self.chapter
+
+    def _get_chapter_title(self) -> str:
+        return self.titles.get(self.chapter)
+
+    def _get_type(self):
+        return self.type
+
+    def _get_description(self):
+        return self.description
+
+    def _get_importance(self):
+        return self.importance
+
+    def _get_emotional_tone(self):
+        return self.emotional_tone
+
+    def _get_participants(self):
+        if isinstance(self.participants, tuple):
+            return list(self.participants)
+        return self.participants
+
+
+def materialize(records: Optional[Iterable]) -> List[Dict]:
+    """
+    将记录列表还原为字典列表（已是字典的元素原样保留）
+
+    Args:
+        records: 记录列表
+
+    Returns:
+        字典列表
+    """
+    return [r.to_dict() if isinstance(r, _CompactRecord) else r for r in (records or [])]
+
+
+class JsonlSpool:
+    """落盘列表：只支持追加和顺序遍历，元素逐行写入 JSONL 文件（读回时为字典）"""
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: 临时文件路径（已存在时覆盖）
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._file = open(path, 'w', encoding='utf-8')
+        self._count = 0
+
+    def append(self, item: Any):
+        self._file.write(json.dumps(item, ensure_ascii=False, default=to_jsonable) + '\n')
+        self._count += 1
+
+    def extend(self, items: Iterable):
+        for item in items:
+            self.append(item)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __iter__(self) -> Iterator[Any]:
+        if not self._file.closed:
+            self._file.flush()
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                yield json.loads(line)
+
+    def close(self):
+        """关闭写入句柄（之后仍可遍历）"""
+        if not self._file.closed:
+            self._file.close()
+
+
+class HistoryStore:
+    """逐章明细的落盘存储：按 (类别, 名称) 追加和读取 (章节号, 值)"""
+
+    BATCH_SIZE = 2000
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: SQLite 文件路径（已存在时覆盖）
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if os.path.exists(path):
+            os.remove(path)
+        self.path = path
+        self._conn = sqlite3.connect(path)
+        self._conn.execute('PRAGMA journal_mode=OFF')
+        self._conn.execute('PRAGMA synchronous=OFF')
+        self._conn.execute('CREATE TABLE history (kind TEXT, name TEXT, chapter INTEGER, value TEXT)')
+        self._conn.execute('CREATE INDEX history_key ON history (kind, name)')
+        self._conn.execute('CREATE TABLE titles (chapter INTEGER PRIMARY KEY, title TEXT)')
+        self._pending = []
+        self._pending_titles = []
+
+    def add(self, kind: str, name: str, chapter: int, value: Any):
+        self._pending.append((kind, name, chapter, json.dumps(value, ensure_ascii=False)))
+        if len(self._pending) >= self.BATCH_SIZE:
+            self.flush()
+
+    def get(self, kind: str, name: str) -> List[tuple]:
+        """读取某条记录的全部明细（按追加顺序）"""
+        self.flush()
+        rows = self._conn.execute(
+            'SELECT chapter, value FROM history WHERE kind = ? AND name = ? ORDER BY rowid', (kind, name))
+        return [(chapter, json.loads(value)) for chapter, value in rows]
+
+    def add_title(self, chapter: int, title: str):
+        """登记章节标题（同一章节号以首次登记为准）"""
+        self._pending_titles.append((chapter, title))
+        if len(self._pending_titles) >= self.BATCH_SIZE:
+            self.flush()
+
+    def get_title(self, chapter: int) -> Optional[str]:
+        self.flush()
+        row = self._conn.execute('SELECT title FROM titles WHERE chapter = ?', (chapter,)).fetchone()
+        return row[0] if row else None
+
+    def count_titles(self) -> int:
+        self.flush()
+        return self._conn.execute('SELECT COUNT(*) FROM titles').fetchone()[0]
+
+    def flush(self):
+        if self._pending:
+            self._conn.executemany('INSERT INTO history VALUES (?, ?, ?, ?)', self._pending)
+            self._pending = []
+        if self._pending_titles:
+            self._conn.executemany('INSERT OR IGNORE INTO titles VALUES (?, ?)', self._pending_titles)
+            self._pending_titles = []
+
+    def close(self):
+        self._conn.close()
+
+
+class SpilledTitleTable(ChapterTitleTable):
+    """章节标题表的落盘版本（流式聚合用）：标题写入 HistoryStore，查询时读取"""
+
+    __slots__ = ('store', '_last')
+
+    def __init__(self, store: HistoryStore):
+        super().__init__()
+        self.store = store
+        self._last = None
+
+    def add(self, chapter_num: int, title: str) -> str:
+        # 同一章节的角色/地点/事件连续登记，只写入一次
+        if chapter_num != self._last:
+            self._last = chapter_num
+            self.store.add_title(chapter_num, title)
+        return title
+
+    def get(self, chapter_num: int) -> str:
+        title = self.store.get_title(chapter_num)
+        return title if title is not None else f'第{chapter_num}章'
+
+    def __len__(self) -> int:
+        return self.store.count_titles()
+
+
+class SpilledList:
+    """记录明细列表的落盘替身：append 写入 HistoryStore，遍历时读回"""
+
+    __slots__ = ('store', 'kind', 'name', '_count')
+
+    def __init__(self, store: HistoryStore, kind: str, name: str):
+        self.store = store
+        self.kind = kind
+        self.name = name
+        self._count = 0
+
+    def append(self, item: tuple):
+        chapter, value = item
+        self.store.add(self.kind, self.name, chapter, value)
+        self._count += 1
+
+    def extend(self, items: Iterable[tuple]):
+        for item in items:
+            self.append(item)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __iter__(self):
+        return iter(self.store.get(self.kind, self.name) if self._count else [])
+
+
+def _contains_spool(obj: Any) -> bool:
+    if isinstance(obj, JsonlSpool):
+        return True
+    return isinstance(obj, dict) and any(_contains_spool(v) for v in obj.values())
+
+
+def dump_json(obj: Any, f: TextIO, indent: int = 2, level: int = 0):
+    """
+    json.dump 的流式版本：JsonlSpool 逐条写出，其余部分与 json.dump(indent=...) 输出一致
+
+    Args:
+        obj: 要序列化的数据
+        f: 文本文件对象
+        indent: 缩进空格数
+        level: 当前嵌套层级（递归用）
+    """
+    pad = ' ' * (indent * level)
+    inner = ' ' * (indent * (level + 1))
+    if isinstance(obj, JsonlSpool):
+        f.write('[')
+        first = True
+        for item in obj:
+            text = json.dumps(item, ensure_ascii=False, indent=indent, default=to_jsonable)
+            f.write(('\n' if first else ',\n') + inner + text.replace('\n', '\n' + inner))
+            first = False
+        f.write(']' if first else '\n' + pad + ']')
+    elif isinstance(obj, dict) and _contains_spool(obj):
+        f.write('{')
+        for i, (key, value) in enumerate(obj.items()):
+            f.write((',\n' if i else '\n') + inner + json.dumps(str(key), ensure_ascii=False) + ': ')
+            dump_json(value, f, indent, level + 1)
+        f.write('\n' + pad + '}')
+    else:
+        # 分段编码写出（与 json.dump 相同，不拼接整个字符串）
+        encoder = json.JSONEncoder(ensure_ascii=False, indent=indent, default=to_jsonable)
+        for chunk in encoder.iterencode(obj):
+            f.write(chunk.replace('\n', '\n' + pad) if pad else chunk)
@@ -0,0 +1,338 @@
+"""
+角色关系图引擎 - 基于 NumPy 的角色共现与关系演变分析
+
+由聚合角色数据构建 角色×章节 出场矩阵，用矩阵运算一次性计算所有角色两两之间的
+共现次数与共现强度（余弦归一化），结合 relationships[].chapter 生成关系时间线，
+并以幂迭代计算特征向量中心度。结果可压缩导出给 LLM 提示词和 indexes 层。
+"""
+from typing import Dict, List, Any, Optional, Tuple
+from collections import defaultdict
+import numpy as np
+
+
+class CharacterGraph:
+    """角色共现关系图"""
+
+    VERSION = 1
+
+    def __init__(self, names: List[str], roles: List[str], first_chapters: np.ndarray,
+                 chapter_numbers: np.ndarray, appearance: np.ndarray,
+                 relations: Dict[Tuple[str, str], List[Dict]]):
+        """
+        初始化关系图（一般通过 CharacterGraph.build 构建）
+
+        Args:
+            names: 角色名（按出场次数降序）
+            roles: 角色定位
+            first_chapters: 首次出场章节
+            chapter_numbers: 出场矩阵各列对应的章节号（升序）
+            appearance: 角色×章节 出场矩阵（bool）
+            relations: {(角色A, 角色B): 关系时间线}，A < B
+        """
+        self.names = names
+        self.roles = roles
+        self.first_chapters = first_chapters
+        self.chapter_numbers = chapter_numbers
+        self.appearance = appearance
+        self.relations = relations
+        self.name_to_idx = {name: i for i, name in enumerate(names)}
+
+        matrix = appearance.astype(np.float32)
+        self.appearances = appearance.sum(axis=1).astype(np.int64)
+
+        # 共现次数：A·Aᵀ（对角线为自身出场次数）
+        self.cooccurrence = (matrix @ matrix.T).astype(np.int64)
+        np.fill_diagonal(self.cooccurrence, 0)
+
+        # 共现强度：余弦归一化 c_ij / sqrt(n_i · n_j)
+        norms = np.sqrt(np.maximum(self.appearances, 1).astype(np.float64))
+        self.strength = self.cooccurrence / np.outer(norms, norms)
+
+        self.degree = self._degree_centrality()
+        self.centrality = self._eigenvector_centrality()
+
+    # ========== 构建 ==========
+
+    @classmethod
+    def build(cls, characters: List[Any], min_appearances: int = 1,
+              max_nodes: int = 2000) -> 'CharacterGraph':
+        """
+        由聚合角色列表构建关系图
+
+        Args:
+            characters: aggregate_characters 的结果（字典或 CharacterRecord）
+            min_appearances: 参与建图的最少出场次数
+            max_nodes: 最多保留的角色数（按出场次数取前N个）
+
+        Returns:
+            角色关系图
+        """
+        chapter_lists = [np.asarray(cls._appearance_numbers(c), dtype=np.int64) for c in characters]
+        counts = np.array([len(np.unique(chs)) for chs in chapter_lists], dtype=np.int64)
+
+        # 按出场次数降序（同次数按首次出场）筛选节点
+        firsts = np.array([c.get('first_appearance_chapter', 0) or 0 for c in characters], dtype=np.int64)
+        order = np.lexsort((firsts, -counts)) if len(characters) else np.array([], dtype=np.int64)
+        order = order[counts[order] >= min_appearances][:max_nodes]
+
+        names = [characters[i]['name'] for i in order]
+        roles = [characters[i].get('role', 'unknown') for i in order]
+        chapter_lists = [chapter_lists[i] for i in order]
+
+        # 出场矩阵：行=角色，列=出现过的章节
+        if chapter_lists:
+            chapter_numbers = np.unique(np.concatenate(chapter_lists))
+        else:
+            chapter_numbers = np.array([], dtype=np.int64)
+        appearance = np.zeros((len(names), len(chapter_numbers)), dtype=bool)
+        if len(names) and len(chapter_numbers):
+            rows = np.repeat(np.arange(len(names)), [len(chs) for chs in chapter_lists])
+            cols = np.searchsorted(chapter_numbers, np.concatenate(chapter_lists))
+            appearance[rows, cols] = True
+
+        relations = cls._collect_relations([characters[i] for i in order], set(names))
+
+        return cls(names, roles, firsts[order], chapter_numbers, appearance, relations)
+
+    @staticmethod
+    def _appearance_numbers(char: Any) -> List[int]:
+        """获取出场章节号（紧凑记录直接读取章节号数组）"""
+        if hasattr(char, 'chapters'):
+            return char.chapters.tolist()
+        return [c['chapter_number'] for c in char.get('appearance_chapters', [])]
+
+    @staticmethod
+    def _collect_relations(characters: List[Any], known: set) -> Dict[Tuple[str, str], List[Dict]]:
+        """
+        收集关系时间线（双方都在图中的关系，按章节排序）
+
+        Returns:
+            {(角色A, 角色B): [{'chapter', 'from', 'relation_type', 'description'}]}
+        """
+        relations = defaultdict(list)
+        for char in characters:
+            source = char['name']
+            for rel in char.get('relationships', []):
+                if not isinstance(rel, dict):
+                    continue
+                target = rel.get('target') or rel.get('with')
+                if not target or target == source or target not in known:
+                    continue
+                pair = (source, target) if source < target else (target, source)
+                relations[pair].append({
+                    'chapter': rel.get('chapter'),
+                    'from': source,
+                    'relation_type': rel.get('relation_type', ''),
+                    'description': rel.get('description', '')
+                })
+
+        for timeline in relations.values():
+            timeline.sort(key=lambda r: r['chapter'] if isinstance(r['chapter'], int) else 0)
+        return dict(relations)
+
+    # ========== 图指标 ==========
+
+    def _degree_centrality(self) -> np.ndarray:
+        """加权度中心度（共现强度之和，归一化到[0,1]）"""
+        if len(self.names) < 2:
+            return np.zeros(len(self.names))
+        degree = self.strength.sum(axis=1)
+        peak = degree.max()
+        return degree / peak if peak > 0 else degree
+
+    def _eigenvector_centrality(self, max_iter: int = 100, tol: float = 1e-8) -> np.ndarray:
+        """特征向量中心度（对共现强度矩阵做幂迭代，归一化到[0,1]）"""
+        n = len(self.names)
+        if n < 2 or not self.strength.any():
+            return np.zeros(n)
+
+        # 加单位阵保证收敛（不改变特征向量）
+        matrix = self.strength + np.eye(n)
+        x = np.full(n, 1.0 / n)
+        for _ in range(max_iter):
+            nxt = matrix @ x
+            nxt /= np.linalg.norm(nxt)
+            if np.abs(nxt - x).sum() < tol:
+                x = nxt
+                break
+            x = nxt
+        peak = x.max()
+        return x / peak if peak > 0 else x
+
+    # ========== 查询 ==========
+
+    def ranked_indices(self, top_n: Optional[int] = None) -> np.ndarray:
+        """按特征向量中心度降序的角色下标"""
+        order = np.lexsort((-self.appearances, -self.centrality))
+        return order[:top_n] if top_n else order
+
+    def top_edges(self, max_edges: int = 100, min_cooccurrence: int = 2,
+                  nodes: Optional[np.ndarray] = None) -> List[Dict[str, Any]]:
+        """
+        获取共现强度最高的边
+
+        Args:
+            max_edges: 最多返回的边数
+            min_cooccurrence: 最少共现章节数
+            nodes: 限定在这些角色下标之间（默认全部）
+
+        Returns:
+            边列表
+        """
+        if nodes is None:
+            nodes = np.arange(len(self.names))
+        if len(nodes) < 2:
+            return []
+
+        sub_counts = self.cooccurrence[np.ix_(nodes, nodes)]
+        sub_strength = self.strength[np.ix_(nodes, nodes)]
+        rows, cols = np.triu_indices(len(nodes), k=1)
+        mask = sub_counts[rows, cols] >= min_cooccurrence
+        rows, cols = rows[mask], cols[mask]
+
+        weights = sub_strength[rows, cols]
+        top = np.argsort(-weights, kind='stable')[:max_edges]
+
+        edges = []
+        for k in top:
+            i, j = int(nodes[rows[k]]), int(nodes[cols[k]])
+            shared = np.flatnonzero(self.appearance[i] & self.appearance[j])
+            a, b = self.names[i], self.names[j]
+            pair = (a, b) if a < b else (b, a)
+            timeline = self.relations.get(pair, [])
+            edges.append({
+                'source': a,
+                'target': b,
+                'cooccurrence': int(self.cooccurrence[i, j]),
+                'strength': round(float(self.strength[i, j]), 4),
+                'first_chapter': int(self.chapter_numbers[shared[0]]),
+                'last_chapter': int(self.chapter_numbers[shared[-1]]),
+                'relation_types': self._relation_types(timeline)
+            })
+        return edges
+
+    def relationship_timelines(self, names: Optional[set] = None,
+                               max_events: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        获取关系演变时间线
+
+        Args:
+            names: 只保留双方都在该集合中的关系（默认全部）
+            max_events: 每条时间线最多保留的记录数（保留关系类型变化点）
+
+        Returns:
+            时间线列表（按记录数降序）
+        """
+        timelines = []
+        for (a, b), timeline in self.relations.items():
+            if names is not None and (a not in names or b not in names):
+                continue
+            changes = self._relation_changes(timeline)
+            if max_events:
+                changes = changes[:max_events]
+            timelines.append({
+                'pair': [a, b],
+                'records': len(timeline),
+                'evolution': changes
+            })
+        timelines.sort(key=lambda t: (-t['records'], t['pair']))
+        return timelines
+
+    @staticmethod
+    def _relation_types(timeline: List[Dict]) -> List[str]:
+        """关系类型（按首次出现顺序去重）"""
+        return list(dict.fromkeys(r['relation_type'] for r in timeline if r['relation_type']))
+
+    @staticmethod
+    def _relation_changes(timeline: List[Dict]) -> List[Dict]:
+        """只保留关系类型发生变化的记录"""
+        changes = []
+        last_type = None
+        for rel in timeline:
+            if rel['relation_type'] != last_type:
+                changes.append({
+                    'chapter': rel['chapter'],
+                    'relation_type': rel['relation_type'],
+                    'description': (rel['description'] or '')[:50]
+                })
+                last_type = rel['relation_type']
+        return changes
+
+    # ========== 导出 ==========
+
+    def _node(self, i: int) -> Dict[str, Any]:
+        """单个节点的导出数据"""
+        return {
+            'name': self.names[i],
+            'role': self.roles[i],
+            'appearances': int(self.appearances[i]),
+            'first_chapter': int(self.first_chapters[i]),
+            'degree': round(float(self.degree[i]), 4),
+            'centrality': round(float(self.centrality[i]), 4)
+        }
+
+    def to_prompt_data(self, top_n: int = 30, max_edges: int = 60,
+                       max_timelines: int = 20) -> Dict[str, Any]:
+        """
+        导出给 LLM 提示词的压缩图（核心角色 + 强关系边 + 关系演变）
+
+        Args:
+            top_n: 保留的核心角色数（按中心度）
+            max_edges: 保留的边数
+            max_timelines: 保留的关系时间线数
+
+        Returns:
+            压缩图数据
+        """
+        nodes = self.ranked_indices(top_n)
+        kept = {self.names[i] for i in nodes}
+        return {
+            'nodes': [self._node(int(i)) for i in nodes],
+            'edges': self.top_edges(max_edges=max_edges, nodes=nodes),
+            'relationship_evolution': self.relationship_timelines(kept, max_events=5)[:max_timelines]
+        }
+
+    def to_index(self, max_edges: int = 2000, min_cooccurrence: int = 2) -> Dict[str, Any]:
+        """
+        导出 indexes 层的关系图索引
+
+        Args:
+            max_edges: 保留的边数
+            min_cooccurrence: 最少共现章节数
+
+        Returns:
+            关系图索引
+        """
+        return {
+            'version': self.VERSION,
+            'total_nodes': len(self.names),
+            'nodes': [self._node(int(i)) for i in self.ranked_indices()],
+            'edges': self.top_edges(max_edges=max_edges, min_cooccurrence=min_cooccurrence),
+            'relationship_timelines': self.relationship_timelines()
+        }
+
+    def neighbors(self, name: str, top_n: int = 10) -> List[Dict[str, Any]]:
+        """
+        获取与某角色共现最强的角色
+
+        Args:
+            name: 角色名
+            top_n: 返回数量
+
+        Returns:
+            [{'name', 'cooccurrence', 'strength'}]
+        """
+        i = self.name_to_idx.get(name)
+        if i is None:
+            return []
+        order = np.argsort(-self.strength[i], kind='stable')
+        result = []
+        for j in order[:top_n + 1]:
+            if j == i or self.cooccurrence[i, j] == 0:
+                continue
+            result.append({
+                'name': self.names[j],
+                'cooccurrence': int(self.cooccurrence[i, j]),
+                'strength': round(float(self.strength[i, j]), 4)
+            })
+        return result[:top_n]
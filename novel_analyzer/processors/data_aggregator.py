@@ -3,35 +3,61 @@
 """
 import json
 import os
+import re
+from array import array
 from pathlib import Path
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Iterator, Callable, Tuple
 from collections import defaultdict
+from .aggregate_records import (
+    ChapterTitleTable, CharacterRecord, LocationRecord, EventRecord,
+    JsonlSpool, HistoryStore, SpilledList, SpilledTitleTable, materialize, to_jsonable
+)
+from .stylometrics import Stylometrics
+from .event_clusters import EventClusterer
 
 
 class DataAggregator:
     """数据聚合器，将章节JSON聚合为分类数据"""
     
-    def __init__(self, chapter_summaries_dir: str):
+    # 增量聚合状态文件版本（状态格式变化时递增，旧状态自动作废；记录类的槽位另行校验）
+    STATE_VERSION = 2
+    STATE_RECORD_CLASSES = (CharacterRecord, LocationRecord, EventRecord)
+    
+    # 顶层章节号（排序时用于快速读取，避免完整解析JSON）
+    CHAPTER_NUMBER_PATTERN = re.compile(r'"chapter_number"\s*:\s*(-?\d+)')
+    
+    def __init__(self, chapter_summaries_dir: str, compact: bool = False,
+                 event_clustering: Optional[Dict] = None):
         """
         初始化聚合器
         
         Args:
             chapter_summaries_dir: 章节摘要JSON文件目录
+            compact: 是否返回紧凑记录（__slots__记录 + 章节标题表），
+                     序列化时需使用 to_jsonable 作为 json default
+            event_clustering: 事件聚类配置（config.yaml 的 event_clustering 段，未启用时保留全部事件）
         """
         self.chapter_dir = Path(chapter_summaries_dir)
         if not self.chapter_dir.exists():
             raise ValueError(f"章节摘要目录不存在: {chapter_summaries_dir}")
+        
+        self.compact = compact
+        self.titles = ChapterTitleTable()
+        self.event_clusterer = EventClusterer.from_settings(event_clustering)
+        self.history = None   # 流式落盘时的明细存储（输出完成后由调用方关闭）
     
-    def load_all_chapters(self) -> List[Dict]:
-        """加载所有章节JSON文件，并按chapter_number排序"""
-        chapters = []
-        # 修改glob模式，排除.backup文件
-        chapter_files = [
+    def _chapter_files(self) -> List[Path]:
+        """获取章节JSON文件列表（排除.backup文件）"""
+        return [
             f for f in self.chapter_dir.glob("*.json")
             if not f.name.endswith('.backup')
         ]
+    
+    def load_all_chapters(self) -> List[Dict]:
+        """加载所有章节JSON文件，并按chapter_number排序"""
+        chapters = []
         
-        for file_path in chapter_files:
+        for file_path in self._chapter_files():
             try:
                 with open(file_path, 'r', encoding='utf-8') as f:
                     chapter_data = json.load(f)
@@ -44,163 +70,267 @@ class DataAggregator:
         
         return chapters
     
-    def aggregate_characters(self, chapters: List[Dict]) -> List[Dict]:
+    def iter_chapters(self) -> Iterator[Dict]:
+        """
+        按chapter_number顺序逐个加载章节（不在内存中保留全部章节）
+        
+        Yields:
+            章节数据
+        """
+        # 只保留文件名和章节号数组（几万个 Path 对象本身就会占用数MB）
+        names = [name for name in os.listdir(self.chapter_dir)
+                 if name.endswith('.json') and not name.startswith('.')]
+        numbers = array('i', (self._peek_chapter_number(self.chapter_dir / name) for name in names))
+        for i in sorted(range(len(names)), key=numbers.__getitem__):
+            file_path = self.chapter_dir / names[i]
+            try:
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    chapter_data = json.load(f)
+            except Exception as e:
+                print(f"⚠️  加载章节文件失败 {file_path.name}: {e}")
+                continue
+            yield chapter_data
+    
+    def _peek_chapter_number(self, file_path: Path) -> int:
+        """
+        读取章节号用于排序（正则匹配，避免完整解析JSON）
+        
+        Args:
+            file_path: 章节JSON文件路径
+            
+        Returns:
+            章节号，读取失败返回0
+        """
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                text = f.read()
+            match = self.CHAPTER_NUMBER_PATTERN.search(text)
+            if match:
+                return int(match.group(1))
+            return json.loads(text).get('chapter_number', 0) or 0
+        except Exception:
+            return 0
+    
+    # ========== 逐章折叠（聚合的最小单元，批量/流式共用） ==========
+    
+    def _register_chapter(self, chapter: Dict) -> int:
+        """登记章节标题，返回章节号"""
+        chapter_num = chapter.get('chapter_number')
+        self.titles.add(chapter_num, chapter.get('chapter_title', f'第{chapter_num}章'))
+        return chapter_num
+    
+    def _fold_characters(self, characters_dict: Dict[str, CharacterRecord], chapter: Dict,
+                         history: Optional[HistoryStore] = None):
+        """将一个章节的角色折叠进角色聚合（history 不为空时状态变化与关系明细落盘）"""
+        chapter_num = self._register_chapter(chapter)
+        
+        for char in chapter.get('characters', []):
+            name = char.get('name')
+            if not name:
+                continue
+            
+            record = characters_dict.get(name)
+            if record is None:
+                record = CharacterRecord(name, char.get('role', 'unknown'), chapter_num, self.titles)
+                if history is not None:
+                    record.status_changes = SpilledList(history, 'status', name)
+                    record.relationships = SpilledList(history, 'relation', name)
+                characters_dict[name] = record
+            
+            # 记录出现章节（同时维护最小的首次出现章节）
+            record.add_appearance(chapter_num, char.get('first_appearance', False))
+            
+            # 聚合状态变化
+            for status in char.get('status_changes', []):
+                if status:
+                    record.add_status_change(chapter_num, status)
+            
+            # 聚合关系
+            for rel in char.get('relationships', []):
+                if rel and isinstance(rel, dict):
+                    record.add_relationship(chapter_num, rel)
+            
+            # 聚合特征（有序去重）
+            record.add_traits(char.get('appearance_traits', []), char.get('personality_traits', []))
+    
+    def _finish_characters(self, characters_dict: Dict[str, CharacterRecord]) -> List[Any]:
+        """角色聚合收尾：按出场次数排序"""
+        characters_list = list(characters_dict.values())
+        characters_list.sort(key=lambda x: x.total_appearances, reverse=True)
+        return characters_list if self.compact else materialize(characters_list)
+    
+    def _fold_locations(self, locations_dict: Dict[str, LocationRecord], chapter: Dict,
+                        history: Optional[HistoryStore] = None):
+        """将一个章节的地点折叠进地点聚合（history 不为空时描述明细落盘）"""
+        chapter_num = self._register_chapter(chapter)
+        
+        for loc in chapter.get('locations', []):
+            name = loc.get('name')
+            if not name:
+                continue
+            
+            record = locations_dict.get(name)
+            if record is None:
+                record = LocationRecord(name, loc.get('type', 'unknown'), chapter_num, self.titles)
+                if history is not None:
+                    record.descriptions = SpilledList(history, 'description', name)
+                locations_dict[name] = record
+            
+            record.add_appearance(chapter_num, loc.get('first_appearance', False))
+            
+            desc = loc.get('description')
+            if desc:
+                record.add_description(chapter_num, desc)
+    
+    def _finish_locations(self, locations_dict: Dict[str, LocationRecord]) -> List[Any]:
+        """地点聚合收尾：按出场次数排序"""
+        locations_list = list(locations_dict.values())
+        locations_list.sort(key=lambda x: x.total_appearances, reverse=True)
+        return locations_list if self.compact else materialize(locations_list)
+    
+    def _fold_events(self, events_list: List[EventRecord], chapter: Dict) -> List[EventRecord]:
+        """将一个章节的事件追加到事件列表，返回本章新增的事件"""
+        chapter_num = self._register_chapter(chapter)
+        new_events = [EventRecord(chapter_num, event, self.titles) for event in chapter.get('events', [])]
+        events_list.extend(new_events)
+        return new_events
+    
+    def _finish_events(self, events_list: List[EventRecord]) -> List[Any]:
+        """事件聚合收尾：启用事件聚类时合并跨章节重复的事件"""
+        if self.event_clusterer:
+            # 聚类需要全部事件（落盘的事件在此读回内存）
+            events_list = self.event_clusterer.cluster(list(events_list))
+        elif isinstance(events_list, JsonlSpool):
+            return events_list
+        return events_list if self.compact else materialize(events_list)
+    
+    def _fold_world_elements(self, world_elements: Dict[str, List[Dict]],
+                             element_index: Dict[tuple, Dict], chapter: Dict):
+        """将一个章节的世界观元素折叠进聚合（保留最早出现章节）"""
+        chapter_num = chapter.get('chapter_number')
+        
+        for element in chapter.get('world_elements', []):
+            if not isinstance(element, dict):
+                continue
+            elem_type = element.get('type', 'unknown')
+            elem_name = element.get('element', '')
+            
+            # 基于类型和名称的唯一key
+            key = (elem_type, elem_name)
+            
+            existing = element_index.get(key)
+            if existing is None:
+                elem = {
+                    'element': elem_name,
+                    'details': element.get('details', ''),
+                    'first_mentioned_chapter': chapter_num
+                }
+                element_index[key] = elem
+                world_elements[elem_type].append(elem)
+            elif chapter_num < existing['first_mentioned_chapter']:
+                # 如果当前章节更早，更新首次出现章节
+                existing['first_mentioned_chapter'] = chapter_num
+    
+    def _fold_writing_style(self, style_counters: Dict[str, Any], chapter: Dict):
+        """将一个章节的写作风格折叠进统计"""
+        chapter_num = chapter.get('chapter_number')
+        style = chapter.get('writing_style_notes') or {}
+        
+        # 统计叙事视角
+        perspective = style.get('narrative_perspective', 'unknown')
+        style_counters['narrative_perspectives'][perspective] += 1
+        
+        # 收集关键短语
+        for phrase in style.get('key_phrases', []):
+            style_counters['key_phrases'].append({
+                'chapter': chapter_num,
+                'phrase': phrase
+            })
+        
+        # 统计情感强度
+        intensity = style.get('emotional_intensity', 'unknown')
+        style_counters['emotional_intensities'][intensity] += 1
+        
+        # 统计描写重点
+        for focus in style.get('description_focus', []):
+            style_counters['description_focuses'][focus] += 1
+        
+        # 本地文体统计指标（单章分析时计算）
+        metrics = chapter.get('stylometrics')
+        if isinstance(metrics, dict):
+            style_counters['stylometrics'].append(dict(metrics, chapter=chapter_num))
+    
+    def _new_style_counters(self) -> Dict[str, Any]:
+        """创建空的写作风格统计"""
+        return {
+            'narrative_perspectives': defaultdict(int),
+            'key_phrases': [],
+            'emotional_intensities': defaultdict(int),
+            'description_focuses': defaultdict(int),
+            'stylometrics': []
+        }
+    
+    def _finish_writing_style(self, style_counters: Dict[str, Any]) -> Dict[str, Any]:
+        """写作风格收尾：计数器转为普通字典"""
+        return {
+            'narrative_perspectives': dict(style_counters['narrative_perspectives']),
+            'key_phrases': style_counters['key_phrases'],
+            'emotional_intensities': dict(style_counters['emotional_intensities']),
+            'description_focuses': dict(style_counters['description_focuses']),
+            'stylometrics': Stylometrics.summarize(style_counters['stylometrics'])
+        }
+    
+    def _plot_arc(self, chapter: Dict) -> Dict:
+        """由章节摘要生成情节线索条目"""
+        summary = chapter.get('chapter_summary', {})
+        
+        return {
+            'chapter_number': chapter.get('chapter_number'),
+            'chapter_title': summary.get('title', chapter.get('chapter_title', '')),
+            'main_content': summary.get('main_content', ''),
+            'key_points': summary.get('key_points', []),
+            'chapter_purpose': summary.get('chapter_purpose', ''),
+            'word_count': chapter.get('word_count', 0)
+        }
+    
+    # ========== 批量聚合 ==========
+    
+    def aggregate_characters(self, chapters: List[Dict]) -> List[Any]:
         """
         聚合角色数据
         
         Returns:
             角色列表，每个角色包含所有出现章节的信息
+            （compact模式下为 CharacterRecord，否则为字典）
         """
         characters_dict = {}
-        
         for chapter in chapters:
-            chapter_num = chapter.get('chapter_number')
-            chapter_title = chapter.get('chapter_title', f'第{chapter_num}章')
-            
-            for char in chapter.get('characters', []):
-                name = char.get('name')
-                if not name:
-                    continue
-                
-                if name not in characters_dict:
-                    characters_dict[name] = {
-                        'name': name,
-                        'role': char.get('role', 'unknown'),
-                        'first_appearance_chapter': chapter_num,
-                        'first_appearance_title': chapter_title,
-                        'appearance_chapters': [],
-                        'status_changes': [],
-                        'relationships': [],
-                        'appearance_traits': set(),
-                        'personality_traits': set()
-                    }
-                else:
-                    # 更新首次出现章节（取最小的chapter_number）
-                    if chapter_num < characters_dict[name]['first_appearance_chapter']:
-                        characters_dict[name]['first_appearance_chapter'] = chapter_num
-                        characters_dict[name]['first_appearance_title'] = chapter_title
-                
-                # 记录出现章节
-                characters_dict[name]['appearance_chapters'].append({
-                    'chapter_number': chapter_num,
-                    'chapter_title': chapter_title,
-                    'is_first_appearance': char.get('first_appearance', False)
-                })
-                
-                # 聚合状态变化
-                for status in char.get('status_changes', []):
-                    if status:
-                        characters_dict[name]['status_changes'].append({
-                            'chapter': chapter_num,
-                            'change': status
-                        })
-                
-                # 聚合关系
-                for rel in char.get('relationships', []):
-                    if rel:
-                        characters_dict[name]['relationships'].append({
-                            'chapter': chapter_num,
-                            **rel
-                        })
-                
-                # 聚合特征
-                for trait in char.get('appearance_traits', []):
-                    if trait:
-                        characters_dict[name]['appearance_traits'].add(trait)
-                
-                for trait in char.get('personality_traits', []):
-                    if trait:
-                        characters_dict[name]['personality_traits'].add(trait)
-        
-        # 转换set为list
-        characters_list = []
-        for char_data in characters_dict.values():
-            char_data['appearance_traits'] = list(char_data['appearance_traits'])
-            char_data['personality_traits'] = list(char_data['personality_traits'])
-            char_data['total_appearances'] = len(char_data['appearance_chapters'])
-            characters_list.append(char_data)
-        
-        # 按出场次数排序
-        characters_list.sort(key=lambda x: x['total_appearances'], reverse=True)
-        
-        return characters_list
-    
-    def aggregate_locations(self, chapters: List[Dict]) -> List[Dict]:
+            self._fold_characters(characters_dict, chapter)
+        return self._finish_characters(characters_dict)
+    
+    def aggregate_locations(self, chapters: List[Dict]) -> List[Any]:
         """
         聚合地点数据
         
         Returns:
-            地点列表
+            地点列表（compact模式下为 LocationRecord，否则为字典）
         """
         locations_dict = {}
-        
         for chapter in chapters:
-            chapter_num = chapter.get('chapter_number')
-            chapter_title = chapter.get('chapter_title', f'第{chapter_num}章')
-            
-            for loc in chapter.get('locations', []):
-                name = loc.get('name')
-                if not name:
-                    continue
-                
-                if name not in locations_dict:
-                    locations_dict[name] = {
-                        'name': name,
-                        'type': loc.get('type', 'unknown'),
-                        'first_appearance_chapter': chapter_num,
-                        'first_appearance_title': chapter_title,
-                        'appearance_chapters': [],
-                        'descriptions': []
-                    }
-                else:
-                    # 更新首次出现章节（取最小的chapter_number）
-                    if chapter_num < locations_dict[name]['first_appearance_chapter']:
-                        locations_dict[name]['first_appearance_chapter'] = chapter_num
-                        locations_dict[name]['first_appearance_title'] = chapter_title
-                
-                locations_dict[name]['appearance_chapters'].append({
-                    'chapter_number': chapter_num,
-                    'chapter_title': chapter_title,
-                    'is_first_appearance': loc.get('first_appearance', False)
-                })
-                
-                desc = loc.get('description')
-                if desc:
-                    locations_dict[name]['descriptions'].append({
-                        'chapter': chapter_num,
-                        'description': desc
-                    })
-        
-        locations_list = list(locations_dict.values())
-        locations_list.sort(key=lambda x: len(x['appearance_chapters']), reverse=True)
-        
-        return locations_list
+            self._fold_locations(locations_dict, chapter)
+        return self._finish_locations(locations_dict)
     
-    def aggregate_events(self, chapters: List[Dict]) -> List[Dict]:
+    def aggregate_events(self, chapters: List[Dict]) -> List[Any]:
         """
         聚合事件数据
         
         Returns:
-            事件列表
+            事件列表（compact模式下为 EventRecord，否则为字典）
         """
         events_list = []
-        
         for chapter in chapters:
-            chapter_num = chapter.get('chapter_number')
-            chapter_title = chapter.get('chapter_title', f'第{chapter_num}章')
-            
-            for event in chapter.get('events', []):
-                events_list.append({
-                    'chapter_number': chapter_num,
-                    'chapter_title': chapter_title,
-                    'type': event.get('type', 'unknown'),
-                    'description': event.get('description', ''),
-                    'importance': event.get('importance', 'medium'),
-                    'emotional_tone': event.get('emotional_tone', ''),
-                    'participants': event.get('participants', [])
-                })
-        
-        return events_list
+            self._fold_events(events_list, chapter)
+        return self._finish_events(events_list)
     
     def aggregate_world_elements(self, chapters: List[Dict]) -> Dict[str, List[Dict]]:
         """
@@ -210,37 +340,9 @@ class DataAggregator:
             按类型分类的世界观元素字典
         """
         world_elements = defaultdict(list)
-        # 改用字典来追踪每个元素的首次出现章节
-        element_first_chapter = {}
-        
+        element_index = {}
         for chapter in chapters:
-            chapter_num = chapter.get('chapter_number')
-            
-            for element in chapter.get('world_elements', []):
-                elem_type = element.get('type', 'unknown')
-                elem_name = element.get('element', '')
-                
-                # 基于类型和名称的唯一key
-                key = (elem_type, elem_name)
-                
-                # 更新首次出现章节（取最小值）
-                if key not in element_first_chapter:
-                    element_first_chapter[key] = chapter_num
-                    world_elements[elem_type].append({
-                        'element': elem_name,
-                        'details': element.get('details', ''),
-                        'first_mentioned_chapter': chapter_num
-                    })
-                else:
-                    # 如果当前章节更早，更新首次出现章节
-                    if chapter_num < element_first_chapter[key]:
-                        # 找到并更新该元素
-                        for elem in world_elements[elem_type]:
-                            if elem['element'] == elem_name:
-                                elem['first_mentioned_chapter'] = chapter_num
-                                element_first_chapter[key] = chapter_num
-                                break
-        
+            self._fold_world_elements(world_elements, element_index, chapter)
         return dict(world_elements)
     
     def aggregate_writing_styles(self, chapters: List[Dict]) -> Dict[str, Any]:
@@ -250,40 +352,10 @@ class DataAggregator:
         Returns:
             写作风格统计
         """
-        perspectives = defaultdict(int)
-        key_phrases = []
-        emotional_intensities = defaultdict(int)
-        description_focuses = defaultdict(int)
-        
+        style_counters = self._new_style_counters()
         for chapter in chapters:
-            chapter_num = chapter.get('chapter_number')
-            style = chapter.get('writing_style_notes', {})
-            
-            # 统计叙事视角
-            perspective = style.get('narrative_perspective', 'unknown')
-            perspectives[perspective] += 1
-            
-            # 收集关键短语
-            for phrase in style.get('key_phrases', []):
-                key_phrases.append({
-                    'chapter': chapter_num,
-                    'phrase': phrase
-                })
-            
-            # 统计情感强度
-            intensity = style.get('emotional_intensity', 'unknown')
-            emotional_intensities[intensity] += 1
-            
-            # 统计描写重点
-            for focus in style.get('description_focus', []):
-                description_focuses[focus] += 1
-        
-        return {
-            'narrative_perspectives': dict(perspectives),
-            'key_phrases': key_phrases,
-            'emotional_intensities': dict(emotional_intensities),
-            'description_focuses': dict(description_focuses)
-        }
+            self._fold_writing_style(style_counters, chapter)
+        return self._finish_writing_style(style_counters)
     
     def aggregate_plot_arcs(self, chapters: List[Dict]) -> List[Dict]:
         """
@@ -292,27 +364,35 @@ class DataAggregator:
         Returns:
             情节线索列表
         """
-        plot_arcs = []
-        
-        for chapter in chapters:
-            chapter_num = chapter.get('chapter_number')
-            summary = chapter.get('chapter_summary', {})
-            
-            plot_arcs.append({
-                'chapter_number': chapter_num,
-                'chapter_title': summary.get('title', chapter.get('chapter_title', '')),
-                'main_content': summary.get('main_content', ''),
-                'key_points': summary.get('key_points', []),
-                'chapter_purpose': summary.get('chapter_purpose', ''),
-                'word_count': chapter.get('word_count', 0)
-            })
-        
-        return plot_arcs
+        return [self._plot_arc(chapter) for chapter in chapters]
+    
+    def _build_result(self, total_chapters: int, characters: List, locations: List,
+                      events: List, world_elements: Dict, writing_styles: Dict,
+                      plot_arcs: List) -> Dict[str, Any]:
+        """组装聚合结果字典"""
+        return {
+            'metadata': {
+                'total_chapters': total_chapters,
+                'total_characters': len(characters),
+                'total_locations': len(locations),
+                'total_events': len(events),
+                'total_world_elements': sum(len(v) for v in world_elements.values())
+            },
+            'characters': characters,
+            'locations': locations,
+            'events': events,
+            'world_elements': world_elements,
+            'writing_styles': writing_styles,
+            'plot_arcs': plot_arcs
+        }
     
-    def create_aggregated_data(self) -> Dict[str, Any]:
+    def create_aggregated_data(self, include_raw_chapters: bool = True) -> Dict[str, Any]:
         """
         创建完整的聚合数据
         
+        Args:
+            include_raw_chapters: 是否在结果中保留原始章节数据（raw_chapters）
+        
         Returns:
             包含所有聚合分类的字典
         """
@@ -345,23 +425,374 @@ class DataAggregator:
         plot_arcs = self.aggregate_plot_arcs(chapters)
         print(f"✅ 聚合 {len(plot_arcs)} 个情节线索")
         
+        data = self._build_result(len(chapters), characters, locations, events,
+                                  world_elements, writing_styles, plot_arcs)
+        if include_raw_chapters:
+            data['raw_chapters'] = chapters
+        
+        return data
+    
+    def stream_aggregated_data(self, on_chapter: Optional[Callable[[Dict, Dict], None]] = None,
+                               spill_dir: Optional[str] = None) -> Dict[str, Any]:
+        """
+        流式聚合：逐章加载并折叠进运行中的聚合结果，不保留原始章节
+        
+        Args:
+            on_chapter: 每章折叠完成后的回调 on_chapter(chapter, folded)，
+                        folded 包含本章的 'events' 和 'plot_arc'，
+                        可用于直接写出 raw / rag_ready 等逐行文件
+            spill_dir: 落盘目录；指定时事件、情节线索、关键短语、文体指标逐行写入该目录，
+                       结果中对应字段为 JsonlSpool（用 dump_json 序列化），角色/地点的逐章明细
+                       写入该目录下的 SQLite 文件，内存不随章节数增长
+        
+        Returns:
+            聚合数据字典（不含 raw_chapters）
+        """
+        print("📚 流式聚合章节数据...")
+        
+        state = self.new_state(spill_dir)
+        for chapter in self.iter_chapters():
+            folded = self.fold_chapter(state, chapter)
+            if on_chapter:
+                on_chapter(chapter, folded)
+        
+        data = self.finish_state(state)
+        
+        meta = data['metadata']
+        print(f"✅ 流式聚合完成: {meta['total_chapters']} 章, {meta['total_characters']} 个角色, "
+              f"{meta['total_locations']} 个地点, {meta['total_events']} 个事件, "
+              f"{meta['total_world_elements']} 个世界观元素")
+        
+        return data
+    
+    # ========== 聚合状态（流式折叠 / 并行分片合并共用） ==========
+    
+    def new_state(self, spill_dir: Optional[str] = None) -> Dict[str, Any]:
+        """
+        创建空的聚合状态
+        
+        Args:
+            spill_dir: 落盘目录（指定时随章节数增长的列表改为 JsonlSpool，仅用于流式聚合）
+        
+        Returns:
+            聚合状态字典
+        """
+        history = None
+        if spill_dir:
+            history = HistoryStore(os.path.join(spill_dir, 'history.sqlite'))
+            self.titles = SpilledTitleTable(history)
+        state = {
+            'total_chapters': 0,
+            'characters': {},
+            'locations': {},
+            'events': [],
+            'world_elements': defaultdict(list),
+            'element_index': {},
+            'styles': self._new_style_counters(),
+            'plot_arcs': [],
+            'titles': self.titles,
+            'history': history
+        }
+        if spill_dir:
+            state['events'] = JsonlSpool(os.path.join(spill_dir, 'events.jsonl'))
+            state['plot_arcs'] = JsonlSpool(os.path.join(spill_dir, 'plot_arcs.jsonl'))
+            for key in ('key_phrases', 'stylometrics'):
+                state['styles'][key] = JsonlSpool(os.path.join(spill_dir, f'{key}.jsonl'))
+        return state
+    
+    def fold_chapter(self, state: Dict[str, Any], chapter: Dict) -> Dict[str, Any]:
+        """
+        将一个章节折叠进聚合状态
+        
+        Args:
+            state: 聚合状态
+            chapter: 章节数据
+            
+        Returns:
+            本章折叠结果 {'events': 本章事件, 'plot_arc': 本章情节线索}
+        """
+        state['total_chapters'] += 1
+        self._fold_characters(state['characters'], chapter, state.get('history'))
+        self._fold_locations(state['locations'], chapter, state.get('history'))
+        chapter_events = self._fold_events(state['events'], chapter)
+        self._fold_world_elements(state['world_elements'], state['element_index'], chapter)
+        self._fold_writing_style(state['styles'], chapter)
+        plot_arc = self._plot_arc(chapter)
+        state['plot_arcs'].append(plot_arc)
+        
+        return {'events': chapter_events, 'plot_arc': plot_arc}
+    
+    def fold_files(self, file_paths: List[Path], state: Dict[str, Any] = None) -> Dict[str, Any]:
+        """
+        按给定顺序加载并折叠一组章节文件
+        
+        Args:
+            file_paths: 章节JSON文件路径（需已按章节号排序）
+            state: 已有聚合状态（为None时新建）
+            
+        Returns:
+            聚合状态
+        """
+        if state is None:
+            state = self.new_state()
+        
+        for file_path in file_paths:
+            try:
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    chapter = json.load(f)
+            except Exception as e:
+                print(f"⚠️  加载章节文件失败 {Path(file_path).name}: {e}")
+                continue
+            self.fold_chapter(state, chapter)
+        
+        return state
+    
+    def merge_states(self, left: Dict[str, Any], right: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        合并两个聚合状态（right 覆盖的章节须在 left 之后）
+        
+        合并满足结合律，按分片顺序合并的结果与串行折叠完全一致：
+        首次出现章节取最小值，角色定位/元素详情以先出现者为准，
+        列表按章节顺序拼接，计数器相加。
+        
+        Args:
+            left: 前一段章节的聚合状态（将被原地更新）
+            right: 后一段章节的聚合状态
+            
+        Returns:
+            合并后的状态（即 left）
+            
+        Raises:
+            ValueError: 任一状态为流式聚合的落盘状态（new_state(spill_dir=...)）
+        """
+        for state in (left, right):
+            if isinstance(state['titles'], SpilledTitleTable):
+                raise ValueError("落盘的聚合状态（流式聚合）不支持合并，并行聚合请使用内存状态")
+        
+        titles = left['titles']
+        titles.merge(right['titles'])
+        
+        left['total_chapters'] += right['total_chapters']
+        
+        for key in ('characters', 'locations'):
+            merged = left[key]
+            for name, record in right[key].items():
+                existing = merged.get(name)
+                if existing is None:
+                    record.titles = titles
+                    merged[name] = record
+                else:
+                    existing.merge(record)
+        
+        for event in right['events']:
+            event.titles = titles
+        left['events'].extend(right['events'])
+        
+        for elem_type, elements in right['world_elements'].items():
+            for elem in elements:
+                key = (elem_type, elem['element'])
+                existing = left['element_index'].get(key)
+                if existing is None:
+                    left['element_index'][key] = elem
+                    left['world_elements'][elem_type].append(elem)
+                elif elem['first_mentioned_chapter'] < existing['first_mentioned_chapter']:
+                    existing['first_mentioned_chapter'] = elem['first_mentioned_chapter']
+        
+        for key in ('narrative_perspectives', 'emotional_intensities', 'description_focuses'):
+            for value, count in right['styles'][key].items():
+                left['styles'][key][value] += count
+        left['styles']['key_phrases'].extend(right['styles']['key_phrases'])
+        left['styles']['stylometrics'].extend(right['styles']['stylometrics'])
+        
+        left['plot_arcs'].extend(right['plot_arcs'])
+        
+        return left
+    
+    def finish_state(self, state: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        由聚合状态生成最终聚合数据
+        
+        Args:
+            state: 聚合状态
+            
+        Returns:
+            聚合数据字典（不含 raw_chapters）
+        """
+        self.titles = state['titles']
+        self.history = state.get('history')
+        for spool in (state['events'], state['plot_arcs'],
+                      state['styles']['key_phrases'], state['styles']['stylometrics']):
+            if isinstance(spool, JsonlSpool):
+                spool.close()
+        return self._build_result(
+            state['total_chapters'],
+            self._finish_characters(state['characters']),
+            self._finish_locations(state['locations']),
+            self._finish_events(state['events']),
+            dict(state['world_elements']),
+            self._finish_writing_style(state['styles']),
+            state['plot_arcs']
+        )
+    
+    # ========== 增量聚合（连载跟更） ==========
+    
+    def update_aggregated_data(self, state_path: str, on_chapter: Optional[Callable[[Dict, Dict], None]] = None,
+                               resume: bool = True) -> Tuple[Dict[str, Any], bool]:
+        """
+        增量聚合：加载上次保存的聚合状态，只折叠新增的章节文件
+        
+        上次折叠过的章节文件都未变化、且新增文件的章节号都在已折叠章节之后时增量折叠；
+        否则（章节被修订、删除或插入到中间）重新折叠全部章节。完成后保存新的聚合状态。
+        
+        Args:
+            state_path: 聚合状态文件路径
+            on_chapter: 每章折叠完成后的回调（同 stream_aggregated_data，只对本次折叠的章节调用）
+            resume: 为False时忽略已保存的状态，重新折叠全部章节
+        
+        Returns:
+            (聚合数据字典（不含 raw_chapters）, 是否为增量折叠)
+        """
+        signatures = {}
+        for file_path in self._chapter_files():
+            stat = file_path.stat()
+            signatures[file_path.name] = (stat.st_mtime_ns, stat.st_size)
+        
+        saved = self._load_state(state_path) if resume else None
+        appended = None
+        if saved and all(signatures.get(name) == sig for name, sig in saved['files'].items()):
+            appended = [self.chapter_dir / name for name in signatures if name not in saved['files']]
+            numbers = [self._peek_chapter_number(f) for f in appended]
+            if numbers and min(numbers) <= saved['last_chapter']:
+                appended = None
+            else:
+                appended = [f for _, f in sorted(zip(numbers, appended), key=lambda x: x[0])]
+        
+        if appended is None:
+            print("📚 重新聚合全部章节...")
+            state = self.new_state()
+            files = self.sorted_chapter_files()
+            last_chapter = 0
+        else:
+            print(f"📚 增量聚合: 已有 {saved['state']['total_chapters']} 章，新增 {len(appended)} 章")
+            state = saved['state']
+            self.titles = state['titles']
+            files = appended
+            last_chapter = saved['last_chapter']
+        
+        for file_path in files:
+            try:
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    chapter = json.load(f)
+            except Exception as e:
+                print(f"⚠️  加载章节文件失败 {file_path.name}: {e}")
+                continue
+            folded = self.fold_chapter(state, chapter)
+            last_chapter = max(last_chapter, chapter.get('chapter_number') or 0)
+            if on_chapter:
+                on_chapter(chapter, folded)
+        
+        # 在生成最终结果之前保存（finish_state 会聚类事件、整理记录）
+        self._save_state(state_path, state, signatures, last_chapter)
+        data = self.finish_state(state)
+        
+        meta = data['metadata']
+        print(f"✅ 聚合完成: {meta['total_chapters']} 章, {meta['total_characters']} 个角色, "
+              f"{meta['total_events']} 个事件")
+        
+        return data, appended is not None
+    
+    def _load_state(self, state_path: str) -> Optional[Dict[str, Any]]:
+        """加载保存的聚合状态（不存在、损坏、版本/记录结构/模式不符时返回None）"""
+        if not os.path.exists(state_path):
+            return None
+        try:
+            with open(state_path, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+            if (saved.get('version') != self.STATE_VERSION or saved.get('layout') != self._state_layout()
+                    or saved.get('compact') != self.compact):
+                return None
+            saved['files'] = {name: tuple(sig) for name, sig in saved['files'].items()}
+            saved['state'] = self._restore_state(saved['state'])
+        except Exception as e:
+            print(f"⚠️  聚合状态损坏，重新聚合: {e}")
+            return None
+        return saved
+    
+    def _save_state(self, state_path: str, state: Dict[str, Any], signatures: Dict[str, tuple],
+                    last_chapter: int):
+        """保存聚合状态（JSON，先写临时文件再替换）"""
+        tmp_path = state_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'version': self.STATE_VERSION,
+                'layout': self._state_layout(),
+                'compact': self.compact,
+                'files': signatures,
+                'last_chapter': last_chapter,
+                'state': self._dump_state(state)
+            }, f, ensure_ascii=False)
+        os.replace(tmp_path, state_path)
+    
+    def _state_layout(self) -> Dict[str, List[str]]:
+        """记录类的槽位布局（与状态一同保存，记录类变化后旧状态作废）"""
+        return {cls.__name__: list(cls.__slots__) for cls in self.STATE_RECORD_CLASSES}
+    
+    def _dump_state(self, state: Dict[str, Any]) -> Dict[str, Any]:
+        """将内存聚合状态转为可 JSON 序列化的结构（计数器和世界观元素的键可能不是字符串，按键值对保存）"""
+        styles = state['styles']
         return {
-            'metadata': {
-                'total_chapters': len(chapters),
-                'total_characters': len(characters),
-                'total_locations': len(locations),
-                'total_events': len(events),
-                'total_world_elements': total_elements
+            'total_chapters': state['total_chapters'],
+            'titles': state['titles'].to_state(),
+            'characters': [record.to_state() for record in state['characters'].values()],
+            'locations': [record.to_state() for record in state['locations'].values()],
+            'events': [event.to_state() for event in state['events']],
+            'world_elements': [[elem_type, elements] for elem_type, elements in state['world_elements'].items()],
+            'styles': {
+                'narrative_perspectives': list(styles['narrative_perspectives'].items()),
+                'key_phrases': styles['key_phrases'],
+                'emotional_intensities': list(styles['emotional_intensities'].items()),
+                'description_focuses': list(styles['description_focuses'].items()),
+                'stylometrics': styles['stylometrics']
             },
-            'characters': characters,
-            'locations': locations,
-            'events': events,
-            'world_elements': world_elements,
-            'writing_styles': writing_styles,
-            'plot_arcs': plot_arcs,
-            'raw_chapters': chapters
+            'plot_arcs': state['plot_arcs']
         }
     
+    def _restore_state(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """由 _dump_state 的结果重建内存聚合状态"""
+        self.titles = titles = ChapterTitleTable.from_state(data['titles'])
+        state = self.new_state()
+        state['total_chapters'] = data['total_chapters']
+        for values in data['characters']:
+            record = CharacterRecord.from_state(values, titles)
+            state['characters'][record.name] = record
+        for values in data['locations']:
+            record = LocationRecord.from_state(values, titles)
+            state['locations'][record.name] = record
+        state['events'] = [EventRecord.from_state(values, titles) for values in data['events']]
+        for elem_type, elements in data['world_elements']:
+            state['world_elements'][elem_type] = elements
+            for elem in elements:
+                state['element_index'][(elem_type, elem['element'])] = elem
+        styles = data['styles']
+        for key in ('narrative_perspectives', 'emotional_intensities', 'description_focuses'):
+            for value, count in styles[key]:
+                state['styles'][key][value] = count
+        state['styles']['key_phrases'] = styles['key_phrases']
+        state['styles']['stylometrics'] = styles['stylometrics']
+        state['plot_arcs'] = data['plot_arcs']
+        return state
+    
+    def sorted_chapter_files(self) -> List[Path]:
+        """
+        获取按章节号排序的章节文件列表
+        
+        Returns:
+            文件路径列表
+        """
+        keyed_files = [(self._peek_chapter_number(f), f) for f in self._chapter_files()]
+        keyed_files.sort(key=lambda x: x[0])
+        return [f for _, f in keyed_files]
+    
     def save_aggregated_data(self, output_dir: str, data: Dict[str, Any] = None):
         """
         保存聚合数据到分类文件
@@ -392,7 +823,7 @@ class DataAggregator:
         for filename, content in categories.items():
             file_path = output_path / filename
             with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(content, f, ensure_ascii=False, indent=2)
+                json.dump(content, f, ensure_ascii=False, indent=2, default=to_jsonable)
             
             size_kb = file_path.stat().st_size / 1024
             print(f"  ✅ {filename}: {size_kb:.2f} KB")
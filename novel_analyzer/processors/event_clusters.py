@@ -0,0 +1,181 @@
+"""
+事件聚类 - 合并跨章节重复描述的同一事件
+
+一场持续十几章的战斗会在每章各产生几条几乎相同的事件，使 events.json、分块层和
+情节维度的重要事件输入大量重复。聚类器按章节顺序扫描事件，只在共享参与者的事件之间
+比较（按参与者分块，无参与者的事件按类型分块），章节间隔不超过 window 且描述的
+汉字 n-gram Jaccard 相似度达到阈值的事件归入同一簇。每簇输出一条事件：保留章节跨度、
+参与者并集、最高重要性，描述取与簇内其他描述最相似的一条作为代表。
+"""
+from collections import Counter
+from typing import Dict, List, Any, Optional, Set
+
+
+class EventClusterer:
+    """跨章节事件聚类"""
+
+    IMPORTANCE_RANK = {'low': 0, 'medium': 1, 'high': 2, 'critical': 3}
+    # 与簇比较时只取最近的若干条描述（长战斗簇的早期描述与后续章节已无可比性）
+    RECENT_MEMBERS = 5
+
+    def __init__(self, window: int = 3, threshold: float = 0.35, ngram: int = 2,
+                 min_participant_overlap: float = 0.5):
+        """
+        初始化聚类器
+
+        Args:
+            window: 同簇相邻事件的最大章节间隔
+            threshold: 描述 n-gram Jaccard 相似度阈值
+            ngram: n-gram 字数
+            min_participant_overlap: 参与者重合度下限（交集 / 较小集合）
+        """
+        self.window = window
+        self.threshold = threshold
+        self.ngram = ngram
+        self.min_participant_overlap = min_participant_overlap
+
+    @classmethod
+    def from_settings(cls, settings: Optional[Dict]) -> Optional['EventClusterer']:
+        """
+        由 event_clustering 配置创建聚类器
+
+        Args:
+            settings: 配置段（未启用时返回None）
+
+        Returns:
+            聚类器或None
+        """
+        if not settings or not settings.get('enabled', False):
+            return None
+        return cls(
+            window=int(settings.get('window', 3)),
+            threshold=float(settings.get('threshold', 0.35)),
+            ngram=int(settings.get('ngram', 2)),
+            min_participant_overlap=float(settings.get('min_participant_overlap', 0.5))
+        )
+
+    # ========== 聚类 ==========
+
+    def cluster(self, events: List[Any]) -> List[Any]:
+        """
+        聚类事件列表
+
+        Args:
+            events: 聚合事件（字典或 EventRecord，按章节顺序）
+
+        Returns:
+            聚类后的事件列表（未合并的事件原样保留，合并的簇为字典）
+        """
+        order = sorted(range(len(events)), key=lambda i: events[i]['chapter_number'])
+        clusters: List[Dict[str, Any]] = []
+        blocks: Dict[str, List[int]] = {}
+
+        for i in order:
+            event = events[i]
+            chapter = event['chapter_number']
+            names = self._participants(event)
+            grams = self._ngrams(event.get('description', ''))
+            keys = [f"p:{name}" for name in names] or [f"t:{event.get('type') or 'unknown'}"]
+
+            # 事件按章节顺序处理，超出窗口的簇不会再有新成员，从分块中移除
+            for key in keys:
+                if key in blocks:
+                    blocks[key] = [cid for cid in blocks[key]
+                                   if chapter - clusters[cid]['last_chapter'] <= self.window]
+
+            best, best_score = None, self.threshold
+            for cid in dict.fromkeys(cid for key in keys for cid in blocks.get(key, [])):
+                candidate = clusters[cid]
+                if names and not self._participants_match(names, candidate['participants']):
+                    continue
+                score = max(self.jaccard(grams, other) for other in candidate['grams'][-self.RECENT_MEMBERS:])
+                if score >= best_score:
+                    best, best_score = cid, score
+
+            if best is None:
+                best = len(clusters)
+                clusters.append({'members': [], 'grams': [], 'participants': [], 'last_chapter': chapter})
+            candidate = clusters[best]
+            candidate['members'].append(event)
+            candidate['grams'].append(grams)
+            candidate['last_chapter'] = max(candidate['last_chapter'], chapter)
+            for name in names:
+                if name not in candidate['participants']:
+                    candidate['participants'].append(name)
+            for key in keys:
+                if best not in blocks.setdefault(key, []):
+                    blocks[key].append(best)
+
+        merged = sum(len(c['members']) - 1 for c in clusters)
+        if merged:
+            print(f"🧩 事件聚类: {len(events)} 条 → {len(clusters)} 条（合并 {merged} 条重复事件）")
+        return [self._summarize(c) if len(c['members']) > 1 else c['members'][0] for c in clusters]
+
+    def _summarize(self, cluster: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        把一个簇合并为一条事件
+
+        Args:
+            cluster: 簇（members 为按章节顺序的事件）
+
+        Returns:
+            合并后的事件字典（含 chapter_span、chapter_numbers、merged_count）
+        """
+        members, grams = cluster['members'], cluster['grams']
+        # 代表描述：与簇内其他描述平均相似度最高的一条（相同时取重要性高、描述长的）
+        scores = [sum(self.jaccard(g, other) for other in grams) for g in grams]
+        rep_idx = max(range(len(members)), key=lambda k: (
+            scores[k], self._rank(members[k].get('importance')), len(members[k].get('description', ''))))
+        representative = members[rep_idx]
+
+        chapters = sorted({m['chapter_number'] for m in members})
+        importance = max((m.get('importance') for m in members), key=self._rank)
+        tones = Counter(m.get('emotional_tone') for m in members if m.get('emotional_tone'))
+        return {
+            'chapter_number': chapters[0],
+            'chapter_title': members[0].get('chapter_title', ''),
+            'type': representative.get('type', 'unknown'),
+            'description': representative.get('description', ''),
+            'importance': importance,
+            'emotional_tone': tones.most_common(1)[0][0] if tones else '',
+            'participants': list(cluster['participants']),
+            'chapter_span': [chapters[0], chapters[-1]],
+            'chapter_numbers': chapters,
+            'merged_count': len(members)
+        }
+
+    # ========== 相似度 ==========
+
+    def _ngrams(self, text: Any) -> Set[str]:
+        """描述的字符 n-gram 集合（去掉空白和标点）"""
+        text = ''.join(ch for ch in str(text or '') if ch.isalnum())
+        n = self.ngram
+        if len(text) <= n:
+            return {text} if text else set()
+        return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+    @staticmethod
+    def jaccard(a: Set[str], b: Set[str]) -> float:
+        """两个集合的 Jaccard 相似度（任一为空时为0）"""
+        if not a or not b:
+            return 0.0
+        return len(a & b) / len(a | b)
+
+    def _participants_match(self, names: List[str], others: List[str]) -> bool:
+        """参与者重合度是否达到下限"""
+        overlap = len(set(names) & set(others))
+        return overlap / min(len(names), len(others) or 1) >= self.min_participant_overlap
+
+    @staticmethod
+    def _participants(event: Any) -> List[str]:
+        """规范化参与者字段（列表/元组去重，字符串视为单个参与者）"""
+        participants = event.get('participants')
+        if isinstance(participants, str):
+            participants = [participants]
+        if not isinstance(participants, (list, tuple)):
+            return []
+        return list(dict.fromkeys(p for p in participants if isinstance(p, str) and p))
+
+    @classmethod
+    def _rank(cls, importance: Any) -> int:
+        return cls.IMPORTANCE_RANK.get(importance, 1)
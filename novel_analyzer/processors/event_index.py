@@ -0,0 +1,225 @@
+"""
+事件索引 - 按章节范围、参与者、类型、重要性快速筛选聚合事件
+
+事件按章节号稳定排序后分配位置编号，章节号保存为有序数组；参与者、类型、
+重要性分别建立倒排表（位置编号有序列表）。查询时先用二分查找确定章节范围，
+再对各倒排表在该范围内的切片做集合交集，避免线性扫描全部事件。
+
+聚类合并的事件（带 chapter_numbers）在涉及的每个章节各占一个位置，跨章事件
+在任一章节落入查询范围时都能命中；查询结果按事件去重。
+"""
+import json
+from array import array
+from bisect import bisect_left, bisect_right
+from pathlib import Path
+from typing import Dict, List, Any, Iterable, Optional, Union
+
+
+class EventIndex:
+    """聚合事件索引"""
+
+    VERSION = 2
+
+    def __init__(self):
+        self.event_ids = array('i')   # 位置 -> events.json 中的下标（跨章事件占多个位置）
+        self.chapters = array('i')    # 位置 -> 章节号（升序）
+        self.participants: Dict[str, array] = {}
+        self.types: Dict[str, array] = {}
+        self.importance: Dict[str, array] = {}
+
+    # ========== 构建 ==========
+
+    @classmethod
+    def build(cls, events: Iterable[Any]) -> 'EventIndex':
+        """
+        由聚合事件列表构建索引
+
+        事件只按顺序遍历两遍（第一遍取章节号排序，第二遍建倒排表），
+        可直接传入流式聚合落盘的事件（JsonlSpool）。
+
+        Args:
+            events: aggregate_events 的结果（字典或 EventRecord 的列表，或可重复遍历的对象）
+
+        Returns:
+            事件索引
+        """
+        index = cls()
+        # 第一遍：展开每个事件涉及的章节（offsets[i]:offsets[i+1] 为第 i 个事件的条目）
+        chapters = array('i')
+        offsets = array('i', [0])
+        for event in events:
+            chapters.extend(cls._event_chapters(event))
+            offsets.append(len(chapters))
+        order = sorted(range(len(chapters)), key=chapters.__getitem__)
+        owners = array('i', [0]) * len(chapters)
+        for event_id in range(len(offsets) - 1):
+            for entry in range(offsets[event_id], offsets[event_id + 1]):
+                owners[entry] = event_id
+        position = array('i', [0]) * len(order)
+        for pos, entry in enumerate(order):
+            index.event_ids.append(owners[entry])
+            index.chapters.append(chapters[entry])
+            position[entry] = pos
+
+        for event_id, event in enumerate(events):
+            positions = [position[entry] for entry in range(offsets[event_id], offsets[event_id + 1])]
+            keys = [(index.participants, name) for name in cls._participant_names(event.get('participants'))]
+            keys.append((index.types, event.get('type') or 'unknown'))
+            keys.append((index.importance, event.get('importance') or 'medium'))
+            for postings_map, key in keys:
+                postings_map.setdefault(key, array('i')).extend(positions)
+
+        # 倒排表按位置升序（事件未按章节排好序时第二遍的追加顺序不是位置顺序）
+        for postings_map in (index.participants, index.types, index.importance):
+            for key, postings in postings_map.items():
+                if any(postings[i] > postings[i + 1] for i in range(len(postings) - 1)):
+                    postings_map[key] = array('i', sorted(postings))
+        return index
+
+    @staticmethod
+    def _event_chapters(event: Any) -> List[int]:
+        """事件涉及的章节号（聚类合并的事件取 chapter_numbers，否则为 chapter_number）"""
+        numbers = event.get('chapter_numbers')
+        if isinstance(numbers, (list, tuple)) and numbers:
+            return sorted(set(int(num) for num in numbers))
+        return [event['chapter_number']]
+
+    @staticmethod
+    def _participant_names(participants: Any) -> List[str]:
+        """规范化参与者字段（列表去重，字符串视为单个参与者）"""
+        if isinstance(participants, str):
+            participants = [participants]
+        if not isinstance(participants, (list, tuple)):
+            return []
+        names = []
+        for name in participants:
+            if isinstance(name, str) and name and name not in names:
+                names.append(name)
+        return names
+
+    # ========== 查询 ==========
+
+    def query(self, start_chapter: Optional[int] = None, end_chapter: Optional[int] = None,
+              participants: Union[str, Iterable[str], None] = None,
+              types: Union[str, Iterable[str], None] = None,
+              importance: Union[str, Iterable[str], None] = None) -> List[int]:
+        """
+        筛选事件
+
+        Args:
+            start_chapter: 起始章节（含），None 表示不限
+            end_chapter: 结束章节（含），None 表示不限
+            participants: 参与者，多个时要求全部参与
+            types: 事件类型，多个时满足其一即可
+            importance: 重要性（high/medium/low），多个时满足其一即可
+
+        Returns:
+            命中事件在 events.json 中的下标（按范围内最早涉及的章节排序）
+        """
+        lo = 0 if start_chapter is None else bisect_left(self.chapters, start_chapter)
+        hi = len(self.chapters) if end_chapter is None else bisect_right(self.chapters, end_chapter)
+        if lo >= hi:
+            return []
+
+        # 每个条件得到一个候选集合，集合之间取交集
+        candidates = []
+        for name in self._as_list(participants):
+            candidates.append(self._slice(self.participants.get(name), lo, hi))
+        for postings_map, values in ((self.types, types), (self.importance, importance)):
+            values = self._as_list(values)
+            if values:
+                union = set()
+                for value in values:
+                    union.update(self._slice(postings_map.get(value), lo, hi))
+                candidates.append(union)
+
+        if not candidates:
+            positions = range(lo, hi)
+        else:
+            candidates.sort(key=len)
+            result = set(candidates[0])
+            for other in candidates[1:]:
+                if not result:
+                    break
+                result.intersection_update(other)
+            positions = sorted(result)
+
+        # 跨章事件可能有多个位置落在范围内，只保留第一次
+        return list(dict.fromkeys(self.event_ids[pos] for pos in positions))
+
+    def select(self, events: List[Any], **filters) -> List[Any]:
+        """
+        筛选事件并返回事件本身
+
+        Args:
+            events: 构建索引时使用的事件列表（或 aggregated/events.json）
+            **filters: 同 query 的参数
+
+        Returns:
+            命中的事件列表（按章节顺序）
+        """
+        return [events[i] for i in self.query(**filters)]
+
+    def count_by_chapter_range(self, start_chapter: int, end_chapter: int) -> int:
+        """统计章节范围内的事件数（跨章事件只计一次）"""
+        lo = bisect_left(self.chapters, start_chapter)
+        hi = bisect_right(self.chapters, end_chapter)
+        return len(set(self.event_ids[lo:hi]))
+
+    @staticmethod
+    def _slice(postings: Optional[array], lo: int, hi: int) -> array:
+        """取倒排表中位于 [lo, hi) 的位置（倒排表有序，二分定位）"""
+        if not postings:
+            return array('i')
+        return postings[bisect_left(postings, lo):bisect_left(postings, hi)]
+
+    @staticmethod
+    def _as_list(value: Union[str, Iterable[str], None]) -> List[str]:
+        """将单个值或可迭代对象统一为列表"""
+        if value is None:
+            return []
+        if isinstance(value, str):
+            return [value]
+        return list(value)
+
+    # ========== 持久化 ==========
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为可序列化字典"""
+        return {
+            'version': self.VERSION,
+            'total_events': len(set(self.event_ids)),
+            'event_ids': self.event_ids.tolist(),
+            'chapters': self.chapters.tolist(),
+            'participants': {k: v.tolist() for k, v in self.participants.items()},
+            'types': {k: v.tolist() for k, v in self.types.items()},
+            'importance': {k: v.tolist() for k, v in self.importance.items()}
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'EventIndex':
+        """从字典恢复索引"""
+        if data.get('version') != cls.VERSION:
+            raise ValueError(f"不支持的事件索引版本: {data.get('version')}")
+
+        index = cls()
+        index.event_ids = array('i', data['event_ids'])
+        index.chapters = array('i', data['chapters'])
+        index.participants = {k: array('i', v) for k, v in data['participants'].items()}
+        index.types = {k: array('i', v) for k, v in data['types'].items()}
+        index.importance = {k: array('i', v) for k, v in data['importance'].items()}
+        return index
+
+    @classmethod
+    def load(cls, file_path: Union[str, Path]) -> 'EventIndex':
+        """
+        加载索引文件（indexes/event_index.json）
+
+        Args:
+            file_path: 索引文件路径
+
+        Returns:
+            事件索引
+        """
+        with open(file_path, 'r', encoding='utf-8') as f:
+            return cls.from_dict(json.load(f))
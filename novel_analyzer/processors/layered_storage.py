@@ -3,16 +3,21 @@
 """
 import json
 import os
+import shutil
 from pathlib import Path
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Iterable, Tuple
 from .data_aggregator import DataAggregator
+from .aggregate_records import to_jsonable, dump_json
+from .event_index import EventIndex
+from .character_graph import CharacterGraph
 from novel_analyzer.utils.smart_chunker import SmartChunker
 
 
 class LayeredStorageGenerator:
     """分层存储生成器，创建raw/aggregated/chunked/indexes/rag_ready五层结构"""
     
-    def __init__(self, novel_name: str, base_output_dir: str, model_type: str = 'gpt4'):
+    def __init__(self, novel_name: str, base_output_dir: str, model_type: str = 'gpt4',
+                 event_clustering: Optional[Dict] = None):
         """
         初始化分层存储生成器
         
@@ -20,10 +25,12 @@ class LayeredStorageGenerator:
             novel_name: 小说名称
             base_output_dir: 基础输出目录
             model_type: 目标LLM类型（用于分块大小）
+            event_clustering: 事件聚类配置（启用时各层使用合并重复事件后的事件列表）
         """
         self.novel_name = novel_name
         self.base_path = Path(base_output_dir) / novel_name
         self.model_type = model_type
+        self.event_clustering = event_clustering
         self.chunker = SmartChunker(model_type=model_type)
         
         # 定义各层目录
@@ -39,25 +46,85 @@ class LayeredStorageGenerator:
         for path in self.layers.values():
             path.mkdir(parents=True, exist_ok=True)
     
-    def generate_all_layers(self, chapter_summaries_dir: str):
+    def generate_all_layers(self, chapter_summaries_dir: str, streaming: bool = False):
         """
         生成所有层级的存储结构
         
         Args:
             chapter_summaries_dir: 章节摘要目录
+            streaming: 流式模式，逐章聚合并直接写出 raw / rag_ready 的逐行文件，
+                       不在内存中保留原始章节（适合超长小说）
         """
         print(f"🏗️  开始生成分层存储结构: {self.novel_name}")
         print(f"📁 输出目录: {self.base_path}")
         print(f"🤖 目标模型: {self.model_type} (最大块: {self.chunker.max_size/1024:.0f}KB)\n")
         
-        # 创建聚合器
-        aggregator = DataAggregator(chapter_summaries_dir)
-        aggregated_data = aggregator.create_aggregated_data()
+        # 创建聚合器（紧凑记录模式，序列化时再还原为字典）
+        aggregator = DataAggregator(chapter_summaries_dir, compact=True, event_clustering=self.event_clustering)
+        
+        if streaming:
+            self._generate_layers_streaming(aggregator)
+        else:
+            aggregated_data = aggregator.create_aggregated_data()
+            
+            # Layer 1: Raw - 保存原始完整数据
+            print("\n📦 Layer 1: 生成 Raw 层...")
+            self._generate_raw_layer(aggregated_data)
+            
+            # Layer 2-4
+            self._generate_derived_layers(aggregated_data)
+            
+            # Layer 5: RAG Ready - 生成向量检索格式
+            print("\n🔍 Layer 5: 生成 RAG Ready 层...")
+            self._generate_rag_layer(aggregated_data)
+        
+        print(f"\n✨ 分层存储生成完成！")
+        self._print_storage_summary()
+    
+    def update_layers(self, chapter_summaries_dir: str):
+        """
+        增量更新分层存储（连载跟更）
+        
+        聚合状态保存在 .aggregate_state.json，只有新增章节时把新章节折叠进已有状态并追加到
+        raw/*_chapters.jsonl，其余情况重新聚合全部章节；各层随后由更新后的聚合数据重新生成。
+        原始章节按流式布局逐行保存，complete.json 不含 raw_chapters。
+        
+        Args:
+            chapter_summaries_dir: 章节摘要目录
+        """
+        print(f"🏗️  更新分层存储结构: {self.novel_name}")
+        
+        aggregator = DataAggregator(chapter_summaries_dir, compact=True, event_clustering=self.event_clustering)
+        raw_chapters_path = self.layers['raw'] / f"{self.novel_name}_chapters.jsonl"
+        state_path = self.base_path / '.aggregate_state.json'
+        pending_path = raw_chapters_path.with_name(raw_chapters_path.name + '.tmp')
+        
+        # 本次折叠的章节先写入临时文件：增量时追加到已有文件，重新聚合时替换
+        with open(pending_path, 'w', encoding='utf-8') as pending_f:
+            def on_chapter(chapter: Dict, folded: Dict):
+                pending_f.write(json.dumps(chapter, ensure_ascii=False) + '\n')
+            
+            aggregated_data, incremental = aggregator.update_aggregated_data(
+                str(state_path), on_chapter=on_chapter, resume=raw_chapters_path.exists())
+        
+        if incremental:
+            with open(raw_chapters_path, 'a', encoding='utf-8') as raw_f, \
+                    open(pending_path, 'r', encoding='utf-8') as pending_f:
+                shutil.copyfileobj(pending_f, raw_f)
+            pending_path.unlink()
+        else:
+            os.replace(pending_path, raw_chapters_path)
         
-        # Layer 1: Raw - 保存原始完整数据
         print("\n📦 Layer 1: 生成 Raw 层...")
         self._generate_raw_layer(aggregated_data)
+        self._generate_derived_layers(aggregated_data)
+        print("\n🔍 Layer 5: 生成 RAG Ready 层...")
+        self._generate_rag_layer(aggregated_data)
         
+        print(f"\n✨ 分层存储{'增量' if incremental else ''}更新完成！")
+    
+    def _generate_derived_layers(self, aggregated_data: Dict[str, Any]):
+        """Layer 2-4: 由聚合数据派生的层级"""
         # Layer 2: Aggregated - 保存分类聚合数据
         print("\n📊 Layer 2: 生成 Aggregated 层...")
         self._generate_aggregated_layer(aggregated_data)
@@ -69,20 +136,71 @@ class LayeredStorageGenerator:
         # Layer 4: Indexes - 生成快速索引
         print("\n🗂️  Layer 4: 生成 Indexes 层...")
         self._generate_indexes_layer(aggregated_data)
+    
+    def _generate_layers_streaming(self, aggregator: DataAggregator):
+        """
+        流式生成所有层级
         
-        # Layer 5: RAG Ready - 生成向量检索格式
-        print("\n🔍 Layer 5: 生成 RAG Ready 层...")
-        self._generate_rag_layer(aggregated_data)
-        
-        print(f"\n✨ 分层存储生成完成！")
-        self._print_storage_summary()
+        逐章读取时直接写出 raw/*_chapters.jsonl、rag_ready/plot_arcs.jsonl 和
+        rag_ready/events.jsonl（启用事件聚类时 events.jsonl 在聚类后写出）；
+        事件、情节线索、关键短语、文体指标落盘到临时目录，其余层级由落盘文件逐条生成，
+        内存只随角色/地点数量增长，不随章节数增长。
+        """
+        rag_dir = self.layers['rag_ready']
+        spill_dir = self.base_path / '.spill'
+        raw_chapters_path = self.layers['raw'] / f"{self.novel_name}_chapters.jsonl"
+        stream_events = aggregator.event_clusterer is None
+        counters = {'chapters': 0, 'events': 0}
+        
+        print("📦 Layer 1 / 🔍 Layer 5: 流式写出 Raw 与 RAG 逐行文件...")
+        try:
+            with open(raw_chapters_path, 'w', encoding='utf-8') as raw_f, \
+                    open(rag_dir / 'plot_arcs.jsonl', 'w', encoding='utf-8') as plot_f, \
+                    open(rag_dir / 'events.jsonl', 'w', encoding='utf-8') as events_f:
+                
+                def on_chapter(chapter: Dict, folded: Dict):
+                    raw_f.write(json.dumps(chapter, ensure_ascii=False) + '\n')
+                    plot_f.write(json.dumps(self._plot_rag_item(folded['plot_arc']), ensure_ascii=False) + '\n')
+                    counters['chapters'] += 1
+                    if stream_events:
+                        for event in folded['events']:
+                            rag_item = self._event_rag_item(event, counters['events'])
+                            events_f.write(json.dumps(rag_item, ensure_ascii=False, default=to_jsonable) + '\n')
+                            counters['events'] += 1
+                
+                aggregated_data = aggregator.stream_aggregated_data(on_chapter=on_chapter,
+                                                                    spill_dir=str(spill_dir))
+            
+            size_kb = raw_chapters_path.stat().st_size / 1024
+            print(f"  ✅ 原始章节: {counters['chapters']} 行, {size_kb:.2f} KB")
+            print(f"  ✅ plot_arcs.jsonl: {counters['chapters']} 条")
+            if stream_events:
+                print(f"  ✅ events.jsonl: {counters['events']} 条")
+            
+            # Layer 1: Raw - 聚合数据（原始章节已逐行写出，不再重复保存）
+            print("\n📦 Layer 1: 生成 Raw 层...")
+            self._generate_raw_layer(aggregated_data)
+            
+            # Layer 2-4
+            self._generate_derived_layers(aggregated_data)
+            
+            # Layer 5: RAG Ready - 角色与地点需要完整聚合后才能生成
+            print("\n🔍 Layer 5: 生成 RAG Ready 层（角色/地点" + ("" if stream_events else "/事件") + "）...")
+            self._write_character_rag(aggregated_data['characters'])
+            self._write_location_rag(aggregated_data['locations'])
+            if not stream_events:
+                self._write_event_rag(aggregated_data['events'])
+        finally:
+            if aggregator.history is not None:
+                aggregator.history.close()
+            shutil.rmtree(spill_dir, ignore_errors=True)
     
     def _generate_raw_layer(self, data: Dict[str, Any]):
         """Layer 1: 原始完整数据（单文件）"""
         raw_file = self.layers['raw'] / f"{self.novel_name}_complete.json"
         
         with open(raw_file, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+            dump_json(data, f)
         
         size_kb = raw_file.stat().st_size / 1024
         print(f"  ✅ 完整数据: {size_kb:.2f} KB")
@@ -104,7 +222,7 @@ class LayeredStorageGenerator:
         for filename, content in categories.items():
             file_path = aggregated_dir / filename
             with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(content, f, ensure_ascii=False, indent=2)
+                dump_json(content, f)
             
             size_kb = file_path.stat().st_size / 1024
             print(f"  ✅ {filename}: {size_kb:.2f} KB")
@@ -151,7 +269,7 @@ class LayeredStorageGenerator:
             )
         
         # Plot Arcs - 按章节范围分块（每20章一块）
-        plot_chunks = self.chunker.chunk_by_chapters(
+        plot_chunks = self.chunker.iter_chapter_chunks(
             data['plot_arcs'],
             chapters_per_chunk=20
         )
@@ -165,7 +283,7 @@ class LayeredStorageGenerator:
             file_path = plot_dir / f"chapters_{start_ch:03d}-{end_ch:03d}.json"
             
             with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(chunk, f, ensure_ascii=False, indent=2)
+                json.dump(chunk, f, ensure_ascii=False, indent=2, default=to_jsonable)
             
             info = self.chunker.get_chunk_info(chunk)
             print(f"  ✅ 第{start_ch}-{end_ch}章: {info['size_kb']} KB, {info['item_count']}章")
@@ -180,7 +298,7 @@ class LayeredStorageGenerator:
                 'role': char['role'],
                 'first_chapter': char['first_appearance_chapter'],
                 'total_appearances': char['total_appearances'],
-                'appearance_chapters': [c['chapter_number'] for c in char['appearance_chapters']]
+                'appearance_chapters': self._appearance_numbers(char)
             }
             for char in data['characters']
         }
@@ -192,24 +310,24 @@ class LayeredStorageGenerator:
             loc['name']: {
                 'type': loc['type'],
                 'first_chapter': loc['first_appearance_chapter'],
-                'appearance_chapters': [c['chapter_number'] for c in loc['appearance_chapters']]
+                'appearance_chapters': self._appearance_numbers(loc)
             }
             for loc in data['locations']
         }
         
         self._save_index(indexes_dir / 'location_index.json', loc_index)
         
-        # 章节索引
-        chapter_index = {
-            arc['chapter_number']: {
+        # 章节索引（逐条写出，情节线索可能是落盘的 JsonlSpool）
+        chapter_index = (
+            (arc['chapter_number'], {
                 'title': arc['chapter_title'],
                 'word_count': arc['word_count'],
                 'key_points_count': len(arc['key_points'])
-            }
+            })
             for arc in data['plot_arcs']
-        }
+        )
         
-        self._save_index(indexes_dir / 'chapter_index.json', chapter_index)
+        self._save_index_items(indexes_dir / 'chapter_index.json', chapter_index)
         
         # 世界观元素索引
         world_index = {
@@ -218,15 +336,52 @@ class LayeredStorageGenerator:
         }
         
         self._save_index(indexes_dir / 'world_elements_index.json', world_index)
+        
+        # 事件索引（章节有序数组 + 参与者/类型/重要性倒排表，用 EventIndex.load 查询）
+        event_index = EventIndex.build(data['events'])
+        self._save_index(indexes_dir / 'event_index.json', event_index.to_dict(), indent=None)
+        
+        # 角色关系图索引（共现强度、中心度、关系演变）
+        graph = CharacterGraph.build(data['characters'])
+        self._save_index(indexes_dir / 'character_graph.json', graph.to_index())
     
     def _generate_rag_layer(self, data: Dict[str, Any]):
         """Layer 5: RAG检索格式（JSONL格式，每行一个可检索单元）"""
         rag_dir = self.layers['rag_ready']
         
         # Characters RAG
-        char_rag_path = rag_dir / 'characters.jsonl'
+        self._write_character_rag(data['characters'])
+        
+        # Locations RAG
+        self._write_location_rag(data['locations'])
+        
+        # Events RAG
+        self._write_event_rag(data['events'])
+        
+        # Plot Arcs RAG
+        plot_rag_path = rag_dir / 'plot_arcs.jsonl'
+        with open(plot_rag_path, 'w', encoding='utf-8') as f:
+            for arc in data['plot_arcs']:
+                rag_item = self._plot_rag_item(arc)
+                f.write(json.dumps(rag_item, ensure_ascii=False, default=to_jsonable) + '\n')
+        
+        print(f"  ✅ plot_arcs.jsonl: {len(data['plot_arcs'])} 条")
+    
+    def _write_event_rag(self, events: List):
+        """写出事件RAG文件"""
+        events_rag_path = self.layers['rag_ready'] / 'events.jsonl'
+        with open(events_rag_path, 'w', encoding='utf-8') as f:
+            for i, event in enumerate(events):
+                rag_item = self._event_rag_item(event, i)
+                f.write(json.dumps(rag_item, ensure_ascii=False, default=to_jsonable) + '\n')
+        
+        print(f"  ✅ events.jsonl: {len(events)} 条")
+    
+    def _write_character_rag(self, characters: List):
+        """写出角色RAG文件"""
+        char_rag_path = self.layers['rag_ready'] / 'characters.jsonl'
         with open(char_rag_path, 'w', encoding='utf-8') as f:
-            for char in data['characters']:
+            for char in characters:
                 rag_item = {
                     'id': f"char_{char['name']}",
                     'type': 'character',
@@ -238,14 +393,15 @@ class LayeredStorageGenerator:
                         'total_appearances': char['total_appearances']
                     }
                 }
-                f.write(json.dumps(rag_item, ensure_ascii=False) + '\n')
+                f.write(json.dumps(rag_item, ensure_ascii=False, default=to_jsonable) + '\n')
         
-        print(f"  ✅ characters.jsonl: {len(data['characters'])} 条")
-        
-        # Locations RAG
-        loc_rag_path = rag_dir / 'locations.jsonl'
+        print(f"  ✅ characters.jsonl: {len(characters)} 条")
+    
+    def _write_location_rag(self, locations: List):
+        """写出地点RAG文件"""
+        loc_rag_path = self.layers['rag_ready'] / 'locations.jsonl'
         with open(loc_rag_path, 'w', encoding='utf-8') as f:
-            for loc in data['locations']:
+            for loc in locations:
                 rag_item = {
                     'id': f"loc_{loc['name']}",
                     'type': 'location',
@@ -256,67 +412,86 @@ class LayeredStorageGenerator:
                         'first_chapter': loc['first_appearance_chapter']
                     }
                 }
-                f.write(json.dumps(rag_item, ensure_ascii=False) + '\n')
-        
-        print(f"  ✅ locations.jsonl: {len(data['locations'])} 条")
-        
-        # Events RAG
-        events_rag_path = rag_dir / 'events.jsonl'
-        with open(events_rag_path, 'w', encoding='utf-8') as f:
-            for i, event in enumerate(data['events']):
-                rag_item = {
-                    'id': f"event_{event['chapter_number']}_{i}",
-                    'type': 'event',
-                    'content': event['description'],
-                    'metadata': {
-                        'chapter': event['chapter_number'],
-                        'event_type': event['type'],
-                        'importance': event['importance'],
-                        'participants': event['participants']
-                    }
-                }
-                f.write(json.dumps(rag_item, ensure_ascii=False) + '\n')
-        
-        print(f"  ✅ events.jsonl: {len(data['events'])} 条")
-        
-        # Plot Arcs RAG
-        plot_rag_path = rag_dir / 'plot_arcs.jsonl'
-        with open(plot_rag_path, 'w', encoding='utf-8') as f:
-            for arc in data['plot_arcs']:
-                rag_item = {
-                    'id': f"chapter_{arc['chapter_number']}",
-                    'type': 'plot_arc',
-                    'content': self._create_plot_text(arc),
-                    'metadata': {
-                        'chapter': arc['chapter_number'],
-                        'title': arc['chapter_title'],
-                        'word_count': arc['word_count']
-                    }
-                }
-                f.write(json.dumps(rag_item, ensure_ascii=False) + '\n')
+                f.write(json.dumps(rag_item, ensure_ascii=False, default=to_jsonable) + '\n')
         
-        print(f"  ✅ plot_arcs.jsonl: {len(data['plot_arcs'])} 条")
+        print(f"  ✅ locations.jsonl: {len(locations)} 条")
+    
+    def _event_rag_item(self, event, i: int) -> Dict:
+        """生成单条事件的RAG条目"""
+        item = {
+            'id': f"event_{event['chapter_number']}_{i}",
+            'type': 'event',
+            'content': event['description'],
+            'metadata': {
+                'chapter': event['chapter_number'],
+                'event_type': event['type'],
+                'importance': event['importance'],
+                'participants': event['participants']
+            }
+        }
+        if 'chapter_span' in event:
+            # 聚类合并的事件：记录章节跨度
+            item['metadata']['chapter_span'] = event['chapter_span']
+            item['metadata']['merged_count'] = event['merged_count']
+        return item
+    
+    def _plot_rag_item(self, arc: Dict) -> Dict:
+        """生成单条情节线索的RAG条目"""
+        return {
+            'id': f"chapter_{arc['chapter_number']}",
+            'type': 'plot_arc',
+            'content': self._create_plot_text(arc),
+            'metadata': {
+                'chapter': arc['chapter_number'],
+                'title': arc['chapter_title'],
+                'word_count': arc['word_count']
+            }
+        }
     
     def _chunk_and_save(self, items: List[Dict], output_dir: Path, 
                         category: str, group_by: Optional[str] = None):
         """分块并保存数据"""
         output_dir.mkdir(parents=True, exist_ok=True)
         
-        chunks = self.chunker.chunk_by_items(items, group_key=group_by)
+        if isinstance(items, list):
+            chunks = self.chunker.chunk_by_items(items, group_key=group_by)
+        else:
+            # 落盘的列表逐条分块，不整体载入内存
+            chunks = self.chunker.iter_chunks(items, group_key=group_by)
         
         for i, chunk in enumerate(chunks):
             file_path = output_dir / f"{category}_part_{i+1:02d}.json"
             
             with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(chunk, f, ensure_ascii=False, indent=2)
+                json.dump(chunk, f, ensure_ascii=False, indent=2, default=to_jsonable)
             
             info = self.chunker.get_chunk_info(chunk)
             print(f"  ✅ {category}_part_{i+1:02d}: {info['size_kb']} KB, {info['item_count']}项, {info['utilization']:.1f}%利用率")
     
-    def _save_index(self, file_path: Path, index_data: Dict):
-        """保存索引文件"""
+    def _appearance_numbers(self, item) -> List[int]:
+        """获取出场章节号列表（紧凑记录直接读取章节号数组）"""
+        if hasattr(item, 'chapters'):
+            return item.chapters.tolist()
+        return [c['chapter_number'] for c in item['appearance_chapters']]
+    
+    def _save_index(self, file_path: Path, index_data: Dict, indent: Optional[int] = 2):
+        """保存索引文件（大型数组索引可传 indent=None 紧凑保存）"""
+        with open(file_path, 'w', encoding='utf-8') as f:
+            json.dump(index_data, f, ensure_ascii=False, indent=indent)
+        
+        size_kb = file_path.stat().st_size / 1024
+        print(f"  ✅ {file_path.name}: {size_kb:.2f} KB")
+    
+    def _save_index_items(self, file_path: Path, items: Iterable[Tuple[Any, Any]], indent: int = 2):
+        """逐条写出 (键, 值) 组成的索引（格式与 _save_index 一致，不在内存中组装整个字典）"""
+        inner = ' ' * indent
         with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(index_data, f, ensure_ascii=False, indent=2)
+            count = 0
+            for key, value in items:
+                text = json.dumps(value, ensure_ascii=False, indent=indent).replace('\n', '\n' + inner)
+                f.write(('{\n' if count == 0 else ',\n') + inner + json.dumps(str(key), ensure_ascii=False) + ': ' + text)
+                count += 1
+            f.write('{}' if count == 0 else '\n}')
         
         size_kb = file_path.stat().st_size / 1024
         print(f"  ✅ {file_path.name}: {size_kb:.2f} KB")
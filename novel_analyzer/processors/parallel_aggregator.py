@@ -0,0 +1,109 @@
+"""
+并行聚合器 - 多进程 map-reduce 聚合章节数据
+
+map 阶段：按章节号排序后切分为连续分片，工作进程解析分片内的章节JSON
+并折叠为部分聚合状态；reduce 阶段：按分片顺序合并部分状态。合并满足结合律，
+结果与 DataAggregator 串行聚合完全一致（包括最早 first_appearance_chapter）。
+"""
+import os
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Any, Optional, Tuple
+from .data_aggregator import DataAggregator
+
+
+def _aggregate_shard(chapter_dir: str, file_paths: List[str], compact: bool) -> Dict[str, Any]:
+    """
+    map 阶段：在工作进程中折叠一个分片
+
+    Args:
+        chapter_dir: 章节摘要目录
+        file_paths: 分片内的章节文件（已按章节号排序）
+        compact: 是否使用紧凑记录
+
+    Returns:
+        分片的部分聚合状态
+    """
+    aggregator = DataAggregator(chapter_dir, compact=compact)
+    return aggregator.fold_files([Path(p) for p in file_paths])
+
+
+class ParallelAggregator:
+    """多进程 map-reduce 聚合器"""
+
+    def __init__(self, max_workers: Optional[int] = None, shard_size: int = 200, compact: bool = False,
+                 event_clustering: Optional[Dict] = None):
+        """
+        初始化并行聚合器
+
+        Args:
+            max_workers: 工作进程数（默认CPU核数）
+            shard_size: 每个分片的章节数
+            compact: 是否返回紧凑记录（同 DataAggregator）
+            event_clustering: 事件聚类配置（同 DataAggregator，在合并完成后执行）
+        """
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.shard_size = max(1, shard_size)
+        self.compact = compact
+        self.event_clustering = event_clustering
+
+    def aggregate(self, chapter_summaries_dir: str) -> Dict[str, Any]:
+        """
+        并行聚合单部小说
+
+        Args:
+            chapter_summaries_dir: 章节摘要目录
+
+        Returns:
+            聚合数据字典（不含 raw_chapters）
+        """
+        return self.aggregate_corpus({chapter_summaries_dir: chapter_summaries_dir})[chapter_summaries_dir]
+
+    def aggregate_corpus(self, novels: Dict[str, str]) -> Dict[str, Dict[str, Any]]:
+        """
+        并行聚合多部小说（所有小说的分片共用一个进程池）
+
+        Args:
+            novels: {小说名: 章节摘要目录}
+
+        Returns:
+            {小说名: 聚合数据字典}
+        """
+        # 切分分片：每部小说按章节号排序后切成连续分片
+        shards: List[Tuple[str, str, List[str]]] = []
+        aggregators = {}
+        for novel_name, chapter_dir in novels.items():
+            aggregator = DataAggregator(chapter_dir, compact=self.compact, event_clustering=self.event_clustering)
+            aggregators[novel_name] = aggregator
+            files = [str(f) for f in aggregator.sorted_chapter_files()]
+            for i in range(0, len(files), self.shard_size):
+                shards.append((novel_name, chapter_dir, files[i:i + self.shard_size]))
+
+        print(f"⚙️  并行聚合: {len(novels)} 部小说, {len(shards)} 个分片, {self.max_workers} 个进程")
+
+        # map 阶段：工作进程折叠各分片（结果按提交顺序返回，保证合并确定性）
+        if self.max_workers > 1 and len(shards) > 1:
+            with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+                partials = list(executor.map(
+                    _aggregate_shard,
+                    [shard[1] for shard in shards],
+                    [shard[2] for shard in shards],
+                    [self.compact] * len(shards)
+                ))
+        else:
+            partials = [_aggregate_shard(chapter_dir, files, self.compact)
+                        for _, chapter_dir, files in shards]
+
+        # reduce 阶段：按分片顺序合并
+        states = {name: aggregator.new_state() for name, aggregator in aggregators.items()}
+        for (novel_name, _, _), partial in zip(shards, partials):
+            aggregators[novel_name].merge_states(states[novel_name], partial)
+
+        results = {}
+        for novel_name, aggregator in aggregators.items():
+            results[novel_name] = aggregator.finish_state(states[novel_name])
+            meta = results[novel_name]['metadata']
+            print(f"  ✅ {novel_name}: {meta['total_chapters']} 章, {meta['total_characters']} 个角色, "
+                  f"{meta['total_events']} 个事件")
+
+        return results
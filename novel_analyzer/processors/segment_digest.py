@@ -0,0 +1,203 @@
+"""
+分段摘要的本地计算部分 - 可数、可列举的分段字段直接由章节结果得出
+
+分段汇总中的角色数、新角色、主要地点、关键事件、冲突、世界观条目等字段都能从
+章节分析结果精确计算，不必交给LLM（LLM计数常常不准，也是校验失败的常见原因）。
+本模块计算这些字段，并把分段压缩成几行文字摘要，只请LLM撰写主线剧情、情感曲线、
+角色发展等叙述性字段。
+"""
+from collections import Counter
+from typing import Dict, List, Any, Optional, Set
+
+
+class SegmentDigest:
+    """分段摘要的确定性字段与LLM摘要文本"""
+
+    MAX_MAIN_CHARACTERS = 8
+    MAX_LOCATIONS = 10
+    MAX_KEY_EVENTS = 10
+    MAX_CONFLICTS = 8
+    MAX_WORLD_ITEMS = 10
+
+    WORLD_FIELDS = {
+        'power_system': 'power_system_details',
+        'social_rule': 'social_structure',
+        'organization': 'social_structure',
+        'special_item': 'special_items',
+    }
+
+    @classmethod
+    def compute(cls, chapters: List[Dict], seen_before: Optional[Set[str]] = None) -> Dict[str, Any]:
+        """
+        计算分段中可数、可列举的字段
+
+        Args:
+            chapters: 分段内的章节分析结果
+            seen_before: 前面分段中出现过的角色名（为None时按 first_appearance 判断新角色）
+
+        Returns:
+            {'characters_summary', 'locations_summary', 'plot_summary', 'world_building'}（叙述字段留空）
+        """
+        appearances = Counter()
+        roles: Dict[str, Counter] = {}
+        relationships: Dict[str, List[str]] = {}
+        new_characters = []
+        locations = Counter()
+        key_events, conflicts = [], []
+        world = {field: [] for field in set(cls.WORLD_FIELDS.values())}
+
+        for ch in chapters:
+            for char in cls._items(ch.get('characters')):
+                name = char.get('name')
+                if not isinstance(name, str) or not name:
+                    continue
+                appearances[name] += 1
+                roles.setdefault(name, Counter())[char.get('role') or 'supporting'] += 1
+                is_new = name not in seen_before if seen_before is not None else char.get('first_appearance')
+                if is_new and name not in new_characters:
+                    new_characters.append(name)
+                rels = relationships.setdefault(name, [])
+                for rel in cls._items(char.get('relationships')):
+                    label = f"{rel.get('target', '')}：{rel.get('relation_type', '')}".strip('：')
+                    if label and label not in rels:
+                        rels.append(label)
+
+            for loc in cls._items(ch.get('locations')):
+                if isinstance(loc.get('name'), str) and loc['name']:
+                    locations[loc['name']] += 1
+
+            for event in cls._items(ch.get('events')):
+                desc = str(event.get('description', ''))[:100]
+                if not desc:
+                    continue
+                if event.get('importance') == 'high' or event.get('type') in ('climax', 'turning_point'):
+                    key_events.append(desc)
+                if event.get('type') == 'conflict':
+                    conflicts.append(desc)
+
+            for elem in cls._items(ch.get('world_elements')):
+                field = cls.WORLD_FIELDS.get(elem.get('type'))
+                if field and elem.get('element'):
+                    entry = f"{elem['element']}：{elem.get('details', '')}".rstrip('：')[:80]
+                    if entry not in world[field]:
+                        world[field].append(entry)
+
+        # 出场章节数多者优先，同等时主角/反派优先
+        role_rank = {'protagonist': 0, 'antagonist': 1}
+        ranked = sorted(appearances, key=lambda n: (-appearances[n],
+                                                    role_rank.get(roles[n].most_common(1)[0][0], 2)))
+        main_characters = [
+            {
+                'name': name,
+                'role': roles[name].most_common(1)[0][0],
+                'development': '',
+                'key_relationships': relationships[name][:5],
+                'power_growth': '',
+                'appearance_count': appearances[name]
+            }
+            for name in ranked[:cls.MAX_MAIN_CHARACTERS]
+        ]
+
+        return {
+            'characters_summary': {
+                'main_characters': main_characters,
+                'new_characters': new_characters,
+                'character_count': len(appearances)
+            },
+            'locations_summary': {
+                'main_locations': [name for name, _ in locations.most_common(cls.MAX_LOCATIONS)],
+                'location_count': len(locations)
+            },
+            'plot_summary': {
+                'main_storyline': '',
+                'key_events': list(dict.fromkeys(key_events))[:cls.MAX_KEY_EVENTS],
+                'conflicts': list(dict.fromkeys(conflicts))[:cls.MAX_CONFLICTS],
+                'emotional_arc': ''
+            },
+            'world_building': {field: values[:cls.MAX_WORLD_ITEMS] for field, values in sorted(world.items())}
+        }
+
+    @classmethod
+    def to_prompt(cls, chapters: List[Dict], facts: Dict[str, Any],
+                  summaries: Optional[Dict[Any, str]] = None) -> str:
+        """
+        生成供LLM撰写叙述字段的分段摘要（每章一行）
+
+        Args:
+            chapters: 分段内的章节分析结果
+            facts: compute 的结果
+            summaries: 预压缩后的各章摘要 {章节号: 文本}（默认截取摘要前120字）
+
+        Returns:
+            摘要文本
+        """
+        main = facts['characters_summary']['main_characters']
+        lines = ["主要角色：" + '、'.join(
+            f"{c['name']}({c['role']}，{c['appearance_count']}章)" for c in main)]
+
+        # 主要角色的状态变化（角色发展与实力成长的依据）
+        names = {c['name'] for c in main}
+        changes: Dict[str, List[str]] = {}
+        for ch in chapters:
+            for char in cls._items(ch.get('characters')):
+                if char.get('name') in names:
+                    for change in char.get('status_changes') or []:
+                        changes.setdefault(char['name'], []).append(f"第{ch.get('chapter_number')}章 {change}")
+        if changes:
+            lines.append("角色状态变化：")
+            lines.extend(f"- {name}：{'；'.join(items[:6])}" for name, items in changes.items())
+
+        lines.append("各章概要：")
+        for ch in chapters:
+            summary = ch.get('chapter_summary') if isinstance(ch.get('chapter_summary'), dict) else {}
+            if summaries is not None:
+                content = summaries.get(ch.get('chapter_number'), '')
+            else:
+                content = str(summary.get('main_content', ''))[:120]
+            events = '；'.join(str(e.get('description', ''))[:40] for e in cls._items(ch.get('events'))[:3])
+            tone = '/'.join(dict.fromkeys(str(e.get('emotional_tone')) for e in cls._items(ch.get('events'))
+                                          if e.get('emotional_tone')))
+            parts = [f"第{ch.get('chapter_number')}章 {ch.get('chapter_title', '')}".strip()]
+            if content:
+                parts.append(content)
+            if events:
+                parts.append(f"事件：{events}")
+            if tone:
+                parts.append(f"基调：{tone}")
+            lines.append('｜'.join(parts))
+        return '\n'.join(lines)
+
+    @staticmethod
+    def apply_narrative(facts: Dict[str, Any], narrative: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        把LLM撰写的叙述字段填入本地计算结果
+
+        Args:
+            facts: compute 的结果（原地修改）
+            narrative: LLM返回的叙述字段
+
+        Returns:
+            与 SEGMENT_SUMMARY 结构相同的分段汇总（不含 segment_range 等基本信息）
+        """
+        plot = facts['plot_summary']
+        plot['main_storyline'] = str(narrative.get('main_storyline', ''))
+        plot['emotional_arc'] = str(narrative.get('emotional_arc', ''))
+
+        developments = {d.get('name'): d for d in narrative.get('character_development', []) or []
+                        if isinstance(d, dict)}
+        for char in facts['characters_summary']['main_characters']:
+            dev = developments.get(char['name'], {})
+            char['development'] = str(dev.get('development', ''))
+            char['power_growth'] = str(dev.get('power_growth', ''))
+
+        facts['style_patterns'] = {
+            'chapter_structure': str(narrative.get('chapter_structure', '')),
+            'pacing': str(narrative.get('pacing', '')),
+            'dialogue_ratio': str(narrative.get('dialogue_ratio', ''))
+        }
+        return facts
+
+    @staticmethod
+    def _items(value: Any) -> List[Dict]:
+        """列表中的字典条目（忽略格式不符的数据）"""
+        return [item for item in value if isinstance(item, dict)] if isinstance(value, list) else []
@@ -0,0 +1,278 @@
+"""
+文体统计引擎 - 基于 NumPy 的章节写作风格度量
+
+叙事视角、情感强度、描写重点、关键短语这些风格信息大多可以直接从原文统计得到，
+不必为每一章单独调用一次LLM。本模块把章节文本转为 Unicode 码位数组，用向量运算
+计算句长分布、对话占比、第一/第三人称代词比例、标点密度和 n-gram 重复度，
+并按阈值换算成与 writing_style_notes 相同结构的风格描述。
+"""
+import re
+from collections import Counter
+from typing import Dict, List, Any, Optional, Iterable
+import numpy as np
+
+
+class Stylometrics:
+    """章节文体统计"""
+
+    VERSION = 1
+
+    SENTENCE_SPLIT = re.compile(r'[。！？!?…\n]+')
+    QUOTED = re.compile(r'[“「『"][^”」』"]*[”」』"]')
+
+    FIRST_PERSON = ('我', '俺', '咱')
+    THIRD_PERSON = ('他', '她', '它')
+
+    PUNCTUATION = {
+        'comma': '，,、',
+        'period': '。.',
+        'exclamation': '！!',
+        'question': '？?',
+        'ellipsis': '…',
+        'dash': '—',
+        'quote': '“”「」『』"'
+    }
+
+    # 描写重点词表（每千字命中次数超过阈值即视为该章的描写重点）
+    FOCUS_LEXICON = {
+        '动作描写': ('拳', '剑', '刀', '掌', '冲', '踢', '挥', '闪', '劈', '杀'),
+        '心理描写': ('心中', '心里', '想到', '觉得', '感到', '暗道', '念头', '思索', '犹豫'),
+        '环境描写': ('天空', '阳光', '月光', '夜色', '风', '雨', '雾', '云', '树', '山'),
+        '外貌描写': ('眼睛', '眼眸', '脸', '眉', '长发', '衣', '身材', '容貌', '皮肤'),
+    }
+    FOCUS_THRESHOLD = 4.0
+
+    # 关键短语中不应出现的虚字
+    PHRASE_STOPCHARS = set('的了是在不这那就都也和与着把被我你他她它们个一')
+
+    # ========== 单章统计 ==========
+
+    @classmethod
+    def compute(cls, content: str) -> Dict[str, Any]:
+        """
+        计算单章文体指标
+
+        Args:
+            content: 章节原文
+
+        Returns:
+            指标字典（数值已取整，可直接写入JSON）
+        """
+        text = re.sub(r'\s+', '', content or '')
+        total = len(text)
+        codes = np.frombuffer(text.encode('utf-32-le'), dtype=np.uint32) if total else np.zeros(0, np.uint32)
+        per_1k = 1000.0 / total if total else 0.0
+
+        # 句长分布
+        lengths = np.array([len(s) for s in cls.SENTENCE_SPLIT.split(text) if s], dtype=np.int64)
+        if len(lengths):
+            sentence_length = {
+                'mean': round(float(lengths.mean()), 2),
+                'median': float(np.median(lengths)),
+                'std': round(float(lengths.std()), 2),
+                'p10': float(np.percentile(lengths, 10)),
+                'p90': float(np.percentile(lengths, 90))
+            }
+            short_ratio = float((lengths < 10).mean())
+            long_ratio = float((lengths > 40).mean())
+        else:
+            sentence_length = {'mean': 0.0, 'median': 0.0, 'std': 0.0, 'p10': 0.0, 'p90': 0.0}
+            short_ratio = long_ratio = 0.0
+
+        # 对话占比：引号内字数 / 总字数
+        quoted = cls.QUOTED.findall(text)
+        dialogue_chars = sum(len(q) for q in quoted)
+        narration = cls.QUOTED.sub('', text)
+
+        # 叙述部分（不含对话）的人称代词
+        first = sum(narration.count(p) for p in cls.FIRST_PERSON)
+        third = sum(narration.count(p) for p in cls.THIRD_PERSON)
+
+        punctuation = {
+            name: round(float(np.isin(codes, [ord(c) for c in chars]).sum()) * per_1k, 2)
+            for name, chars in cls.PUNCTUATION.items()
+        }
+
+        repetition, top_ngrams = cls._ngram_repetition(codes)
+
+        return {
+            'version': cls.VERSION,
+            'chars': total,
+            'sentences': int(len(lengths)),
+            'sentence_length': sentence_length,
+            'short_sentence_ratio': round(short_ratio, 3),
+            'long_sentence_ratio': round(long_ratio, 3),
+            'dialogue_ratio': round(dialogue_chars / total, 3) if total else 0.0,
+            'dialogue_count': len(quoted),
+            'first_person_per_1k': round(first * per_1k, 2),
+            'third_person_per_1k': round(third * per_1k, 2),
+            'first_person_ratio': round(first / (first + third), 3) if first + third else 0.0,
+            'punctuation_per_1k': punctuation,
+            'ngram_repetition': round(repetition, 4),
+            'top_ngrams': top_ngrams,
+            'focus_per_1k': {
+                focus: round(sum(narration.count(w) for w in words) * per_1k, 2)
+                for focus, words in cls.FOCUS_LEXICON.items()
+            }
+        }
+
+    @classmethod
+    def _ngram_repetition(cls, codes: np.ndarray, n: int = 4, top_n: int = 5):
+        """
+        汉字 4-gram 重复度与高频短语
+
+        每个汉字码位减去 0x4E00 后落在 16 位以内，4 个汉字正好拼成一个 uint64，
+        用 np.unique 一次完成计数。
+
+        Returns:
+            (重复度 = 1 - 不同n-gram数/n-gram总数, [[短语, 次数], ...])
+        """
+        is_cjk = (codes >= 0x4E00) & (codes <= 0x9FFF)
+        if len(codes) < n or not is_cjk.any():
+            return 0.0, []
+
+        offsets = np.where(is_cjk, codes - 0x4E00, 0).astype(np.uint64)
+        windows = len(codes) - n + 1
+        valid = np.ones(windows, dtype=bool)
+        keys = np.zeros(windows, dtype=np.uint64)
+        for k in range(n):
+            valid &= is_cjk[k:k + windows]
+            keys = (keys << np.uint64(16)) | offsets[k:k + windows]
+        keys = keys[valid]
+        if not len(keys):
+            return 0.0, []
+
+        uniques, counts = np.unique(keys, return_counts=True)
+        repetition = 1.0 - len(uniques) / len(keys)
+
+        top = []
+        for idx in np.argsort(-counts, kind='stable'):
+            if counts[idx] < 3 or len(top) >= top_n:
+                break
+            phrase = cls._decode(int(uniques[idx]), n)
+            if not set(phrase) & cls.PHRASE_STOPCHARS:
+                top.append([phrase, int(counts[idx])])
+        return float(repetition), top
+
+    @staticmethod
+    def _decode(key: int, n: int) -> str:
+        """还原 n-gram 键为文字"""
+        chars = []
+        for _ in range(n):
+            chars.append(chr((key & 0xFFFF) + 0x4E00))
+            key >>= 16
+        return ''.join(reversed(chars))
+
+    # ========== 风格描述 ==========
+
+    @classmethod
+    def to_style_notes(cls, metrics: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        换算为 writing_style_notes 结构（替代LLM风格任务）
+
+        Args:
+            metrics: compute 的结果
+
+        Returns:
+            {'narrative_perspective', 'key_phrases', 'emotional_intensity', 'description_focus', 'source'}
+        """
+        if metrics['first_person_ratio'] >= 0.4 and metrics['first_person_per_1k'] >= 3:
+            perspective = '第一人称'
+        else:
+            perspective = '第三人称'
+
+        punct = metrics['punctuation_per_1k']
+        excitement = punct['exclamation'] + 0.5 * (punct['question'] + punct['ellipsis'])
+        if excitement >= 8 or (excitement >= 5 and metrics['short_sentence_ratio'] >= 0.5):
+            intensity = 'high'
+        elif excitement >= 3:
+            intensity = 'medium'
+        else:
+            intensity = 'low'
+
+        focus = sorted(((density, name) for name, density in metrics['focus_per_1k'].items()
+                        if density >= cls.FOCUS_THRESHOLD), reverse=True)
+        description_focus = [name for _, name in focus[:3]]
+        if metrics['dialogue_ratio'] >= 0.3:
+            description_focus.append('对话描写')
+
+        return {
+            'narrative_perspective': perspective,
+            'key_phrases': [phrase for phrase, _ in metrics['top_ngrams']],
+            'emotional_intensity': intensity,
+            'description_focus': description_focus,
+            'source': 'stylometrics'
+        }
+
+    # ========== 全书汇总 ==========
+
+    SUMMARY_FIELDS = {
+        'sentence_length_mean': lambda m: m['sentence_length']['mean'],
+        'dialogue_ratio': lambda m: m['dialogue_ratio'],
+        'first_person_ratio': lambda m: m['first_person_ratio'],
+        'short_sentence_ratio': lambda m: m['short_sentence_ratio'],
+        'exclamation_per_1k': lambda m: m['punctuation_per_1k']['exclamation'],
+        'comma_per_1k': lambda m: m['punctuation_per_1k']['comma'],
+        'ngram_repetition': lambda m: m['ngram_repetition'],
+    }
+
+    @classmethod
+    def summarize(cls, chapter_metrics: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        汇总多章指标（均值/中位数/标准差/最小/最大，及对话占比异常章节）
+
+        只遍历一遍，逐章取出数值列，可直接传入流式聚合落盘的指标。
+
+        Args:
+            chapter_metrics: 每章指标（含 chapter 字段）
+
+        Returns:
+            汇总字典，没有指标时返回空字典
+        """
+        rows = {field: [] for field in cls.SUMMARY_FIELDS}
+        chapters = []
+        perspectives = Counter()
+        total_chars = 0
+        for m in chapter_metrics:
+            if not m or m.get('version') != cls.VERSION:
+                continue
+            for field, getter in cls.SUMMARY_FIELDS.items():
+                rows[field].append(getter(m))
+            chapters.append(m.get('chapter'))
+            perspectives[cls.to_style_notes(m)['narrative_perspective']] += 1
+            total_chars += m['chars']
+        if not chapters:
+            return {}
+
+        summary = {'chapters': len(chapters), 'total_chars': int(total_chars)}
+        columns = {}
+        for field, values in rows.items():
+            values = np.array(values, dtype=np.float64)
+            columns[field] = values
+            summary[field] = {
+                'mean': round(float(values.mean()), 4),
+                'median': round(float(np.median(values)), 4),
+                'std': round(float(values.std()), 4),
+                'min': round(float(values.min()), 4),
+                'max': round(float(values.max()), 4)
+            }
+
+        # 对话占比偏离均值两个标准差以上的章节
+        dialogue = columns['dialogue_ratio']
+        std = dialogue.std()
+        if std > 0:
+            outliers = np.flatnonzero(np.abs(dialogue - dialogue.mean()) > 2 * std)
+            summary['dialogue_outlier_chapters'] = [chapters[i] for i in outliers]
+        else:
+            summary['dialogue_outlier_chapters'] = []
+
+        summary['dominant_perspective'] = perspectives.most_common(1)[0][0]
+        return summary
+
+    @staticmethod
+    def dialogue_ratio_label(chapter_metrics: List[Optional[Dict[str, Any]]]) -> Optional[str]:
+        """多章平均对话占比（如 "32%"），没有指标时返回None"""
+        values = [m['dialogue_ratio'] for m in chapter_metrics if m]
+        if not values:
+            return None
+        return f"{float(np.mean(values)) * 100:.0f}%"
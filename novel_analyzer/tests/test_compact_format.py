@@ -0,0 +1,38 @@
+"""
+紧凑行格式往返回归测试
+
+运行: python -m pytest tests/
+"""
+import os
+import sys
+
+import pytest
+
+# 添加父目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.compact_format import CompactFormat, CompactFormatError
+from tools.benchmark_output_format import TASKS, make_results, project, task_payload
+
+
+@pytest.mark.parametrize('task', TASKS)
+def test_encode_decode_roundtrip(task):
+    """各任务编码后严格解析，结果与原结构一致"""
+    for result in make_results(20):
+        payload = task_payload(task, result)
+        assert CompactFormat.decode(task, CompactFormat.encode(task, payload)) == project(payload)
+
+
+def test_chapter_task_without_style_row():
+    """风格由本地统计代替时整章任务不需要 S 行，也不接受 S 行"""
+    result = make_results(1)[0]
+    text = CompactFormat.encode('chapter_no_style', result)
+    expected = project(result)
+    del expected['writing_style_notes']
+
+    assert not any(line.startswith('S|') for line in CompactFormat.instructions('chapter_no_style').splitlines())
+    assert CompactFormat.decode('chapter_no_style', text) == expected
+    with pytest.raises(CompactFormatError):
+        CompactFormat.decode('chapter', text)
+    with pytest.raises(CompactFormatError):
+        CompactFormat.decode('chapter_no_style', CompactFormat.encode('chapter', result))
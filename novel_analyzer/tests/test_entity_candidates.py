@@ -0,0 +1,53 @@
+"""
+本地实体候选回归测试
+
+运行: python -m pytest tests/
+"""
+import os
+import sys
+
+# 添加父目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analyzers.chapter_analyzer_v2 import ChapterAnalyzerV2
+from utils.entity_candidates import EntityCandidateExtractor
+
+
+CHAPTER = (
+    '林动道：“走吧。”王长老道：“好。”林动道：“此地不宜久留。”王长老道：“萧炎呢？”'
+    '林动说：“萧炎还在山上。”王长老说：“等萧炎回来再说。”'
+)
+
+
+def test_confident_names_keep_non_speaking_characters():
+    """对话只在林动、王长老之间，只被提到的萧炎也要进入本地名单"""
+    extractor = EntityCandidateExtractor({})
+    candidates = extractor.extract(CHAPTER)
+    scores = {c['name']: c['score'] for c in candidates['characters']}
+
+    assert candidates['confidence'] == 1.0
+    assert scores['萧炎'] < extractor.high_score
+    assert set(extractor.confident_names(candidates)) == {'林动', '王长老', '萧炎'}
+
+
+def test_low_confidence_chapter_still_lists_names_with_llm(tmp_path):
+    """对话归属大多落不到高分候选时，即使默认开启 replace_step1 也要调用LLM列出名单"""
+    analyzer = ChapterAnalyzerV2(None, {}, str(tmp_path), no_time_check=True)
+    content = '“走吧。”有人道。“好。”另一人说。“此地不宜久留。”那人又道。林动看了看天色。'
+    calls = []
+
+    def list_names(text):
+        calls.append(text)
+        return None
+
+    analyzer._list_character_names = list_names
+
+    assert analyzer.candidates.replace_step1
+    assert analyzer.candidates.extract(content)['confidence'] < analyzer.candidates.confidence_threshold
+    assert analyzer._extract_characters(content, 1) == []
+    assert calls == [content]
+
+
+def test_replace_step1_can_be_disabled():
+    extractor = EntityCandidateExtractor({'entity_candidates': {'replace_step1': False}})
+    assert extractor.confident_names(extractor.extract(CHAPTER)) == []
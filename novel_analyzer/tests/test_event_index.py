@@ -0,0 +1,38 @@
+"""
+事件索引回归测试
+
+运行: python -m pytest tests/
+"""
+import os
+import sys
+
+# 添加父目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from processors.event_index import EventIndex
+
+
+EVENTS = [
+    {'chapter_number': 3, 'type': 'development', 'importance': 'low', 'participants': ['林动']},
+    # 聚类合并的跨章战斗（第10-15章）
+    {'chapter_number': 10, 'chapter_span': [10, 15], 'chapter_numbers': [10, 12, 15],
+     'type': 'conflict', 'importance': 'high', 'participants': ['林动', '王长老']},
+    {'chapter_number': 13, 'type': 'conflict', 'importance': 'medium', 'participants': ['王长老']},
+]
+
+
+def test_clustered_event_matches_every_chapter_it_spans():
+    index = EventIndex.build(EVENTS)
+
+    assert index.query(start_chapter=12, end_chapter=14) == [1, 2]
+    assert index.query(start_chapter=15, end_chapter=15, participants='林动') == [1]
+    assert index.query(start_chapter=11, end_chapter=11) == []
+    # 多个章节落在范围内时只返回一次
+    assert index.query(start_chapter=1, end_chapter=20, types='conflict') == [1, 2]
+    assert index.count_by_chapter_range(10, 15) == 2
+
+
+def test_round_trip_keeps_span_positions():
+    index = EventIndex.from_dict(EventIndex.build(EVENTS).to_dict())
+    assert index.to_dict()['total_events'] == 3
+    assert index.query(start_chapter=12, end_chapter=14, importance='high') == [1]
@@ -0,0 +1,51 @@
+"""
+连载跟更分段失效回归测试
+
+运行: python -m pytest tests/
+"""
+import os
+import sys
+
+# 添加父目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analyzers.follow_tracker import FollowTracker
+
+
+def make_tracker(output_dir):
+    os.makedirs(os.path.join(output_dir, 'segment_summaries'))
+    tracker = FollowTracker(output_dir, {'processing': {'segment_size': 20}})
+    tracker.has_state = True
+    return tracker
+
+
+def test_segment_boundaries_follow_deduplicated_results(tmp_path):
+    """第5章是重复章节（预处理时去掉、分段前补回），第25章修订后 021-040 分段必须重算"""
+    output_dir = str(tmp_path)
+    tracker = make_tracker(output_dir)
+    for name in ('001-020', '021-040', '041-045'):
+        open(os.path.join(tracker.segment_dir, f'segment_{name}.json'), 'w').close()
+
+    chapter_results = [{'chapter_number': num} for num in range(1, 46)]
+    delta = {'new': [], 'changed': [{'number': 25}], 'removed': []}
+
+    affected_start = tracker.invalidate_segments(chapter_results, delta)
+
+    assert affected_start == 21
+    assert sorted(os.listdir(tracker.segment_dir)) == ['segment_001-020.json']
+    segments = [{'segment_range': '001-020'}, {'segment_range': '021-040'}, {'segment_range': '041-045'}]
+    assert [s['segment_range'] for s in FollowTracker.segments_from(segments, affected_start)] == \
+        ['021-040', '041-045']
+
+
+def test_stale_segment_containing_dirty_chapter_is_removed(tmp_path):
+    """旧分段的边界与本次不同时，包含变化章节的旧分段也要删除"""
+    tracker = make_tracker(str(tmp_path))
+    for name in ('001-014', '015-034'):
+        open(os.path.join(tracker.segment_dir, f'segment_{name}.json'), 'w').close()
+
+    chapter_results = [{'chapter_number': num} for num in range(1, 41)]
+    delta = {'new': [], 'changed': [{'number': 25}], 'removed': []}
+
+    assert tracker.invalidate_segments(chapter_results, delta) == 21
+    assert os.listdir(tracker.segment_dir) == ['segment_001-014.json']
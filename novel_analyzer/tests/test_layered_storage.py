@@ -0,0 +1,86 @@
+"""
+分层存储回归测试：流式与批量生成的各层内容一致
+
+运行: python -m pytest tests/
+"""
+import os
+import sys
+import json
+import shutil
+import filecmp
+
+# 添加父目录（及项目根目录，layered_storage 按包路径导入 smart_chunker）到路径
+ANALYZER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ANALYZER_DIR)
+sys.path.insert(0, os.path.dirname(ANALYZER_DIR))
+
+from processors.layered_storage import LayeredStorageGenerator
+from tools.benchmark_aggregate_memory import make_chapters
+
+
+def write_chapters(folder, num_chapters):
+    os.makedirs(folder)
+    for chapter in make_chapters(num_chapters, 60):
+        path = os.path.join(folder, f"chapter_{chapter['chapter_number']:04d}.json")
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(chapter, f, ensure_ascii=False)
+
+
+def layer_files(root):
+    files = set()
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            files.add(os.path.relpath(os.path.join(dirpath, filename), root))
+    return files
+
+
+def test_streaming_layers_match_batch_layers(tmp_path, capsys):
+    chapter_dir = str(tmp_path / 'chapters')
+    write_chapters(chapter_dir, 240)
+
+    for name, streaming in (('batch', False), ('streaming', True)):
+        generator = LayeredStorageGenerator('novel', str(tmp_path / name), model_type='llama3')
+        generator.generate_all_layers(chapter_dir, streaming=streaming)
+    capsys.readouterr()
+
+    batch_root = str(tmp_path / 'batch' / 'novel')
+    stream_root = str(tmp_path / 'streaming' / 'novel')
+    # raw 层：批量模式在 complete.json 中保留原始章节，流式模式另存为逐行文件
+    compared = {f for f in layer_files(batch_root) if not f.startswith('raw')}
+    assert compared == {f for f in layer_files(stream_root) if not f.startswith('raw')}
+    assert any(f.startswith(os.path.join('chunked', 'events')) for f in compared)
+
+    _, mismatch, errors = filecmp.cmpfiles(batch_root, stream_root, sorted(compared), shallow=False)
+    assert mismatch == [] and errors == []
+
+
+def test_incremental_update_matches_full_rebuild(tmp_path, capsys):
+    """先聚合前 200 章再追加 40 章（从 JSON 聚合状态恢复），结果与一次聚合全部章节一致"""
+    all_dir = str(tmp_path / 'all')
+    write_chapters(all_dir, 240)
+    follow_dir = str(tmp_path / 'follow')
+    os.makedirs(follow_dir)
+    names = sorted(os.listdir(all_dir))
+    for name in names[:200]:
+        shutil.copy(os.path.join(all_dir, name), follow_dir)
+
+    follow = LayeredStorageGenerator('novel', str(tmp_path / 'follow_kb'), model_type='llama3')
+    follow.update_layers(follow_dir)
+    state_path = tmp_path / 'follow_kb' / 'novel' / '.aggregate_state.json'
+    with open(state_path, 'r', encoding='utf-8') as f:
+        assert json.load(f)['state']['total_chapters'] == 200
+
+    for name in names[200:]:
+        shutil.copy(os.path.join(all_dir, name), follow_dir)
+    follow.update_layers(follow_dir)
+    assert '增量更新完成' in capsys.readouterr().out
+
+    LayeredStorageGenerator('novel', str(tmp_path / 'full_kb'), model_type='llama3').update_layers(all_dir)
+    capsys.readouterr()
+
+    follow_root = str(tmp_path / 'follow_kb' / 'novel')
+    full_root = str(tmp_path / 'full_kb' / 'novel')
+    compared = layer_files(full_root) - {'.aggregate_state.json'}
+    assert compared == layer_files(follow_root) - {'.aggregate_state.json'}
+    _, mismatch, errors = filecmp.cmpfiles(full_root, follow_root, sorted(compared), shallow=False)
+    assert mismatch == [] and errors == []
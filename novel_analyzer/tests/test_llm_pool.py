@@ -0,0 +1,72 @@
+"""
+LLM客户端池回归测试
+
+运行: python -m pytest tests/
+"""
+import os
+import sys
+
+import pytest
+
+# 添加父目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.llm_pool import LLMClientPool
+
+
+class StatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+class FakeLLM:
+    def __init__(self, url, errors):
+        self.url = url
+        self.errors = errors
+        self.calls = 0
+
+    def invoke(self, prompt):
+        self.calls += 1
+        error = self.errors.get(self.url)
+        if error is not None:
+            raise error
+        return f"ok from {self.url}"
+
+
+def make_pool(errors):
+    clients = {}
+
+    def factory(url):
+        clients[url] = FakeLLM(url, errors)
+        return clients[url]
+
+    pool = LLMClientPool(['http://a', 'http://b'], factory, health_interval=0, max_failures=1)
+    return pool, clients
+
+
+def test_client_error_is_raised_without_failover_or_ejection():
+    pool, clients = make_pool({'http://a': StatusError(400), 'http://b': StatusError(400)})
+    with pytest.raises(StatusError):
+        pool.invoke('prompt')
+    assert sum(c.calls for c in clients.values()) == 1
+    assert all(item['healthy'] and item['failures'] == 0 for item in pool.get_stats())
+
+
+@pytest.mark.parametrize('error', [StatusError(503), ConnectionRefusedError(), TimeoutError()])
+def test_endpoint_errors_fail_over_and_count(error):
+    pool, clients = make_pool({'http://a': error})
+    # 第一次调用选中 a（请求数相同时按顺序），失败后切换到 b
+    assert pool.invoke('prompt') == 'ok from http://b'
+    stats = {item['url']: item for item in pool.get_stats()}
+    assert stats['http://a']['failures'] == 1 and not stats['http://a']['healthy']
+
+
+def test_wrapped_connection_error_counts_as_endpoint_error():
+    try:
+        try:
+            raise ConnectionResetError()
+        except ConnectionResetError as e:
+            raise ValueError('wrapped') from e
+    except ValueError as wrapped:
+        assert LLMClientPool._is_endpoint_error(wrapped)
@@ -0,0 +1,37 @@
+"""
+预处理非正文章节检测回归测试
+
+运行: python -m pytest tests/
+"""
+import os
+import sys
+import random
+
+# 添加父目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analyzers.preprocessor import NovelPreprocessor
+
+
+def story_text(length, seed=7):
+    rng = random.Random(seed)
+    return ''.join(chr(rng.randint(0x4E00, 0x4E00 + 2000)) for _ in range(length))
+
+
+def reason_for(preprocessor, title, content):
+    chapter = {'number': 1, 'title': title, 'content': content}
+    return preprocessor._non_story_reason(chapter, preprocessor.hasher.shingles(content))
+
+
+def test_story_chapter_with_notice_word_in_title_is_kept(tmp_path):
+    preprocessor = NovelPreprocessor(str(tmp_path), {})
+    assert reason_for(preprocessor, '第35章 皇榜公告', story_text(2500)) is None
+
+
+def test_short_or_notice_dense_chapters_are_skipped(tmp_path):
+    preprocessor = NovelPreprocessor(str(tmp_path), {})
+    notice = '今天家里有事请假一天，明天加更补上，感谢各位书友的月票和打赏。' + story_text(300)
+    assert reason_for(preprocessor, '请假条', notice)
+    # 篇幅较长，但公告用语达到标题门槛
+    long_notice = story_text(1500) + '上架感言：感谢书友订阅，求月票推荐票，作者会努力更新。'
+    assert reason_for(preprocessor, '上架感言', long_notice)
@@ -0,0 +1,35 @@
+"""
+实体出处索引回归测试
+
+运行: python -m pytest tests/
+"""
+import os
+import sys
+
+# 添加父目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.provenance_index import ProvenanceIndex
+
+
+def test_apply_keeps_unmatchable_and_annotated_names():
+    """单字名无法匹配时保留；带括注的名称按去掉括注后的写法匹配；真正不存在的名称剔除"""
+    data = {
+        'characters': [
+            {'name': '炎', 'appearance_chapters': [], 'first_appearance_chapter': 1},
+            {'name': '林动（少年）', 'appearance_chapters': [], 'first_appearance_chapter': 1},
+            {'name': '王虚构', 'appearance_chapters': [], 'first_appearance_chapter': 1},
+        ],
+        'locations': [],
+        'events': [],
+        'plot_arcs': [{'chapter_number': 2, 'chapter_title': '第2章 出发'}],
+    }
+    chapters = [(1, '炎独自站在山顶。'), (2, '林动拔剑，炎在一旁观战。')]
+
+    index = ProvenanceIndex.build(ProvenanceIndex.collect_entities(data), chapters)
+    report = index.apply(data)
+
+    assert [c['name'] for c in data['characters']] == ['炎', '林动（少年）']
+    assert report['dropped_characters'] == ['王虚构']
+    assert report['unverified'] == ['炎']
+    assert data['characters'][1]['first_appearance_chapter'] == 2
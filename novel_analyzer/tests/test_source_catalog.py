@@ -0,0 +1,60 @@
+"""
+原文目录索引回归测试
+
+运行: python -m pytest tests/
+"""
+import os
+import sys
+
+# 添加父目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.file_utils import FileUtils
+from utils.source_catalog import SourceCatalog
+
+
+def write_chapters(folder, files):
+    for filename, content in files.items():
+        with open(os.path.join(folder, filename), 'w', encoding='utf-8') as f:
+            f.write(content)
+
+
+def test_sub_section_heading_does_not_split_chapter(tmp_path):
+    """章内的“第X节”小标题不切分章节，序号与 load_novel_files 一致"""
+    write_chapters(str(tmp_path), {
+        '第1章.txt': '第1章 开端\n正文甲\n第一节 小标题\n正文乙\n第二节 又一小节\n正文丙\n',
+        '第2章.txt': '第2章 出发\n正文丁\n',
+    })
+    catalog = SourceCatalog(str(tmp_path)).load()
+    chapters = FileUtils.load_novel_files(str(tmp_path))
+
+    assert [e['index'] for e in catalog.get_entries()] == [ch['number'] for ch in chapters]
+    assert catalog.lookup(2)['title'] == '第2章 出发'
+    assert catalog.read_chapter(1) == chapters[0]['content']
+
+
+def test_multi_chapter_file_keeps_file_index(tmp_path):
+    """合集文件按标题可查到各章节，但只占一个阅读顺序序号"""
+    write_chapters(str(tmp_path), {
+        '01.txt': '第1章 开端\n正文甲\n第2章 出发\n正文乙\n',
+        '02.txt': '第3章 归来\n正文丙\n',
+    })
+    catalog = SourceCatalog(str(tmp_path)).load()
+
+    assert len(catalog.get_entries()) == 2
+    assert catalog.read_chapter(chapter_title='第2章 出发').startswith('第2章 出发')
+    assert catalog.read_chapter(2).startswith('第3章 归来')
+
+
+def test_catalog_cache_is_kept_out_of_novel_dir(tmp_path):
+    """索引文件写入指定的 intermediate 目录，小说原文目录保持不变"""
+    novel_dir = tmp_path / 'novel'
+    novel_dir.mkdir()
+    write_chapters(str(novel_dir), {'第1章.txt': '第1章 开端\n正文甲\n'})
+    cache_path = str(tmp_path / 'output' / 'intermediate' / SourceCatalog.CATALOG_FILENAME)
+
+    SourceCatalog(str(novel_dir), cache_path).load()
+
+    assert os.listdir(str(novel_dir)) == ['第1章.txt']
+    assert os.path.exists(cache_path)
+    assert SourceCatalog(str(novel_dir), cache_path).load().lookup(1)['title'] == '第1章 开端'
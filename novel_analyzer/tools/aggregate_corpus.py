@@ -0,0 +1,96 @@
+"""
+语料库聚合工具 - 多进程并行聚合多部小说的章节分析结果
+
+每部小说的输出目录下应包含 intermediate/chapter_summaries/，
+聚合结果保存到 <output>/<小说名>/ 下的分类JSON文件。
+"""
+import os
+import sys
+import time
+import argparse
+import yaml
+
+# 添加父目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from processors.parallel_aggregator import ParallelAggregator
+from processors.data_aggregator import DataAggregator
+
+
+def find_novels(corpus_dir: str) -> dict:
+    """
+    查找语料库目录下所有含章节摘要的小说
+
+    Args:
+        corpus_dir: 语料库目录（每个子目录为一部小说的分析输出）
+
+    Returns:
+        {小说名: 章节摘要目录}
+    """
+    novels = {}
+    for name in sorted(os.listdir(corpus_dir)):
+        summaries_dir = os.path.join(corpus_dir, name, 'intermediate', 'chapter_summaries')
+        if os.path.isdir(summaries_dir):
+            novels[name] = summaries_dir
+    return novels
+
+
+def load_config(config_path: str = None) -> dict:
+    """
+    加载配置文件
+
+    Args:
+        config_path: 配置文件路径（默认 config/config.yaml）
+
+    Returns:
+        配置字典
+    """
+    if config_path is None:
+        config_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                   'config', 'config.yaml')
+    with open(config_path, 'r', encoding='utf-8') as f:
+        return yaml.safe_load(f) or {}
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='多进程并行聚合多部小说')
+    parser.add_argument('--corpus-dir', required=True, help='语料库目录（每个子目录为一部小说的分析输出）')
+    parser.add_argument('--output', '-o', required=True, help='聚合结果输出目录')
+    parser.add_argument('--workers', type=int, help='工作进程数（默认CPU核数）')
+    parser.add_argument('--shard-size', type=int, default=200, help='每个分片的章节数')
+    parser.add_argument('--cluster-events', action='store_true',
+                        help='合并跨章节重复的事件（等同于 event_clustering.enabled: true）')
+    parser.add_argument('--config', help='配置文件路径（默认 config/config.yaml，读取 event_clustering 段）')
+
+    args = parser.parse_args()
+
+    print("\n" + "="*60)
+    print("📚 语料库并行聚合")
+    print("="*60 + "\n")
+
+    novels = find_novels(args.corpus_dir)
+    if not novels:
+        print(f"❌ 未找到任何 intermediate/chapter_summaries 目录: {args.corpus_dir}")
+        return
+
+    # 事件聚类参数取自配置文件，--cluster-events 只覆盖 enabled
+    config = load_config(args.config)
+    event_clustering = dict(config.get('event_clustering', {}) or {})
+    if args.cluster_events:
+        event_clustering['enabled'] = True
+
+    start = time.time()
+    aggregator = ParallelAggregator(max_workers=args.workers, shard_size=args.shard_size,
+                                    event_clustering=event_clustering)
+    results = aggregator.aggregate_corpus(novels)
+    print(f"\n⏱️  聚合耗时: {time.time() - start:.1f}秒")
+
+    for novel_name, data in results.items():
+        DataAggregator(novels[novel_name]).save_aggregated_data(
+            os.path.join(args.output, novel_name), data
+        )
+
+
+if __name__ == '__main__':
+    main()
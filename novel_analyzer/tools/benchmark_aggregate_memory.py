@@ -0,0 +1,180 @@
+"""
+聚合数据内存基准 - 对比字典聚合与紧凑记录聚合的内存占用
+
+使用合成章节数据，分别以 compact=False / compact=True 运行 DataAggregator
+的角色、地点、事件聚合，用 tracemalloc 统计聚合结果常驻内存，并校验两种
+模式序列化后的 JSON 一致。
+
+--streaming 模式下将合成章节写入临时目录，在不同章节规模下对比
+create_aggregated_data 与 stream_aggregated_data 的内存峰值。
+"""
+import os
+import sys
+import json
+import random
+import argparse
+import tempfile
+import tracemalloc
+
+# 添加父目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from processors.data_aggregator import DataAggregator
+from processors.aggregate_records import to_jsonable
+
+
+def make_chapters(num_chapters: int, num_characters: int, seed: int = 42) -> list:
+    """
+    生成合成章节数据
+
+    Args:
+        num_chapters: 章节数
+        num_characters: 角色池大小
+        seed: 随机种子
+
+    Returns:
+        章节数据列表
+    """
+    rng = random.Random(seed)
+    names = [f"角色{i:04d}" for i in range(num_characters)]
+    places = [f"地点{i:03d}" for i in range(num_characters // 4 + 1)]
+
+    chapters = []
+    for num in range(1, num_chapters + 1):
+        cast = rng.sample(names, min(12, len(names)))
+        chapters.append({
+            'chapter_number': num,
+            'chapter_title': f"第{num}章 标题{num}",
+            'characters': [
+                {
+                    'name': name,
+                    'role': rng.choice(['protagonist', 'supporting', 'antagonist']),
+                    'first_appearance': rng.random() < 0.05,
+                    'status_changes': [f"{name}状态变化{num}"] if rng.random() < 0.3 else [],
+                    'relationships': [
+                        {'target': rng.choice(cast), 'relation_type': '朋友', 'description': '同伴'}
+                    ] if rng.random() < 0.3 else [],
+                    'appearance_traits': ['黑发', '高大'],
+                    'personality_traits': ['坚毅', rng.choice(['冷静', '冲动'])]
+                }
+                for name in cast
+            ],
+            'locations': [
+                {
+                    'name': rng.choice(places),
+                    'type': '城市',
+                    'first_appearance': False,
+                    'description': f"第{num}章描述"
+                }
+                for _ in range(3)
+            ],
+            'events': [
+                {
+                    'type': rng.choice(['conflict', 'development', 'climax']),
+                    'description': f"第{num}章事件{i}",
+                    'importance': rng.choice(['high', 'medium', 'low']),
+                    'emotional_tone': '紧张',
+                    'participants': rng.sample(cast, 3)
+                }
+                for i in range(5)
+            ]
+        })
+    return chapters
+
+
+def measure(chapters: list, compact: bool, workdir: str):
+    """
+    统计一次聚合结果的常驻内存
+
+    Returns:
+        (结果, 常驻字节数, 峰值字节数)
+    """
+    aggregator = DataAggregator(workdir, compact=compact)
+
+    tracemalloc.start()
+    result = {
+        'characters': aggregator.aggregate_characters(chapters),
+        'locations': aggregator.aggregate_locations(chapters),
+        'events': aggregator.aggregate_events(chapters),
+    }
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return result, current, peak
+
+
+def measure_streaming(num_chapters: int, num_characters: int):
+    """
+    在给定章节规模下对比批量聚合与流式聚合的内存峰值
+
+    Returns:
+        (批量峰值字节数, 流式峰值字节数)
+    """
+    with tempfile.TemporaryDirectory() as workdir:
+        for chapter in make_chapters(num_chapters, num_characters):
+            path = os.path.join(workdir, f"chapter_{chapter['chapter_number']:05d}.json")
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(chapter, f, ensure_ascii=False)
+
+        peaks = []
+        for streaming in (False, True):
+            aggregator = DataAggregator(workdir, compact=True)
+            tracemalloc.start()
+            if streaming:
+                # 事件、情节线索等随章节增长的列表落盘，与 --aggregate --streaming 一致
+                data = aggregator.stream_aggregated_data(spill_dir=os.path.join(workdir, '.spill'))
+            else:
+                data = aggregator.create_aggregated_data()
+            peaks.append(tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+            del data
+
+    return peaks[0], peaks[1]
+
+
+def normalize(data: dict) -> dict:
+    """序列化并对无序的特征列表排序，便于比较"""
+    data = json.loads(json.dumps(data, ensure_ascii=False, default=to_jsonable))
+    for char in data['characters']:
+        char['appearance_traits'].sort()
+        char['personality_traits'].sort()
+    return data
+
+
+def main():
+    parser = argparse.ArgumentParser(description='聚合数据内存基准')
+    parser.add_argument('--chapters', type=int, default=3000, help='合成章节数')
+    parser.add_argument('--characters', type=int, default=800, help='角色池大小')
+    parser.add_argument('--streaming', action='store_true', help='对比批量聚合与流式聚合的内存峰值')
+    parser.add_argument('--scales', default='1000,5000,20000', help='流式对比的章节规模（逗号分隔）')
+    args = parser.parse_args()
+
+    if args.streaming:
+        rows = []
+        for scale in [int(x) for x in args.scales.split(',')]:
+            print(f"📊 章节规模 {scale} ...")
+            rows.append((scale, *measure_streaming(scale, args.characters)))
+
+        print(f"\n{'章节数':<10}{'批量峰值':>14}{'流式峰值':>14}")
+        for scale, batch_peak, stream_peak in rows:
+            print(f"{scale:<10}{batch_peak / 1024 / 1024:>12.2f}MB{stream_peak / 1024 / 1024:>12.2f}MB")
+        return
+
+    print(f"📊 生成合成数据: {args.chapters} 章, {args.characters} 个角色池")
+    chapters = make_chapters(args.chapters, args.characters)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        legacy, legacy_current, legacy_peak = measure(chapters, False, workdir)
+        compact, compact_current, compact_peak = measure(chapters, True, workdir)
+
+    print(f"\n{'模式':<10}{'常驻内存':>14}{'峰值内存':>14}")
+    print(f"{'dict':<10}{legacy_current / 1024 / 1024:>12.2f}MB{legacy_peak / 1024 / 1024:>12.2f}MB")
+    print(f"{'compact':<10}{compact_current / 1024 / 1024:>12.2f}MB{compact_peak / 1024 / 1024:>12.2f}MB")
+    print(f"\n📉 常驻内存降低: {(1 - compact_current / legacy_current) * 100:.1f}%")
+
+    same = normalize(legacy) == normalize(compact)
+    print(f"{'✅' if same else '❌'} JSON序列化结果{'一致' if same else '不一致'}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,254 @@
+"""
+输出格式基准 - 对比 JSON 与紧凑行格式的输出Token与延迟
+
+离线模式：把章节分析结果（--input-dir 下已有的 chapter_summaries，或合成数据）
+分别编码为模型通常输出的缩进 JSON 和紧凑行格式，按 ModelRouter.estimate_tokens
+统计各任务的输出Token，按 --tokens-per-second 估算生成耗时，统计本地解析耗时
+（JSONParser vs CompactFormat），并校验紧凑格式解析后与原结构一致。
+
+--live 模式：读取 --chapter-file 的章节原文，用 config.yaml 中的模型分别以两种格式
+调用 V2 的单次调用任务，记录实际的输出Token与调用耗时。
+"""
+import os
+import sys
+import glob
+import json
+import time
+import random
+import argparse
+import tempfile
+
+# 添加父目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.json_parser import JSONParser
+from utils.model_router import ModelRouter
+from utils.compact_format import CompactFormat
+
+# 基准任务（V1 整章任务 + V2 各单次调用任务）
+TASKS = ['chapter', 'characters', 'locations', 'events', 'world_elements', 'writing_style_notes', 'chapter_summary']
+# --live 模式调用的 V2 任务及对应方法
+LIVE_TASKS = {
+    'locations': '_extract_locations',
+    'world_elements': '_extract_world_elements',
+    'writing_style_notes': '_extract_writing_style',
+    'chapter_summary': '_extract_chapter_summary',
+}
+
+
+def make_results(num_chapters: int, seed: int = 42) -> list:
+    """
+    生成合成章节分析结果（六个字段齐全）
+
+    Args:
+        num_chapters: 章节数
+        seed: 随机种子
+
+    Returns:
+        章节分析结果列表
+    """
+    rng = random.Random(seed)
+    names = ['林远', '苏晴', '韩长老', '王铁', '赵灵儿', '黑袍人', '陈掌柜', '青衣少女']
+    places = ['青云城', '落霞山', '万剑宗', '黑风寨', '望月湖']
+
+    results = []
+    for num in range(1, num_chapters + 1):
+        cast = rng.sample(names, 4)
+        results.append({
+            'characters': [
+                {
+                    'name': name,
+                    'role': rng.choice(['protagonist', 'supporting', 'antagonist']),
+                    'first_appearance': rng.random() < 0.2,
+                    'status_changes': [f"{name}突破到炼气{rng.randint(2, 9)}层"] if rng.random() < 0.4 else [],
+                    'relationships': [
+                        {'target': rng.choice([c for c in cast if c != name]), 'relation_type': '师徒',
+                         'description': '在宗门试炼中结下师徒之谊'}
+                    ] if rng.random() < 0.5 else [],
+                    'appearance_traits': ['一袭青衫', '眉目清秀'],
+                    'personality_traits': ['沉稳', rng.choice(['冷静', '冲动', '谨慎'])]
+                }
+                for name in cast
+            ],
+            'locations': [
+                {'name': place, 'type': '城池', 'first_appearance': False,
+                 'description': f"{place}依山而建，是附近修士往来的要地"}
+                for place in rng.sample(places, 2)
+            ],
+            'events': [
+                {
+                    'type': rng.choice(['conflict', 'development', 'climax', 'turning_point']),
+                    'description': f"{cast[0]}与{cast[1]}在{rng.choice(places)}发生争执，最终不欢而散",
+                    'importance': rng.choice(['high', 'medium', 'low']),
+                    'emotional_tone': rng.choice(['紧张', '压抑', '轻松']),
+                    'participants': cast[:2]
+                }
+                for _ in range(4)
+            ],
+            'world_elements': [
+                {'type': 'power_system', 'element': '炼气境', 'details': '修炼的第一个大境界，共分九层'},
+                {'type': 'organization', 'element': '万剑宗', 'details': '以剑修为主的正道宗门'}
+            ],
+            'writing_style_notes': {
+                'narrative_perspective': '第三人称',
+                'key_phrases': ['剑气纵横', '心中一凛'],
+                'emotional_intensity': rng.choice(['high', 'medium', 'low']),
+                'description_focus': ['动作描写', '心理描写']
+            },
+            'chapter_summary': {
+                'title': f"第{num}章 试炼",
+                'main_content': f"{cast[0]}随{cast[1]}进入试炼之地，途中遭遇伏击，"
+                                f"凭借机智化险为夷，并从{cast[2]}口中得知宗门内部暗流涌动。" * 3,
+                'key_points': ['进入试炼之地', '遭遇伏击', '得知宗门秘密'],
+                'chapter_purpose': '推进主线并埋下伏笔'
+            }
+        })
+    return results
+
+
+def load_results(input_dir: str) -> list:
+    """读取已有的章节分析结果（只保留六个字段齐全的）"""
+    results = []
+    for path in sorted(glob.glob(os.path.join(input_dir, '*.json'))):
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if isinstance(data, dict) and all(key in data for key in TASKS[1:]):
+            results.append({key: data[key] for key in TASKS[1:]})
+    return results
+
+
+def task_payload(task: str, result: dict):
+    """任务对应的输出结构"""
+    return result if task == 'chapter' else result[task]
+
+
+def project(payload):
+    """去掉协议之外的附加字段（如本地文体统计写入的 source），便于往返比较"""
+    keys = {name for columns in CompactFormat.RECORDS.values() for name, _, _ in columns}
+    keys |= {'relationships', 'key_points', 'characters', 'locations', 'events',
+             'world_elements', 'writing_style_notes', 'chapter_summary'}
+
+    def strip(value):
+        if isinstance(value, dict):
+            return {k: strip(v) for k, v in value.items() if k in keys and not (k == 'aliases' and not v)}
+        if isinstance(value, list):
+            return [strip(v) for v in value]
+        return value
+    return strip(payload)
+
+
+def benchmark_offline(results: list, tokens_per_second: float):
+    """离线对比两种格式的输出Token、估算生成耗时与本地解析耗时"""
+    print(f"\n{'任务':<22}{'JSON Tok':>10}{'紧凑 Tok':>10}{'节省':>8}"
+          f"{'JSON生成':>10}{'紧凑生成':>10}{'JSON解析':>11}{'紧凑解析':>11}")
+
+    mismatches = 0
+    for task in TASKS:
+        json_tokens = compact_tokens = 0
+        json_parse = compact_parse = 0.0
+        for result in results:
+            payload = task_payload(task, result)
+            json_text = json.dumps(payload, ensure_ascii=False, indent=2)
+            compact_text = CompactFormat.encode(task, payload)
+            json_tokens += ModelRouter.estimate_tokens(json_text)
+            compact_tokens += ModelRouter.estimate_tokens(compact_text)
+
+            start = time.perf_counter()
+            JSONParser.parse(json_text)
+            json_parse += time.perf_counter() - start
+
+            start = time.perf_counter()
+            decoded = CompactFormat.decode(task, compact_text)
+            compact_parse += time.perf_counter() - start
+            if decoded != project(payload):
+                mismatches += 1
+
+        count = len(results)
+        saving = (1 - compact_tokens / json_tokens) * 100 if json_tokens else 0.0
+        print(f"{task:<22}{json_tokens / count:>10.0f}{compact_tokens / count:>10.0f}{saving:>7.1f}%"
+              f"{json_tokens / count / tokens_per_second:>9.1f}s{compact_tokens / count / tokens_per_second:>9.1f}s"
+              f"{json_parse / count * 1000:>9.3f}ms{compact_parse / count * 1000:>9.3f}ms")
+
+    print(f"\n（Token 与耗时均为每章平均值，生成耗时按 {tokens_per_second:.0f} tok/s 估算）")
+    if mismatches:
+        print(f"❌ 往返校验不一致: {mismatches} 处")
+    else:
+        print(f"✅ 紧凑格式往返解析与原结构一致")
+
+
+class RecordingLLM:
+    """记录每次调用的输出文本与耗时"""
+
+    def __init__(self, llm):
+        self.llm = llm
+        self.calls = []
+
+    def invoke(self, prompt):
+        start = time.perf_counter()
+        response = self.llm.invoke(prompt)
+        text = response.content if hasattr(response, 'content') else str(response)
+        self.calls.append((ModelRouter.estimate_tokens(text), time.perf_counter() - start))
+        return response
+
+
+def benchmark_live(chapter_file: str, config_path: str, rounds: int):
+    """用真实模型对比两种格式的输出Token与调用耗时"""
+    from main import load_config, init_llm
+    from analyzers.chapter_analyzer_v2 import ChapterAnalyzerV2
+
+    with open(chapter_file, 'r', encoding='utf-8') as f:
+        content = f.read()[:6000]
+
+    config = load_config(config_path)
+    config.setdefault('entity_registry', {})['enabled'] = False
+    llm = init_llm(config)
+
+    print(f"\n{'任务':<22}{'格式':<9}{'输出Tok':>9}{'耗时':>9}{'成功':>6}")
+    with tempfile.TemporaryDirectory() as workdir:
+        for output_format in ('json', 'compact'):
+            config.setdefault('extraction', {})['output_format'] = output_format
+            recorder = RecordingLLM(llm)
+            analyzer = ChapterAnalyzerV2(recorder, config, workdir, no_time_check=True)
+            for task, method in LIVE_TASKS.items():
+                recorder.calls = []
+                successes = 0
+                for _ in range(rounds):
+                    if getattr(analyzer, method)(content, 0) is not None:
+                        successes += 1
+                tokens = sum(t for t, _ in recorder.calls) / max(len(recorder.calls), 1)
+                latency = sum(s for _, s in recorder.calls) / max(len(recorder.calls), 1)
+                print(f"{task:<22}{output_format:<9}{tokens:>9.0f}{latency:>8.1f}s{successes:>4}/{rounds}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='JSON 与紧凑行格式的输出Token/延迟基准')
+    parser.add_argument('--input-dir', help='已有的 chapter_summaries 目录（默认使用合成数据）')
+    parser.add_argument('--chapters', type=int, default=200, help='合成章节数')
+    parser.add_argument('--tokens-per-second', type=float, default=30.0, help='估算生成耗时用的输出速度')
+    parser.add_argument('--live', action='store_true', help='用 config.yaml 中的模型实际调用对比')
+    parser.add_argument('--chapter-file', help='--live 模式使用的章节原文文件')
+    parser.add_argument('--config', default=None, help='配置文件路径')
+    parser.add_argument('--rounds', type=int, default=3, help='--live 模式每个任务的调用轮数')
+    args = parser.parse_args()
+
+    if args.live:
+        if not args.chapter_file:
+            parser.error('--live 需要 --chapter-file')
+        benchmark_live(args.chapter_file, args.config, args.rounds)
+        return
+
+    if args.input_dir:
+        results = load_results(args.input_dir)
+        print(f"📊 读取 {len(results)} 章分析结果: {args.input_dir}")
+    else:
+        results = make_results(args.chapters)
+        print(f"📊 生成合成数据: {args.chapters} 章")
+    if not results:
+        print("❌ 没有可用的章节分析结果")
+        return
+
+    benchmark_offline(results, args.tokens_per_second)
+
+
+if __name__ == '__main__':
+    main()
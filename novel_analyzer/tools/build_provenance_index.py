@@ -0,0 +1,115 @@
+"""
+实体出处索引工具 - 扫描原文建立 实体 → (章节, 偏移) 索引，并据此修正聚合数据
+
+用法：
+  # 建立索引（保存到 <output>/intermediate/provenance_index.json）
+  python tools/build_provenance_index.py -i <小说原文目录> -o <输出目录>
+
+  # 建立索引并修正聚合数据（剔除原文中不存在的实体，重建 appearance_chapters）
+  python tools/build_provenance_index.py -i <小说原文目录> -o <输出目录> --apply <聚合结果目录>
+
+  # 查询实体或事件的原文片段（使用已有索引，不调用LLM）
+  python tools/build_provenance_index.py -i <小说原文目录> -o <输出目录> --snippet 林远 --chapter 12
+  python tools/build_provenance_index.py -i <小说原文目录> -o <输出目录> --event 3
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+# 添加父目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from processors.data_aggregator import DataAggregator
+from utils.source_catalog import SourceCatalog
+from utils.provenance_index import ProvenanceIndex
+from utils.entity_registry import EntityRegistry
+
+
+def load_registry(intermediate_dir: str) -> dict:
+    """读取实体词典（提供别名；不存在时返回空字典）"""
+    path = os.path.join(intermediate_dir, EntityRegistry.REGISTRY_FILENAME)
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def build_index(catalog: SourceCatalog, data: dict, registry: dict, index_path: str) -> ProvenanceIndex:
+    """扫描原文建立索引并保存"""
+    entities = ProvenanceIndex.collect_entities(data, registry)
+    entries = catalog.get_entries()
+    print(f"🔎 扫描原文: {len(entries)} 章, {len(entities)} 个实体")
+
+    start = time.time()
+    # 章节号与 FileUtils.load_novel_files 一致：按阅读顺序从1开始
+    index = ProvenanceIndex.build(entities, ((e['index'], catalog.read_entry(e)) for e in entries))
+    index.save(index_path)
+
+    missing = [name for name in entities if index.is_matchable(name) and not index.count(name)]
+    unverified = [name for name in entities if not index.is_matchable(name)]
+    print(f"✅ 索引完成（{time.time() - start:.1f}秒）: {index_path}")
+    print(f"   原文中未出现的实体: {len(missing)} 个" + (f"（{'、'.join(missing[:20])}）" if missing else ''))
+    if unverified:
+        print(f"   名称过短无法匹配的实体: {len(unverified)} 个（{'、'.join(unverified[:20])}），修正时原样保留")
+    return index
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='实体出处索引：实体 → 原文章节与偏移')
+    parser.add_argument('--input', '-i', required=True, help='小说原文目录')
+    parser.add_argument('--output', '-o', required=True, help='分析输出目录（含 intermediate/chapter_summaries）')
+    parser.add_argument('--apply', metavar='DIR', help='修正聚合数据并保存到该目录')
+    parser.add_argument('--snippet', metavar='NAME', help='输出实体的原文片段')
+    parser.add_argument('--event', type=int, metavar='N', help='输出第 N 条聚合事件的原文证据')
+    parser.add_argument('--chapter', type=int, help='只取该章节的片段')
+    parser.add_argument('--limit', type=int, default=3, help='片段数量')
+    parser.add_argument('--rebuild', action='store_true', help='忽略已有索引重新扫描')
+    args = parser.parse_args()
+
+    intermediate_dir = os.path.join(args.output, 'intermediate')
+    chapter_dir = os.path.join(intermediate_dir, 'chapter_summaries')
+    index_path = os.path.join(intermediate_dir, ProvenanceIndex.INDEX_FILENAME)
+    catalog = SourceCatalog(args.input, os.path.join(intermediate_dir, SourceCatalog.CATALOG_FILENAME)).load()
+
+    data = None
+    if args.rebuild or args.apply or args.event is not None or not os.path.exists(index_path):
+        data = DataAggregator(chapter_dir).create_aggregated_data(include_raw_chapters=False)
+
+    if args.rebuild or not os.path.exists(index_path):
+        index = build_index(catalog, data, load_registry(intermediate_dir), index_path)
+    else:
+        index = ProvenanceIndex.load(index_path)
+        print(f"📂 读取已有索引: {index_path}（{len(index.entities)} 个实体）")
+
+    if args.snippet:
+        print(f"\n📍 {args.snippet}: 出现 {index.count(args.snippet)} 次，"
+              f"{len(index.chapters_of(args.snippet))} 章")
+        for item in index.snippets(args.snippet, catalog, args.chapter, limit=args.limit):
+            print(f"  第{item['chapter']}章 @{item['offset']}: …{item['text']}…")
+
+    if args.event is not None:
+        events = data['events']
+        if not 0 <= args.event < len(events):
+            print(f"❌ 事件编号超出范围: 0-{len(events) - 1}")
+        else:
+            event = events[args.event]
+            print(f"\n📍 事件 {args.event}（第{event['chapter_number']}章）: {event['description']}")
+            evidence = index.event_evidence(event, catalog)
+            print(f"  @{evidence['offset']}: …{evidence['text']}…" if evidence else "  ⚠️  参与者未在该章原文中出现")
+
+    if args.apply:
+        report = index.apply(data)
+        print(f"\n🧹 剔除原文中不存在的角色 {len(report['dropped_characters'])} 个、"
+              f"地点 {len(report['dropped_locations'])} 个，重建 {report['updated']} 个实体的出场章节，"
+              f"{len(report['unverified'])} 个无法匹配的实体原样保留")
+        for key in ('dropped_characters', 'dropped_locations'):
+            if report[key]:
+                print(f"   {key}: {'、'.join(report[key][:30])}")
+        DataAggregator(chapter_dir).save_aggregated_data(args.apply, data)
+
+
+if __name__ == '__main__':
+    main()
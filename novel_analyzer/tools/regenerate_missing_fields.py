@@ -27,6 +27,7 @@ except ImportError:
 
 from utils.file_utils import FileUtils
 from utils.json_parser import JSONParser
+from utils.source_catalog import SourceCatalog
 
 
 class MissingFieldsRegenerator:
@@ -41,16 +42,19 @@ class MissingFieldsRegenerator:
         'chapter_summary'
     ]
     
-    def __init__(self, llm, retry_times: int = 5):
+    def __init__(self, llm, retry_times: int = 5, cache_dir: Optional[str] = None):
         """
         初始化修复器
         
         Args:
             llm: LangChain LLM实例
             retry_times: 每个字段的重试次数
+            cache_dir: 原文目录索引的保存目录（分析输出的 intermediate 目录，为空时不保存）
         """
         self.llm = llm
         self.retry_times = retry_times
+        self.cache_dir = cache_dir
+        self._catalogs = {}
     
     def scan_incomplete_chapters(self, summaries_dir: str) -> Dict[int, List[str]]:
         """
@@ -86,7 +90,7 @@ class MissingFieldsRegenerator:
     
     def load_chapter_content(self, chapter_num: int, novel_dir: str) -> Optional[str]:
         """
-        加载章节原始内容
+        加载章节原始内容（通过原文目录索引定位）
         
         Args:
             chapter_num: 章节编号
@@ -95,38 +99,27 @@ class MissingFieldsRegenerator:
         Returns:
             章节内容文本
         """
-        novel_path = Path(novel_dir)
+        if novel_dir not in self._catalogs:
+            cache_path = os.path.join(self.cache_dir, SourceCatalog.CATALOG_FILENAME) if self.cache_dir else None
+            self._catalogs[novel_dir] = SourceCatalog(novel_dir, cache_path).load()
         
-        # 尝试常见的文件名格式
-        patterns = [
-            f"第{chapter_num}章*.txt",
-            f"第{chapter_num:03d}章*.txt",
-            f"chapter_{chapter_num:03d}.txt",
-            f"{chapter_num:03d}*.txt"
-        ]
+        content = self._catalogs[novel_dir].read_chapter(chapter_num)
+        if not content:
+            return None
         
-        for pattern in patterns:
-            files = list(novel_path.glob(pattern))
-            if files:
-                try:
-                    with open(files[0], 'r', encoding='utf-8') as f:
-                        content = f.read().strip()
-                    
-                    # 智能截断
-                    max_length = 6000
-                    if len(content) > max_length:
-                        truncate_pos = max_length
-                        for i in range(max_length, max(0, max_length - 200), -1):
-                            if content[i] in '。！？…\n':
-                                truncate_pos = i + 1
-                                break
-                        content = content[:truncate_pos]
-                    
-                    return content
-                except Exception as e:
-                    print(f"      ❌ 读取文件失败: {e}")
+        content = content.strip()
         
-        return None
+        # 智能截断
+        max_length = 6000
+        if len(content) > max_length:
+            truncate_pos = max_length
+            for i in range(max_length, max(0, max_length - 200), -1):
+                if content[i] in '。！？…\n':
+                    truncate_pos = i + 1
+                    break
+            content = content[:truncate_pos]
+        
+        return content
     
     def regenerate_field(self, field_name: str, content: str, chapter_num: int) -> Optional[any]:
         """
@@ -458,7 +451,8 @@ def main():
     llm = init_llm(config)
     
     # 创建修复器
-    regenerator = MissingFieldsRegenerator(llm)
+    # 原文目录索引保存在 chapter_summaries 的上级目录（intermediate）
+    regenerator = MissingFieldsRegenerator(llm, cache_dir=os.path.dirname(os.path.abspath(args.summaries_dir)))
     
     # 扫描不完整章节
     print("🔍 扫描不完整章节...\n")
@@ -18,6 +18,7 @@ load_dotenv()
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from utils.json_parser import JSONParser
+from utils.source_catalog import SourceCatalog
 
 # 导入LLM
 try:
@@ -34,14 +35,17 @@ except ImportError:
 class CharacterEventUpdater:
     """人物和事件信息更新器"""
     
-    def __init__(self, llm):
+    def __init__(self, llm, cache_dir: Optional[str] = None):
         """
         初始化更新器
         
         Args:
             llm: LangChain LLM实例
+            cache_dir: 原文目录索引的保存目录（分析输出的 intermediate 目录，为空时不保存）
         """
         self.llm = llm
+        self.cache_dir = cache_dir
+        self._catalogs = {}
     
     def update_chapter_file(self, json_file: str, novel_dir: str, backup: bool = True) -> bool:
         """
@@ -113,7 +117,7 @@ class CharacterEventUpdater:
     
     def _load_chapter_content(self, novel_dir: str, chapter_number: int, chapter_title: str = '') -> Optional[str]:
         """
-        加载章节原文
+        加载章节原文（通过原文目录索引定位）
         
         Args:
             novel_dir: 小说目录
@@ -123,63 +127,32 @@ class CharacterEventUpdater:
         Returns:
             章节内容
         """
-        # 方法1: 如果有章节标题，直接匹配标题
-        if chapter_title:
-            title_file = os.path.join(novel_dir, f"{chapter_title}.txt")
-            if os.path.exists(title_file):
-                try:
-                    with open(title_file, 'r', encoding='utf-8') as f:
-                        content = f.read()
-                    content = self._truncate_content(content)
-                    print(f"  📖 加载文件: {chapter_title}.txt")
-                    return content
-                except Exception as e:
-                    print(f"  ⚠️  读取文件 {chapter_title}.txt 失败: {e}")
-        
-        # 方法2: 遍历目录查找包含章节号的文件
-        try:
-            for filename in os.listdir(novel_dir):
-                if not filename.endswith('.txt'):
-                    continue
-                
-                # 匹配 "第X章" 开头的文件
-                if filename.startswith(f"第{chapter_number}章"):
-                    file_path = os.path.join(novel_dir, filename)
-                    try:
-                        with open(file_path, 'r', encoding='utf-8') as f:
-                            content = f.read()
-                        content = self._truncate_content(content)
-                        print(f"  📖 加载文件: {filename}")
-                        return content
-                    except Exception as e:
-                        print(f"  ⚠️  读取文件 {filename} 失败: {e}")
-        except Exception as e:
-            print(f"  ⚠️  遍历目录失败: {e}")
+        catalog = self._get_catalog(novel_dir)
+        record = catalog.lookup(chapter_number, chapter_title)
+        if not record:
+            return None
         
-        # 方法3: 尝试固定格式的文件名
-        possible_names = [
-            f"第{chapter_number}章.txt",
-            f"第{chapter_number:03d}章.txt",
-            f"第{chapter_number:04d}章.txt",
-            f"{chapter_number}.txt",
-            f"{chapter_number:03d}.txt",
-            f"chapter_{chapter_number}.txt",
-            f"chapter_{chapter_number:03d}.txt",
-        ]
+        content = catalog.read_entry(record)
+        if content is None:
+            return None
         
-        for name in possible_names:
-            file_path = os.path.join(novel_dir, name)
-            if os.path.exists(file_path):
-                try:
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        content = f.read()
-                    content = self._truncate_content(content)
-                    print(f"  📖 加载文件: {name}")
-                    return content
-                except Exception as e:
-                    print(f"  ⚠️  读取文件 {name} 失败: {e}")
+        print(f"  📖 加载文件: {record['path']}")
+        return self._truncate_content(content)
+    
+    def _get_catalog(self, novel_dir: str) -> SourceCatalog:
+        """
+        获取小说目录的原文索引（每个目录只构建一次）
         
-        return None
+        Args:
+            novel_dir: 小说目录
+            
+        Returns:
+            原文目录索引
+        """
+        if novel_dir not in self._catalogs:
+            cache_path = os.path.join(self.cache_dir, SourceCatalog.CATALOG_FILENAME) if self.cache_dir else None
+            self._catalogs[novel_dir] = SourceCatalog(novel_dir, cache_path).load()
+        return self._catalogs[novel_dir]
     
     def _truncate_content(self, content: str) -> str:
         """
@@ -424,7 +397,8 @@ def main():
     print()
     
     # 初始化更新器
-    updater = CharacterEventUpdater(llm)
+    # 原文目录索引保存在 chapter_summaries 的上级目录（intermediate）
+    updater = CharacterEventUpdater(llm, cache_dir=os.path.dirname(os.path.abspath(args.json_dir)))
     
     # 获取所有JSON文件（支持标题命名）
     json_files = []
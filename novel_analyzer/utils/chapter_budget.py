@@ -0,0 +1,119 @@
+"""
+单章预算 - 限制单个章节的LLM调用次数与耗时
+
+章节超出预算时抛出 ChapterBudgetExceeded，批量分析据此把该章节放入推迟重试队列，
+其余章节继续处理，推迟的章节在最后换用更短的内容窗口和备用模型重试。
+"""
+import time
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class ChapterBudgetExceeded(BaseException):
+    """
+    章节超出预算
+
+    与 asyncio.CancelledError 一样继承 BaseException：它是调度信号而不是调用错误，
+    不能被提取流程中的 except Exception 重试逻辑吞掉。
+    """
+
+
+class ChapterBudget:
+    """单章的调用次数与耗时预算"""
+
+    def __init__(self, max_calls: int = 0, max_seconds: float = 0):
+        """
+        初始化预算
+
+        Args:
+            max_calls: 最多LLM调用次数（0 表示不限）
+            max_seconds: 最长耗时（秒，0 表示不限）
+        """
+        self.max_calls = max_calls
+        self.max_seconds = max_seconds
+        self.calls = 0
+        self.start_time = time.time()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_calls > 0 or self.max_seconds > 0
+
+    @property
+    def elapsed(self) -> float:
+        return time.time() - self.start_time
+
+    def charge(self):
+        """登记一次LLM调用，超出预算时抛出 ChapterBudgetExceeded"""
+        if self.max_seconds and self.elapsed >= self.max_seconds:
+            raise ChapterBudgetExceeded(f"耗时 {self.elapsed:.0f}秒 超过 {self.max_seconds}秒")
+        if self.max_calls and self.calls >= self.max_calls:
+            raise ChapterBudgetExceeded(f"调用 {self.calls} 次达到上限 {self.max_calls} 次")
+        self.calls += 1
+
+
+class BudgetedLLM:
+    """在每次调用前扣减预算的LLM包装（其余属性透传给被包装的LLM）"""
+
+    def __init__(self, llm: Any, budget: ChapterBudget):
+        self.llm = llm
+        self.budget = budget
+
+    def invoke(self, *args, **kwargs):
+        self.budget.charge()
+        return self.llm.invoke(*args, **kwargs)
+
+    def __getattr__(self, name: str):
+        return getattr(self.llm, name)
+
+
+class DeferredQueue:
+    """推迟重试队列（线程安全）"""
+
+    def __init__(self, config: dict):
+        """
+        初始化队列
+
+        Args:
+            config: 配置字典（读取 scheduling 段）
+        """
+        scheduling = config.get('scheduling', {}) or {}
+        self.max_calls = int(scheduling.get('chapter_max_calls', 0) or 0)
+        self.max_seconds = float(scheduling.get('chapter_max_seconds', 0) or 0)
+        self.deferred_max_length = int(scheduling.get('deferred_max_length', 3000))
+        self.deferred_route = scheduling.get('deferred_route', 'deferred')
+
+        self._items: List[Tuple[int, Dict]] = []
+        self._lock = threading.Lock()
+
+    def new_budget(self) -> Optional[ChapterBudget]:
+        """为一个章节创建预算（未配置预算时返回None）"""
+        budget = ChapterBudget(self.max_calls, self.max_seconds)
+        return budget if budget.enabled else None
+
+    def park(self, idx: int, chapter: Dict, reason: Any):
+        """推迟一个章节"""
+        with self._lock:
+            self._items.append((idx, chapter))
+        print(f"  ⏸️  章节 {chapter['number']} 超出预算（{reason}），推迟到最后重试")
+
+    def drain(self) -> List[Tuple[int, Dict]]:
+        """取出全部推迟的章节（按原顺序）"""
+        with self._lock:
+            items = sorted(self._items, key=lambda item: item[0])
+            self._items = []
+        return items
+
+    def alternate_llm(self, llm: Any) -> Optional[Any]:
+        """
+        获取推迟重试使用的备用模型（启用模型路由时按 deferred_route 路由）
+
+        Args:
+            llm: 分析器当前的LLM（ModelRouter 或 RoutedLLM）
+
+        Returns:
+            备用模型，未启用路由时返回None
+        """
+        router = llm if hasattr(llm, 'route') else getattr(llm, 'router', None)
+        if router is None or not hasattr(router, 'route'):
+            return None
+        return router.route(self.deferred_route)
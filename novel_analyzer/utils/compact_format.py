@@ -0,0 +1,353 @@
+"""
+紧凑行格式 - 替代 JSON 的逐行输出协议
+
+JSON 输出要为每个实体重复键名、引号和缩进，输出 Token 是分析调用最慢的部分。
+紧凑模式下模型每行输出一条记录：首列为记录类型标记，其余字段按固定列序用 | 分隔，
+字段内的多个值用 ; 分隔。本地严格解析器按列序还原为与 JSON 模式完全相同的结构，
+任何一行不合规（未知标记、列数不足、枚举值非法）都视为解析失败，交给调用方重试。
+
+示例（地点任务）：
+    L|青云城|城市|1|坐落在山脚下的大城
+"""
+import re
+from typing import Dict, List, Any, Optional, Tuple
+
+
+class CompactFormatError(ValueError):
+    """紧凑格式解析错误"""
+
+
+class CompactFormat:
+    """紧凑行格式的提示词说明、编码与严格解析"""
+
+    FIELD_SEP = '|'
+    LIST_SEP = re.compile(r'\s*[;；]\s*')
+    EMPTY = {'', '-', '无'}
+    NONE_LINE = 'NONE'
+
+    TRUE_VALUES = {'1', 'true', 'yes', 'y', '是'}
+    FALSE_VALUES = {'0', 'false', 'no', 'n', '否'}
+
+    ENUM_ALIASES = {
+        'role': {'主角': 'protagonist', '反派': 'antagonist', '配角': 'supporting'},
+        'level': {'高': 'high', '中': 'medium', '低': 'low'},
+        'event_type': {'冲突': 'conflict', '发展': 'development', '高潮': 'climax', '转折': 'turning_point'},
+    }
+    ENUMS = {
+        'role': ('protagonist', 'antagonist', 'supporting'),
+        'level': ('high', 'medium', 'low'),
+        'event_type': ('conflict', 'development', 'climax', 'turning_point'),
+    }
+
+    # 记录类型：标记 -> [(字段名, 类型, 提示)]，类型为 str / bool / list / 枚举名
+    RECORDS = {
+        'C': [('name', 'str', '角色名'), ('role', 'role', '定位(protagonist/antagonist/supporting)'),
+              ('first_appearance', 'bool', '首次出场(1/0)'), ('status_changes', 'list', '状态变化'),
+              ('appearance_traits', 'list', '外貌特征'), ('personality_traits', 'list', '性格特征'),
+              ('aliases', 'list', '本章新出现的别称')],
+        'R': [('source', 'str', '角色名'), ('target', 'str', '相关角色名'),
+              ('relation_type', 'str', '关系类型'), ('description', 'str', '关系描述')],
+        'L': [('name', 'str', '地点名'), ('type', 'str', '地点类型'),
+              ('first_appearance', 'bool', '首次出现(1/0)'), ('aliases', 'list', '本章新出现的别称'),
+              ('description', 'str', '地点描述')],
+        'E': [('type', 'event_type', '类型(conflict/development/climax/turning_point)'),
+              ('importance', 'level', '重要性(high/medium/low)'), ('emotional_tone', 'str', '情感基调'),
+              ('participants', 'list', '参与角色'), ('description', 'str', '事件描述')],
+        'W': [('type', 'str', '类型(power_system/social_rule/special_item/organization)'),
+              ('element', 'str', '要素名称'), ('details', 'str', '详细信息')],
+        'S': [('narrative_perspective', 'str', '叙事视角'),
+              ('emotional_intensity', 'level', '情感强度(high/medium/low)'),
+              ('key_phrases', 'list', '关键短语'), ('description_focus', 'list', '描写重点')],
+        'T': [('title', 'str', '章节标题或核心主题'), ('chapter_purpose', 'str', '本章在整体故事中的作用'),
+              ('main_content', 'str', '主要内容概括(150-300字)')],
+        'K': [('point', 'str', '要点')],
+    }
+
+    # 任务 -> 允许的记录类型
+    TASKS = {
+        'characters': ('C', 'R'),
+        'character': ('C', 'R'),
+        'locations': ('L',),
+        'events': ('E',),
+        'event': ('E',),
+        'world_elements': ('W',),
+        'writing_style_notes': ('S',),
+        'chapter_summary': ('T', 'K'),
+        'chapter': ('C', 'R', 'L', 'E', 'W', 'S', 'T', 'K'),
+        # 写作风格由本地文体统计代替时的整章任务（不要求 S 行）
+        'chapter_no_style': ('C', 'R', 'L', 'E', 'W', 'T', 'K'),
+    }
+
+    # 整章任务（结果为各字段组成的字典）
+    CHAPTER_TASKS = ('chapter', 'chapter_no_style')
+
+    # ========== 提示词 ==========
+
+    @classmethod
+    def instructions(cls, task: str) -> str:
+        """
+        生成任务的输出格式说明
+
+        Args:
+            task: 任务名（见 TASKS）
+
+        Returns:
+            提示词片段
+        """
+        rows = []
+        for tag in cls.TASKS[task]:
+            rows.append(cls.FIELD_SEP.join([tag] + [hint for _, _, hint in cls.RECORDS[tag]]))
+
+        notes = [
+            "每行输出一条记录，第一列是记录类型标记，字段按以下列序用 | 分隔，字段内的多个值用 ; 分隔，"
+            "字段为空时写 -，不要输出表头、JSON、编号或任何解释文字：",
+            '\n'.join(rows)
+        ]
+        if 'R' in cls.TASKS[task]:
+            notes.append("R 行写在对应角色的 C 行之后，第一列是该角色名。")
+        if 'K' in cls.TASKS[task]:
+            notes.append("T 行只输出一行，每个要点单独一行 K。")
+        if task in ('character', 'event'):
+            notes.append("只输出这一条记录。")
+        elif task in cls.CHAPTER_TASKS:
+            notes.append(("S 行只输出一行，其余类型" if 'S' in cls.TASKS[task] else "") +
+                         "每条记录一行，按上面的顺序分组输出。")
+        elif task not in ('writing_style_notes', 'chapter_summary'):
+            notes.append(f"没有任何内容时只输出 {cls.NONE_LINE}。")
+        return '\n'.join(notes)
+
+    @classmethod
+    def build_prompt(cls, task: str, intro: str, content: str) -> str:
+        """
+        构建紧凑格式的任务提示词
+
+        Args:
+            task: 任务名
+            intro: 任务说明（如“分析以下章节内容，只提取地点信息。”）
+            content: 章节内容
+
+        Returns:
+            提示词
+        """
+        return f"{intro}\n\n章节内容：\n{content}\n\n{cls.instructions(task)}"
+
+    # ========== 解析 ==========
+
+    @classmethod
+    def parse(cls, task: str, text: str) -> Optional[Any]:
+        """
+        解析紧凑格式输出（失败返回None，与 JSONParser.parse 一致）
+
+        Args:
+            task: 任务名
+            text: LLM响应文本
+
+        Returns:
+            与 JSON 模式相同结构的结果
+        """
+        try:
+            return cls.decode(task, text)
+        except CompactFormatError:
+            return None
+
+    @classmethod
+    def decode(cls, task: str, text: str) -> Any:
+        """
+        严格解析紧凑格式输出
+
+        Args:
+            task: 任务名
+            text: LLM响应文本
+
+        Returns:
+            与 JSON 模式相同结构的结果
+
+        Raises:
+            CompactFormatError: 任意一行不合规
+        """
+        allowed = cls.TASKS[task]
+        records: Dict[str, List[Dict[str, Any]]] = {tag: [] for tag in allowed}
+        saw_none = False
+
+        for line_no, line in enumerate((text or '').splitlines(), 1):
+            line = line.strip()
+            if not line or line.startswith('```'):
+                continue
+            if line.upper() == cls.NONE_LINE:
+                saw_none = True
+                continue
+            tag, _, rest = line.partition(cls.FIELD_SEP)
+            tag = tag.strip().upper()
+            if tag not in allowed or not _:
+                raise CompactFormatError(f"第{line_no}行: 未知记录类型 {line[:20]!r}")
+            records[tag].append(cls._decode_fields(tag, rest, line_no))
+
+        if not saw_none and not any(records.values()):
+            raise CompactFormatError("没有任何记录")
+        return cls._assemble(task, records)
+
+    @classmethod
+    def _decode_fields(cls, tag: str, rest: str, line_no: int) -> Dict[str, Any]:
+        """按列序解析一行（多余的分隔符并入最后一列文本）"""
+        columns = cls.RECORDS[tag]
+        fields = rest.split(cls.FIELD_SEP)
+        if len(fields) < len(columns):
+            raise CompactFormatError(f"第{line_no}行: {tag} 需要 {len(columns)} 列，实际 {len(fields)} 列")
+        if len(fields) > len(columns):
+            fields = fields[:len(columns) - 1] + [cls.FIELD_SEP.join(fields[len(columns) - 1:])]
+
+        record = {}
+        for (name, kind, _), raw in zip(columns, fields):
+            record[name] = cls._decode_value(kind, raw.strip(), line_no, name)
+        return record
+
+    @classmethod
+    def _decode_value(cls, kind: str, raw: str, line_no: int, name: str) -> Any:
+        """解析单个字段"""
+        if kind == 'str':
+            return '' if raw in cls.EMPTY else raw
+        if kind == 'list':
+            return [] if raw in cls.EMPTY else [v for v in cls.LIST_SEP.split(raw) if v and v not in cls.EMPTY]
+        if kind == 'bool':
+            value = raw.lower()
+            if value in cls.TRUE_VALUES:
+                return True
+            if value in cls.FALSE_VALUES or value in cls.EMPTY:
+                return False
+            raise CompactFormatError(f"第{line_no}行: {name} 不是 1/0: {raw!r}")
+
+        value = cls.ENUM_ALIASES[kind].get(raw, raw.lower())
+        if value not in cls.ENUMS[kind]:
+            raise CompactFormatError(f"第{line_no}行: {name} 取值非法: {raw!r}")
+        return value
+
+    @classmethod
+    def _assemble(cls, task: str, records: Dict[str, List[Dict[str, Any]]]) -> Any:
+        """把记录还原为 JSON 模式的结构"""
+        result = {}
+        if 'C' in records:
+            result['characters'] = cls._characters(records['C'], records['R'])
+        if 'L' in records:
+            result['locations'] = [cls._drop_empty_aliases(loc) for loc in records['L']]
+        if 'E' in records:
+            result['events'] = records['E']
+        if 'W' in records:
+            result['world_elements'] = records['W']
+        if 'S' in records:
+            if len(records['S']) != 1:
+                raise CompactFormatError(f"S 需要恰好1行，实际 {len(records['S'])} 行")
+            result['writing_style_notes'] = records['S'][0]
+        if 'T' in records:
+            if len(records['T']) != 1:
+                raise CompactFormatError(f"T 需要恰好1行，实际 {len(records['T'])} 行")
+            summary = dict(records['T'][0])
+            summary['key_points'] = [k['point'] for k in records['K'] if k['point']]
+            result['chapter_summary'] = {key: summary[key] for key in
+                                         ('title', 'main_content', 'key_points', 'chapter_purpose')}
+
+        if task in cls.CHAPTER_TASKS:
+            return result
+        if task == 'character':
+            if len(result['characters']) != 1:
+                raise CompactFormatError(f"需要恰好1个角色，实际 {len(result['characters'])} 个")
+            return result['characters'][0]
+        if task == 'event':
+            if len(result['events']) != 1:
+                raise CompactFormatError(f"需要恰好1个事件，实际 {len(result['events'])} 个")
+            return result['events'][0]
+        return result[task]
+
+    @classmethod
+    def _characters(cls, characters: List[Dict], relations: List[Dict]) -> List[Dict]:
+        """把 R 行挂到对应角色下"""
+        by_name = {}
+        result = []
+        for row in characters:
+            char = {
+                'name': row['name'],
+                'role': row['role'],
+                'first_appearance': row['first_appearance'],
+                'status_changes': row['status_changes'],
+                'relationships': [],
+                'appearance_traits': row['appearance_traits'],
+                'personality_traits': row['personality_traits']
+            }
+            if row['aliases']:
+                char['aliases'] = row['aliases']
+            by_name.setdefault(char['name'], char)
+            result.append(char)
+
+        for rel in relations:
+            owner = by_name.get(rel['source'])
+            if owner is None:
+                raise CompactFormatError(f"关系行的角色 {rel['source']!r} 没有对应的 C 行")
+            owner['relationships'].append({
+                'target': rel['target'],
+                'relation_type': rel['relation_type'],
+                'description': rel['description']
+            })
+        return result
+
+    @staticmethod
+    def _drop_empty_aliases(record: Dict[str, Any]) -> Dict[str, Any]:
+        """别称列为空时不输出 aliases 字段（与 JSON 模式一致）"""
+        if not record.get('aliases'):
+            record.pop('aliases', None)
+        return record
+
+    # ========== 编码（基准测试与示例） ==========
+
+    @classmethod
+    def encode(cls, task: str, data: Any) -> str:
+        """
+        把 JSON 模式的结构编码为紧凑格式（用于基准测试与往返校验）
+
+        Args:
+            task: 任务名
+            data: 与 JSON 模式相同结构的数据
+
+        Returns:
+            紧凑格式文本
+        """
+        if task == 'character':
+            data = {'characters': [data]}
+        elif task == 'event':
+            data = {'events': [data]}
+        elif task not in cls.CHAPTER_TASKS:
+            data = {task: data}
+
+        lines = []
+        for char in data.get('characters', []):
+            lines.append(cls._row('C', char))
+            for rel in char.get('relationships', []):
+                lines.append(cls._row('R', dict(rel, source=char['name'])))
+        lines.extend(cls._row('L', loc) for loc in data.get('locations', []))
+        lines.extend(cls._row('E', event) for event in data.get('events', []))
+        lines.extend(cls._row('W', elem) for elem in data.get('world_elements', []))
+        if data.get('writing_style_notes') and 'S' in cls.TASKS[task]:
+            lines.append(cls._row('S', data['writing_style_notes']))
+        if data.get('chapter_summary'):
+            summary = data['chapter_summary']
+            lines.append(cls._row('T', summary))
+            lines.extend(cls._row('K', {'point': p}) for p in summary.get('key_points', []))
+        return '\n'.join(lines) if lines else cls.NONE_LINE
+
+    @classmethod
+    def _row(cls, tag: str, record: Dict[str, Any]) -> str:
+        """编码一行"""
+        fields = [tag]
+        for name, kind, _ in cls.RECORDS[tag]:
+            value = record.get(name)
+            if kind == 'list':
+                fields.append(';'.join(str(v) for v in value or []) or '-')
+            elif kind == 'bool':
+                fields.append('1' if value else '0')
+            else:
+                fields.append(str(value) if value not in (None, '') else '-')
+        return cls.FIELD_SEP.join(fields)
+
+    @classmethod
+    def round_trip(cls, task: str, data: Any) -> Tuple[str, Any]:
+        """编码后再解析（返回紧凑文本与解析结果）"""
+        text = cls.encode(task, data)
+        return text, cls.decode(task, text)
@@ -0,0 +1,385 @@
+"""
+本地实体候选提取 - 在调用LLM之前用启发式规则找出章节中的角色与地点候选
+
+综合四类线索：高频 2-4 字片段（n-gram）、对话归属句式（“XX道”“XX说”）、
+常见姓氏、以及前面章节已确认的实体名。候选置信度足够高时可直接代替
+“列出角色名单”这一次LLM调用；无论是否代替，都用于剔除LLM返回的、
+在章节原文中根本不存在的名字。
+"""
+import re
+import threading
+from collections import Counter
+from typing import Dict, List, Any, Callable, Iterable, Optional
+
+
+class EntityCandidateExtractor:
+    """角色/地点候选提取器"""
+
+    # 复姓与常见单姓
+    COMPOUND_SURNAMES = {
+        '欧阳', '司马', '上官', '诸葛', '慕容', '东方', '令狐', '独孤', '皇甫', '公孙',
+        '南宫', '西门', '长孙', '宇文', '尉迟', '夏侯', '轩辕', '端木', '百里', '呼延'
+    }
+    SURNAMES = set(
+        '赵钱孙李周吴郑王冯陈褚卫蒋沈韩杨朱秦尤许何吕施张孔曹严华金魏陶姜戚谢邹喻'
+        '柏水窦章云苏潘葛奚范彭郎鲁韦昌马苗凤花方俞任袁柳鲍史唐费廉岑薛雷贺倪汤'
+        '滕殷罗毕郝邬安常乐于傅皮卞齐康伍余元卜顾孟平黄穆萧尹姚邵湛汪祁毛禹狄'
+        '米贝明臧计伏成戴宋庞熊纪舒屈项祝董梁杜阮蓝闵席季麻强贾路娄危江童颜郭'
+        '梅盛林钟徐邱骆高夏蔡田樊胡凌霍虞万柯管卢莫房裘缪解应宗丁宣邓郁单杭洪'
+        '包诸左石崔吉龚程嵇邢裴陆荣翁荀甄曲封储靳焦牧山谷车侯全班仰秋仲宫宁仇'
+        '甘厉戎祖武符刘景詹龙叶司黎白怀蒲邰从鄂索咸赖卓蔺屠蒙池乔阴胥党翟谭姬'
+        '申冉雍桑桂牛寿通边燕冀尚温庄晏柴瞿阎慕连习艾鱼容向古易廖耿满弘匡国文'
+        '寇广禄东欧沃利蔚越隆师巩聂晁勾敖融冷辛阚那简饶空曾沙乜养鞠须丰巢关相'
+        '查后荆红游竺权盖益桓公楚秦'
+    )
+
+    # 姓氏开头但几乎不会是人名的常用词
+    COMMON_WORDS = {
+        '高兴', '明白', '周围', '方向', '方才', '方面', '时候', '文字', '安静', '安全', '江湖',
+        '于是', '黄色', '白色', '马上', '常常', '金色', '石头', '云层', '何况', '何时', '何处',
+        '余下', '向前', '向后', '钱财', '全部', '全身', '许多', '任何', '平静', '平时', '成功',
+        '成为', '明天', '明显', '高手', '高空', '高处', '黄金', '白天', '程度', '关系', '关于',
+        '相信', '相当', '宁可', '通过', '通常', '边上', '师父', '师傅', '师兄', '师姐', '师弟',
+        '师妹', '公子', '东西', '龙头', '龙族', '华丽', '万一', '万分', '毛病', '简单', '简直',
+        '空气', '空中', '和平', '利用', '越来', '越发', '常见', '宫殿', '山上', '山下', '山中',
+        '林中', '水中', '水面', '花园', '云中', '金光', '红色', '雷电', '风雨', '齐声', '连忙',
+        '连续', '容易', '温柔', '冷冷', '冷声', '冷笑', '冷哼', '易容', '车上', '车马', '叶子',
+        '武功', '武器', '武者', '古代', '古老', '东方', '南方', '西方', '北方', '田地', '秋天'
+    }
+
+    # 人名中几乎不会出现的字
+    NAME_STOPCHARS = set('的了是在不这那就都也和与着把被从对所而又很还要会能么吗呢吧啊呀哦说道笑看听想'
+                         '走来去你我他她它们个一上下里中之其此得地却已便才只将给让向被并或')
+
+    # 对话归属：XX道 / XX说 / XX冷笑道 …（后面跟冒号、逗号或引号）
+    SPEECH_PATTERN = re.compile(
+        r'(?:冷笑|冷哼|笑|怒|喝|叫|答|问|叹|低声|沉声|淡淡|轻声|大声|急|缓缓|微笑)?'
+        r'(?:道|说)[：:，,]?\s*[“"「]'
+    )
+    PRONOUNS = set('他她我你它')
+
+    # 地点后缀
+    LOCATION_SUFFIXES = set('城山峰谷宗门派殿宫府阁楼村镇县州国岛林洞寺院庄堂海河湖关街坊崖原漠境域界')
+    LOCATION_STOPCHARS = set('的了是在不这那就都也和与着把被从对出进回到去上下里你我他她它们个一')
+
+    CJK_RUN = re.compile(r'[一-鿿]+')
+
+    def __init__(self, config: dict):
+        """
+        初始化候选提取器
+
+        Args:
+            config: 配置字典（读取 entity_candidates 段）
+        """
+        settings = config.get('entity_candidates', {}) or {}
+        self.enabled = bool(settings.get('enabled', True))
+        self.replace_step1 = bool(settings.get('replace_step1', True))
+        self.confidence_threshold = float(settings.get('confidence_threshold', 0.75))
+        self.min_count = int(settings.get('min_count', 2))
+        self.max_candidates = int(settings.get('max_candidates', 10))
+        self.high_score = 0.6
+
+        # 前面章节已确认的实体（批量分析过程中逐章累积）
+        self.known_characters = set()
+        self.known_locations = set()
+        self._lock = threading.Lock()
+
+    # ========== 已知实体 ==========
+
+    def learn(self, result: Optional[Dict]):
+        """
+        从已完成的章节结果中记录实体名
+
+        Args:
+            result: 单章分析结果
+        """
+        if not self.enabled or not isinstance(result, dict):
+            return
+        characters = self._names(result.get('characters'))
+        locations = self._names(result.get('locations'))
+        with self._lock:
+            self.known_characters.update(characters)
+            self.known_locations.update(locations)
+
+    @staticmethod
+    def _names(items: Any) -> List[str]:
+        """提取列表中的 name（及 aliases）字段"""
+        if not isinstance(items, list):
+            return []
+        names = []
+        for item in items:
+            if not isinstance(item, dict) or not isinstance(item.get('name'), str) or not item['name']:
+                continue
+            names.append(item['name'])
+            # 已知实体词典登记的别名同样视为已知
+            aliases = item.get('aliases')
+            if isinstance(aliases, list):
+                names.extend(a for a in aliases if isinstance(a, str) and len(a) >= 2)
+        return names
+
+    # ========== 候选提取 ==========
+
+    def extract(self, content: str) -> Dict[str, Any]:
+        """
+        提取章节中的角色与地点候选
+
+        Args:
+            content: 章节内容
+
+        Returns:
+            {'characters': [{'name', 'count', 'score', 'sources'}],
+             'locations': [{'name', 'count', 'sources'}],
+             'speech_sites': 对话归属句数, 'resolved_sites': 归属到高分候选的句数,
+             'confidence': 角色名单置信度}
+        """
+        with self._lock:
+            known_characters = set(self.known_characters)
+            known_locations = set(self.known_locations)
+
+        grams = self._count_ngrams(content)
+
+        # 对话归属
+        speakers = Counter()
+        speech_sites = 0
+        attributed = []
+        for match in self.SPEECH_PATTERN.finditer(content):
+            before = content[max(0, match.start() - 4):match.start()]
+            if not before or before[-1] in self.PRONOUNS:
+                continue
+            speech_sites += 1
+            name = self._attribute_speaker(before, grams, known_characters)
+            attributed.append(name)
+            if name:
+                speakers[name] += 1
+
+        # 角色候选：已知角色 ∪ 对话归属 ∪ 姓氏开头的高频片段
+        names = {name for name in known_characters if name in content}
+        names.update(speakers)
+        for gram, count in grams.items():
+            if count >= self.min_count and self._looks_like_name(gram):
+                names.add(gram)
+        names = self._drop_subsumed(names, grams)
+
+        characters = []
+        for name in names:
+            count = content.count(name)
+            sources = []
+            score = 0.0
+            if name in known_characters:
+                sources.append('known')
+                score += 0.5
+            if speakers[name]:
+                sources.append('dialogue')
+                score += min(speakers[name], 2) * 0.3
+            if self._has_surname(name):
+                sources.append('surname')
+                score += 0.2
+            score += min(count, 5) / 5 * 0.3
+            characters.append({'name': name, 'count': count, 'score': round(min(score, 1.0), 3),
+                               'sources': sources})
+        characters.sort(key=lambda c: (-c['score'], -c['count'], c['name']))
+
+        high = {c['name'] for c in characters if c['score'] >= self.high_score}
+        resolved = sum(1 for name in attributed if name in high)
+        confidence = resolved / speech_sites if speech_sites >= 3 else 0.0
+
+        return {
+            'characters': characters,
+            'locations': self._extract_locations(content, grams, known_locations),
+            'speech_sites': speech_sites,
+            'resolved_sites': resolved,
+            'confidence': round(confidence, 3)
+        }
+
+    def confident_names(self, candidates: Dict[str, Any]) -> List[str]:
+        """
+        候选置信度足够高时返回可直接使用的角色名单，否则返回空列表
+
+        对话归属只能说明说话的角色找全了；不说话的角色（只被提到的姓氏高频片段、
+        已知角色）也要并入名单。并入后超过 max_candidates 时名单会被截断，
+        此时返回空列表，仍由LLM列出名单。
+
+        Args:
+            candidates: extract 的结果
+
+        Returns:
+            角色名单（按得分降序，最多 max_candidates 个）
+        """
+        if not (self.enabled and self.replace_step1):
+            return []
+        if candidates['confidence'] < self.confidence_threshold:
+            return []
+        names = [c['name'] for c in candidates['characters']
+                 if c['score'] >= self.high_score
+                 or (c['count'] >= self.min_count and {'surname', 'known'} & set(c['sources']))]
+        if len(names) > self.max_candidates:
+            return []
+        return names
+
+    def salient_names(self, content: str, known: Optional[Dict[str, List[str]]] = None) -> List[str]:
+        """
+        章节中的重要实体名（高分角色候选 + 地点候选 + 已知实体），供预压缩优先保留相关句子
+
+        Args:
+            content: 章节内容
+            known: EntityRegistry.known_in 的结果
+
+        Returns:
+            实体名列表
+        """
+        names = []
+        if self.enabled:
+            candidates = self.extract(content)
+            names.extend(c['name'] for c in candidates['characters'] if c['score'] >= self.high_score)
+            names.extend(loc['name'] for loc in candidates['locations'])
+        for kind in ('characters', 'locations'):
+            names.extend((known or {}).get(kind, []))
+        return list(dict.fromkeys(names))
+
+    def _count_ngrams(self, content: str) -> Counter:
+        """统计汉字连续片段中的 2-4 字 n-gram"""
+        grams = Counter()
+        for run in self.CJK_RUN.findall(content):
+            length = len(run)
+            for n in (2, 3, 4):
+                for i in range(length - n + 1):
+                    grams[run[i:i + n]] += 1
+        return grams
+
+    def _attribute_speaker(self, before: str, grams: Counter, known: set) -> Optional[str]:
+        """
+        确定对话归属句的说话人（取紧挨“道/说”之前、最像人名的 2-4 字后缀）
+
+        Args:
+            before: 动词前最多4个字
+            grams: n-gram 计数
+            known: 已知角色名
+
+        Returns:
+            说话人，无法确定时返回None
+        """
+        suffixes = [before[-n:] for n in (4, 3, 2) if len(before) >= n]
+        suffixes = [s for s in suffixes if self.CJK_RUN.fullmatch(s)]
+        for suffix in suffixes:
+            if suffix in known:
+                return suffix
+        for suffix in suffixes:
+            if self._looks_like_name(suffix):
+                return suffix
+        # 称谓类（师父、老者…）：足够高频且不含虚字的2字片段
+        suffix = before[-2:]
+        if (len(suffix) == 2 and grams[suffix] >= self.min_count + 1
+                and not set(suffix) & self.NAME_STOPCHARS):
+            return suffix
+        return None
+
+    def _has_surname(self, name: str) -> bool:
+        """是否以常见姓氏开头"""
+        return name[:2] in self.COMPOUND_SURNAMES or name[0] in self.SURNAMES
+
+    def _looks_like_name(self, text: str) -> bool:
+        """姓氏开头、不含虚字、不是常用词的 2-4 字片段"""
+        if not 2 <= len(text) <= 4 or text in self.COMMON_WORDS:
+            return False
+        if not self._has_surname(text):
+            return False
+        return not set(text[1:]) & self.NAME_STOPCHARS
+
+    @staticmethod
+    def _drop_subsumed(names: set, grams: Counter) -> set:
+        """去掉被更长候选覆盖的片段（如“张三丰”几乎总是完整出现时去掉“张三”“三丰”）"""
+        kept = set(names)
+        for name in names:
+            for other in names:
+                if (other != name and name in other and grams[name]
+                        and grams[other] >= grams[name] * 0.8):
+                    kept.discard(name)
+                    break
+        return kept
+
+    def _extract_locations(self, content: str, grams: Counter, known: set) -> List[Dict[str, Any]]:
+        """地点候选：已知地点 ∪ 以地点后缀结尾的高频片段"""
+        locations = {name: ['known'] for name in known if name in content}
+        for gram, count in grams.items():
+            if (count >= self.min_count and len(gram) >= 2 and gram[-1] in self.LOCATION_SUFFIXES
+                    and not set(gram) & self.LOCATION_STOPCHARS and gram not in self.COMMON_WORDS):
+                locations.setdefault(gram, []).append('suffix')
+
+        kept = self._drop_subsumed(set(locations), grams)
+        result = [{'name': name, 'count': content.count(name), 'sources': locations[name]}
+                  for name in kept]
+        result.sort(key=lambda l: (-len(l['sources']), -l['count'], l['name']))
+        return result
+
+    # ========== 幻觉过滤 ==========
+
+    @staticmethod
+    def normalize_name(name: str) -> str:
+        """去掉括注和空白（如“张三（少年）”→“张三”）"""
+        name = re.sub(r'[（(【\[].*?[）)】\]]', '', name)
+        return re.sub(r'\s+', '', name)
+
+    def appears_in(self, name: str, content: str,
+                   forms: Optional[Callable[[str], List[str]]] = None) -> bool:
+        """
+        名字（或其任一别名）是否出现在原文中
+
+        Args:
+            name: 名字
+            content: 章节内容
+            forms: 返回名字所有写法（规范名 + 别名）的函数
+        """
+        name = self.normalize_name(name)
+        if name in content:
+            return True
+        return bool(forms) and any(form in content for form in forms(name))
+
+    def filter_names(self, names: Iterable[Any], content: str,
+                     forms: Optional[Callable[[str], List[str]]] = None) -> List[str]:
+        """
+        剔除章节原文中不存在的名字
+
+        Args:
+            names: LLM返回的名字列表
+            content: 章节内容
+            forms: 返回名字所有写法（规范名 + 别名）的函数
+
+        Returns:
+            保留的名字（保持原顺序、去重）
+        """
+        kept = []
+        for name in names:
+            if not isinstance(name, str):
+                continue
+            name = name.strip()
+            if name and name not in kept and self.appears_in(name, content, forms):
+                kept.append(name)
+        return kept
+
+    def filter_entities(self, items: Any, content: str, label: str = '',
+                        forms: Optional[Callable[[str], List[str]]] = None) -> Any:
+        """
+        剔除实体列表中名字不在原文中出现的条目
+
+        Args:
+            items: LLM返回的实体列表（[{'name': ...}]）
+            content: 章节内容
+            label: 打印提示用的实体类别
+            forms: 返回名字所有写法（规范名 + 别名）的函数
+
+        Returns:
+            过滤后的列表（非列表输入原样返回）
+        """
+        if not self.enabled or not isinstance(items, list):
+            return items
+        kept = []
+        dropped = []
+        for item in items:
+            name = item.get('name') if isinstance(item, dict) else None
+            if isinstance(name, str) and name.strip() and not self.appears_in(name, content, forms):
+                dropped.append(name)
+                continue
+            kept.append(item)
+        if dropped:
+            print(f"\n        🧹 剔除原文中不存在的{label}: {', '.join(dropped[:5])}", end='', flush=True)
+        return kept
@@ -0,0 +1,296 @@
+"""
+已知实体词典 - 在章节之间滚动维护角色/地点的规范名与别名
+
+每分析完一章，把其中的角色和地点登记到词典（规范名 + 别名 + 角色定位/地点类型）。
+分析下一章时只把本章原文中出现过的已知实体压缩成几行注入提示词，并要求模型对
+已知实体使用规范名、只输出本章新增的信息（新特征、状态变化、新别名）。模型返回
+的结果再按别名表统一为规范名，保证后续聚合能把同一角色合并到一起。
+"""
+import os
+import json
+import threading
+from typing import Dict, List, Any, Optional
+
+
+class EntityRegistry:
+    """滚动的已知实体词典（线程安全）"""
+
+    REGISTRY_FILENAME = 'entity_registry.json'
+    VERSION = 1
+
+    def __init__(self, config: dict, output_dir: str):
+        """
+        初始化实体词典（存在已保存的词典时加载，用于断点续传）
+
+        Args:
+            config: 配置字典（读取 entity_registry 段）
+            output_dir: 输出目录（词典保存在该目录下）
+        """
+        settings = config.get('entity_registry', {}) or {}
+        self.enabled = bool(settings.get('enabled', True))
+        self.max_prompt_entities = int(settings.get('max_prompt_entities', 40))
+        self.file_path = os.path.join(output_dir, self.REGISTRY_FILENAME)
+
+        # {规范名: {'aliases': [...], 'role'/'type': ..., 'first_chapter', 'last_chapter'}}
+        self.characters: Dict[str, Dict[str, Any]] = {}
+        self.locations: Dict[str, Dict[str, Any]] = {}
+        # 别名（含规范名本身）-> 规范名
+        self._character_alias: Dict[str, str] = {}
+        self._location_alias: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+        if self.enabled:
+            self._load()
+
+    # ========== 查询 ==========
+
+    def canonical_character(self, name: str) -> str:
+        """角色的规范名（未登记时原样返回）"""
+        return self._character_alias.get(name, name)
+
+    def canonical_location(self, name: str) -> str:
+        """地点的规范名（未登记时原样返回）"""
+        return self._location_alias.get(name, name)
+
+    def is_known_character(self, name: str) -> bool:
+        return name in self._character_alias
+
+    def surface_forms(self, name: str) -> List[str]:
+        """实体的所有写法（规范名 + 别名，角色优先）"""
+        with self._lock:
+            for entries, alias_map in ((self.characters, self._character_alias),
+                                       (self.locations, self._location_alias)):
+                canonical = alias_map.get(name)
+                if canonical is not None:
+                    return [canonical] + list(entries[canonical]['aliases'])
+        return [name]
+
+    def known_in(self, content: str) -> Dict[str, List[str]]:
+        """
+        本章原文中出现过的已知实体（按最近出场排序，数量受 max_prompt_entities 限制）
+
+        Args:
+            content: 章节内容
+
+        Returns:
+            {'characters': [规范名], 'locations': [规范名]}
+        """
+        with self._lock:
+            characters = self._present(self.characters, content)
+            locations = self._present(self.locations, content)
+
+        # 角色优先，地点占用剩余名额
+        characters = characters[:self.max_prompt_entities]
+        locations = locations[:max(0, self.max_prompt_entities - len(characters))]
+        return {'characters': characters, 'locations': locations}
+
+    @staticmethod
+    def _present(entries: Dict[str, Dict], content: str) -> List[str]:
+        """规范名或任一别名出现在原文中的实体"""
+        present = [name for name, entry in entries.items()
+                   if any(alias in content for alias in [name] + entry['aliases'])]
+        present.sort(key=lambda name: -entries[name]['last_chapter'])
+        return present
+
+    # ========== 提示词 ==========
+
+    def to_prompt(self, content: str, kinds: tuple = ('characters', 'locations')) -> str:
+        """
+        生成注入提示词的已知实体列表（紧凑的一行一个实体）
+
+        Args:
+            content: 章节内容（只列出本章出现过的实体）
+            kinds: 包含的实体类别
+
+        Returns:
+            提示词片段，没有相关的已知实体时返回空字符串
+        """
+        if not self.enabled:
+            return ''
+        known = self.known_in(content)
+
+        lines = []
+        with self._lock:
+            if 'characters' in kinds:
+                for name in known['characters']:
+                    entry = self.characters[name]
+                    lines.append(self._line('角色', name, entry['aliases'], entry.get('role')))
+            if 'locations' in kinds:
+                for name in known['locations']:
+                    entry = self.locations[name]
+                    lines.append(self._line('地点', name, entry['aliases'], entry.get('type')))
+        if not lines:
+            return ''
+
+        return ("已知实体（前面章节已出现，格式：类别|规范名|别名|定位）：\n" + '\n'.join(lines) + "\n"
+                "对已知实体：name 必须使用上面的规范名，first_appearance 为 false，"
+                "特征和描述只写本章新出现的信息（没有则留空列表或空字符串），不要重复已知内容；"
+                "本章出现的新称呼写入 aliases 字段。\n\n")
+
+    def describe_character(self, name: str) -> str:
+        """
+        单个已知角色的增量提示（用于逐个角色分析的提示词）
+
+        Args:
+            name: 角色名
+
+        Returns:
+            提示词片段，未登记的角色返回空字符串
+        """
+        if not self.enabled or name not in self._character_alias:
+            return ''
+        canonical = self._character_alias[name]
+        with self._lock:
+            entry = self.characters.get(canonical, {})
+            aliases = '/'.join(entry.get('aliases', [])) or '无'
+            role = entry.get('role', '')
+        return (f"“{canonical}”是前面章节已出现的角色（别名：{aliases}；定位：{role}）。"
+                f"name 使用“{canonical}”，first_appearance 为 false，"
+                f"特征只写本章新出现的（没有则为空列表），不要重复已知内容。\n\n")
+
+    @staticmethod
+    def _line(kind: str, name: str, aliases: List[str], label: Any) -> str:
+        return f"{kind}|{name}|{'/'.join(aliases)}|{label if isinstance(label, str) else ''}"
+
+    # ========== 规范化与登记 ==========
+
+    def normalize(self, result: Dict) -> Dict:
+        """
+        把章节结果中的别名统一为规范名，并合并同一章内重复的实体
+
+        Args:
+            result: 单章分析结果（原地修改）
+
+        Returns:
+            规范化后的结果
+        """
+        if not self.enabled or not isinstance(result, dict):
+            return result
+
+        with self._lock:
+            if isinstance(result.get('characters'), list):
+                result['characters'] = self._merge_duplicates(
+                    result['characters'], self._character_alias, ('appearance_traits', 'personality_traits',
+                                                                 'status_changes', 'relationships'))
+                for char in result['characters']:
+                    for rel in char.get('relationships', []) or []:
+                        if isinstance(rel, dict) and isinstance(rel.get('target'), str):
+                            rel['target'] = self._character_alias.get(rel['target'], rel['target'])
+            if isinstance(result.get('locations'), list):
+                result['locations'] = self._merge_duplicates(result['locations'], self._location_alias, ())
+            for event in result.get('events', []) or []:
+                if isinstance(event, dict) and isinstance(event.get('participants'), list):
+                    event['participants'] = list(dict.fromkeys(
+                        self._character_alias.get(p, p) if isinstance(p, str) else p
+                        for p in event['participants']))
+        return result
+
+    @staticmethod
+    def _merge_duplicates(items: List[Any], alias_map: Dict[str, str], list_fields: tuple) -> List[Any]:
+        """按规范名合并重复条目（列表字段拼接去重，记录被替换的名字为别名）"""
+        merged = {}
+        ordered = []
+        for item in items:
+            if not isinstance(item, dict) or not isinstance(item.get('name'), str):
+                ordered.append(item)
+                continue
+            original = item['name']
+            canonical = alias_map.get(original, original)
+            if canonical != original:
+                item['name'] = canonical
+                aliases = item.setdefault('aliases', [])
+                if isinstance(aliases, list) and original not in aliases:
+                    aliases.append(original)
+
+            existing = merged.get(canonical)
+            if existing is None:
+                merged[canonical] = item
+                ordered.append(item)
+                continue
+            for field in list_fields + ('aliases',):
+                values = item.get(field)
+                if isinstance(values, list):
+                    target = existing.setdefault(field, [])
+                    for value in values:
+                        if value not in target:
+                            target.append(value)
+        return ordered
+
+    def observe(self, result: Optional[Dict], chapter_number: int):
+        """
+        把章节中的角色和地点登记到词典并保存
+
+        Args:
+            result: 单章分析结果（应已 normalize）
+            chapter_number: 章节号
+        """
+        if not self.enabled or not isinstance(result, dict):
+            return
+
+        with self._lock:
+            for char in result.get('characters', []) or []:
+                self._register(self.characters, self._character_alias, char, 'role', chapter_number)
+            for loc in result.get('locations', []) or []:
+                self._register(self.locations, self._location_alias, loc, 'type', chapter_number)
+            self._save()
+
+    @staticmethod
+    def _register(entries: Dict[str, Dict], alias_map: Dict[str, str], item: Any,
+                  label_key: str, chapter_number: int):
+        """登记单个实体"""
+        if not isinstance(item, dict) or not isinstance(item.get('name'), str) or not item['name']:
+            return
+        name = alias_map.get(item['name'], item['name'])
+        entry = entries.get(name)
+        if entry is None:
+            entry = {'aliases': [], label_key: item.get(label_key, 'unknown'),
+                     'first_chapter': chapter_number, 'last_chapter': chapter_number}
+            entries[name] = entry
+            alias_map[name] = name
+        entry['first_chapter'] = min(entry['first_chapter'], chapter_number)
+        entry['last_chapter'] = max(entry['last_chapter'], chapter_number)
+
+        aliases = item.get('aliases')
+        if isinstance(aliases, str):
+            aliases = [aliases]
+        for alias in aliases or []:
+            # 已属于其他实体的别名不抢占
+            if isinstance(alias, str) and alias and alias != name and alias not in alias_map:
+                entry['aliases'].append(alias)
+                alias_map[alias] = name
+
+    # ========== 持久化 ==========
+
+    def _load(self):
+        """加载已保存的词典"""
+        if not os.path.exists(self.file_path):
+            return
+        try:
+            with open(self.file_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except Exception as e:
+            print(f"⚠️  实体词典加载失败，重新建立: {e}")
+            return
+        if data.get('version') != self.VERSION:
+            return
+
+        self.characters = data.get('characters', {})
+        self.locations = data.get('locations', {})
+        for entries, alias_map in ((self.characters, self._character_alias),
+                                   (self.locations, self._location_alias)):
+            for name, entry in entries.items():
+                alias_map[name] = name
+                for alias in entry.get('aliases', []):
+                    alias_map.setdefault(alias, name)
+
+    def _save(self):
+        """保存词典（调用方持有锁）"""
+        data = {
+            'version': self.VERSION,
+            'characters': self.characters,
+            'locations': self.locations
+        }
+        tmp_path = self.file_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.file_path)
@@ -0,0 +1,358 @@
+"""
+LLM 客户端池 - 多个模型服务端点之间的负载均衡
+
+每个端点创建一个长期复用的客户端实例（客户端内部维护 HTTP 连接池，请求之间保持
+keep-alive），每次调用选择当前未完成请求数最少的健康端点。端点连续失败达到阈值后
+被摘除，由后台健康检查线程探测恢复后重新加入。
+
+只有连接失败、超时和 5xx 响应算作端点故障（换端点重试并计入失败次数）；
+400、上下文超长等请求本身的错误换端点也不会成功，直接抛出，不影响端点健康状态。
+
+本模块只依赖标准库，novel_analyzer 与 novel_generator 都可以直接使用：
+    from utils.llm_pool import LLMClientPool                  # novel_analyzer 内
+    from novel_analyzer.utils.llm_pool import LLMClientPool   # 项目根目录下
+"""
+import os
+import time
+import socket
+import threading
+import urllib.error
+import urllib.request
+from typing import Dict, List, Any, Callable, Optional
+
+
+class LLMEndpoint:
+    """单个模型服务端点的状态"""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.outstanding = 0          # 未完成的请求数
+        self.total_requests = 0
+        self.total_failures = 0
+        self.total_latency = 0.0
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0      # 摘除截止时间（0 表示健康）
+
+    @property
+    def healthy(self) -> bool:
+        return self.ejected_until == 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        """端点统计"""
+        return {
+            'url': self.url,
+            'healthy': self.healthy,
+            'outstanding': self.outstanding,
+            'requests': self.total_requests,
+            'failures': self.total_failures,
+            'avg_latency': round(self.total_latency / self.total_requests, 2) if self.total_requests else 0.0
+        }
+
+
+class _PoolState:
+    """端点状态（同一个池及其 bind_tools 派生对象共享）"""
+
+    def __init__(self, endpoints: List[LLMEndpoint], health_path: str, max_failures: int,
+                 eject_seconds: float, health_interval: float, health_timeout: float):
+        self.endpoints = endpoints
+        self.health_path = health_path
+        self.max_failures = max_failures
+        self.eject_seconds = eject_seconds
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.health_thread = None
+
+
+class LLMClientPool:
+    """多端点LLM客户端池（提供与 LangChain LLM 相同的 invoke / bind_tools 接口）"""
+
+    # 各服务商的健康检查路径（相对 base_url）
+    HEALTH_PATHS = {
+        'ollama': '/api/tags',
+        'openai': '/models',
+    }
+
+    # 连接失败/超时类异常的类名片段（httpx、requests、openai、aiohttp 等客户端库）
+    ENDPOINT_ERROR_NAMES = ('Connect', 'Timeout', 'RemoteProtocol', 'ServerDisconnected')
+
+    def __init__(self, endpoints: List[str], llm_factory: Callable[[str], Any],
+                 provider: str = 'ollama', max_failures: int = 3, eject_seconds: float = 30.0,
+                 health_interval: float = 15.0, health_timeout: float = 3.0):
+        """
+        初始化客户端池
+
+        Args:
+            endpoints: 端点地址列表（base_url）
+            llm_factory: 根据 base_url 创建LLM客户端的函数
+            provider: 服务商（决定健康检查路径）
+            max_failures: 连续失败多少次后摘除端点
+            eject_seconds: 摘除后至少等待多久再尝试恢复
+            health_interval: 健康检查间隔（秒），0 表示不启动后台检查
+            health_timeout: 健康检查超时（秒）
+        """
+        urls = [url.strip() for url in endpoints if url and url.strip()]
+        if not urls:
+            raise ValueError("LLM客户端池至少需要一个端点")
+
+        self._state = _PoolState(
+            [LLMEndpoint(url) for url in urls],
+            self.HEALTH_PATHS.get(provider, ''),
+            max_failures, eject_seconds, health_interval, health_timeout
+        )
+        # 每个端点一个长期复用的客户端（保持HTTP连接）
+        self._clients = {url: llm_factory(url) for url in urls}
+
+        if health_interval > 0 and len(urls) > 1:
+            self._start_health_checks()
+
+    # ========== 调用 ==========
+
+    def invoke(self, prompt: Any, *args, **kwargs):
+        """
+        在最空闲的健康端点上调用LLM，失败时换其他端点重试
+
+        Args:
+            prompt: 提示词或消息列表
+
+        Returns:
+            LLM响应
+        """
+        tried = set()
+        last_error = None
+        for _ in range(len(self._state.endpoints)):
+            endpoint = self._acquire(tried)
+            if endpoint is None:
+                break
+            tried.add(endpoint.url)
+
+            start = time.time()
+            try:
+                response = self._clients[endpoint.url].invoke(prompt, *args, **kwargs)
+            except Exception as e:
+                if not self._is_endpoint_error(e):
+                    # 请求本身的错误（400、上下文超长等），端点是正常的
+                    self._release(endpoint, time.time() - start, failed=False)
+                    raise
+                self._release(endpoint, time.time() - start, failed=True)
+                last_error = e
+                if len(self._state.endpoints) > 1:
+                    print(f"  ⚠️  端点 {endpoint.url} 调用失败，切换端点: {str(e)[:80]}")
+                continue
+
+            self._release(endpoint, time.time() - start, failed=False)
+            return response
+
+        if last_error is not None:
+            raise last_error
+        raise RuntimeError("LLM客户端池没有可用端点")
+
+    @classmethod
+    def _is_endpoint_error(cls, error: BaseException) -> bool:
+        """
+        是否为端点故障（连接失败、超时、5xx），沿异常链检查被包装的原始异常
+
+        Args:
+            error: 调用抛出的异常
+
+        Returns:
+            是端点故障返回True，请求本身的错误返回False
+        """
+        seen = set()
+        while error is not None and id(error) not in seen:
+            seen.add(id(error))
+            status = cls._status_code(error)
+            if status is not None:
+                return status >= 500
+            if isinstance(error, (ConnectionError, TimeoutError, socket.timeout)):
+                return True
+            if isinstance(error, urllib.error.URLError):
+                return True
+            if any(part in klass.__name__ for klass in type(error).__mro__
+                   for part in cls.ENDPOINT_ERROR_NAMES):
+                return True
+            error = error.__cause__ or error.__context__
+        return False
+
+    @staticmethod
+    def _status_code(error: BaseException) -> Optional[int]:
+        """异常携带的HTTP状态码（没有时返回None）"""
+        for value in (getattr(error, 'status_code', None),
+                      getattr(getattr(error, 'response', None), 'status_code', None),
+                      getattr(error, 'code', None) if isinstance(error, urllib.error.HTTPError) else None):
+            if isinstance(value, int):
+                return value
+        return None
+
+    def bind_tools(self, tools: List[Any], **kwargs) -> 'LLMClientPool':
+        """
+        为所有端点的客户端绑定工具（返回共享端点状态的新池对象）
+
+        Args:
+            tools: 工具列表
+
+        Returns:
+            绑定工具后的客户端池
+        """
+        bound = object.__new__(LLMClientPool)
+        bound._state = self._state
+        bound._clients = {url: client.bind_tools(tools, **kwargs) for url, client in self._clients.items()}
+        return bound
+
+    def _acquire(self, exclude: set) -> Optional[LLMEndpoint]:
+        """选择未完成请求数最少的健康端点并占用"""
+        state = self._state
+        now = time.time()
+        with state.lock:
+            candidates = [ep for ep in state.endpoints if ep.healthy and ep.url not in exclude]
+            if not candidates:
+                # 没有健康端点时，尝试已过摘除期的端点（半开状态）
+                candidates = [ep for ep in state.endpoints
+                              if ep.url not in exclude and ep.ejected_until <= now]
+            if not candidates:
+                return None
+            endpoint = min(candidates, key=lambda ep: (ep.outstanding, ep.total_requests))
+            endpoint.outstanding += 1
+            endpoint.total_requests += 1
+            return endpoint
+
+    def _release(self, endpoint: LLMEndpoint, elapsed: float, failed: bool):
+        """释放端点并更新健康状态"""
+        state = self._state
+        with state.lock:
+            endpoint.outstanding -= 1
+            endpoint.total_latency += elapsed
+            if not failed:
+                endpoint.consecutive_failures = 0
+                endpoint.ejected_until = 0.0
+                return
+
+            endpoint.total_failures += 1
+            endpoint.consecutive_failures += 1
+            if endpoint.consecutive_failures >= state.max_failures and endpoint.healthy:
+                endpoint.ejected_until = time.time() + state.eject_seconds
+                print(f"  🚫 端点 {endpoint.url} 连续失败 {endpoint.consecutive_failures} 次，已摘除")
+
+    # ========== 健康检查 ==========
+
+    def _start_health_checks(self):
+        """启动后台健康检查线程"""
+        state = self._state
+        thread = threading.Thread(target=self._health_loop, args=(state,), daemon=True,
+                                  name='llm-pool-health')
+        state.health_thread = thread
+        thread.start()
+
+    @classmethod
+    def _health_loop(cls, state: _PoolState):
+        """定期探测端点：失败则摘除，摘除期满且探测成功则恢复"""
+        while not state.stop_event.wait(state.health_interval):
+            for endpoint in state.endpoints:
+                ok = cls._probe(endpoint.url, state.health_path, state.health_timeout)
+                with state.lock:
+                    if ok and not endpoint.healthy and endpoint.ejected_until <= time.time():
+                        endpoint.ejected_until = 0.0
+                        endpoint.consecutive_failures = 0
+                        print(f"  ✅ 端点 {endpoint.url} 已恢复")
+                    elif not ok and endpoint.healthy:
+                        endpoint.ejected_until = time.time() + state.eject_seconds
+                        print(f"  🚫 端点 {endpoint.url} 健康检查失败，已摘除")
+
+    @staticmethod
+    def _probe(url: str, health_path: str, timeout: float) -> bool:
+        """探测端点是否可用"""
+        try:
+            with urllib.request.urlopen(url.rstrip('/') + health_path, timeout=timeout) as response:
+                return response.status < 500
+        except urllib.error.HTTPError as e:
+            # 401/404 等说明服务在线（可能需要鉴权或不支持该路径）
+            return e.code < 500
+        except Exception:
+            return False
+
+    def close(self):
+        """停止后台健康检查"""
+        self._state.stop_event.set()
+
+    # ========== 统计 ==========
+
+    @property
+    def endpoints(self) -> List[str]:
+        """端点地址列表"""
+        return [ep.url for ep in self._state.endpoints]
+
+    def get_stats(self) -> List[Dict[str, Any]]:
+        """获取各端点统计"""
+        with self._state.lock:
+            return [ep.to_dict() for ep in self._state.endpoints]
+
+    def print_stats(self):
+        """打印各端点统计"""
+        print("\n🖧  LLM端点统计:")
+        for item in self.get_stats():
+            status = '✅' if item['healthy'] else '🚫'
+            print(f"  {status} {item['url']}: {item['requests']}次请求, 失败{item['failures']}次, "
+                  f"平均{item['avg_latency']:.1f}秒")
+
+
+_shared_pools: Dict[tuple, LLMClientPool] = {}
+_shared_lock = threading.Lock()
+
+
+def get_shared_pool(endpoints: List[str], llm_factory: Callable[[str], Any],
+                    key: Any = None, **kwargs) -> LLMClientPool:
+    """
+    获取进程内共享的客户端池（同一组端点和配置只创建一次，多个调用方共用负载统计）
+
+    Args:
+        endpoints: 端点地址列表
+        llm_factory: 根据 base_url 创建LLM客户端的函数
+        key: 区分不同模型配置的附加键
+        **kwargs: 传给 LLMClientPool 的其他参数
+
+    Returns:
+        客户端池
+    """
+    pool_key = (tuple(endpoints), key)
+    with _shared_lock:
+        if pool_key not in _shared_pools:
+            _shared_pools[pool_key] = LLMClientPool(endpoints, llm_factory, **kwargs)
+        return _shared_pools[pool_key]
+
+
+def parse_endpoints(value: Any) -> List[str]:
+    """
+    解析端点配置（逗号分隔的字符串或列表）
+
+    Args:
+        value: 环境变量字符串或配置列表
+
+    Returns:
+        端点地址列表
+    """
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.split(',')
+    return [str(url).strip() for url in value if str(url).strip()]
+
+
+def resolve_concurrency(config: dict) -> int:
+    """
+    确定同时处理的章节数
+
+    processing.max_concurrent_chapters 为 0（默认）时自动取 LLM 端点数，
+    这样增加一台推理服务器只需在 LLM_ENDPOINTS / llm.endpoints 中加上地址。
+
+    Args:
+        config: 配置字典
+
+    Returns:
+        并发数（至少为1）
+    """
+    configured = int(config.get('processing', {}).get('max_concurrent_chapters', 0) or 0)
+    if configured > 0:
+        return configured
+    endpoints = parse_endpoints(os.getenv('LLM_ENDPOINTS', config.get('llm', {}).get('endpoints')))
+    return max(1, len(endpoints))
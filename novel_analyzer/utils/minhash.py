@@ -0,0 +1,125 @@
+"""
+MinHash/LSH 近似去重 - 按字符片段（shingle）估算文本的 Jaccard 相似度
+
+每段文本切成重叠的 k 字片段，用 num_perm 个随机哈希函数各取最小值得到签名；
+两个签名中相同位置取值相等的比例即 Jaccard 相似度的估计。LSH 把签名分为若干 band，
+任一 band 完全相同的文本才成为候选对，避免两两比较全部文本。
+"""
+import zlib
+from typing import Dict, List, Any, Set, Hashable
+
+import numpy as np
+
+
+class MinHasher:
+    """MinHash 签名计算"""
+
+    # 梅森素数 2^31-1：乘积不超过 2^62，uint64 内不会溢出
+    PRIME = (1 << 31) - 1
+
+    def __init__(self, num_perm: int = 128, shingle_size: int = 5, seed: int = 1):
+        """
+        初始化签名计算器
+
+        Args:
+            num_perm: 哈希函数个数（签名长度）
+            shingle_size: 片段字数
+            seed: 随机种子（相同种子的签名才能比较）
+        """
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, self.PRIME, size=num_perm).astype(np.uint64)
+        self._b = rng.randint(0, self.PRIME, size=num_perm).astype(np.uint64)
+
+    def shingles(self, text: str) -> Set[str]:
+        """
+        文本的 k 字片段集合（去掉空白，不足 k 字时整段作为一个片段）
+
+        Args:
+            text: 文本
+
+        Returns:
+            片段集合
+        """
+        text = ''.join(text.split())
+        k = self.shingle_size
+        if len(text) <= k:
+            return {text} if text else set()
+        return {text[i:i + k] for i in range(len(text) - k + 1)}
+
+    def signature(self, shingles: Set[str]) -> np.ndarray:
+        """
+        片段集合的 MinHash 签名
+
+        Args:
+            shingles: 片段集合
+
+        Returns:
+            长度为 num_perm 的 uint64 数组（空集合为全部取最大值）
+        """
+        if not shingles:
+            return np.full(self.num_perm, self.PRIME, dtype=np.uint64)
+        hashes = np.fromiter((zlib.crc32(s.encode('utf-8')) % self.PRIME for s in shingles),
+                             dtype=np.uint64, count=len(shingles))
+        values = (self._a[:, None] * hashes[None, :] + self._b[:, None]) % self.PRIME
+        return values.min(axis=1)
+
+    @staticmethod
+    def similarity(sig_a: np.ndarray, sig_b: np.ndarray) -> float:
+        """两个签名估计的 Jaccard 相似度"""
+        return float(np.mean(sig_a == sig_b))
+
+    @staticmethod
+    def jaccard(a: Set[Any], b: Set[Any]) -> float:
+        """两个集合的精确 Jaccard 相似度"""
+        if not a and not b:
+            return 1.0
+        return len(a & b) / len(a | b)
+
+
+class LSHIndex:
+    """MinHash 签名的 LSH 分桶索引"""
+
+    def __init__(self, num_perm: int = 128, bands: int = 32):
+        """
+        初始化索引
+
+        Args:
+            num_perm: 签名长度
+            bands: band 数（每个 band 含 num_perm // bands 个取值；band 越多召回越高）
+        """
+        self.bands = max(1, min(bands, num_perm))
+        self.rows = num_perm // self.bands
+        self._buckets: List[Dict[bytes, List[Hashable]]] = [{} for _ in range(self.bands)]
+
+    def _keys(self, signature: np.ndarray) -> List[bytes]:
+        return [signature[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.bands)]
+
+    def query(self, signature: np.ndarray) -> List[Hashable]:
+        """
+        与签名至少有一个 band 相同的已入库键（按入库顺序）
+
+        Args:
+            signature: MinHash 签名
+
+        Returns:
+            候选键列表
+        """
+        found = []
+        for bucket, key in zip(self._buckets, self._keys(signature)):
+            for item in bucket.get(key, []):
+                if item not in found:
+                    found.append(item)
+        return found
+
+    def add(self, item: Hashable, signature: np.ndarray):
+        """
+        把签名加入索引
+
+        Args:
+            item: 键（如章节号）
+            signature: MinHash 签名
+        """
+        for bucket, key in zip(self._buckets, self._keys(signature)):
+            bucket.setdefault(key, []).append(item)
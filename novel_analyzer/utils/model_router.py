@@ -0,0 +1,266 @@
+"""
+模型路由器 - 按阶段/任务把LLM调用分配到不同的模型档位
+
+config.yaml 的 routing 段定义模型档位（profiles）和路由表（routes）。每条路由是
+一个由弱到强的档位列表：先使用第一个档位，只有当该档位的输出解析失败时才升级到
+下一个档位。路由器记录每条路由、每个档位的调用次数、耗时、Token 和费用估算。
+"""
+import os
+import re
+import json
+import time
+import threading
+from typing import Dict, List, Any, Callable
+
+
+class RoutedLLM:
+    """单个任务的路由LLM（与 LangChain LLM 一样提供 invoke 方法）"""
+
+    def __init__(self, router: 'ModelRouter', task: str, chain: List[str]):
+        """
+        初始化路由LLM
+
+        Args:
+            router: 所属路由器
+            task: 任务名（如 chapter.locations）
+            chain: 档位列表（由弱到强）
+        """
+        self.router = router
+        self.task = task
+        self.chain = chain
+        # 档位按线程记录，多个章节并发分析时互不影响
+        self._local = threading.local()
+
+    @property
+    def level(self) -> int:
+        """当前线程使用的档位序号"""
+        return getattr(self._local, 'level', 0)
+
+    @level.setter
+    def level(self, value: int):
+        self._local.level = value
+
+    @property
+    def profile(self) -> str:
+        """当前使用的档位"""
+        return self.chain[self.level]
+
+    def invoke(self, prompt: str):
+        """调用当前档位的模型并记录耗时与Token"""
+        profile = self.profile
+        llm = self.router.get_llm(profile)
+
+        start = time.time()
+        try:
+            response = llm.invoke(prompt)
+        except Exception:
+            self.router.record(self.task, profile, time.time() - start, prompt, None, error=True)
+            raise
+        self.router.record(self.task, profile, time.time() - start, prompt, response)
+        return response
+
+    def escalate(self) -> bool:
+        """
+        解析失败时升级到更强的档位
+
+        Returns:
+            是否成功升级（已是最强档位时返回False）
+        """
+        self.router.record_parse_failure(self.task, self.profile)
+        if self.level + 1 >= len(self.chain):
+            return False
+        self.level += 1
+        print(f"\n        ⬆️  [{self.task}] 升级模型档位: {self.chain[self.level - 1]} → {self.profile}",
+              end='', flush=True)
+        return True
+
+    def reset(self):
+        """回到最弱档位（用于下一个章节/任务）"""
+        self.level = 0
+
+
+class ModelRouter:
+    """按任务路由的多模型管理器"""
+
+    DEFAULT_PROFILE = 'default'
+
+    def __init__(self, config: dict, llm_factory: Callable[[Dict[str, Any]], Any],
+                 default_llm: Any = None):
+        """
+        初始化模型路由器
+
+        Args:
+            config: 配置字典（读取 llm 与 routing 段）
+            llm_factory: 根据档位配置创建LLM实例的函数
+            default_llm: default 档位的LLM实例（已按环境变量初始化的主模型）
+        """
+        routing_config = config.get('routing', {}) or {}
+        self.base_profile = dict(config.get('llm', {}))
+        self.profiles = routing_config.get('profiles', {}) or {}
+        self.routes = routing_config.get('routes', {}) or {}
+        self.llm_factory = llm_factory
+
+        self._llms = {}
+        if default_llm is not None:
+            self._llms[self.DEFAULT_PROFILE] = default_llm
+
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def is_enabled(config: dict) -> bool:
+        """配置中是否启用了模型路由"""
+        return bool((config.get('routing') or {}).get('enabled', False))
+
+    # ========== 路由 ==========
+
+    def route(self, task: str) -> RoutedLLM:
+        """
+        获取任务的路由LLM
+
+        查找顺序：完整任务名（chapter.locations）→ 阶段名（chapter）→ default
+
+        Args:
+            task: 任务名
+
+        Returns:
+            路由LLM
+        """
+        chain = self.routes.get(task)
+        if chain is None and '.' in task:
+            chain = self.routes.get(task.split('.', 1)[0])
+        if chain is None:
+            chain = self.routes.get('default', [self.DEFAULT_PROFILE])
+        if isinstance(chain, str):
+            chain = [chain]
+        return RoutedLLM(self, task, list(chain) or [self.DEFAULT_PROFILE])
+
+    def invoke(self, prompt: str):
+        """按 default 路由调用（可直接替代单一LLM实例）"""
+        return self.route('default').invoke(prompt)
+
+    def get_llm(self, profile: str):
+        """获取（必要时创建）档位对应的LLM实例"""
+        with self._lock:
+            if profile not in self._llms:
+                if profile != self.DEFAULT_PROFILE and profile not in self.profiles:
+                    raise ValueError(f"未定义的模型档位: {profile}")
+                settings = dict(self.base_profile)
+                settings.update(self.profiles.get(profile, {}))
+                # 密钥可通过环境变量名指定，避免写入配置文件
+                if settings.get('api_key_env'):
+                    settings['api_key'] = os.getenv(settings['api_key_env'], settings.get('api_key', 'dummy'))
+                self._llms[profile] = self.llm_factory(settings)
+            return self._llms[profile]
+
+    # ========== 统计 ==========
+
+    def _entry(self, task: str, profile: str) -> Dict[str, Any]:
+        """获取统计条目（调用方持有锁）"""
+        key = (task, profile)
+        if key not in self._stats:
+            self._stats[key] = {
+                'calls': 0,
+                'errors': 0,
+                'parse_failures': 0,
+                'latency': 0.0,
+                'input_tokens': 0,
+                'output_tokens': 0
+            }
+        return self._stats[key]
+
+    def record(self, task: str, profile: str, elapsed: float, prompt: str,
+               response: Any, error: bool = False):
+        """记录一次调用"""
+        input_tokens, output_tokens = self._usage(prompt, response)
+        with self._lock:
+            entry = self._entry(task, profile)
+            entry['calls'] += 1
+            entry['latency'] += elapsed
+            entry['input_tokens'] += input_tokens
+            entry['output_tokens'] += output_tokens
+            if error:
+                entry['errors'] += 1
+
+    def record_parse_failure(self, task: str, profile: str):
+        """记录一次解析失败"""
+        with self._lock:
+            self._entry(task, profile)['parse_failures'] += 1
+
+    @classmethod
+    def _usage(cls, prompt: str, response: Any):
+        """获取Token用量（优先使用接口返回的用量，否则按字符估算）"""
+        usage = getattr(response, 'usage_metadata', None)
+        if isinstance(usage, dict) and usage.get('input_tokens') is not None:
+            return usage.get('input_tokens', 0), usage.get('output_tokens', 0)
+
+        if response is None:
+            return cls.estimate_tokens(prompt), 0
+        text = response.content if hasattr(response, 'content') else str(response)
+        return cls.estimate_tokens(prompt), cls.estimate_tokens(text)
+
+    @staticmethod
+    def estimate_tokens(text: str) -> int:
+        """粗略估算Token数：中文约1字1Token，其余约4字符1Token"""
+        if not text:
+            return 0
+        cjk = len(re.findall(r'[一-鿿　-〿＀-￯]', text))
+        return cjk + (len(text) - cjk + 3) // 4
+
+    def _cost(self, profile: str, input_tokens: int, output_tokens: int) -> float:
+        """按档位单价估算费用"""
+        settings = self.profiles.get(profile, {})
+        return (input_tokens / 1000 * settings.get('cost_per_1k_input', 0.0)
+                + output_tokens / 1000 * settings.get('cost_per_1k_output', 0.0))
+
+    def get_report(self) -> List[Dict[str, Any]]:
+        """
+        获取各路由的统计报告
+
+        Returns:
+            [{task, profile, model, calls, errors, parse_failures, avg_latency, ...}]
+        """
+        with self._lock:
+            stats = {key: dict(entry) for key, entry in self._stats.items()}
+
+        report = []
+        for (task, profile), entry in sorted(stats.items()):
+            settings = dict(self.base_profile)
+            settings.update(self.profiles.get(profile, {}))
+            report.append({
+                'task': task,
+                'profile': profile,
+                'model': settings.get('model', ''),
+                'calls': entry['calls'],
+                'errors': entry['errors'],
+                'parse_failures': entry['parse_failures'],
+                'total_latency': round(entry['latency'], 2),
+                'avg_latency': round(entry['latency'] / entry['calls'], 2) if entry['calls'] else 0.0,
+                'input_tokens': entry['input_tokens'],
+                'output_tokens': entry['output_tokens'],
+                'cost': round(self._cost(profile, entry['input_tokens'], entry['output_tokens']), 4)
+            })
+        return report
+
+    def print_report(self):
+        """打印路由统计"""
+        report = self.get_report()
+        if not report:
+            return
+
+        print("\n" + "="*60)
+        print("🔀 模型路由统计")
+        print("="*60)
+        for item in report:
+            print(f"  {item['task']:<28} [{item['profile']}] {item['calls']}次, "
+                  f"平均{item['avg_latency']:.1f}秒, 解析失败{item['parse_failures']}次, "
+                  f"Token {item['input_tokens']}/{item['output_tokens']}, 费用 {item['cost']:.4f}")
+
+        total_cost = sum(item['cost'] for item in report)
+        total_calls = sum(item['calls'] for item in report)
+        print(f"\n  合计: {total_calls}次调用, 费用 {total_cost:.4f}")
+
+    def save_report(self, file_path: str):
+        """保存路由统计到JSON文件"""
+        with open(file_path, 'w', encoding='utf-8') as f:
+            json.dump(self.get_report(), f, ensure_ascii=False, indent=2)
@@ -0,0 +1,216 @@
+"""
+提示词预算 - 发送前估算Token，紧凑序列化并按优先级裁剪
+
+分段汇总、分段归并、整体分析的提示词都内嵌大段 JSON 数据，超出模型上下文时服务端
+会静默截断，得到的是无效输出和重试。本模块在组装提示词时：
+1. 按模型估算Token（ModelRouter.estimate_tokens × 模型系数，上下文长度可按模型配置）
+2. 紧凑序列化数据（无缩进、去掉空值、常用键名缩写并附缩写说明）
+3. 超出预算时先删除优先级最低的字段，仍超出时均匀抽掉中间的记录
+4. 打印每次调用的最终Token数
+"""
+import os
+import copy
+import json
+import math
+from typing import Dict, List, Any, Tuple
+from utils.model_router import ModelRouter
+
+
+class PromptBudget:
+    """提示词Token预算"""
+
+    # 常用键名缩写（仅用于提示词中的输入数据，输出格式仍使用完整键名）
+    KEY_ABBREVIATIONS = {
+        'chapter_number': 'no',
+        'title': 'tt',
+        'name': 'n',
+        'role': 'r',
+        'description': 'd',
+        'first_appearance': 'fa',
+        'status_changes': 'sc',
+        'relationships': 'rel',
+        'target': 'to',
+        'relation_type': 'rt',
+        'appearance_traits': 'at',
+        'personality_traits': 'pt',
+        'participants': 'p',
+        'importance': 'imp',
+        'emotional_tone': 'tone',
+        'characters': 'ch',
+        'locations': 'loc',
+        'events': 'ev',
+        'world_elements': 'we',
+        'element': 'el',
+        'details': 'dt',
+        'segment_range': 'range',
+        'main_characters': 'mc',
+        'development': 'dev',
+        'key_relationships': 'kr',
+        'power_growth': 'pg',
+        'main_storyline': 'story',
+        'key_events': 'ke',
+        'emotional_arc': 'arc',
+        'world_building': 'wb',
+    }
+
+    def __init__(self, config: dict):
+        """
+        初始化提示词预算
+
+        Args:
+            config: 配置字典（读取 prompt_budget 与 llm 段）
+        """
+        settings = config.get('prompt_budget', {}) or {}
+        llm_config = config.get('llm', {}) or {}
+        self.enabled = bool(settings.get('enabled', True))
+        self.short_keys = bool(settings.get('short_keys', True))
+        self.context_tokens = int(settings.get('context_tokens', 32768))
+        self.output_reserve = int(settings.get('output_reserve', 0) or 0) or int(
+            os.getenv('LLM_MAX_TOKENS', llm_config.get('max_tokens', 3000)))
+        self.safety_margin = float(settings.get('safety_margin', 0.05))
+        # {模型名: {'context_tokens': ..., 'token_ratio': ...}}
+        self.models = settings.get('models', {}) or {}
+
+        provider = os.getenv('LLM_PROVIDER', llm_config.get('provider', 'ollama'))
+        model_env = 'OPENAI_MODEL' if provider == 'openai' else 'OLLAMA_MODEL'
+        self.default_model = os.getenv(model_env, llm_config.get('model', ''))
+        self.routing_profiles = (config.get('routing', {}) or {}).get('profiles', {}) or {}
+
+    # ========== 模型与预算 ==========
+
+    def model_of(self, llm: Any = None) -> str:
+        """LLM当前使用的模型名（路由LLM按当前档位）"""
+        profile = getattr(llm, 'profile', None)
+        if isinstance(profile, str):
+            return (self.routing_profiles.get(profile) or {}).get('model', self.default_model)
+        return self.default_model
+
+    def limit(self, model: str) -> int:
+        """模型的提示词Token上限（上下文 - 输出预留 - 安全余量）"""
+        context = int((self.models.get(model) or {}).get('context_tokens', self.context_tokens))
+        return max(1000, int(context * (1 - self.safety_margin)) - self.output_reserve)
+
+    def count(self, text: str, model: str) -> int:
+        """按模型估算Token数"""
+        ratio = float((self.models.get(model) or {}).get('token_ratio', 1.0))
+        return int(math.ceil(ModelRouter.estimate_tokens(text) * ratio))
+
+    # ========== 序列化 ==========
+
+    def serialize(self, payload: Any) -> str:
+        """
+        紧凑序列化（未启用时保持原来的缩进格式）
+
+        Args:
+            payload: 提示词中的数据
+
+        Returns:
+            序列化文本（使用缩写时前面附缩写说明）
+        """
+        if not self.enabled:
+            return json.dumps(payload, ensure_ascii=False, indent=2)
+
+        used = set()
+        compact = self._compact(payload, used)
+        text = json.dumps(compact, ensure_ascii=False, separators=(',', ':'))
+        if not used:
+            return text
+        legend = '，'.join(f"{short}={key}" for key, short in self.KEY_ABBREVIATIONS.items() if key in used)
+        return f"（键名缩写：{legend}）\n{text}"
+
+    def _compact(self, value: Any, used: set) -> Any:
+        """去掉空值并缩写键名"""
+        if isinstance(value, dict):
+            result = {}
+            for key, item in value.items():
+                item = self._compact(item, used)
+                if item in (None, '', [], {}):
+                    continue
+                if self.short_keys and key in self.KEY_ABBREVIATIONS:
+                    used.add(key)
+                    key = self.KEY_ABBREVIATIONS[key]
+                result[key] = item
+            return result
+        if isinstance(value, list):
+            return [self._compact(item, used) for item in value]
+        return value
+
+    # ========== 组装 ==========
+
+    def build(self, label: str, template: str, data_field: str, records: List[Dict],
+              trim_fields: Tuple[str, ...] = (), llm: Any = None, **fields) -> str:
+        """
+        组装提示词：紧凑序列化数据，超出预算时按优先级裁剪
+
+        Args:
+            label: 调用名称（用于日志）
+            template: 提示词模板
+            data_field: 模板中放置数据的占位符名
+            records: 数据记录列表（如各章节/各分段）
+            trim_fields: 可删除的记录字段，优先级由低到高
+            llm: 本次调用的LLM（确定模型）
+            **fields: 模板中的其他占位符
+
+        Returns:
+            提示词
+        """
+        if not self.enabled:
+            return template.format(**{data_field: self.serialize(records)}, **fields)
+
+        model = self.model_of(llm)
+        budget = self.limit(model)
+        work = copy.deepcopy(records)
+        trimmed = []
+
+        prompt = template.format(**{data_field: self.serialize(work)}, **fields)
+        tokens = self.count(prompt, model)
+        pending = list(trim_fields)
+        while tokens > budget:
+            if pending:
+                # 先删除优先级最低的字段
+                field = pending.pop(0)
+                for record in work:
+                    if isinstance(record, dict):
+                        record.pop(field, None)
+                trimmed.append(field)
+            elif len(work) > 2:
+                # 字段删完仍超出：均匀抽掉中间的记录（保留首尾）
+                work = [work[0]] + work[1:-1][1::2] + [work[-1]]
+                trimmed.append(f"记录→{len(work)}")
+            else:
+                break
+            prompt = template.format(**{data_field: self.serialize(work)}, **fields)
+            tokens = self.count(prompt, model)
+
+        self.report(label, tokens, budget, trimmed)
+        return prompt
+
+    def check(self, label: str, prompt: str, llm: Any = None, warn_only: bool = False) -> str:
+        """
+        记录已组装好的提示词的Token数（超出预算时警告）
+
+        Args:
+            label: 调用名称
+            prompt: 提示词
+            llm: 本次调用的LLM
+            warn_only: 只在超出预算时打印（单章分析调用频繁，不逐次打印Token数）
+
+        Returns:
+            原提示词
+        """
+        if self.enabled:
+            model = self.model_of(llm)
+            tokens, budget = self.count(prompt, model), self.limit(model)
+            if tokens > budget or not warn_only:
+                self.report(label, tokens, budget, [])
+        return prompt
+
+    @staticmethod
+    def report(label: str, tokens: int, budget: int, trimmed: List[str]):
+        """打印本次调用的Token数"""
+        if tokens > budget:
+            print(f"  ⚠️  [{label}] 提示词约 {tokens} Token，超出预算 {budget}")
+        elif trimmed:
+            print(f"  🧮 [{label}] 提示词约 {tokens} Token（预算 {budget}，已裁剪: {', '.join(trimmed)}）")
+        else:
+            print(f"  🧮 [{label}] 提示词约 {tokens} Token（预算 {budget}）")
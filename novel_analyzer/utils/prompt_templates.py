@@ -72,6 +72,75 @@ class PromptTemplates:
 
 只输出JSON，不要其他文字。"""
 
+    # 多章打包分析Prompt（多个连续短章节共用一次调用）
+    PACKED_CHAPTER_ANALYSIS = """分析以下 {chapter_count} 个连续的小说章节，分别提取每一章的关键信息。
+
+各章节以【第N章】标记开头：
+{chapters_text}
+
+请严格按照以下JSON数组格式输出，数组中每个元素对应一章，按章节顺序排列，
+chapter_number 必须与章节标记中的章节号一致（应包含：{chapter_numbers}），不要添加任何其他文字说明：
+[
+  {{
+    "chapter_number": 章节号,
+    "characters": [
+      {{
+        "name": "角色名",
+        "role": "protagonist/antagonist/supporting",
+        "first_appearance": true,
+        "status_changes": ["变化描述"],
+        "relationships": [
+          {{
+            "target": "相关角色名",
+            "relation_type": "丈夫/妻子/父亲/母亲/兄弟/姐妹/师徒/朋友/敌人/恋人等",
+            "description": "关系描述"
+          }}
+        ],
+        "appearance_traits": ["外貌特征"],
+        "personality_traits": ["性格特征"]
+      }}
+    ],
+    "locations": [
+      {{
+        "name": "地点名",
+        "type": "地点类型",
+        "first_appearance": true,
+        "description": "地点描述"
+      }}
+    ],
+    "events": [
+      {{
+        "type": "conflict/development/climax/turning_point",
+        "description": "事件描述",
+        "importance": "high/medium/low",
+        "emotional_tone": "情感基调",
+        "participants": ["参与角色"]
+      }}
+    ],
+    "world_elements": [
+      {{
+        "type": "power_system/social_rule/special_item/organization",
+        "element": "要素名称",
+        "details": "详细信息"
+      }}
+    ],
+    "writing_style_notes": {{
+      "narrative_perspective": "叙事视角",
+      "key_phrases": ["关键短语"],
+      "emotional_intensity": "high/medium/low",
+      "description_focus": ["描写重点"]
+    }},
+    "chapter_summary": {{
+      "title": "章节标题或核心主题",
+      "main_content": "详细概括本章主要内容（100-200字）",
+      "key_points": ["要点1", "要点2", "要点3"],
+      "chapter_purpose": "本章在整体故事中的作用"
+    }}
+  }}
+]
+
+每一章的信息只来自该章内容，不要混入其他章节。只输出JSON数组，不要其他文字。"""
+
     # 分段汇总Prompt
     SEGMENT_SUMMARY = """基于以下章节的分析结果，进行汇总概括。
 
@@ -306,6 +375,74 @@ class PromptTemplates:
   }}
 }}
 
+只输出JSON，不要其他文字。"""
+
+    # 分段叙述Prompt（混合模式：可数字段在本地计算，只请LLM撰写叙述字段）
+    SEGMENT_NARRATIVE = """以下是小说第 {segment_range} 章（共 {total_chapters} 章，约 {total_words} 字）的分段概要。
+
+{segment_digest}
+
+请基于以上概要撰写该分段的叙述性总结，严格按照以下JSON格式输出，不要添加任何其他文字说明：
+{{
+  "main_storyline": "主线剧情概述（按时间顺序，200-400字）",
+  "emotional_arc": "情感曲线（如：压抑→爆发→释然）",
+  "character_development": [
+    {{
+      "name": "角色名（只写以下角色：{main_characters}）",
+      "development": "该角色在本分段中的发展变化",
+      "power_growth": "实力成长（没有则为空字符串）"
+    }}
+  ],
+  "chapter_structure": "章节结构模式",
+  "pacing": "节奏"
+}}
+
+只输出JSON，不要其他文字。"""
+
+    # 分段合并Prompt（整体分析前的逐层归并）
+    SEGMENT_MERGE = """将以下 {total_segments} 个相邻分段的汇总合并为一个更高层的汇总（覆盖章节 {segment_range}），供后续整体分析使用。
+
+分段汇总数据：
+{segments_data}
+
+要求：
+1. 保留贯穿多个分段的主要角色、主线剧情、关键转折、世界观设定和风格特征
+2. 合并重复信息，删除只在局部出现的次要角色和细节
+3. 主线剧情按时间顺序概括，不超过400字
+
+请严格按照以下JSON格式输出，不要添加任何其他文字说明：
+{{
+  "segment_range": "{segment_range}",
+  "characters": {{
+    "main_characters": [
+      {{
+        "name": "角色名",
+        "role": "角色定位",
+        "development": "在这些分段中的发展变化",
+        "key_relationships": ["关系列表"]
+      }}
+    ],
+    "character_count": 0
+  }},
+  "locations": ["主要地点"],
+  "plot": {{
+    "main_storyline": "主线剧情概述",
+    "key_events": ["关键事件"],
+    "conflicts": ["冲突列表"],
+    "emotional_arc": "情感曲线"
+  }},
+  "world_building": {{
+    "power_system_details": ["力量体系细节"],
+    "social_structure": ["社会结构"],
+    "special_items": ["特殊物品"]
+  }},
+  "style": {{
+    "chapter_structure": "章节结构模式",
+    "pacing": "节奏",
+    "dialogue_ratio": "对话比例"
+  }}
+}}
+
 只输出JSON，不要其他文字。"""
 
     # 整体分析Prompt
@@ -438,4 +575,22 @@ class PromptTemplates:
   }}
 }}
 
+只输出JSON，不要其他文字。"""
+
+    # 整体分析增量更新Prompt（连载跟更：上次的整体分析 + 新增/变化的分段汇总）
+    GLOBAL_DELTA = """以下是一部连载小说此前的整体分析结果，以及之后新增或修订的分段汇总（覆盖章节 {segment_range}，全书现共 {total_segments} 个分段）。
+请在原分析的基础上增量更新，生成完整的新整体分析。
+
+此前的整体分析：
+{previous_analysis}
+
+新增/修订的分段汇总：
+{segments_data}
+
+要求：
+1. 输出与此前的整体分析完全相同的JSON结构，所有字段都要保留
+2. 把新分段中出现的新角色、新地点、新的力量体系细节、组织势力和世界规则并入对应字段
+3. 已有角色有新发展时更新其 character_arc 和 relationships，不要删除此前的内容
+4. plot_structure 的 development、climax 等按新剧情顺延更新；写作风格没有明显变化时保持原样
+
 只输出JSON，不要其他文字。"""
@@ -0,0 +1,370 @@
+"""
+实体出处索引 - 记录角色/地点名在原文中的出现位置
+
+用全部聚合实体的规范名与别名构建 Aho-Corasick 自动机，对原文只扫描一遍，得到
+实体 → {章节号: [字符偏移]} 的索引（偏移相对于 SourceCatalog 读出的章节文本）。
+索引可用于：
+1. 剔除原文中一次都没有出现的实体（模型幻觉）
+2. 按实际出现的章节重建 appearance_chapters
+3. 不调用LLM直接取出实体或事件的原文片段作为证据
+
+名称先去掉括注（“林动（少年）”按“林动”匹配）；去掉括注后仍短于 min_length 的名称
+（如单字名“炎”）不参与匹配，这类实体标记为不可验证，修正聚合数据时原样保留。
+"""
+import os
+import json
+from collections import deque
+from typing import Dict, List, Any, Optional, Iterable, Iterator, Tuple
+from utils.entity_candidates import EntityCandidateExtractor
+
+
+class AhoCorasick:
+    """多模式字符串匹配自动机"""
+
+    def __init__(self):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[Tuple[str, Any]]] = [[]]
+        self._built = False
+
+    def add(self, pattern: str, value: Any):
+        """
+        添加模式串
+
+        Args:
+            pattern: 模式串
+            value: 匹配时返回的值（如实体规范名）
+        """
+        node = 0
+        for ch in pattern:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = nxt
+        self._out[node].append((pattern, value))
+        self._built = False
+
+    def build(self) -> 'AhoCorasick':
+        """计算失败指针（添加完全部模式串后调用）"""
+        queue = deque(self._goto[0].values())
+        for node in queue:
+            self._fail[node] = 0
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(ch, 0)
+                self._fail[nxt] = target if target != nxt else 0
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+        self._built = True
+        return self
+
+    def finditer(self, text: str) -> Iterator[Tuple[int, str, Any]]:
+        """
+        扫描文本中的全部匹配（含重叠匹配）
+
+        Args:
+            text: 文本
+
+        Yields:
+            (起始偏移, 模式串, 值)
+        """
+        if not self._built:
+            self.build()
+        goto, fail, out = self._goto, self._fail, self._out
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            for pattern, value in out[node]:
+                yield i - len(pattern) + 1, pattern, value
+
+
+class ProvenanceIndex:
+    """实体出处索引"""
+
+    INDEX_FILENAME = 'provenance_index.json'
+    VERSION = 2
+
+    def __init__(self):
+        # {规范名: {'kind': 'character'/'location', 'forms': [...], 'matchable': 是否有可匹配的写法,
+        #           'chapters': {章节号: [偏移]}, 'count': 总次数}}
+        self.entities: Dict[str, Dict[str, Any]] = {}
+
+    # ========== 构建 ==========
+
+    @staticmethod
+    def collect_entities(aggregated_data: Dict[str, Any],
+                         registry: Optional[Dict[str, Any]] = None) -> Dict[str, Dict[str, Any]]:
+        """
+        从聚合数据（和实体词典）收集实体名与别名
+
+        Args:
+            aggregated_data: DataAggregator 的聚合数据
+            registry: entity_registry.json 的内容（提供别名，可选）
+
+        Returns:
+            {规范名: {'kind': ..., 'forms': [规范名, 别名...]}}
+        """
+        registry = registry or {}
+        entities = {}
+        for kind, key in (('character', 'characters'), ('location', 'locations')):
+            known = registry.get(key, {}) or {}
+            for item in aggregated_data.get(key, []) or []:
+                name = item.get('name')
+                if not isinstance(name, str) or not name.strip():
+                    continue
+                forms = [name]
+                for alias in (known.get(name) or {}).get('aliases', []) or []:
+                    if isinstance(alias, str) and alias and alias not in forms:
+                        forms.append(alias)
+                entities.setdefault(name, {'kind': kind, 'forms': forms})
+        return entities
+
+    @classmethod
+    def build(cls, entities: Dict[str, Dict[str, Any]], chapters: Iterable[Tuple[int, str]],
+              min_length: int = 2, max_offsets: int = 50) -> 'ProvenanceIndex':
+        """
+        扫描原文建立索引
+
+        Args:
+            entities: collect_entities 的结果
+            chapters: (章节号, 章节原文) 序列
+            min_length: 参与匹配的名称最短字数（单字别名误匹配太多）
+            max_offsets: 每个实体每章最多记录的偏移数（次数仍完整统计）
+
+        Returns:
+            出处索引
+        """
+        index = cls()
+        automaton = AhoCorasick()
+        for name, entity in entities.items():
+            patterns = []
+            for form in entity['forms']:
+                form = EntityCandidateExtractor.normalize_name(form)
+                if len(form) >= min_length and form not in patterns:
+                    patterns.append(form)
+            index.entities[name] = {'kind': entity['kind'], 'forms': list(entity['forms']),
+                                    'matchable': bool(patterns), 'chapters': {}, 'count': 0}
+            for pattern in patterns:
+                automaton.add(pattern, name)
+        automaton.build()
+
+        for chapter_number, text in chapters:
+            if not text:
+                continue
+            last_end = {}
+            for start, pattern, name in automaton.finditer(text):
+                # 同一实体的重叠匹配（如规范名包含别名）只计一次
+                if start < last_end.get(name, -1):
+                    continue
+                last_end[name] = start + len(pattern)
+                entry = index.entities[name]
+                entry['count'] += 1
+                offsets = entry['chapters'].setdefault(chapter_number, [])
+                if len(offsets) < max_offsets:
+                    offsets.append(start)
+        return index
+
+    # ========== 查询 ==========
+
+    def is_matchable(self, name: str) -> bool:
+        """实体是否有可匹配的写法（未收录的实体为False）"""
+        return bool((self.entities.get(name) or {}).get('matchable'))
+
+    def count(self, name: str) -> int:
+        """实体在原文中的出现次数（未收录的实体为0）"""
+        return (self.entities.get(name) or {}).get('count', 0)
+
+    def chapters_of(self, name: str) -> List[int]:
+        """实体出现的章节号（升序）"""
+        return sorted((self.entities.get(name) or {}).get('chapters', {}))
+
+    def hits(self, name: str, chapter: Optional[int] = None) -> List[Tuple[int, int]]:
+        """
+        实体的出现位置
+
+        Args:
+            name: 实体规范名
+            chapter: 只返回该章节的位置（None 为全部）
+
+        Returns:
+            [(章节号, 字符偏移)]
+        """
+        chapters = (self.entities.get(name) or {}).get('chapters', {})
+        numbers = [chapter] if chapter is not None else sorted(chapters)
+        return [(num, offset) for num in numbers for offset in chapters.get(num, [])]
+
+    def snippets(self, name: str, catalog, chapter: Optional[int] = None,
+                 width: int = 40, limit: int = 3) -> List[Dict[str, Any]]:
+        """
+        取出实体在原文中的片段（不调用LLM）
+
+        Args:
+            name: 实体规范名
+            catalog: SourceCatalog（按章节号读取原文）
+            chapter: 只取该章节的片段
+            width: 出现位置前后各取的字数
+            limit: 最多返回的片段数
+
+        Returns:
+            [{'chapter': 章节号, 'offset': 偏移, 'text': 片段}]
+        """
+        results = []
+        texts = {}
+        for num, offset in self.hits(name, chapter)[:limit]:
+            if num not in texts:
+                texts[num] = catalog.read_chapter(num) or ''
+            text = texts[num]
+            results.append({
+                'chapter': num,
+                'offset': offset,
+                'text': text[max(0, offset - width):offset + width].replace('\n', ' ')
+            })
+        return results
+
+    def event_evidence(self, event: Dict[str, Any], catalog, width: int = 60) -> Optional[Dict[str, Any]]:
+        """
+        事件的原文证据：事件所在章节中参与者出现位置最集中的片段
+
+        Args:
+            event: 聚合事件（chapter_number、participants）
+            catalog: SourceCatalog
+            width: 片段前后各取的字数
+
+        Returns:
+            {'chapter', 'offset', 'text'}，参与者都不在该章出现时返回None
+        """
+        chapter = event.get('chapter_number')
+        participants = [p for p in event.get('participants', []) or [] if p in self.entities]
+        positions = sorted((offset, name) for name in participants
+                           for _, offset in self.hits(name, chapter))
+        if not positions:
+            return None
+
+        # 覆盖参与者最多、跨度最短的位置窗口
+        best = None
+        for i, (start, _) in enumerate(positions):
+            seen = set()
+            for offset, name in positions[i:]:
+                if offset - start > width * 2:
+                    break
+                seen.add(name)
+                key = (-len(seen), offset - start)
+                if best is None or key < best[0]:
+                    best = (key, start, offset)
+        _, start, end = best
+        text = catalog.read_chapter(chapter) or ''
+        return {
+            'chapter': chapter,
+            'offset': start,
+            'text': text[max(0, start - width // 2):end + width].replace('\n', ' ')
+        }
+
+    # ========== 修正聚合数据 ==========
+
+    def apply(self, aggregated_data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        用索引修正聚合数据（原地修改，需为字典形式的聚合数据）
+
+        - 原文中没有出现过的角色/地点视为幻觉，从结果中剔除（没有可匹配写法的实体无法验证，原样保留）
+        - appearance_chapters / first_appearance_chapter / total_appearances 按实际出现的章节重建
+        - 事件参与者中被剔除的角色一并去掉
+
+        Args:
+            aggregated_data: 聚合数据
+
+        Returns:
+            修正报告 {'dropped_characters', 'dropped_locations', 'unverified', 'updated'}
+        """
+        titles = {arc.get('chapter_number'): arc.get('chapter_title', '')
+                  for arc in aggregated_data.get('plot_arcs', []) or []}
+        report = {'dropped_characters': [], 'dropped_locations': [], 'unverified': [], 'updated': 0}
+
+        for key, kind in (('characters', 'character'), ('locations', 'location')):
+            kept = []
+            for item in aggregated_data.get(key, []) or []:
+                name = item.get('name')
+                if name not in self.entities:
+                    kept.append(item)
+                    continue
+                if not self.is_matchable(name):
+                    report['unverified'].append(name)
+                    kept.append(item)
+                    continue
+                chapters = self.chapters_of(name)
+                if not chapters:
+                    report[f'dropped_{key}'].append(name)
+                    continue
+                item['appearance_chapters'] = [
+                    {
+                        'chapter_number': num,
+                        'chapter_title': titles.get(num, f'第{num}章'),
+                        'is_first_appearance': num == chapters[0]
+                    }
+                    for num in chapters
+                ]
+                item['first_appearance_chapter'] = chapters[0]
+                if 'first_appearance_title' in item:
+                    item['first_appearance_title'] = titles.get(chapters[0], f'第{chapters[0]}章')
+                if 'total_appearances' in item:
+                    item['total_appearances'] = len(chapters)
+                report['updated'] += 1
+                kept.append(item)
+            aggregated_data[key] = kept
+
+        dropped = set(report['dropped_characters'])
+        if dropped:
+            for event in aggregated_data.get('events', []) or []:
+                if isinstance(event.get('participants'), list):
+                    event['participants'] = [p for p in event['participants'] if p not in dropped]
+
+        metadata = aggregated_data.get('metadata')
+        if isinstance(metadata, dict):
+            metadata['total_characters'] = len(aggregated_data.get('characters', []))
+            metadata['total_locations'] = len(aggregated_data.get('locations', []))
+        return report
+
+    # ========== 持久化 ==========
+
+    def save(self, path: str):
+        """保存索引"""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        data = {'version': self.VERSION, 'entities': self.entities}
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'ProvenanceIndex':
+        """
+        加载索引
+
+        Args:
+            path: 索引文件路径
+
+        Returns:
+            出处索引（版本不符时为空索引）
+        """
+        index = cls()
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('version') != cls.VERSION:
+            print(f"⚠️  出处索引版本不符，需要重新建立: {path}")
+            return index
+        # JSON 的键为字符串，还原为章节号
+        for name, entry in data.get('entities', {}).items():
+            entry['chapters'] = {int(num): offsets for num, offsets in entry.get('chapters', {}).items()}
+            index.entities[name] = entry
+        return index
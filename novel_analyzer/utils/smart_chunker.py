@@ -2,7 +2,9 @@
 智能分块器 - 根据文件大小限制和语义分组进行智能分块
 """
 import json
-from typing import List, Dict, Any, Optional
+import sqlite3
+from array import array
+from typing import List, Dict, Any, Optional, Iterable, Iterator
 
 
 class SmartChunker:
@@ -46,44 +48,63 @@ class SmartChunker:
         if not items:
             return []
         
-        chunks = []
-        current_chunk = []
-        current_size = 0
-        
-        # 如果有分组键，先按组分类
-        if group_key:
-            groups = self._group_by_key(items, group_key)
-            for group_items in groups.values():
-                chunk, remaining = self._fill_chunk(group_items, current_chunk, current_size)
-                if chunk:
-                    chunks.append(chunk)
-                current_chunk = []
-                current_size = 0
-                
-                # 处理剩余项目
-                while remaining:
-                    chunk, remaining = self._fill_chunk(remaining, [], 0)
-                    if chunk:
-                        chunks.append(chunk)
-        else:
-            # 简单顺序分块
-            for item in items:
-                item_size = len(json.dumps(item, ensure_ascii=False).encode('utf-8'))
-                
-                if current_size + item_size > self.effective_max_size:
-                    if current_chunk:
-                        chunks.append(current_chunk)
-                    current_chunk = [item]
-                    current_size = item_size
-                else:
-                    current_chunk.append(item)
-                    current_size += item_size
-            
-            if current_chunk:
-                chunks.append(current_chunk)
+        groups = [item.get(group_key) for item in items] if group_key else None
+        assignment = self._assign_chunks([self._json_size(item) for item in items], groups)
         
+        chunks = [[] for _ in range(max(assignment) + 1)]
+        for item, chunk_id in zip(items, assignment):
+            chunks[chunk_id].append(item)
         return chunks
     
+    def _assign_chunks(self, sizes: List[int], groups: Optional[List[Any]] = None) -> array:
+        """
+        计算每个项目所属的块编号（chunk_by_items 与 iter_chunks 共用，保证分块一致）
+        
+        有分组时每组单独分块：按组首次出现的顺序，每轮从剩余项目中按顺序放入能装下的项目，
+        装不下的留到下一块；无分组时按顺序装满即换块。单个项目超过上限时单独成块。
+        
+        Args:
+            sizes: 各项目序列化后的字节数
+            groups: 各项目的分组值（None 表示不分组）
+            
+        Returns:
+            块编号数组（块编号即输出顺序）
+        """
+        assignment = array('i', [0]) * len(sizes)
+        next_chunk = 0
+        
+        if groups is None:
+            current_size = 0
+            for i, item_size in enumerate(sizes):
+                if i and current_size + item_size > self.effective_max_size:
+                    next_chunk += 1
+                    current_size = 0
+                assignment[i] = next_chunk
+                current_size += item_size
+            return assignment
+        
+        members = {}
+        for i, group in enumerate(groups):
+            members.setdefault(group, array('i')).append(i)
+        
+        for pending in members.values():
+            while pending:
+                size = 0
+                rest = array('i')
+                for i in pending:
+                    if size + sizes[i] <= self.effective_max_size:
+                        assignment[i] = next_chunk
+                        size += sizes[i]
+                    else:
+                        rest.append(i)
+                if len(rest) == len(pending):
+                    # 超过上限的项目单独成块
+                    assignment[rest[0]] = next_chunk
+                    rest = rest[1:]
+                next_chunk += 1
+                pending = rest
+        return assignment
+    
     def chunk_by_chapters(self, chapters: List[Dict], chapters_per_chunk: int = None) -> List[List[Dict]]:
         """
         按章节范围分块
@@ -108,6 +129,85 @@ class SmartChunker:
             # 按大小自动分块
             return self.chunk_by_items(chapters)
     
+    def iter_chunks(self, items: Iterable[Dict], group_key: Optional[str] = None) -> Iterator[List[Dict]]:
+        """
+        流式分块：分块结果与 chunk_by_items 完全一致，但不把全部项目载入内存（适合落盘的大列表）
+        
+        无分组时块由连续的项目组成，逐项读取、块满即产出；有分组时同一块的项目分散在
+        整个列表中，先遍历一遍只记录大小和分组并计算块编号，第二遍把项目按块编号写入
+        临时 SQLite 数据库，再按块顺序读出（items 需可重复遍历，如 JsonlSpool）。
+        
+        Args:
+            items: 要分块的项目（可迭代对象）
+            group_key: 用于分组的键名（可选）
+            
+        Yields:
+            分块（顺序与 chunk_by_items 相同）
+        """
+        if not group_key:
+            chunk, size = [], 0
+            for item in items:
+                item_size = self._json_size(item)
+                if chunk and size + item_size > self.effective_max_size:
+                    yield chunk
+                    chunk, size = [], 0
+                chunk.append(item)
+                size += item_size
+            if chunk:
+                yield chunk
+            return
+        
+        sizes, groups = array('i'), []
+        group_ids = {}
+        for item in items:
+            sizes.append(self._json_size(item))
+            groups.append(group_ids.setdefault(item.get(group_key), len(group_ids)))
+        if not sizes:
+            return
+        assignment = self._assign_chunks(sizes, groups)
+        del groups
+        
+        # 空路径为临时数据库，关闭后自动删除
+        db = sqlite3.connect('')
+        try:
+            db.execute('CREATE TABLE items (seq INTEGER PRIMARY KEY, chunk INTEGER, body TEXT)')
+            db.executemany('INSERT INTO items VALUES (?, ?, ?)', (
+                (i, assignment[i], json.dumps(item, ensure_ascii=False, default=self._json_default))
+                for i, item in enumerate(items)
+            ))
+            db.execute('CREATE INDEX items_chunk ON items (chunk, seq)')
+            chunk, current = [], 0
+            for chunk_id, body in db.execute('SELECT chunk, body FROM items ORDER BY chunk, seq'):
+                if chunk_id != current and chunk:
+                    yield chunk
+                    chunk = []
+                current = chunk_id
+                chunk.append(json.loads(body))
+            if chunk:
+                yield chunk
+        finally:
+            db.close()
+    
+    def iter_chapter_chunks(self, chapters: Iterable[Dict], chapters_per_chunk: int) -> Iterator[List[Dict]]:
+        """
+        流式按章节数分块（与 chunk_by_chapters 的固定章节数分块一致）
+        
+        Args:
+            chapters: 章节条目（可迭代对象，已按章节顺序）
+            chapters_per_chunk: 每个块的章节数
+            
+        Yields:
+            分块
+        """
+        chunk = []
+        for chapter in chapters:
+            chunk.append(chapter)
+            if len(chunk) >= chapters_per_chunk:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+    
     def chunk_dict_by_category(self, data: Dict[str, List[Dict]]) -> Dict[str, List[List[Dict]]]:
         """
         对字典中的每个类别分别分块
@@ -133,7 +233,7 @@ class SmartChunker:
         Returns:
             估算的块数量
         """
-        total_size = len(json.dumps(items, ensure_ascii=False).encode('utf-8'))
+        total_size = self._json_size(items)
         return max(1, (total_size + self.effective_max_size - 1) // self.effective_max_size)
     
     def get_chunk_info(self, chunk: List[Dict]) -> Dict[str, Any]:
@@ -146,7 +246,7 @@ class SmartChunker:
         Returns:
             块信息（大小、项目数等）
         """
-        chunk_json = json.dumps(chunk, ensure_ascii=False)
+        chunk_json = json.dumps(chunk, ensure_ascii=False, default=self._json_default)
         size_bytes = len(chunk_json.encode('utf-8'))
         
         return {
@@ -156,35 +256,13 @@ class SmartChunker:
             'utilization': round(size_bytes / self.effective_max_size * 100, 2)
         }
     
-    def _group_by_key(self, items: List[Dict], key: str) -> Dict[Any, List[Dict]]:
-        """按键值分组项目"""
-        groups = {}
-        for item in items:
-            value = item.get(key)
-            if value not in groups:
-                groups[value] = []
-            groups[value].append(item)
-        return groups
+    @staticmethod
+    def _json_default(obj: Any) -> Any:
+        """序列化钩子：支持带 to_dict() 的紧凑记录"""
+        if hasattr(obj, 'to_dict'):
+            return obj.to_dict()
+        raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
     
-    def _fill_chunk(self, items: List[Dict], current_chunk: List[Dict], 
-                    current_size: int) -> tuple[List[Dict], List[Dict]]:
-        """
-        尽可能填充当前块
-        
-        Returns:
-            (完成的块, 剩余项目)
-        """
-        chunk = current_chunk.copy()
-        size = current_size
-        remaining = []
-        
-        for item in items:
-            item_size = len(json.dumps(item, ensure_ascii=False).encode('utf-8'))
-            
-            if size + item_size <= self.effective_max_size:
-                chunk.append(item)
-                size += item_size
-            else:
-                remaining.append(item)
-        
-        return chunk, remaining
+    def _json_size(self, obj: Any) -> int:
+        """计算对象序列化后的字节数"""
+        return len(json.dumps(obj, ensure_ascii=False, default=self._json_default).encode('utf-8'))
@@ -0,0 +1,378 @@
+"""
+原文目录索引 - 为小说原文建立持久化的章节定位表
+
+按章节号和规范化标题映射到 文件路径 + 字节范围，附带内容哈希和编码。
+索引保存在分析输出的 intermediate 目录（不写入小说原文目录），文件 mtime/大小 变化时仅重建对应文件的条目。
+
+阅读顺序序号（index）与 FileUtils.load_novel_files 的章节号一致：一个文件一个条目。
+确实包含多个章节（至少两个章节号不同的“第X章/回”标题行）的文件另外记录各章节的
+字节范围（sections），只用于按标题或章节号查找，不占用阅读顺序序号。
+"""
+import os
+import re
+import json
+import hashlib
+from typing import Dict, List, Optional, Tuple
+from utils.file_utils import FileUtils
+
+
+class SourceCatalog:
+    """小说原文目录索引"""
+
+    CATALOG_FILENAME = '.source_catalog.json'
+    VERSION = 2
+
+    # 章节标题行（用于在单个文件中切分多个章节；“第X节”是章内小节，不参与切分）
+    HEADING_PATTERN = re.compile(r'^\s*第\s*([0-9０-９零〇一二两三四五六七八九十百千万]+)\s*[章回]')
+    # 标题/文件名中的章节号
+    NUMBER_PATTERN = re.compile(r'^\s*第\s*([0-9０-９零〇一二两三四五六七八九十百千万]+)\s*[章节回]')
+
+    CN_DIGITS = {'零': 0, '〇': 0, '一': 1, '二': 2, '两': 2, '三': 3, '四': 4,
+                 '五': 5, '六': 6, '七': 7, '八': 8, '九': 9}
+    CN_UNITS = {'十': 10, '百': 100, '千': 1000}
+
+    def __init__(self, novel_dir: str, cache_path: str = None,
+                 encodings: Tuple[str, ...] = ('utf-8', 'gb18030')):
+        """
+        初始化原文目录索引
+
+        Args:
+            novel_dir: 小说原文目录
+            cache_path: 索引文件路径（通常为 intermediate/.source_catalog.json；为空时只在内存中构建）
+            encodings: 依次尝试的文件编码
+        """
+        self.novel_dir = novel_dir
+        self.cache_path = cache_path
+        self.encodings = encodings
+
+        self.files = {}      # filename -> {mtime, size, encoding, entry, sections}
+        self.entries = []    # 按阅读顺序排列的章节条目
+        self._by_title = {}
+        self._by_index = {}
+        self._by_number = {}
+        self._loaded = False
+
+    # ========== 构建与加载 ==========
+
+    def load(self) -> 'SourceCatalog':
+        """
+        加载索引；文件有变动时增量重建并写回
+
+        Returns:
+            self
+        """
+        if not os.path.isdir(self.novel_dir):
+            raise FileNotFoundError(f"文件夹不存在: {self.novel_dir}")
+
+        cached_files = self._read_cache()
+        txt_files = sorted(
+            (f for f in os.listdir(self.novel_dir) if f.endswith('.txt')),
+            key=FileUtils._natural_sort_key
+        )
+
+        files = {}
+        rebuilt = 0
+        for filename in txt_files:
+            path = os.path.join(self.novel_dir, filename)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+
+            cached = cached_files.get(filename)
+            if cached and cached.get('mtime') == stat.st_mtime and cached.get('size') == stat.st_size:
+                files[filename] = cached
+                continue
+
+            file_info = self._scan_file(filename, path, stat)
+            if file_info:
+                files[filename] = file_info
+                rebuilt += 1
+
+        changed = rebuilt > 0 or set(files) != set(cached_files)
+        self.files = files
+        self._build_lookup()
+
+        if changed:
+            self._write_cache()
+            print(f"  🗂️  原文索引已更新: {len(self.entries)} 个章节 (重建 {rebuilt} 个文件)")
+
+        self._loaded = True
+        return self
+
+    def _read_cache(self) -> Dict:
+        """读取已有索引文件，版本或小说目录不匹配时视为空"""
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return {}
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') != self.VERSION or data.get('novel_dir') != os.path.abspath(self.novel_dir):
+                return {}
+            return data.get('files', {})
+        except Exception as e:
+            print(f"  ⚠️  原文索引损坏，重新构建: {e}")
+            return {}
+
+    def _write_cache(self):
+        """写回索引文件（失败不影响使用）"""
+        if not self.cache_path:
+            return
+        try:
+            directory = os.path.dirname(self.cache_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.cache_path, 'w', encoding='utf-8') as f:
+                json.dump({'version': self.VERSION, 'novel_dir': os.path.abspath(self.novel_dir),
+                           'files': self.files}, f, ensure_ascii=False)
+        except Exception as e:
+            print(f"  ⚠️  保存原文索引失败: {e}")
+
+    def _scan_file(self, filename: str, path: str, stat) -> Optional[Dict]:
+        """
+        扫描单个文件，按标题行切分章节并记录字节范围
+
+        Args:
+            filename: 文件名
+            path: 文件路径
+            stat: os.stat结果
+
+        Returns:
+            文件信息字典
+        """
+        try:
+            with open(path, 'rb') as f:
+                raw = f.read()
+        except Exception as e:
+            print(f"  ⚠️  读取文件 {filename} 失败: {e}")
+            return None
+
+        encoding = self._detect_encoding(raw)
+        if encoding is None:
+            print(f"  ⚠️  无法识别文件编码: {filename}")
+            return None
+
+        # 逐行扫描标题（utf-8 与 gb18030 的多字节序列都不含 0x0A，可直接按字节切行）
+        headings = []
+        offset = 0
+        for line in raw.splitlines(keepends=True):
+            text = line.decode(encoding, errors='ignore').strip()
+            if self.HEADING_PATTERN.match(text):
+                headings.append((offset, text))
+            offset += len(line)
+
+        # 整个文件是一个条目：标题规则与 FileUtils._extract_chapter_title 保持一致
+        stem = os.path.splitext(filename)[0]
+        content = raw.decode(encoding, errors='ignore')
+        entry = self._make_entry(raw, 0, len(raw), FileUtils._extract_chapter_title(content, filename), stem)
+
+        # 章节号不同的标题行至少两个时才视为合集文件（重复的标题行不算）
+        sections = []
+        if len({self._parse_chapter_number(title) for _, title in headings}) >= 2:
+            for i, (start, title) in enumerate(headings):
+                end = headings[i + 1][0] if i + 1 < len(headings) else len(raw)
+                sections.append(self._make_entry(raw, start, end, title, stem))
+
+        return {
+            'mtime': stat.st_mtime,
+            'size': stat.st_size,
+            'encoding': encoding,
+            'stem': stem,
+            'entry': entry,
+            'sections': sections
+        }
+
+    def _make_entry(self, raw: bytes, start: int, end: int, title: str, stem: str) -> Dict:
+        """字节范围对应的章节条目"""
+        return {
+            'title': title,
+            'number': self._parse_chapter_number(title) or self._parse_chapter_number(stem),
+            'start': start,
+            'end': end,
+            'sha1': hashlib.sha1(raw[start:end]).hexdigest()
+        }
+
+    def _detect_encoding(self, raw: bytes) -> Optional[str]:
+        """依次尝试候选编码"""
+        for encoding in self.encodings:
+            try:
+                raw.decode(encoding)
+                return encoding
+            except (UnicodeDecodeError, LookupError):
+                continue
+        return None
+
+    def _build_lookup(self):
+        """根据文件信息建立查找表"""
+        self.entries = []
+        self._by_title = {}
+        self._by_index = {}
+        self._by_number = {}
+
+        for filename, info in self.files.items():
+            record = dict(info['entry'], path=filename, encoding=info['encoding'])
+            record['index'] = len(self.entries) + 1
+            self.entries.append(record)
+            self._by_index[record['index']] = record
+
+            # 合集文件的各章节按自己的标题和章节号查找（index 为所在文件的序号）
+            records = [dict(section, path=filename, encoding=info['encoding'], index=record['index'])
+                       for section in info.get('sections', [])]
+            if not records:
+                records = [record]
+            for item in records:
+                if item['number'] is not None:
+                    self._by_number.setdefault(item['number'], item)
+                keys = [item['title']] + ([info.get('stem', '')] if item is record else [])
+                for key in keys:
+                    norm = self.normalize_title(key)
+                    if norm:
+                        self._by_title.setdefault(norm, item)
+
+    # ========== 查询 ==========
+
+    def lookup(self, chapter_number: int = None, chapter_title: str = '') -> Optional[Dict]:
+        """
+        查找章节条目
+
+        优先按规范化标题匹配，其次按阅读顺序序号（与 FileUtils.load_novel_files
+        分配 chapter_number 的方式一致），最后按标题中解析出的章节号。
+
+        Args:
+            chapter_number: 章节号
+            chapter_title: 章节标题
+
+        Returns:
+            章节条目，找不到返回None
+        """
+        if not self._loaded:
+            self.load()
+
+        if chapter_title:
+            record = self._by_title.get(self.normalize_title(chapter_title))
+            if record:
+                return record
+
+        if chapter_number is not None:
+            record = self._by_index.get(chapter_number) or self._by_number.get(chapter_number)
+            if record:
+                return record
+
+        return None
+
+    def read_chapter(self, chapter_number: int = None, chapter_title: str = '') -> Optional[str]:
+        """
+        读取章节原文（只读取该章节的字节范围）
+
+        Args:
+            chapter_number: 章节号
+            chapter_title: 章节标题
+
+        Returns:
+            章节内容，找不到返回None
+        """
+        record = self.lookup(chapter_number, chapter_title)
+        if not record:
+            return None
+        return self.read_entry(record)
+
+    def read_entry(self, record: Dict) -> Optional[str]:
+        """
+        按条目读取原文
+
+        Args:
+            record: lookup 返回的章节条目
+
+        Returns:
+            章节内容
+        """
+        path = os.path.join(self.novel_dir, record['path'])
+        try:
+            with open(path, 'rb') as f:
+                f.seek(record['start'])
+                raw = f.read(record['end'] - record['start'])
+            return raw.decode(record['encoding'], errors='ignore')
+        except Exception as e:
+            print(f"  ⚠️  读取文件 {record['path']} 失败: {e}")
+            return None
+
+    # ========== 辅助方法 ==========
+
+    @staticmethod
+    def normalize_title(title: str) -> str:
+        """
+        规范化标题：去除空白、标点和扩展名，全角数字转半角
+
+        Args:
+            title: 原始标题
+
+        Returns:
+            规范化后的标题
+        """
+        if not title:
+            return ''
+        title = title.strip()
+        if title.endswith('.txt'):
+            title = title[:-4]
+        title = title.translate({ord(c): ord('0') + i for i, c in enumerate('０１２３４５６７８９')})
+        return re.sub(r'[\s　_\-—·:：,，.。!！?？"“”\'‘’()（）\[\]【】《》]', '', title).lower()
+
+    @classmethod
+    def _parse_chapter_number(cls, text: str) -> Optional[int]:
+        """
+        从标题或文件名中解析章节号（支持阿拉伯数字和中文数字）
+
+        Args:
+            text: 标题或文件名
+
+        Returns:
+            章节号，解析失败返回None
+        """
+        if not text:
+            return None
+
+        match = cls.NUMBER_PATTERN.match(text)
+        if match:
+            token = match.group(1)
+        else:
+            match = re.match(r'^\D{0,10}?(\d+)', text)
+            if not match:
+                return None
+            token = match.group(1)
+
+        token = token.translate({ord(c): ord('0') + i for i, c in enumerate('０１２３４５６７８９')})
+        if token.isdigit():
+            return int(token)
+        return cls._parse_chinese_number(token)
+
+    @classmethod
+    def _parse_chinese_number(cls, token: str) -> Optional[int]:
+        """解析中文数字（如 一百二十三、两千零五）"""
+        total = 0
+        section = 0
+        digit = 0
+        for ch in token:
+            if ch in cls.CN_DIGITS:
+                digit = cls.CN_DIGITS[ch]
+            elif ch in cls.CN_UNITS:
+                section += (digit or 1) * cls.CN_UNITS[ch]
+                digit = 0
+            elif ch == '万':
+                total += (section + digit) * 10000
+                section = 0
+                digit = 0
+            else:
+                return None
+        result = total + section + digit
+        return result or None
+
+    def get_entries(self) -> List[Dict]:
+        """
+        获取全部章节条目（按阅读顺序，一个文件一个条目，index 与 load_novel_files 的章节号一致）
+
+        Returns:
+            章节条目列表
+        """
+        if not self._loaded:
+            self.load()
+        return self.entries
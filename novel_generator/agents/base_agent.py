@@ -6,6 +6,12 @@ from dotenv import load_dotenv
 from langchain_openai import ChatOpenAI
 from langchain_ollama import ChatOllama
 
+# 多端点客户端池在 novel_analyzer 中实现；单独部署 novel_generator 时不可用，只使用单个端点
+try:
+    from novel_analyzer.utils.llm_pool import get_shared_pool, parse_endpoints
+except ImportError:
+    get_shared_pool = None
+
 # 加载环境变量
 load_dotenv()
 
@@ -33,6 +39,21 @@ class BaseAgent(ABC):
         openai_model = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
         temperature = float(os.getenv("LLM_TEMPERATURE", "0.7"))
         
+        # 多端点负载均衡：LLM_ENDPOINTS=http://gpu1:11434,http://gpu2:11434
+        endpoints = parse_endpoints(os.getenv("LLM_ENDPOINTS")) if get_shared_pool else []
+        if os.getenv("LLM_ENDPOINTS") and get_shared_pool is None:
+            print("⚠️ 未找到 novel_analyzer.utils.llm_pool，忽略 LLM_ENDPOINTS，使用单个端点")
+        if endpoints and llm_provider in ("ollama", "openai"):
+            model = ollama_model if llm_provider == "ollama" else openai_model
+            self.log(f"🤖 使用 {llm_provider} 模型: {model} ({len(endpoints)} 个端点负载均衡)")
+            # 同一进程内的所有智能体共用一个客户端池
+            return get_shared_pool(
+                endpoints,
+                lambda url: self._create_endpoint_llm(llm_provider, model, temperature, url),
+                key=(llm_provider, model, temperature),
+                provider=llm_provider
+            )
+        
         if llm_provider == "ollama":
             try:
                 self.log(f"🤖 使用 Ollama 模型: {ollama_model}")
@@ -59,6 +80,13 @@ class BaseAgent(ABC):
         else:
             raise Exception(f"❌ 不支持的 LLM_PROVIDER: {llm_provider}，请使用 'ollama' 或 'openai'")
     
+    @staticmethod
+    def _create_endpoint_llm(provider: str, model: str, temperature: float, base_url: str):
+        """为单个端点创建LLM实例（客户端池使用）"""
+        if provider == "ollama":
+            return ChatOllama(model=model, temperature=temperature, base_url=base_url)
+        return ChatOpenAI(model=model, temperature=temperature, base_url=base_url)
+    
     @abstractmethod
     def run(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
         """